@@ -0,0 +1,187 @@
+"""
+Persistent cache of LLM answers keyed on the retrieved context
+A question that retrieves the same documents from the same data gets the same prompt, so
+its answer is generated once. Entries are keyed by the normalized question, a hash of the
+ordered ids of the retrieved documents and the LLM that wrote the answer, and tagged with
+the data version (database.get_data_version) current when it was written; an entry from
+an older version is dropped when next looked up.
+
+With ANSWER_CACHE_SEMANTIC, a differently worded question is served a cached answer when
+it retrieved exactly the same documents and its embedding is within ANSWER_CACHE_MIN_COSINE
+of the cached question's. Only entries with the same context are compared, so the check
+is a handful of dot products rather than a vector search.
+
+Entries live in SQLite, shared by the API's worker processes and kept across restarts.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+import numpy as np
+import config
+from retrieval_cache import normalize_query
+
+ANSWERS_FILE = 'answers.sqlite'
+
+# Seconds an entry's last_used may lag before a hit rewrites it; eviction order only needs it roughly
+TOUCH_INTERVAL = 60
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS answers (
+    query TEXT NOT NULL,
+    context TEXT NOT NULL,
+    model TEXT NOT NULL,
+    data_version INTEGER NOT NULL,
+    answer TEXT NOT NULL,
+    embedding BLOB,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (query, context, model)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_answers_context ON answers(context, model);
+CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers(last_used);
+"""
+
+def context_key(document_ids: List[str]) -> str:
+    """sha256 of the retrieved document ids in rank order"""
+    return hashlib.sha256('\x1f'.join(str(doc_id) for doc_id in document_ids).encode('utf-8')).hexdigest()
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+class AnswerCache:
+    """Answers of one LLM, by question and retrieved context"""
+
+    def __init__(self, model_name: str, path: Optional[str] = None, max_entries: Optional[int] = None,
+                 semantic: Optional[bool] = None, min_cosine: Optional[float] = None):
+        self.model_name = model_name
+        self.path = path or config.ANSWER_CACHE_PATH
+        self.max_entries = max_entries or config.ANSWER_CACHE_SIZE
+        self.semantic = config.ANSWER_CACHE_SEMANTIC if semantic is None else semantic
+        self.min_cosine = config.ANSWER_CACHE_MIN_COSINE if min_cosine is None else min_cosine
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+        # Autocommit mode: each statement is its own transaction
+        self._db = sqlite3.connect(os.path.join(self.path, ANSWERS_FILE), timeout=30,
+                                   isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # A cache can lose its last commits on power loss; WAL keeps it consistent without an fsync each
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA_SQL)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, query_text: str, document_ids: List[str], data_version: int,
+            query_embedding: Optional[List[float]] = None) -> Optional[str]:
+        """
+        The cached answer to a question with this context, or None
+
+        query_embedding enables the semantic tier; questions answered without embedding
+        them (identifier lookups) only match exactly.
+        """
+        query, context = normalize_query(query_text), context_key(document_ids)
+        with self._lock:
+            row = self._db.execute("SELECT answer, data_version, last_used FROM answers WHERE query = ? AND context = ? AND model = ?",
+                                   (query, context, self.model_name)).fetchone()
+            if row is not None and row[1] != data_version:
+                self._db.execute("DELETE FROM answers WHERE query = ? AND context = ? AND model = ?",
+                                 (query, context, self.model_name))
+                self.stale += 1
+                row = None
+            if row is not None:
+                self._touch(query, context, row[2])
+                self.hits += 1
+                return row[0]
+
+            if self.semantic and query_embedding is not None:
+                candidates = self._db.execute("""
+                    SELECT query, answer, embedding, last_used FROM answers
+                    WHERE context = ? AND model = ? AND data_version = ? AND embedding IS NOT NULL
+                """, (context, self.model_name, data_version)).fetchall()
+                if candidates:
+                    target = _unit(query_embedding)
+                    cosines = [float(np.frombuffer(embedding, dtype=np.float32) @ target)
+                               if len(embedding) == target.nbytes else -1.0 for _, _, embedding, _ in candidates]
+                    best = int(np.argmax(cosines))
+                    if cosines[best] >= self.min_cosine:
+                        self._touch(candidates[best][0], context, candidates[best][3])
+                        self.hits += 1
+                        self.semantic_hits += 1
+                        return candidates[best][1]
+            self.misses += 1
+            return None
+
+    def _touch(self, query: str, context: str, last_used: float):
+        """Mark an entry as used, at most once per TOUCH_INTERVAL"""
+        now = time.time()
+        if now - last_used >= TOUCH_INTERVAL:
+            self._db.execute("UPDATE answers SET last_used = ? WHERE query = ? AND context = ? AND model = ?",
+                             (now, query, context, self.model_name))
+
+    def put(self, query_text: str, document_ids: List[str], data_version: int, answer: str,
+            query_embedding: Optional[List[float]] = None):
+        if not answer:
+            return
+        embedding = _unit(query_embedding).tobytes() if query_embedding is not None else None
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (normalize_query(query_text), context_key(document_ids), self.model_name,
+                              int(data_version), answer, embedding, time.time()))
+            excess = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._db.execute("""
+                    DELETE FROM answers WHERE (query, context, model) IN
+                        (SELECT query, context, model FROM answers ORDER BY last_used LIMIT ?)
+                """, (excess,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM answers WHERE model = ?", (self.model_name,)).fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Hit rate of this process's lookups and the size of the shared cache"""
+        entries = len(self)
+        with self._lock:
+            return {
+                'model': self.model_name,
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'semantic': self.semantic,
+                'min_cosine': self.min_cosine,
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hit_rate, 4),
+                'stale': self.stale
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+_caches: Dict[str, AnswerCache] = {}
+_caches_pid: Optional[int] = None
+_caches_lock = threading.Lock()
+
+def get_answer_cache(model_name: str) -> AnswerCache:
+    """Return the process-wide answer cache for an LLM, opening it on first use"""
+    global _caches_pid
+    with _caches_lock:
+        if _caches_pid != os.getpid():
+            # Forked worker: SQLite connections must not cross a fork
+            _caches.clear()
+            _caches_pid = os.getpid()
+        if model_name not in _caches:
+            _caches[model_name] = AnswerCache(model_name)
+        return _caches[model_name]
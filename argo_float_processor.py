@@ -6,19 +6,29 @@ Processes actual ARGO float profiles instead of gridded data
 import xarray as xr
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, text
+from sqlalchemy import inspect, text
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import List, Optional
+import argparse
 import config
 import os
 import glob
+import uuid
+from database import get_engine, bump_data_version, get_data_version
+from summary_views import refresh_summary_views
+from data_cube import build_data_cube, compute_cube, merge_into_data_cube
+from bulk_loader import copy_dataframe
 
-engine = create_engine(config.DATABASE_URL)
+engine = get_engine()
 
 def create_argo_tables():
     """Create proper ARGO database schema with float and profile structure"""
     
     create_tables_sql = """
     -- Drop existing tables if they exist
+    DROP TABLE IF EXISTS ingest_changes CASCADE;
+    DROP TABLE IF EXISTS ingest_watermarks CASCADE;
     DROP TABLE IF EXISTS measurements CASCADE;
     DROP TABLE IF EXISTS profiles CASCADE;
     DROP TABLE IF EXISTS floats CASCADE;
@@ -44,6 +54,7 @@ def create_argo_tables():
         profile_lat FLOAT,
         profile_lon FLOAT,
         n_levels INTEGER,
+        content_hash VARCHAR(16),
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
     
@@ -77,7 +88,7 @@ def create_argo_tables():
     CREATE INDEX idx_measurements_depth ON measurements(depth);
     CREATE INDEX idx_profiles_float_id ON profiles(float_id);
     CREATE INDEX idx_profiles_date ON profiles(profile_date);
-    """
+    """ + INGEST_TABLES_SQL
     
     with engine.connect() as conn:
         # Execute each statement separately
@@ -88,6 +99,62 @@ def create_argo_tables():
     
     print("✅ ARGO database schema created successfully!")
 
+# Upsert key of profiles, per-float ingestion watermarks and the log of changed profiles
+INGEST_TABLES_SQL = """
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_profiles_float_cycle ON profiles(float_id, cycle_number);
+    
+    -- Measurements are replaced, and fetched for retrieved profiles, by profile_id
+    CREATE INDEX IF NOT EXISTS idx_measurements_profile_id ON measurements(profile_id);
+    
+    CREATE TABLE IF NOT EXISTS ingest_watermarks (
+        float_id VARCHAR(20) PRIMARY KEY REFERENCES floats(float_id),
+        last_cycle_number INTEGER NOT NULL,
+        last_profile_date TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    CREATE TABLE IF NOT EXISTS ingest_changes (
+        id BIGSERIAL PRIMARY KEY,
+        batch_id VARCHAR(32) NOT NULL,
+        data_version BIGINT,
+        float_id VARCHAR(20) NOT NULL,
+        cycle_number INTEGER NOT NULL,
+        profile_id INTEGER NOT NULL,
+        change_type VARCHAR(10) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    CREATE INDEX IF NOT EXISTS idx_ingest_changes_version ON ingest_changes(data_version);
+"""
+
+# Serializes concurrent ingestion runs (pg_advisory_xact_lock key)
+INGEST_LOCK_KEY = 5900001
+
+def ensure_argo_tables():
+    """
+    Create the ARGO schema if it is missing, or upgrade an existing one for incremental ingestion
+    
+    Unlike create_argo_tables nothing is dropped. Databases loaded before incremental
+    ingestion get the content_hash column, the (float_id, cycle_number) key and the ingest
+    tables, and the profile id sequence is moved past ids that were inserted explicitly.
+    """
+    if not inspect(engine).has_table('profiles'):
+        create_argo_tables()
+        return
+    
+    upgrade_sql = """
+    ALTER TABLE profiles ADD COLUMN IF NOT EXISTS content_hash VARCHAR(16);
+    """ + INGEST_TABLES_SQL + """;
+    SELECT setval(pg_get_serial_sequence('profiles', 'profile_id'), COALESCE(MAX(profile_id), 0) + 1, false) FROM profiles;
+    SELECT setval(pg_get_serial_sequence('measurements', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM measurements
+    """
+    
+    with engine.connect() as conn:
+        for statement in upgrade_sql.split(';'):
+            if statement.strip():
+                conn.execute(text(statement))
+        conn.commit()
+
 def clear_existing_data():
     """Clear existing ARGO data from database"""
     print("Clearing existing ARGO data...")
@@ -106,6 +173,111 @@ def clear_existing_data():
 
     print("✅ Existing data cleared!")
 
+SOURCE_COLUMNS = {
+    'TAXIS': 'time', 
+    'ZAX': 'depth', 
+    'YAXIS': 'lat', 
+    'XAXIS': 'lon', 
+    'TEMP': 'temperature',
+    'SAL': 'salinity'
+}
+
+def read_gridded_measurements(data, max_rows):
+    """
+    Flatten a gridded TEMP/SAL dataset into measurement rows, keeping the first max_rows valid ones
+    
+    The grid is converted a slice of its leading dimension at a time (sized to roughly
+    max_rows cells), so memory stays bounded by the cap however large the source grid is.
+    Row order is the same as a single to_dataframe() of the whole grid.
+    """
+    dims = list(data.dims)
+    leading = dims[0]
+    cells_per_step = int(np.prod([data.sizes[dim] for dim in dims[1:]]))
+    steps = max(1, max_rows // max(cells_per_step, 1))
+    
+    frames = []
+    total = 0
+    truncated = False
+    for start in range(0, data.sizes[leading], steps):
+        chunk = data.isel({leading: slice(start, start + steps)})
+        df = chunk.to_dataframe(dim_order=dims).reset_index().rename(columns=SOURCE_COLUMNS)
+        df = df.dropna()
+        
+        if total + len(df) > max_rows:
+            df = df.head(max_rows - total)
+            truncated = True
+        frames.append(df)
+        total += len(df)
+        if truncated:
+            break
+    
+    if truncated:
+        print(f"Limited to {max_rows:,} measurements for ingestion")
+    
+    return pd.concat(frames, ignore_index=True)
+
+def build_float_structure(df, max_floats):
+    """
+    Turn flat gridded measurements into floats, profiles and measurements frames
+    
+    Each unique lat/lon becomes a virtual float (numbered in sorted order) and each of its
+    time steps a profile. Everything is computed column-wise from group numbers over the
+    sorted rows; only the first max_floats floats are kept.
+    """
+    # Stable sort keeps the source depth order inside every profile
+    df = df.sort_values(['lat', 'lon', 'time'], kind='mergesort')
+    float_number = df.groupby(['lat', 'lon'], sort=True).ngroup().to_numpy()
+    keep = float_number < max_floats
+    df = df[keep].reset_index(drop=True)
+    float_number = float_number[keep]
+    profile_number = df.groupby(['lat', 'lon', 'time'], sort=True).ngroup().to_numpy()
+    
+    n_floats = int(float_number.max()) + 1 if len(df) else 0
+    n = len(df)
+    float_ids = ('ARGO_' + pd.Series(np.arange(1, n_floats + 1)).astype(str).str.zfill(4)).to_numpy()
+    
+    # Rows are sorted, so group numbers are non-decreasing and groups are contiguous runs
+    float_starts = np.flatnonzero(np.diff(float_number, prepend=-1))
+    float_ends = np.append(float_starts[1:], n) - 1
+    profile_starts = np.flatnonzero(np.diff(profile_number, prepend=-1))
+    profile_ends = np.append(profile_starts[1:], n)
+    
+    times = df['time']
+    floats_df = pd.DataFrame({
+        'float_id': float_ids,
+        'wmo_id': 5900000 + np.arange(1, n_floats + 1),
+        'deployment_date': times.iloc[float_starts].dt.date.to_numpy(),
+        'deployment_lat': df['lat'].to_numpy()[float_starts],
+        'deployment_lon': df['lon'].to_numpy()[float_starts],
+        'status': 'ACTIVE',
+        'last_contact': times.iloc[float_ends].dt.date.to_numpy()
+    })
+    
+    profile_float = float_number[profile_starts]
+    profiles_df = pd.DataFrame({
+        'profile_id': np.arange(1, len(profile_starts) + 1),
+        'float_id': float_ids[profile_float],
+        'cycle_number': pd.Series(profile_float).groupby(profile_float).cumcount().to_numpy() + 1,
+        'profile_date': times.to_numpy()[profile_starts],
+        'profile_lat': df['lat'].to_numpy()[profile_starts],
+        'profile_lon': df['lon'].to_numpy()[profile_starts],
+        'n_levels': profile_ends - profile_starts
+    })
+    
+    measurements_df = pd.DataFrame({
+        'profile_id': profile_number + 1,
+        'float_id': float_ids[float_number],
+        'time': times.to_numpy(),
+        'lat': df['lat'].to_numpy(),
+        'lon': df['lon'].to_numpy(),
+        'depth': df['depth'].to_numpy(),
+        'pressure': df['depth'].to_numpy() * 1.025,  # Approximate pressure from depth
+        'temperature': df['temperature'].to_numpy(),
+        'salinity': df['salinity'].to_numpy()
+    })
+    
+    return floats_df, profiles_df, measurements_df
+
 def simulate_real_argo_floats():
     """
     Create realistic ARGO float data structure from your gridded data
@@ -115,168 +287,343 @@ def simulate_real_argo_floats():
     # Load your existing data
     ds = xr.open_dataset("tempsal.nc")
     
-    # Create a subset limited to ~30k measurements
+    # Create a subset of the first time steps
     subset = ds.isel(TAXIS=slice(0, 50))  # 50 time steps
     subset = subset.sel(XAXIS=slice(50, 120), YAXIS=slice(-30, 30))  # Larger Indian Ocean region
     
-    # Convert to DataFrame
-    df = subset[["TEMP", "SAL"]].to_dataframe().reset_index()
-    df = df.rename(columns={
-        'TAXIS': 'time', 
-        'ZAX': 'depth', 
-        'YAXIS': 'lat', 
-        'XAXIS': 'lon', 
-        'TEMP': 'temperature',
-        'SAL': 'salinity'
-    })
-    
-    # Remove NaN values
-    df = df.dropna()
-
-    # Limit to 100k measurements as requested
-    if len(df) > 100000:
-        df = df.head(100000)
-        print(f"Limited to 100,000 measurements for ingestion")
+    # Convert to rows (NaNs removed), capped at MAX_MEASUREMENTS
+    df = read_gridded_measurements(subset[["TEMP", "SAL"]], config.MAX_MEASUREMENTS)
 
     print(f"Processing {len(df)} measurements...")
     
     # Group by location and time to create "virtual floats"
-    # Each unique lat/lon combination becomes a float
-    location_groups = df.groupby(['lat', 'lon'])
-    
-    floats_data = []
-    profiles_data = []
-    measurements_data = []
-    
-    float_counter = 1
-    profile_counter = 1
-    
-    for (lat, lon), location_df in location_groups:
-        if len(location_df) < 1:  # Skip locations with too few measurements
-            continue
-            
-        # Create a virtual float
-        float_id = f"ARGO_{float_counter:04d}"
-        wmo_id = 5900000 + float_counter
-        
-        floats_data.append({
-            'float_id': float_id,
-            'wmo_id': wmo_id,
-            'deployment_date': location_df['time'].min().date(),
-            'deployment_lat': lat,
-            'deployment_lon': lon,
-            'status': 'ACTIVE',
-            'last_contact': location_df['time'].max().date()
-        })
-        
-        # Group by time to create profiles (each time step is a profile)
-        time_groups = location_df.groupby('time')
-        
-        cycle_num = 1
-        for time_val, time_df in time_groups:
-            # Create a profile for this time/location
-            profile_id = profile_counter
-            
-            profiles_data.append({
-                'profile_id': profile_id,
-                'float_id': float_id,
-                'cycle_number': cycle_num,
-                'profile_date': time_val,
-                'profile_lat': lat,
-                'profile_lon': lon,
-                'n_levels': len(time_df)
-            })
-            
-            # Add measurements for this profile
-            for _, row in time_df.iterrows():
-                measurements_data.append({
-                    'profile_id': profile_id,
-                    'float_id': float_id,
-                    'time': row['time'],
-                    'lat': row['lat'],
-                    'lon': row['lon'],
-                    'depth': row['depth'],
-                    'pressure': row['depth'] * 1.025,  # Approximate pressure from depth
-                    'temperature': row['temperature'],
-                    'salinity': row['salinity']
-                })
-            
-            cycle_num += 1
-            profile_counter += 1
-        
-        float_counter += 1
-        
-        if float_counter > config.MAX_FLOATS:  # Limit floats for testing
-            break
-    
-    return pd.DataFrame(floats_data), pd.DataFrame(profiles_data), pd.DataFrame(measurements_data)
+    # Each unique lat/lon combination becomes a float, each time step a profile
+    return build_float_structure(df, config.MAX_FLOATS)
 
-def add_realistic_bgc_data(measurements_df):
-    """Add realistic BGC data to measurements"""
+def add_realistic_bgc_data(measurements_df, seed=None):
+    """
+    Add realistic BGC data to measurements
     
+    Each parameter is drawn per depth regime with boolean masks over the whole frame,
+    so cost is a handful of NumPy calls regardless of row count. Pass a seed for
+    reproducible output.
+    """
+    
+    rng = np.random.default_rng(seed)
     measurements_with_bgc = measurements_df.copy()
+    depth = measurements_with_bgc['depth'].to_numpy(dtype=float)
+    n = len(depth)
+    
+    # Oxygen (ml/L) - realistic oceanographic profile
+    surface = depth < 100                      # Surface waters
+    omz = (depth >= 100) & (depth < 1000)      # Oxygen minimum zone
+    deep = ~(surface | omz)                    # Deep waters
+    oxygen = np.empty(n)
+    oxygen[surface] = rng.normal(6.5, 0.5, surface.sum())
+    oxygen[omz] = rng.normal(3.5, 1.0, omz.sum())
+    oxygen[deep] = rng.normal(4.8, 0.3, deep.sum())
+    
+    # pH - decreases slightly with depth
+    ph = 8.15 - (depth / 15000) + rng.normal(0, 0.03, n)
+    
+    # Chlorophyll (mg/m³) - surface maximum
+    mixed = depth < 50
+    subsurface = (depth >= 50) & (depth < 200)
+    below = ~(mixed | subsurface)
+    chlorophyll = np.empty(n)
+    chlorophyll[mixed] = rng.exponential(0.8, mixed.sum())
+    chlorophyll[subsurface] = rng.exponential(0.15, subsurface.sum())
+    chlorophyll[below] = 0.01 + rng.exponential(0.005, below.sum())
+    
+    # Nitrate (μmol/kg) - increases with depth
+    nitrate = 2 + (depth / 80) + rng.normal(0, 1.5, n)
+    
+    # Other BGC parameters
+    backscatter = 0.0008 + rng.exponential(0.0003, n)
+    cdom = 0.3 + rng.exponential(0.15, n)
+    
+    # PAR - only in upper ocean
+    lit = depth < 150
+    par = np.zeros(n)
+    par[lit] = 1800 * np.exp(-depth[lit] / 45) + rng.normal(0, 30, lit.sum())
+    
+    # Add to dataframe
+    measurements_with_bgc['oxygen'] = np.clip(oxygen, 0, None)
+    measurements_with_bgc['ph'] = np.clip(ph, 7.5, 8.3)
+    measurements_with_bgc['chlorophyll'] = np.clip(chlorophyll, 0, None)
+    measurements_with_bgc['nitrate'] = np.clip(nitrate, 0, None)
+    measurements_with_bgc['backscatter'] = np.clip(backscatter, 0, None)
+    measurements_with_bgc['cdom'] = np.clip(cdom, 0, None)
+    measurements_with_bgc['downwelling_par'] = np.clip(par, 0, None)
+    
+    return measurements_with_bgc
+
+# Observed columns that define a profile's content; the synthetic BGC columns are redrawn
+# on every run, so including them would make every profile look changed
+PROFILE_HASH_COLUMNS = ['time', 'lat', 'lon', 'depth', 'pressure', 'temperature', 'salinity']
+
+PROFILE_COLUMNS = ['profile_id', 'float_id', 'cycle_number', 'profile_date', 'profile_lat',
+                   'profile_lon', 'n_levels', 'content_hash']
+
+CHANGE_COLUMNS = ['float_id', 'cycle_number', 'profile_id']
+
+def compute_profile_hashes(measurements_df):
+    """
+    Content hash of every profile's measurements, as 16 hex digits indexed by profile_id
     
-    for idx, row in measurements_with_bgc.iterrows():
-        depth = row['depth']
-        lat = row['lat']
-        temp = row['temperature'] if pd.notna(row['temperature']) else 15.0
+    Each row is hashed with pandas' stable hashing, mixed with its level number inside the
+    profile and summed per profile, so the hash depends on values and level order only.
+    """
+    if measurements_df.empty:
+        return pd.Series(dtype=object, name='content_hash')
+    
+    columns = [column for column in PROFILE_HASH_COLUMNS if column in measurements_df.columns]
+    ordered = measurements_df.sort_values('profile_id', kind='mergesort')
+    profile_ids = ordered['profile_id'].to_numpy()
+    
+    row_hash = pd.util.hash_pandas_object(ordered[columns], index=False).to_numpy()
+    level = ordered.groupby('profile_id').cumcount().to_numpy().astype(np.uint64)
+    mixed = pd.util.hash_array(row_hash ^ pd.util.hash_array(level))
+    
+    # Rows of a profile are contiguous after the sort; uint64 sums wrap, which is fine for a hash
+    starts = np.flatnonzero(np.diff(profile_ids, prepend=profile_ids[0] - 1))
+    sums = np.add.reduceat(mixed, starts)
+    return pd.Series([f"{value:016x}" for value in sums], index=profile_ids[starts], name='content_hash')
+
+def classify_profiles(profiles_df, stored_profiles, watermarks, recheck=True):
+    """
+    Label incoming profiles 'insert', 'update' or 'unchanged' against the stored ones
+    
+    stored_profiles has float_id, cycle_number, profile_id and content_hash of what is in
+    the database; watermarks maps float_id to the last ingested cycle. Profiles matching a
+    stored (float_id, cycle_number) are updates when their content hash differs. With
+    recheck=False cycles at or below a float's watermark are taken as unchanged without
+    comparing, which suits append-only sources. Returns profiles_df with stored_profile_id
+    and change_type columns.
+    """
+    stored = stored_profiles[['float_id', 'cycle_number', 'profile_id', 'content_hash']].rename(
+        columns={'profile_id': 'stored_profile_id', 'content_hash': 'stored_hash'})
+    classified = profiles_df.merge(stored, on=['float_id', 'cycle_number'], how='left')
+    
+    missing = classified['stored_profile_id'].isna().to_numpy()
+    changed = (classified['stored_hash'] != classified['content_hash']).to_numpy()
+    change_type = np.where(missing, 'insert', np.where(changed, 'update', 'unchanged'))
+    
+    if not recheck:
+        watermark = classified['float_id'].map(watermarks).fillna(-1).to_numpy()
+        change_type[classified['cycle_number'].to_numpy() <= watermark] = 'unchanged'
+    
+    classified['change_type'] = change_type
+    return classified.drop(columns='stored_hash')
+
+@dataclass
+class ChangeSet:
+    """Profiles written by one ingestion batch, for downstream caches and the vector index"""
+    batch_id: str
+    inserted: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=CHANGE_COLUMNS))
+    updated: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=CHANGE_COLUMNS))
+    unchanged: int = 0
+    measurements: int = 0
+    data_version: Optional[int] = None
+    full_reload: bool = False
+    
+    @property
+    def is_empty(self) -> bool:
+        return self.inserted.empty and self.updated.empty
+    
+    @property
+    def profile_ids(self) -> List[int]:
+        """Database ids of every inserted or updated profile"""
+        return [int(i) for i in pd.concat([self.inserted['profile_id'], self.updated['profile_id']])]
+    
+    @property
+    def float_ids(self) -> List[str]:
+        """Floats with at least one inserted or updated profile"""
+        return sorted(set(self.inserted['float_id']) | set(self.updated['float_id']))
+    
+    def to_dict(self) -> dict:
+        return {
+            'batch_id': self.batch_id,
+            'data_version': self.data_version,
+            'full_reload': self.full_reload,
+            'inserted': self.inserted[CHANGE_COLUMNS].astype(object).to_dict('records'),
+            'updated': self.updated[CHANGE_COLUMNS].astype(object).to_dict('records'),
+            'unchanged': self.unchanged,
+            'measurements': self.measurements
+        }
+    
+    def __str__(self) -> str:
+        return (f"{len(self.inserted)} inserted, {len(self.updated)} updated, "
+                f"{self.unchanged} unchanged profiles ({self.measurements} measurements written)")
+
+def upsert_argo_data(floats_df, profiles_df, measurements_df, recheck=True, drop_indexes=False):
+    """
+    Write only new or changed profiles, keyed on (float_id, cycle_number); returns a ChangeSet
+    
+    Floats are upserted, new profiles get ids from the profile sequence and changed ones keep
+    theirs, and the measurements of changed profiles are replaced. Watermarks, the change
+    log and the data version bump are written in the same transaction, so a run is
+    all-or-nothing and repeating it writes nothing. profile_id in the input frames is only a local key linking them.
+    """
+    change_set = ChangeSet(batch_id=uuid.uuid4().hex)
+    hashes = compute_profile_hashes(measurements_df)
+    profiles_df = profiles_df.assign(content_hash=hashes.reindex(profiles_df['profile_id']).to_numpy())
+    float_ids = [str(float_id) for float_id in floats_df['float_id']]
+    
+    with engine.connect() as conn:
+        # One ingestion at a time; a second run waits and then sees the first one's rows
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': INGEST_LOCK_KEY})
+        
+        watermarks = pd.read_sql_query(text(
+            "SELECT float_id, last_cycle_number FROM ingest_watermarks WHERE float_id = ANY(:float_ids)"
+        ), conn, params={'float_ids': float_ids})
+        stored = pd.read_sql_query(text(f"""
+            SELECT p.profile_id, p.float_id, p.cycle_number, p.content_hash
+            FROM profiles p
+            LEFT JOIN ingest_watermarks w ON w.float_id = p.float_id
+            WHERE p.float_id = ANY(:float_ids)
+            {'' if recheck else 'AND p.cycle_number > COALESCE(w.last_cycle_number, -1)'}
+        """), conn, params={'float_ids': float_ids})
         
-        # Oxygen (ml/L) - realistic oceanographic profile
-        if depth < 100:
-            oxygen = np.random.normal(6.5, 0.5)  # Surface waters
-        elif depth < 1000:
-            oxygen = np.random.normal(3.5, 1.0)  # Oxygen minimum zone
-        else:
-            oxygen = np.random.normal(4.8, 0.3)  # Deep waters
+        classified = classify_profiles(profiles_df, stored, watermarks.set_index('float_id')['last_cycle_number'], recheck)
+        changed = classified[classified['change_type'] != 'unchanged'].copy()
+        change_set.unchanged = len(classified) - len(changed)
+        if changed.empty:
+            return change_set
         
-        # pH - decreases slightly with depth
-        ph = 8.15 - (depth / 15000) + np.random.normal(0, 0.03)
+        inserts = (changed['change_type'] == 'insert').to_numpy()
+        new_ids = conn.execute(text(
+            "SELECT nextval(pg_get_serial_sequence('profiles', 'profile_id')) FROM generate_series(1, :n)"
+        ), {'n': int(inserts.sum())}).scalars().all()
+        db_profile_ids = changed['stored_profile_id'].to_numpy(copy=True)
+        db_profile_ids[inserts] = new_ids
+        changed['db_profile_id'] = db_profile_ids.astype('int64')
         
-        # Chlorophyll (mg/m³) - surface maximum
-        if depth < 50:
-            chlorophyll = np.random.exponential(0.8)
-        elif depth < 200:
-            chlorophyll = np.random.exponential(0.15)
-        else:
-            chlorophyll = 0.01 + np.random.exponential(0.005)
+        # Floats first (profiles reference them); deployment details stay as first seen
+        conn.execute(text("CREATE TEMP TABLE staging_floats (LIKE floats INCLUDING DEFAULTS) ON COMMIT DROP"))
+        copy_dataframe(floats_df[floats_df['float_id'].isin(changed['float_id'])], 'staging_floats',
+                       connection=conn, analyze=False, verbose=False)
+        conn.execute(text("""
+            INSERT INTO floats (float_id, wmo_id, deployment_date, deployment_lat, deployment_lon, status, last_contact)
+            SELECT float_id, wmo_id, deployment_date, deployment_lat, deployment_lon, status, last_contact
+            FROM staging_floats
+            ON CONFLICT (float_id) DO UPDATE SET
+                wmo_id = EXCLUDED.wmo_id,
+                status = EXCLUDED.status,
+                last_contact = GREATEST(floats.last_contact, EXCLUDED.last_contact)
+        """))
         
-        # Nitrate (μmol/kg) - increases with depth
-        nitrate = 2 + (depth / 80) + np.random.normal(0, 1.5)
+        conn.execute(text("CREATE TEMP TABLE staging_profiles (LIKE profiles) ON COMMIT DROP"))
+        staged = changed.assign(profile_id=changed['db_profile_id'])[PROFILE_COLUMNS]
+        copy_dataframe(staged, 'staging_profiles', connection=conn, analyze=False, verbose=False)
+        conn.execute(text("""
+            INSERT INTO profiles (profile_id, float_id, cycle_number, profile_date, profile_lat, profile_lon, n_levels, content_hash)
+            SELECT profile_id, float_id, cycle_number, profile_date, profile_lat, profile_lon, n_levels, content_hash
+            FROM staging_profiles
+            ON CONFLICT (float_id, cycle_number) DO UPDATE SET
+                profile_date = EXCLUDED.profile_date,
+                profile_lat = EXCLUDED.profile_lat,
+                profile_lon = EXCLUDED.profile_lon,
+                n_levels = EXCLUDED.n_levels,
+                content_hash = EXCLUDED.content_hash
+        """))
         
-        # Other BGC parameters
-        backscatter = 0.0008 + np.random.exponential(0.0003)
-        cdom = 0.3 + np.random.exponential(0.15)
+        # Replace the measurements of changed profiles and append those of new ones
+        updated_ids = [int(i) for i in changed.loc[~inserts, 'db_profile_id']]
+        if updated_ids:
+            conn.execute(text("DELETE FROM measurements WHERE profile_id = ANY(:ids)"), {'ids': updated_ids})
+        id_map = pd.Series(changed['db_profile_id'].to_numpy(), index=changed['profile_id'].to_numpy())
+        rows = measurements_df[measurements_df['profile_id'].isin(id_map.index)]
+        rows = rows.assign(profile_id=rows['profile_id'].map(id_map).astype('int64'))
+        load_stats = copy_dataframe(rows, 'measurements', connection=conn, drop_indexes=drop_indexes, verbose=False)
         
-        # PAR - only in upper ocean
-        if depth < 150:
-            par = 1800 * np.exp(-depth / 45) + np.random.normal(0, 30)
-        else:
-            par = 0.0
+        marks = changed.groupby('float_id', as_index=False).agg(
+            last_cycle_number=('cycle_number', 'max'), last_profile_date=('profile_date', 'max'))
+        conn.execute(text("""
+            INSERT INTO ingest_watermarks (float_id, last_cycle_number, last_profile_date, updated_at)
+            VALUES (:float_id, :last_cycle_number, :last_profile_date, CURRENT_TIMESTAMP)
+            ON CONFLICT (float_id) DO UPDATE SET
+                last_cycle_number = GREATEST(ingest_watermarks.last_cycle_number, EXCLUDED.last_cycle_number),
+                last_profile_date = GREATEST(ingest_watermarks.last_profile_date, EXCLUDED.last_profile_date),
+                updated_at = CURRENT_TIMESTAMP
+        """), marks.astype(object).to_dict('records'))
         
-        # Add to dataframe
-        measurements_with_bgc.loc[idx, 'oxygen'] = max(0, oxygen)
-        measurements_with_bgc.loc[idx, 'ph'] = max(7.5, min(8.3, ph))
-        measurements_with_bgc.loc[idx, 'chlorophyll'] = max(0, chlorophyll)
-        measurements_with_bgc.loc[idx, 'nitrate'] = max(0, nitrate)
-        measurements_with_bgc.loc[idx, 'backscatter'] = max(0, backscatter)
-        measurements_with_bgc.loc[idx, 'cdom'] = max(0, cdom)
-        measurements_with_bgc.loc[idx, 'downwelling_par'] = max(0, par)
+        # Readers never see the rows without the new version, nor a change log row without it
+        change_set.data_version = bump_data_version(connection=conn)
+        log = pd.DataFrame({
+            'batch_id': change_set.batch_id,
+            'data_version': change_set.data_version,
+            'float_id': changed['float_id'].to_numpy(),
+            'cycle_number': changed['cycle_number'].to_numpy(),
+            'profile_id': changed['db_profile_id'].to_numpy(),
+            'change_type': changed['change_type'].to_numpy()
+        })
+        copy_dataframe(log, 'ingest_changes', connection=conn, analyze=False, verbose=False)
+        conn.commit()
     
-    return measurements_with_bgc
+    changes = changed.assign(profile_id=changed['db_profile_id'])
+    change_set.inserted = changes.loc[inserts, CHANGE_COLUMNS].reset_index(drop=True)
+    change_set.updated = changes.loc[~inserts, CHANGE_COLUMNS].reset_index(drop=True)
+    change_set.measurements = load_stats.rows
+    return change_set
 
-def ingest_argo_data():
-    """Main function to ingest properly structured ARGO data"""
+def refresh_derived_data(engine=None, measurements_df=None, change_set=None, profiles_df=None, full=False):
+    """
+    Bring the data cube and summary views up to date with the committed profiles
+    
+    With the change set of the ingest just committed, appended profiles are folded into the
+    cube; otherwise (rewritten profiles, or a retry after a failed refresh) it is rebuilt
+    from the measurements table, which is always safe to repeat.
+    """
+    engine = engine or get_engine()
+    
+    # Appended profiles are folded into the cube; rewritten ones need a rebuild
+    print("5. Updating data cube...")
+    if full:
+        print(f"   ✅ {build_data_cube(engine, measurements=measurements_df)} cube cells")
+    elif change_set is not None and change_set.updated.empty:
+        new_profiles = profiles_df.merge(change_set.inserted[['float_id', 'cycle_number']])['profile_id']
+        delta = compute_cube(measurements_df[measurements_df['profile_id'].isin(new_profiles)])
+        print(f"   ✅ {merge_into_data_cube(delta, engine)} cube cells updated")
+    else:
+        print(f"   ✅ {build_data_cube(engine)} cube cells rebuilt")
+    
+    # Rebuild the pre-aggregated views behind the analytical templates
+    print("6. Refreshing summary views...")
+    view_status = refresh_summary_views(engine, concurrently=not full)
+    print(f"   ✅ {len(view_status)} summary views ready")
+
+def get_changes_since(data_version, engine=None):
+    """
+    Profiles inserted or updated after data_version, one row per profile (latest change wins)
+    
+    Lets caches and the vector index in other processes catch up from the version they last saw.
+    """
+    return pd.read_sql_query(text("""
+        SELECT DISTINCT ON (profile_id) profile_id, float_id, cycle_number, change_type, data_version
+        FROM ingest_changes
+        WHERE data_version > :version
+        ORDER BY profile_id, id DESC
+    """), engine or get_engine(), params={'version': data_version})
+
+def ingest_argo_data(full=False, recheck=True):
+    """
+    Main function to ingest properly structured ARGO data
+    
+    By default only new or changed profiles are written (see upsert_argo_data) and the
+    resulting ChangeSet is returned; full=True drops and recreates the schema first.
+    """
     
     print("🌊 Processing ARGO Float Data...")
     print("=" * 50)
     
-    # Step 0: Clear existing data
-    print("0. Clearing existing ARGO data...")
-    clear_existing_data()
-
-    # Step 1: Create proper database schema
-    print("1. Creating ARGO database schema...")
-    create_argo_tables()
+    # Step 1: Create or upgrade the database schema
+    if full:
+        print("1. Recreating ARGO database schema...")
+        create_argo_tables()
+    else:
+        print("1. Checking ARGO database schema...")
+        ensure_argo_tables()
     
     # Step 2: Process data into float structure
     print("2. Converting gridded data to float profiles...")
@@ -288,29 +635,29 @@ def ingest_argo_data():
     
     # Step 3: Add BGC data
     print("3. Adding BGC parameters...")
-    measurements_df = add_realistic_bgc_data(measurements_df)
+    measurements_df = add_realistic_bgc_data(measurements_df, seed=config.BGC_SEED)
     
-    # Step 4: Insert data into database
-    print("4. Inserting data into PostgreSQL...")
+    # Step 4: Write new and changed profiles; a fresh schema's indexes are built once afterwards
+    print("4. Upserting new and changed profiles...")
+    change_set = upsert_argo_data(floats_df, profiles_df, measurements_df, recheck=recheck, drop_indexes=full)
+    change_set.full_reload = full
+    print(f"   ✅ {change_set}")
     
-    # Insert floats
-    floats_df.to_sql('floats', engine, if_exists='append', index=False, method='multi')
-    print(f"   ✅ Inserted {len(floats_df)} floats")
+    if change_set.is_empty:
+        print("\n✅ Database already up to date, nothing to refresh")
+        return change_set
     
-    # Insert profiles
-    profiles_df.to_sql('profiles', engine, if_exists='append', index=False, method='multi')
-    print(f"   ✅ Inserted {len(profiles_df)} profiles")
+    # The profiles and their data version are committed; the cube and views derive from them
+    try:
+        refresh_derived_data(engine, measurements_df, change_set, profiles_df, full)
+    except Exception as e:
+        print(f"   ⚠️ Data cube/summary views not refreshed: {e}")
+        print("   Rerun with --refresh-derived to rebuild them from the stored measurements")
     
-    # Insert measurements in batches
-    batch_size = 5000
-    total_measurements = len(measurements_df)
+    # Running backends see the new version within DATA_VERSION_TTL; this process at once
+    get_data_version(engine, max_age=0)
     
-    for i in range(0, total_measurements, batch_size):
-        batch = measurements_df.iloc[i:i+batch_size]
-        batch.to_sql('measurements', engine, if_exists='append', index=False, method='multi')
-        print(f"   ✅ Inserted batch {i//batch_size + 1}/{(total_measurements//batch_size) + 1}")
-    
-    print("\n🎉 ARGO float data ingestion completed!")
+    print(f"\n🎉 ARGO float data ingestion completed! (data version {change_set.data_version})")
     
     # Show summary
     with engine.connect() as conn:
@@ -322,6 +669,8 @@ def ingest_argo_data():
         print(f"   Floats: {float_count}")
         print(f"   Profiles: {profile_count}")
         print(f"   Measurements: {measurement_count}")
+    
+    return change_set
 
 def get_sample_queries():
     """Get some sample data to test the new structure"""
@@ -351,7 +700,19 @@ def get_sample_queries():
         print(df.to_string(index=False))
 
 if __name__ == "__main__":
-    ingest_argo_data()
+    parser = argparse.ArgumentParser(description="Ingest ARGO float data into PostgreSQL")
+    parser.add_argument("--full", action="store_true", help="Drop and reload everything instead of upserting changes")
+    parser.add_argument("--no-recheck", action="store_true",
+                        help="Skip cycles at or below each float's watermark instead of comparing their content")
+    parser.add_argument("--refresh-derived", action="store_true",
+                        help="Only rebuild the data cube and summary views from the stored measurements")
+    args = parser.parse_args()
+    
+    if args.refresh_derived:
+        refresh_derived_data()
+        raise SystemExit(0)
+    
+    ingest_argo_data(full=args.full, recheck=not args.no_recheck)
     print("\n" + "="*50)
     print("Sample Data Preview:")
     get_sample_queries()
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Concurrency benchmark for the async database layer
+Measures p50/p99 request latency with 50 parallel clients, before (blocking DB call
+inside an async route) and after (the same call routed through database.run_blocking)
+
+Usage:
+    python benchmarks/bench_async_db.py                 # local server, simulated query latency
+    python benchmarks/bench_async_db.py --url http://127.0.0.1:8000/float/ARGO_0001
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+import uvicorn
+from fastapi import FastAPI
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import run_blocking
+
+def simulated_query(latency_s: float):
+    """Stand-in for pd.read_sql_query: blocks the calling thread like a real DB round trip"""
+    time.sleep(latency_s)
+    return {"rows": 1}
+
+def build_app(latency_s: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/before")
+    async def before():
+        return simulated_query(latency_s)
+
+    @app.get("/after")
+    async def after():
+        return await run_blocking(simulated_query, latency_s)
+
+    return app
+
+def start_server(app: FastAPI) -> tuple[uvicorn.Server, str]:
+    """Serve the app from its own thread so a blocked server loop cannot stall the clients"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+async def run_clients(client: httpx.AsyncClient, url: str, clients: int, requests_per_client: int):
+    latencies = []
+
+    async def worker():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            response = await client.get(url)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    return np.array(latencies) * 1000, elapsed
+
+def report(label: str, latencies_ms: np.ndarray, elapsed: float):
+    print(f"{label:<8} p50={np.percentile(latencies_ms, 50):8.1f} ms  "
+          f"p99={np.percentile(latencies_ms, 99):8.1f} ms  "
+          f"throughput={len(latencies_ms) / elapsed:7.1f} req/s")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=4, help="Requests per client")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Simulated query latency")
+    parser.add_argument("--url", help="Benchmark a running backend endpoint instead of the simulated app")
+    args = parser.parse_args()
+
+    print(f"{args.clients} parallel clients x {args.requests} requests")
+
+    if args.url:
+        async with httpx.AsyncClient(timeout=120) as client:
+            latencies, elapsed = await run_clients(client, args.url, args.clients, args.requests)
+        report("live", latencies, elapsed)
+        return
+
+    server, base_url = start_server(build_app(args.latency_ms / 1000))
+    limits = httpx.Limits(max_connections=args.clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        for label in ("before", "after"):
+            latencies, elapsed = await run_clients(client, f"/{label}", args.clients, args.requests)
+            report(label, latencies, elapsed)
+    server.should_exit = True
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""
+Benchmark for synthetic BGC generation in argo_float_processor
+Times the previous iterrows/.loc implementation against the vectorized add_realistic_bgc_data
+and compares the per-regime distributions of every generated parameter
+
+Usage:
+    python benchmarks/bench_bgc_synthesis.py                      # 1e5 and 1e7 rows
+    python benchmarks/bench_bgc_synthesis.py --rows 100000 --legacy-rows 100000
+
+The row-by-row version is far too slow to run at 1e7 rows, so it is timed on
+--legacy-rows rows and extrapolated linearly (its cost is strictly per row).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from argo_float_processor import add_realistic_bgc_data
+
+BGC_COLUMNS = ['oxygen', 'ph', 'chlorophyll', 'nitrate', 'backscatter', 'cdom', 'downwelling_par']
+
+# Standard levels similar to the gridded source data, so every depth regime is populated
+DEPTH_LEVELS = np.array([5, 15, 25, 35, 45, 55, 65, 75, 85, 95, 105, 115, 125, 135, 145, 155, 165,
+                         175, 185, 195, 205, 220, 250, 300, 400, 500, 750, 1000, 1500, 2000], dtype=float)
+
+def legacy_add_realistic_bgc_data(measurements_df):
+    """The previous row-by-row implementation, kept here for comparison"""
+    measurements_with_bgc = measurements_df.copy()
+
+    for idx, row in measurements_with_bgc.iterrows():
+        depth = row['depth']
+
+        if depth < 100:
+            oxygen = np.random.normal(6.5, 0.5)
+        elif depth < 1000:
+            oxygen = np.random.normal(3.5, 1.0)
+        else:
+            oxygen = np.random.normal(4.8, 0.3)
+
+        ph = 8.15 - (depth / 15000) + np.random.normal(0, 0.03)
+
+        if depth < 50:
+            chlorophyll = np.random.exponential(0.8)
+        elif depth < 200:
+            chlorophyll = np.random.exponential(0.15)
+        else:
+            chlorophyll = 0.01 + np.random.exponential(0.005)
+
+        nitrate = 2 + (depth / 80) + np.random.normal(0, 1.5)
+        backscatter = 0.0008 + np.random.exponential(0.0003)
+        cdom = 0.3 + np.random.exponential(0.15)
+
+        if depth < 150:
+            par = 1800 * np.exp(-depth / 45) + np.random.normal(0, 30)
+        else:
+            par = 0.0
+
+        measurements_with_bgc.loc[idx, 'oxygen'] = max(0, oxygen)
+        measurements_with_bgc.loc[idx, 'ph'] = max(7.5, min(8.3, ph))
+        measurements_with_bgc.loc[idx, 'chlorophyll'] = max(0, chlorophyll)
+        measurements_with_bgc.loc[idx, 'nitrate'] = max(0, nitrate)
+        measurements_with_bgc.loc[idx, 'backscatter'] = max(0, backscatter)
+        measurements_with_bgc.loc[idx, 'cdom'] = max(0, cdom)
+        measurements_with_bgc.loc[idx, 'downwelling_par'] = max(0, par)
+
+    return measurements_with_bgc
+
+def make_measurements(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'depth': DEPTH_LEVELS[np.arange(rows) % len(DEPTH_LEVELS)],
+        'lat': rng.uniform(-30, 30, rows),
+        'lon': rng.uniform(50, 120, rows),
+        'temperature': rng.normal(20, 5, rows),
+        'salinity': rng.normal(35, 0.5, rows)
+    })
+
+def regime_summary(df: pd.DataFrame) -> pd.DataFrame:
+    """Mean/std of each BGC column within the depth regimes used by the generator"""
+    regimes = pd.cut(df['depth'], [-np.inf, 50, 100, 150, 200, 1000, np.inf], right=False)
+    return df.groupby(regimes, observed=True)[BGC_COLUMNS].agg(['mean', 'std'])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 10_000_000])
+    parser.add_argument("--legacy-rows", type=int, default=20_000,
+                        help="Rows to time the row-by-row version on before extrapolating")
+    args = parser.parse_args()
+
+    legacy_input = make_measurements(args.legacy_rows)
+    np.random.seed(0)
+    start = time.perf_counter()
+    legacy = legacy_add_realistic_bgc_data(legacy_input)
+    legacy_per_row = (time.perf_counter() - start) / args.legacy_rows
+    print(f"legacy     {args.legacy_rows:>10,} rows  {legacy_per_row * args.legacy_rows:8.2f} s  (measured)")
+
+    for rows in args.rows:
+        measurements = make_measurements(rows)
+        start = time.perf_counter()
+        add_realistic_bgc_data(measurements, seed=0)
+        elapsed = time.perf_counter() - start
+
+        legacy_estimate = legacy_per_row * rows
+        note = "measured" if rows == args.legacy_rows else "extrapolated"
+        print(f"legacy     {rows:>10,} rows  {legacy_estimate:8.2f} s  ({note})")
+        print(f"vectorized {rows:>10,} rows  {elapsed:8.2f} s  speedup x{legacy_estimate / elapsed:,.0f}")
+
+    # Same input, both generators: per-regime moments should agree within sampling noise
+    vectorized = add_realistic_bgc_data(legacy_input, seed=0)
+    comparison = pd.concat({'legacy': regime_summary(legacy), 'vectorized': regime_summary(vectorized)}, axis=1)
+    pd.set_option('display.width', 200)
+    for column in BGC_COLUMNS:
+        print(f"\n{column}")
+        print(comparison.xs(column, axis=1, level=1).round(4).to_string())
+
+if __name__ == "__main__":
+    main()
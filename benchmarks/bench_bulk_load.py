@@ -0,0 +1,120 @@
+"""
+Benchmark for PostgreSQL bulk loading
+Loads synthetic measurement rows into a scratch copy of the measurements schema with
+DataFrame.to_sql(method='multi') and with bulk_loader.copy_dataframe (CSV and binary COPY,
+with and without dropping the secondary indexes), reporting rows per second
+
+Usage:
+    DATABASE_URL=postgresql+psycopg2://... python benchmarks/bench_bulk_load.py --rows 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_loader import copy_dataframe
+from database import get_engine
+
+TABLE = 'bench_measurements'
+
+CREATE_SQL = f"""
+DROP TABLE IF EXISTS {TABLE};
+CREATE TABLE {TABLE} (
+    id SERIAL PRIMARY KEY,
+    profile_id INTEGER,
+    float_id VARCHAR(20),
+    time TIMESTAMP,
+    lat FLOAT,
+    lon FLOAT,
+    depth FLOAT,
+    pressure FLOAT,
+    temperature FLOAT,
+    salinity FLOAT,
+    oxygen FLOAT,
+    ph FLOAT,
+    chlorophyll FLOAT,
+    nitrate FLOAT,
+    backscatter FLOAT,
+    cdom FLOAT,
+    downwelling_par FLOAT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_{TABLE}_float_id ON {TABLE}(float_id);
+CREATE INDEX idx_{TABLE}_time ON {TABLE}(time);
+CREATE INDEX idx_{TABLE}_location ON {TABLE}(lat, lon);
+CREATE INDEX idx_{TABLE}_depth ON {TABLE}(depth);
+"""
+
+def make_rows(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    levels = 30
+    profile = np.arange(rows) // levels
+    df = pd.DataFrame({
+        'profile_id': profile + 1,
+        'float_id': 'ARGO_' + pd.Series(profile // 50 + 1).astype(str).str.zfill(4),
+        'time': pd.Timestamp('2020-01-01') + pd.to_timedelta(profile % 50 * 10, unit='D'),
+        'lat': rng.uniform(-30, 30, rows).round(3),
+        'lon': rng.uniform(50, 120, rows).round(3),
+        'depth': np.tile(np.linspace(5, 2000, levels), rows // levels + 1)[:rows],
+    })
+    df['pressure'] = df['depth'] * 1.025
+    for column in ['temperature', 'salinity', 'oxygen', 'ph', 'chlorophyll', 'nitrate',
+                   'backscatter', 'cdom', 'downwelling_par']:
+        df[column] = rng.normal(10, 2, rows)
+    df.loc[::11, 'oxygen'] = np.nan
+    return df
+
+def reset(engine):
+    with engine.connect() as conn:
+        for statement in CREATE_SQL.split(';'):
+            if statement.strip():
+                conn.execute(text(statement))
+        conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--insert-rows", type=int, default=100_000,
+                        help="Rows for the to_sql(method='multi') baseline")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    df = make_rows(args.rows)
+
+    reset(engine)
+    sample = df.head(args.insert_rows)
+    start = time.perf_counter()
+    sample.to_sql(TABLE, engine, if_exists='append', index=False, method='multi', chunksize=5000)
+    elapsed = time.perf_counter() - start
+    print(f"to_sql multi     {len(sample):>10,} rows  {elapsed:7.2f} s  {len(sample) / elapsed:>10,.0f} rows/s")
+
+    checksums = {}
+    for format in ('csv', 'binary'):
+        for drop_indexes in (False, True):
+            reset(engine)
+            stats = copy_dataframe(df, TABLE, engine, format=format, drop_indexes=drop_indexes, verbose=False)
+            label = f"copy {format}{' -idx' if drop_indexes else ''}"
+            print(f"{label:<16} {stats.rows:>10,} rows  {stats.seconds:7.2f} s  {stats.rows_per_second:>10,.0f} rows/s")
+
+            with engine.connect() as conn:
+                checksums[label] = conn.execute(text(
+                    f"SELECT COUNT(*), COUNT(oxygen), SUM(temperature), MAX(time), COUNT(DISTINCT float_id) FROM {TABLE}"
+                )).one()
+
+    reference = next(iter(checksums.values()))
+    assert all(value == reference for value in checksums.values()), checksums
+    print(f"all loads identical: {reference}")
+
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP TABLE {TABLE}"))
+        conn.commit()
+
+if __name__ == "__main__":
+    main()
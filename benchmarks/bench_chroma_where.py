@@ -0,0 +1,216 @@
+"""
+Benchmark for metadata-filter pushdown on a 1M-document collection
+--build writes a persistent Chroma collection of synthetic measurement documents with the
+metadata keys of argo_measurements and vectors clustered by float and depth, as embeddings
+of templated documents are, and keeps the vectors and metadata columns next to it so the
+exact filtered nearest neighbours can be computed.
+The query phase runs constrained questions three ways: unfiltered search, every constraint
+pushed into Chroma's where, and retrieval.constrained_query, which post-filters an
+over-fetched search and falls back to ranking the candidates found in a SQLite copy of the
+measurements table (indexed like the ingest schema, standing in for PostgreSQL). It reports
+latency, recall@k against the exact filtered top-k and how many results violate the
+question's constraints.
+
+Usage:
+    python benchmarks/bench_chroma_where.py --build --documents 1000000 --path /tmp/bench_where
+    python benchmarks/bench_chroma_where.py --path /tmp/bench_where --repeats 5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+import pandas as pd
+from database import build_engine
+from query_constraints import extract_query_constraints
+from retrieval import constrained_query
+
+COLLECTION = 'bench_where'
+DIMENSIONS = 384
+BATCH = 5000
+LEVELS = np.array([5, 10, 20, 30, 50, 75, 100, 125, 150, 200, 250, 300, 400, 500, 600, 700, 800, 900,
+                   1000, 1100, 1200, 1300, 1400, 1500, 1600, 1700, 1800, 1900, 2000, 2000], dtype=float)
+
+QUESTIONS = [
+    "temperature near the equator",
+    "cold water below 1000 m",
+    "salinity in 2023",
+    "profiles of float ARGO_0012",
+    "oxygen in the Arabian Sea in March 2023",
+    "surface temperature in the Bay of Bengal within the top 50 m",
+    "measurements between 10N and 20N deeper than 1500 m since 2024",
+    "float ARGO_0420 below 1000 m in 2021",
+]
+
+def synthetic_columns(start, count, seed=0):
+    """Metadata columns of documents start..start+count (30 levels per profile, 50 profiles per float)"""
+    index = np.arange(start, start + count)
+    profile = index // len(LEVELS)
+    float_number = profile // 50 % 1000 + 1
+    lats = np.random.default_rng(seed + 1).uniform(-40, 30, 1000)
+    lons = np.random.default_rng(seed + 2).uniform(40, 120, 1000)
+    drift = (profile % 50) * 0.05 + (profile * 2654435761 % 1000) / 1e5  # one position per profile
+    days = (profile % 50) * 43 + float_number % 43  # 2019 through 2024
+    dates = np.datetime64('2019-01-01') + days.astype('timedelta64[D]')
+    yyyymmdd = np.char.replace(np.datetime_as_string(dates, unit='D'), '-', '').astype(int)
+    return {
+        'postgres_id': index + 1,
+        'profile_id': profile + 1,
+        'float_number': float_number,
+        'cycle_number': profile % 50 + 1,
+        'yyyymmdd': yyyymmdd,
+        'dates': np.datetime_as_string(dates, unit='D'),
+        'depth': LEVELS[index % len(LEVELS)],
+        'lat': np.round(lats[float_number - 1] + drift, 3),
+        'lon': np.round(lons[float_number - 1] + drift, 3),
+        'has_bgc': float_number % 4 == 0,
+    }
+
+def synthetic_embeddings(batch, rng):
+    """Unit vectors near a per-float-group centre, shifted by a per-depth direction"""
+    directions = np.random.default_rng(42).normal(size=(256 + len(LEVELS), DIMENSIONS))
+    centres, depths = directions[:256], directions[256:]
+    level = np.searchsorted(LEVELS, batch['depth'])
+    vectors = centres[batch['float_number'] % 256] + 0.5 * depths[level] + 0.7 * rng.normal(size=(len(level), DIMENSIONS))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def build(path, documents):
+    client = chromadb.PersistentClient(path=path)
+    try:
+        client.delete_collection(COLLECTION)
+    except Exception:
+        pass
+    collection = client.create_collection(COLLECTION, embedding_function=None)
+    vectors = np.lib.format.open_memmap(os.path.join(path, 'vectors.npy'), mode='w+', dtype=np.float16,
+                                        shape=(documents, DIMENSIONS))
+    columns = {}
+    started = time.perf_counter()
+    for start in range(0, documents, BATCH):
+        count = min(BATCH, documents - start)
+        batch = synthetic_columns(start, count)
+        embeddings = synthetic_embeddings(batch, np.random.default_rng(start))
+        vectors[start:start + count] = embeddings
+        metadatas = [
+            {'postgres_id': int(batch['postgres_id'][i]), 'profile_id': int(batch['profile_id'][i]),
+             'float_id': f"ARGO_{batch['float_number'][i]:04d}", 'wmo_id': int(5900000 + batch['float_number'][i]),
+             'cycle_number': int(batch['cycle_number'][i]), 'time': str(batch['dates'][i]),
+             'profile_date': str(batch['dates'][i]), 'yyyymmdd': int(batch['yyyymmdd'][i]),
+             'depth': float(batch['depth'][i]), 'lat': float(batch['lat'][i]), 'lon': float(batch['lon'][i]),
+             'n_levels': len(LEVELS), 'has_bgc': bool(batch['has_bgc'][i])}
+            for i in range(count)
+        ]
+        collection.add(ids=[str(i) for i in batch['postgres_id']], embeddings=embeddings.tolist(), metadatas=metadatas,
+                       documents=[f"measurement {i}" for i in batch['postgres_id']])
+        for name, values in batch.items():
+            columns.setdefault(name, []).append(values)
+        done = start + count
+        if done % 50_000 == 0 or done == documents:
+            elapsed = time.perf_counter() - started
+            print(f"   {done:,} documents ({done / elapsed:,.0f} docs/s)", flush=True)
+    vectors.flush()
+    np.savez(os.path.join(path, 'columns.npz'), **{name: np.concatenate(parts) for name, parts in columns.items()})
+
+def matches(columns, constraints):
+    """Boolean mask of the documents satisfying constraints, evaluated on the saved columns"""
+    mask = np.ones(len(columns['postgres_id']), dtype=bool)
+    bounds = [('lat', constraints.lat_min, np.greater_equal), ('lat', constraints.lat_max, np.less_equal),
+              ('lon', constraints.lon_min, np.greater_equal), ('lon', constraints.lon_max, np.less_equal),
+              ('depth', constraints.depth_min, np.greater_equal), ('depth', constraints.depth_max, np.less_equal)]
+    for column, value, compare in bounds:
+        if value is not None:
+            mask &= compare(columns[column], value)
+    if constraints.time_start is not None:
+        mask &= columns['yyyymmdd'] >= int(constraints.time_start.strftime('%Y%m%d'))
+    if constraints.time_end is not None:
+        mask &= columns['yyyymmdd'] < int(constraints.time_end.strftime('%Y%m%d'))
+    if constraints.float_ids:
+        mask &= np.isin(columns['float_number'], [int(f.split('_')[1]) for f in constraints.float_ids])
+    return mask
+
+def measurement_engine(path, columns):
+    """SQLite measurements table with the saved columns, created on first use"""
+    database = os.path.join(path, 'measurements.db')
+    exists = os.path.exists(database)
+    engine = build_engine(f"sqlite:///{database}")
+    if not exists:
+        pd.DataFrame({
+            'id': columns['postgres_id'], 'profile_id': columns['profile_id'],
+            'float_id': [f"ARGO_{n:04d}" for n in columns['float_number']],
+            'time': pd.to_datetime(columns['dates']), 'lat': columns['lat'], 'lon': columns['lon'], 'depth': columns['depth']
+        }).to_sql('measurements', engine, index=False, chunksize=100_000)
+        with engine.begin() as conn:
+            for name, column in [('float_id', 'float_id'), ('time', 'time'), ('location', 'lat, lon'), ('depth', 'depth')]:
+                conn.exec_driver_sql(f"CREATE INDEX idx_measurements_{name} ON measurements({column})")
+    return engine
+
+def exact_top_k(vectors, candidates, query, k, chunk=100_000):
+    """Positions of the k candidates nearest to query (unit vectors, so by inner product)"""
+    best = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    for start in range(0, len(candidates), chunk):
+        positions = candidates[start:start + chunk]
+        scores = np.asarray(vectors[positions], dtype=np.float32) @ query
+        positions, scores = np.concatenate([best[0], positions]), np.concatenate([best[1], scores])
+        top = np.argsort(-scores)[:k]
+        best = positions[top], scores[top]
+    return set(best[0].tolist())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="/tmp/bench_where")
+    parser.add_argument("--build", action="store_true")
+    parser.add_argument("--documents", type=int, default=1_000_000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3, help="Query vectors per question")
+    args = parser.parse_args()
+
+    if args.build:
+        build(args.path, args.documents)
+        return
+
+    collection = chromadb.PersistentClient(path=args.path).get_collection(COLLECTION, embedding_function=None)
+    vectors = np.load(os.path.join(args.path, 'vectors.npy'), mmap_mode='r')
+    columns = dict(np.load(os.path.join(args.path, 'columns.npz')))
+    engine = measurement_engine(args.path, columns)
+    print(f"{collection.count():,} documents, k={args.k}, {args.repeats} query vectors per question")
+    collection.query(query_embeddings=[[0.0] * DIMENSIONS], n_results=1)  # load the HNSW index
+
+    strategies = {
+        'unfiltered': lambda q, c: collection.query(query_embeddings=[q.tolist()], n_results=args.k),
+        'pushdown': lambda q, c: collection.query(query_embeddings=[q.tolist()], n_results=args.k,
+                                                  where=c.to_chroma_where('measurements')),
+        'planned': lambda q, c: constrained_query(collection, q.tolist(), c, 'measurements', args.k, engine),
+    }
+    print(f"{'question':<58} {'matches':>7}" + ''.join(f" | {name:<27}" for name in strategies))
+    rng = np.random.default_rng(1)
+    totals = {name: [] for name in strategies}
+    for question in QUESTIONS:
+        constraints = extract_query_constraints(question)
+        mask = matches(columns, constraints)
+        candidates = np.flatnonzero(mask)
+        line = f"{question[:58]:<58} {mask.mean():7.2%}"
+        for name, run in strategies.items():
+            latencies, recalls, violations = [], [], 0
+            for _ in range(args.repeats):
+                query = synthetic_embeddings({'float_number': rng.integers(1, 1000, 1),
+                                              'depth': rng.choice(LEVELS, 1)}, rng)[0]
+                start = time.perf_counter()
+                result = run(query, constraints)
+                latencies.append(time.perf_counter() - start)
+                returned = [int(i) - 1 for i in result['ids'][0]]
+                exact = exact_top_k(vectors, candidates, query, args.k)
+                recalls.append(len(exact & set(returned)) / len(exact) if exact else float(not returned))
+                violations += int((~mask[returned]).sum())
+            totals[name] += latencies
+            line += f" | {np.median(latencies) * 1000:8.1f} ms r@k {np.mean(recalls):4.2f} bad {violations:2d}"
+        print(line, flush=True)
+    print(f"{'median over all questions':<67}" + ''.join(
+        f" | {np.median(values) * 1000:8.1f} ms{'':15}" for values in totals.values()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark for the CPU embedding backends
+Loads config.EMBEDDING_MODEL on each backend of embedding_backends and reports load time,
+cosine parity with the fp32 model over PARITY_TEXTS, bulk-ingest throughput on synthetic
+profile summaries (the documents data_chroma_floats indexes) at EMBED_BATCH_SIZE, and
+single-question latency as /query sees it (one text per call).
+
+Usage:
+    python benchmarks/bench_embedding_backends.py --documents 2000 --queries 200
+    python benchmarks/bench_embedding_backends.py --backends torch onnx-int8 --threads 4
+
+The torch backends need torch and sentence-transformers; the ONNX ones export the model into
+EMBED_EXPORT_PATH on first use, which also needs them (plus onnx), and run on onnxruntime.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from bench_lexical import synthetic_profiles
+from data_chroma_floats import build_profile_documents
+from embedding_backends import BACKENDS, PARITY_TEXTS, check_parity, load_encoder
+from sample_queries import CHAT_SAMPLE_QUERIES, SEMANTIC_SAMPLE_QUERIES
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--documents", type=int, default=2000, help="Profile summaries encoded in bulk")
+    parser.add_argument("--queries", type=int, default=200, help="Single-question encode calls")
+    parser.add_argument("--batch-size", type=int, default=config.EMBED_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    _, documents, _ = build_profile_documents(synthetic_profiles(args.documents))
+    questions = [q for qs in [*CHAT_SAMPLE_QUERIES.values(), *SEMANTIC_SAMPLE_QUERIES.values()] for q in qs]
+    print(f"{config.EMBEDDING_MODEL}: {len(documents)} documents at batch size {args.batch_size}, "
+          f"{args.queries} single questions, {args.threads} threads")
+    print(f"{'backend':<11} {'load':>8} {'min cos':>8} {'mean cos':>9} {'bulk docs/s':>12} {'query p50':>10} {'query p95':>10}")
+
+    reference = None
+    for backend in args.backends:
+        started = time.perf_counter()
+        try:
+            encode = load_encoder(config.EMBEDDING_MODEL, backend, args.threads)
+        except ImportError as e:
+            print(f"{backend:<11} unavailable: {e}")
+            continue
+        load_seconds = time.perf_counter() - started
+        if backend == 'torch':
+            reference = encode
+        parity = check_parity(reference, encode, PARITY_TEXTS) if reference else None
+
+        encode(documents[:args.batch_size], args.batch_size)  # warm up
+        started = time.perf_counter()
+        encode(documents, args.batch_size)
+        bulk = len(documents) / (time.perf_counter() - started)
+
+        latencies = []
+        for i in range(args.queries):
+            started = time.perf_counter()
+            encode([questions[i % len(questions)]])
+            latencies.append(time.perf_counter() - started)
+        cosines = f"{parity['min_cosine']:8.4f} {parity['mean_cosine']:9.4f}" if parity else f"{'-':>8} {'-':>9}"
+        print(f"{backend:<11} {load_seconds:7.1f}s {cosines} {bulk:12.0f} {np.percentile(latencies, 50) * 1000:7.1f} ms "
+              f"{np.percentile(latencies, 95) * 1000:7.1f} ms", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark for building the argo_measurements Chroma collection
+Runs the previous implementation (whole join read with read_sql_query, iterrows documents,
+Chroma calling the embedding function inside each serial collection.add) and the streaming
+pipeline in data_chroma_floats on the same rows, each in its own process, and reports docs/s,
+busy time per pipeline stage and peak RSS
+
+Usage:
+    DATABASE_URL=postgresql+psycopg2://... python benchmarks/bench_embedding_pipeline.py --rows 20000
+    ... --encoder model --workers 4     # SentenceTransformer (config.EMBEDDING_MODEL) on worker processes
+
+--encoder hash (default) replaces the model with a cheap deterministic hash embedding, which
+isolates what the pipeline itself changes (reading, document building, writing) from model cost.
+--encode-ms adds a per-document sleep to it, standing in for inference that does not compete
+for the writer's CPU (a GPU or a separate host).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+import config
+import data_chroma_floats
+from embedding_pipeline import InlineEncoder, ProcessPoolEncoder
+
+DIMENSIONS = 384
+
+ENCODE_SECONDS_PER_DOC = 0.0
+
+def hash_embed(documents):
+    """Deterministic stand-in embedding: a blake2b digest tiled to DIMENSIONS floats"""
+    if ENCODE_SECONDS_PER_DOC:
+        time.sleep(ENCODE_SECONDS_PER_DOC * len(documents))
+    digests = b''.join(hashlib.blake2b(doc.encode(), digest_size=64).digest() for doc in documents)
+    values = np.frombuffer(digests, dtype=np.uint8).reshape(len(documents), 64).astype(np.float32)
+    return np.tile(values, DIMENSIONS // 64) / 255.0
+
+class SerialEmbeddingFunction(chromadb.EmbeddingFunction):
+    """Chroma embedding function around an encode callable, called inside collection.add"""
+
+    def __init__(self, encode):
+        self.encode = encode
+
+    def __call__(self, input):
+        return np.asarray(self.encode(input), dtype=np.float32).tolist()
+
+def legacy_build(df, collection, batch_size):
+    """The previous row-by-row implementation, kept here for comparison"""
+    for i in range(0, len(df), batch_size):
+        batch_df = df.iloc[i:i + batch_size]
+        documents, metadatas, ids = [], [], []
+        for _, row in batch_df.iterrows():
+            temp_str = f"{row['temperature']:.2f}°C" if pd.notna(row['temperature']) else "not available"
+            sal_str = f"{row['salinity']:.2f} PSU" if pd.notna(row['salinity']) else "not available"
+            bgc_info = ""
+            if pd.notna(row['oxygen']):
+                bgc_info += f" The dissolved oxygen was {row['oxygen']:.2f} ml/L."
+            if pd.notna(row['ph']):
+                bgc_info += f" The pH was {row['ph']:.2f}."
+            if pd.notna(row['chlorophyll']) and row['chlorophyll'] > 0.01:
+                bgc_info += f" The chlorophyll concentration was {row['chlorophyll']:.3f} mg/m³."
+            documents.append(
+                f"ARGO float {row['float_id']} (WMO ID: {row['wmo_id']}) recorded measurements "
+                f"on {row['time'].strftime('%Y-%m-%d')} during cycle {row['cycle_number']}. "
+                f"The float was located at latitude {row['lat']:.3f}° and longitude {row['lon']:.3f}°. "
+                f"At a depth of {row['depth']:.1f} meters, the temperature was {temp_str} "
+                f"and the salinity was {sal_str}.{bgc_info} "
+                f"This measurement was part of a profile with {row['n_levels']} depth levels. "
+                f"The float was deployed on {row['deployment_date']}."
+            )
+            metadatas.append({
+                'postgres_id': int(row['id']),
+                'profile_id': int(row['profile_id']),
+                'float_id': str(row['float_id']),
+                'wmo_id': int(row['wmo_id']),
+                'cycle_number': int(row['cycle_number']),
+                'time': row['time'].strftime('%Y-%m-%d'),
+                'profile_date': row['profile_date'].strftime('%Y-%m-%d'),
+                'depth': float(row['depth']),
+                'lat': float(row['lat']),
+                'lon': float(row['lon']),
+                'n_levels': int(row['n_levels']),
+                'has_bgc': bool(pd.notna(row['oxygen']) or pd.notna(row['ph']) or pd.notna(row['chlorophyll']))
+            })
+            ids.append(str(row['id']))
+        collection.add(documents=documents, metadatas=metadatas, ids=ids)
+
+def run_mode(args):
+    """One measured run in this process; prints a JSON line"""
+    global ENCODE_SECONDS_PER_DOC
+    ENCODE_SECONDS_PER_DOC = args.encode_ms / 1000
+    client = chromadb.EphemeralClient()
+    config.MAX_DOCUMENTS = args.rows
+    start = time.perf_counter()
+
+    if args.mode == 'legacy':
+        if args.encoder == 'hash':
+            encode = hash_embed
+        else:
+            from sentence_transformers import SentenceTransformer
+            encode = SentenceTransformer(config.EMBEDDING_MODEL).encode
+        collection = client.get_or_create_collection(name=data_chroma_floats.MEASUREMENT_COLLECTION,
+                                                      embedding_function=SerialEmbeddingFunction(encode))
+        sql = data_chroma_floats.MEASUREMENT_SQL.format(where="") + f"ORDER BY m.id LIMIT {args.rows}"
+        df = pd.read_sql_query(sql, data_chroma_floats.engine)
+        legacy_build(df, collection, config.BATCH_SIZE)
+        result = {'documents': collection.count()}
+    else:
+        encoder = InlineEncoder(hash_embed) if args.encoder == 'hash' else ProcessPoolEncoder(workers=args.workers)
+        with encoder:
+            stats = data_chroma_floats.create_float_aware_embeddings(encoder, client).embedding
+        result = {'documents': stats.documents, 'read': stats.read_seconds, 'build': stats.build_seconds,
+                  'encode_wait': stats.encode_wait_seconds, 'write': stats.write_seconds}
+
+    result['seconds'] = time.perf_counter() - start
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print("RESULT " + json.dumps(result))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--encoder", choices=['hash', 'model'], default='hash')
+    parser.add_argument("--workers", type=int, default=config.EMBED_WORKERS)
+    parser.add_argument("--encode-ms", type=float, default=0.0, help="Simulated model latency per document (hash encoder)")
+    parser.add_argument("--mode", choices=['legacy', 'pipeline'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return run_mode(args)
+
+    print(f"{args.rows:,} rows, {args.encoder} encoder (+{args.encode_ms} ms/doc), {os.cpu_count()} CPUs")
+    for mode in ('legacy', 'pipeline'):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--rows", str(args.rows),
+             "--encoder", args.encoder, "--workers", str(args.workers), "--encode-ms", str(args.encode_ms)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.split("RESULT ", 1)[1])
+        rate = result['documents'] / result['seconds']
+        stages = ""
+        if mode == 'pipeline':
+            stages = (f"  (read {result['read']:.1f}s, build {result['build']:.1f}s, "
+                      f"encode wait {result['encode_wait']:.1f}s, write {result['write']:.1f}s)")
+        print(f"{mode:<9} {result['documents']:>9,} docs  {result['seconds']:7.1f} s  {rate:>7,.0f} docs/s  "
+              f"peak RSS {result['peak_rss_mb']:6.0f} MB{stages}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark for micro-batched query embedding under concurrent load
+Simulates --clients concurrent users, each embedding --queries questions one after another
+from a database executor thread as /query does, once with every thread calling the model
+directly and once through embedding_service.EmbeddingService. Reports throughput, request
+latency percentiles and the batch sizes the service formed.
+
+Usage:
+    python benchmarks/bench_embedding_service.py --clients 16 --queries 20
+    python benchmarks/bench_embedding_service.py --clients 16 --max-wait-ms 2 --max-batch 64
+
+The model is Chroma's default ONNX all-MiniLM-L6-v2, the embedding main.py falls back to.
+Where it cannot be downloaded, a numpy stand-in with MiniLM's shape (6 layers, 384 wide,
+1536 feed-forward, 32 tokens) is used instead, so per-call overhead and per-text cost are
+of the same kind.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chromadb.utils import embedding_functions
+from embedding_service import EmbeddingService
+
+TEMPLATES = [
+    "warm surface water near {lat} degrees", "oxygen minimum zone at {depth} meters",
+    "salinity of float ARGO_{n:04d}", "temperature profiles in {year}",
+]
+
+class StandInModel:
+    """Random-weight encoder with the layer sizes of all-MiniLM-L6-v2 (no attention)"""
+
+    def __init__(self, layers=6, width=384, hidden=1536, tokens=32, vocabulary=30522):
+        rng = np.random.default_rng(0)
+        self.tokens = tokens
+        self.vocabulary = rng.normal(size=(vocabulary, width)).astype(np.float32)
+        self.layers = [(rng.normal(size=(width, hidden)).astype(np.float32) / np.sqrt(width),
+                        rng.normal(size=(hidden, width)).astype(np.float32) / np.sqrt(hidden)) for _ in range(layers)]
+
+    def __call__(self, input):
+        ids = np.array([[hash(word) % len(self.vocabulary) for word in (text.split() * self.tokens)[:self.tokens]]
+                        for text in input])
+        hidden = self.vocabulary[ids]
+        for up, down in self.layers:
+            hidden = hidden + np.maximum(hidden @ up, 0) @ down
+            hidden /= np.linalg.norm(hidden, axis=-1, keepdims=True)
+        pooled = hidden.mean(axis=1)
+        return (pooled / np.linalg.norm(pooled, axis=1, keepdims=True)).tolist()
+
+def load_model():
+    try:
+        model = embedding_functions.DefaultEmbeddingFunction()
+        model(["warm up"])
+        return model, 'ONNX all-MiniLM-L6-v2'
+    except Exception as e:
+        print(f"default embedding model unavailable ({type(e).__name__}), using the numpy stand-in")
+        return StandInModel(), 'numpy stand-in'
+
+def questions(count, seed):
+    rng = np.random.default_rng(seed)
+    return [TEMPLATES[i % len(TEMPLATES)].format(lat=int(rng.integers(-40, 30)), depth=int(rng.integers(5, 2000)),
+                                                 n=int(rng.integers(1, 1000)), year=int(rng.integers(2019, 2025)))
+            for i in range(count)]
+
+async def run_clients(encode, clients, queries):
+    """Per-request latencies and the wall time of clients threads each encoding queries questions"""
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=clients)
+
+    def client(seed):
+        latencies = []
+        for question in questions(queries, seed):
+            started = time.perf_counter()
+            encode([question])
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(loop.run_in_executor(executor, client, seed) for seed in range(clients)))
+    elapsed = time.perf_counter() - started
+    executor.shutdown()
+    return [latency for latencies in results for latency in latencies], elapsed
+
+def report(name, latencies, elapsed):
+    print(f"{name:<10} {len(latencies) / elapsed:8.1f} q/s   p50 {np.percentile(latencies, 50) * 1000:7.1f} ms"
+          f"   p95 {np.percentile(latencies, 95) * 1000:7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=20, help="Questions per client")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    model, name = load_model()
+    print(f"{name}, {args.clients} clients x {args.queries} questions")
+
+    async def direct():
+        report('direct', *await run_clients(model, args.clients, args.queries))
+
+    async def batched():
+        service = EmbeddingService(model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+        service.start()
+        report('batched', *await run_clients(service.encode, args.clients, args.queries))
+        stats = service.stats()
+        await service.stop()
+        service.close()
+        print(f"{'':10} {stats['batches']} batches, mean {stats['mean_batch']} texts, largest {stats['largest_batch']},"
+              f" encode p50 {stats['encode_ms_p50']} ms")
+
+    asyncio.run(direct())
+    asyncio.run(batched())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark for virtual-float construction in argo_float_processor
+Builds a synthetic TAXIS/ZAX/YAXIS/XAXIS grid shaped like tempsal.nc, then times the previous
+nested groupby/iterrows construction against read_gridded_measurements + build_float_structure,
+checks that both produce identical floats/profiles/measurements frames, and reports peak memory
+
+Usage:
+    python benchmarks/bench_float_structure.py                       # 100k-row cap
+    python benchmarks/bench_float_structure.py --max-rows 2000000 --skip-legacy
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from argo_float_processor import build_float_structure, read_gridded_measurements
+
+def make_grid(times: int, depths: int, lats: int, lons: int, seed: int = 0) -> xr.Dataset:
+    """Gridded TEMP/SAL with a land mask and a few missing values, like the source file"""
+    rng = np.random.default_rng(seed)
+    shape = (times, depths, lats, lons)
+    temp = rng.normal(20, 5, shape)
+    sal = rng.normal(35, 0.5, shape)
+    land = rng.random((lats, lons)) < 0.3
+    temp[:, :, land] = np.nan
+    temp[rng.random(shape) < 0.02] = np.nan
+    coords = {
+        'TAXIS': pd.date_range('2020-01-01', periods=times, freq='MS'),
+        'ZAX': np.linspace(5, 2000, depths),
+        'YAXIS': np.linspace(-30, 30, lats),
+        'XAXIS': np.linspace(50, 120, lons)
+    }
+    dims = ('TAXIS', 'ZAX', 'YAXIS', 'XAXIS')
+    return xr.Dataset({'TEMP': (dims, temp), 'SAL': (dims, sal)}, coords=coords)
+
+def legacy_simulate(data: xr.Dataset, max_rows: int, max_floats: int):
+    """The previous implementation, kept here for comparison"""
+    df = data.to_dataframe().reset_index()
+    df = df.rename(columns={'TAXIS': 'time', 'ZAX': 'depth', 'YAXIS': 'lat', 'XAXIS': 'lon',
+                            'TEMP': 'temperature', 'SAL': 'salinity'})
+    df = df.dropna()
+    if len(df) > max_rows:
+        df = df.head(max_rows)
+
+    floats_data, profiles_data, measurements_data = [], [], []
+    float_counter = 1
+    profile_counter = 1
+    for (lat, lon), location_df in df.groupby(['lat', 'lon']):
+        float_id = f"ARGO_{float_counter:04d}"
+        floats_data.append({
+            'float_id': float_id,
+            'wmo_id': 5900000 + float_counter,
+            'deployment_date': location_df['time'].min().date(),
+            'deployment_lat': lat,
+            'deployment_lon': lon,
+            'status': 'ACTIVE',
+            'last_contact': location_df['time'].max().date()
+        })
+        cycle_num = 1
+        for time_val, time_df in location_df.groupby('time'):
+            profiles_data.append({
+                'profile_id': profile_counter,
+                'float_id': float_id,
+                'cycle_number': cycle_num,
+                'profile_date': time_val,
+                'profile_lat': lat,
+                'profile_lon': lon,
+                'n_levels': len(time_df)
+            })
+            for _, row in time_df.iterrows():
+                measurements_data.append({
+                    'profile_id': profile_counter,
+                    'float_id': float_id,
+                    'time': row['time'],
+                    'lat': row['lat'],
+                    'lon': row['lon'],
+                    'depth': row['depth'],
+                    'pressure': row['depth'] * 1.025,
+                    'temperature': row['temperature'],
+                    'salinity': row['salinity']
+                })
+            cycle_num += 1
+            profile_counter += 1
+        float_counter += 1
+        if float_counter > max_floats:
+            break
+    return pd.DataFrame(floats_data), pd.DataFrame(profiles_data), pd.DataFrame(measurements_data)
+
+def vectorized_simulate(data: xr.Dataset, max_rows: int, max_floats: int):
+    return build_float_structure(read_gridded_measurements(data, max_rows), max_floats)
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grid", type=int, nargs=4, default=[50, 30, 61, 71], metavar=("T", "Z", "Y", "X"))
+    parser.add_argument("--max-rows", type=int, default=100_000)
+    parser.add_argument("--max-floats", type=int, default=1000)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    data = make_grid(*args.grid)
+    cells = int(np.prod(args.grid))
+    print(f"grid {' x '.join(map(str, args.grid))} = {cells:,} cells ({cells * 16 / 1e6:.0f} MB as float64 TEMP+SAL)")
+
+    new, elapsed, peak = measure(vectorized_simulate, data, args.max_rows, args.max_floats)
+    print(f"vectorized {len(new[2]):>10,} measurements  {elapsed:8.2f} s  peak {peak:8.1f} MB")
+
+    if args.skip_legacy:
+        return
+
+    old, elapsed_old, peak_old = measure(legacy_simulate, data, args.max_rows, args.max_floats)
+    print(f"legacy     {len(old[2]):>10,} measurements  {elapsed_old:8.2f} s  peak {peak_old:8.1f} MB")
+    print(f"speedup x{elapsed_old / elapsed:,.0f}")
+
+    for name, old_df, new_df in zip(['floats', 'profiles', 'measurements'], old, new):
+        pd.testing.assert_frame_equal(old_df, new_df, check_dtype=False)
+        print(f"{name:<13} identical ({len(new_df):,} rows)")
+
+if __name__ == "__main__":
+    main()
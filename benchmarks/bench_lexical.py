@@ -0,0 +1,127 @@
+"""
+Benchmark for identifier lookups through the BM25 lexical index
+Builds profile summary documents with data_chroma_floats.build_profile_documents from
+synthetic profile aggregates, indexes them in a Chroma collection and a LexicalIndex, and
+asks questions naming a float, a WMO number, a float and cycle, or only ocean terms. Each
+question runs through retrieval.hybrid_query with the lexical index and through the vector
+search alone (whose identifier constraints are resolved in a SQLite copy of the profiles'
+rows, standing in for PostgreSQL), reporting latency and whether the named float's profiles
+came back.
+
+Usage:
+    python benchmarks/bench_lexical.py --profiles 50000 --queries 100
+
+Embeddings are the cheap deterministic hash of bench_retrieval, so vector latency here
+excludes the sentence-transformer call an identifier lookup no longer makes.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+import config
+from bench_retrieval import HashEmbeddingFunction
+from database import build_engine
+from data_chroma_floats import build_profile_documents
+from lexical_index import LexicalIndex, index_path
+from retrieval import constrained_query, embed_question, hybrid_query, question_constraints
+
+QUESTIONS = [
+    "profiles of float ARGO_{n:04d}", "WMO {wmo} temperature", "float ARGO_{n:04d} cycle {c}",
+    "warm surface water with high oxygen",
+]
+
+def synthetic_profiles(count, seed=0):
+    """Profile aggregates shaped like PROFILE_SQL rows, 50 cycles per float"""
+    rng = np.random.default_rng(seed)
+    profile = np.arange(count)
+    float_number = profile // 50 + 1
+    min_temp = rng.uniform(2, 10, count)
+    return pd.DataFrame({
+        'profile_id': profile + 1,
+        'float_id': [f"ARGO_{n:04d}" for n in float_number],
+        'wmo_id': 5900000 + float_number,
+        'cycle_number': profile % 50 + 1,
+        'profile_date': pd.Timestamp('2019-01-01') + pd.to_timedelta(profile % 2000, unit='D'),
+        'profile_lat': rng.uniform(-40, 30, count),
+        'profile_lon': rng.uniform(40, 120, count),
+        'n_levels': 30,
+        'min_depth': 5.0,
+        'max_depth': 2000.0,
+        'min_temp': min_temp,
+        'max_temp': min_temp + rng.uniform(5, 20, count),
+        'min_sal': rng.uniform(33, 35, count),
+        'max_sal': rng.uniform(35, 37, count),
+        'avg_oxygen': np.where(float_number % 4 == 0, rng.uniform(1, 6, count), np.nan),
+        'avg_ph': np.nan,
+        'avg_chlorophyll': np.nan,
+    })
+
+def measurement_engine(path, profiles):
+    """SQLite measurements (one row per profile) and floats tables for the candidate queries"""
+    engine = build_engine(f"sqlite:///{os.path.join(path, 'measurements.db')}")
+    pd.DataFrame({
+        'id': profiles['profile_id'], 'profile_id': profiles['profile_id'], 'float_id': profiles['float_id'],
+        'time': profiles['profile_date'], 'lat': profiles['profile_lat'], 'lon': profiles['profile_lon'],
+        'depth': profiles['min_depth']
+    }).to_sql('measurements', engine, index=False)
+    profiles[['float_id', 'wmo_id']].drop_duplicates().to_sql('floats', engine, index=False)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE INDEX idx_measurements_float_id ON measurements(float_id)")
+    return engine
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=100, help="Questions of each kind")
+    args = parser.parse_args()
+
+    profiles = synthetic_profiles(args.profiles)
+    ids, documents, metadatas = build_profile_documents(profiles)
+    collection = chromadb.EphemeralClient().create_collection(f"bench_{uuid.uuid4().hex[:12]}",
+                                                              embedding_function=HashEmbeddingFunction())
+    for start in range(0, len(ids), 5000):
+        collection.add(ids=ids[start:start + 5000], documents=documents[start:start + 5000],
+                       metadatas=metadatas[start:start + 5000])
+    start = time.perf_counter()
+    index = LexicalIndex()
+    index.add(ids, documents, metadatas)
+    print(f"{len(index):,} profiles, {len(index.postings):,} terms, indexed in {time.perf_counter() - start:.1f} s")
+
+    rng = np.random.default_rng(1)
+    floats = args.profiles // 50
+    print(f"{'question':<40} | {'hybrid':>10} {'found':>6} | {'vector only':>11} {'found':>6}")
+    with tempfile.TemporaryDirectory() as path, patch.object(config, 'LEXICAL_INDEX_PATH', path):
+        index.save(index_path(collection.name))
+        engine = measurement_engine(path, profiles)
+        for template in QUESTIONS:
+            timings = {'hybrid': [], 'vector': []}
+            found = {'hybrid': 0, 'vector': 0}
+            for _ in range(args.queries):
+                n = int(rng.integers(1, floats + 1))
+                question = template.format(n=n, wmo=5900000 + n, c=int(rng.integers(1, 51)))
+                runs = {
+                    'hybrid': lambda: hybrid_query(collection, question, 'profiles', 5, engine),
+                    'vector': lambda: constrained_query(collection, embed_question(collection, question),
+                                                        question_constraints(question), 'profiles', 5, engine),
+                }
+                for name, run in runs.items():
+                    started = time.perf_counter()
+                    results = run()
+                    timings[name].append(time.perf_counter() - started)
+                    found[name] += any(meta['float_id'] == f"ARGO_{n:04d}" for meta in results['metadatas'][0])
+            print(f"{template:<40} | {np.median(timings['hybrid']) * 1000:7.2f} ms {found['hybrid']:>6} | "
+                  f"{np.median(timings['vector']) * 1000:8.2f} ms {found['vector']:>6}", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark for the memory-mapped vector store against Chroma on the 1M-document collection
+Uses the collection, vectors and metadata columns written by bench_chroma_where --build.
+--build copies them into a memory-mapped collection (int8 or float16, --dtype); the query
+phase then compares the two stores: time from opening the store to the first answer,
+resident and on-disk size of the embeddings, latency and recall@k against the exact top-k
+of unfiltered searches, and the constrained questions of bench_chroma_where, answered by
+the store's where masks and by Chroma through retrieval.constrained_query.
+
+Usage:
+    python benchmarks/bench_chroma_where.py --build --documents 1000000 --path /tmp/bench_where
+    python benchmarks/bench_mmap_store.py --build --path /tmp/bench_where --dtype int8
+    python benchmarks/bench_mmap_store.py --path /tmp/bench_where --repeats 5
+
+Run the query phase in a fresh process: the startup figures include reading the files cold
+only when the page cache has not been warmed by --build.
+"""
+
+import argparse
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+import config
+from bench_chroma_where import (COLLECTION, DIMENSIONS, LEVELS, QUESTIONS, exact_top_k, matches,
+                                measurement_engine, synthetic_embeddings)
+from mmap_store import MmapClient
+from query_constraints import extract_query_constraints
+from retrieval import constrained_query
+
+BATCH = 50_000
+
+def build(path, store_path, dtype):
+    config.MMAP_STORE_DTYPE = dtype
+    client = MmapClient(store_path)
+    try:
+        client.delete_collection(COLLECTION)
+    except ValueError:
+        pass
+    collection = client.create_collection(COLLECTION)
+    vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+    columns = dict(np.load(os.path.join(path, 'columns.npz')))
+    started = time.perf_counter()
+    for start in range(0, len(vectors), BATCH):
+        rows = slice(start, start + BATCH)
+        batch = {name: values[rows] for name, values in columns.items()}
+        metadatas = [
+            {'postgres_id': int(batch['postgres_id'][i]), 'profile_id': int(batch['profile_id'][i]),
+             'float_id': f"ARGO_{batch['float_number'][i]:04d}", 'wmo_id': int(5900000 + batch['float_number'][i]),
+             'cycle_number': int(batch['cycle_number'][i]), 'time': str(batch['dates'][i]),
+             'profile_date': str(batch['dates'][i]), 'yyyymmdd': int(batch['yyyymmdd'][i]),
+             'depth': float(batch['depth'][i]), 'lat': float(batch['lat'][i]), 'lon': float(batch['lon'][i]),
+             'n_levels': len(LEVELS), 'has_bgc': bool(batch['has_bgc'][i])}
+            for i in range(len(batch['postgres_id']))
+        ]
+        collection.add(ids=[str(i) for i in batch['postgres_id']], embeddings=np.asarray(vectors[rows], dtype=np.float32),
+                       metadatas=metadatas, documents=[f"measurement {i}" for i in batch['postgres_id']])
+        done = min(start + BATCH, len(vectors))
+        print(f"   {done:,} documents ({done / (time.perf_counter() - started):,.0f} docs/s)", flush=True)
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+
+def disk_mb(path):
+    """Allocated size of a file or directory tree (files are preallocated sparsely)"""
+    paths = [path] if os.path.isfile(path) else [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+    return sum(os.stat(p).st_blocks * 512 for p in paths) / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="/tmp/bench_where")
+    parser.add_argument("--store", help="Memory-mapped store directory (default: <path>/mmap_store)")
+    parser.add_argument("--build", action="store_true")
+    parser.add_argument("--dtype", default="int8", choices=["int8", "float16"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3, help="Query vectors per question")
+    parser.add_argument("--unfiltered", type=int, default=20, help="Unfiltered queries")
+    args = parser.parse_args()
+    store_path = args.store or os.path.join(args.path, 'mmap_store')
+
+    if args.build:
+        build(args.path, store_path, args.dtype)
+        return
+
+    rss = rss_mb()
+    started = time.perf_counter()
+    mmap_collection = MmapClient(store_path).get_collection(COLLECTION)
+    documents = mmap_collection.count()
+    mmap_open = time.perf_counter() - started
+    mmap_collection.query(query_embeddings=[[0.0] * DIMENSIONS], n_results=1)
+    mmap_startup = time.perf_counter() - started
+    mmap_rss = rss_mb() - rss
+    manifest = mmap_collection._store.current().manifest
+    vectors_mb = disk_mb(os.path.join(mmap_collection._store._generation(manifest), 'vectors.npy'))
+
+    rss = rss_mb()
+    started = time.perf_counter()
+    chroma_collection = chromadb.PersistentClient(path=args.path).get_collection(COLLECTION, embedding_function=None)
+    chroma_collection.count()
+    chroma_open = time.perf_counter() - started
+    chroma_collection.query(query_embeddings=[[0.0] * DIMENSIONS], n_results=1)  # loads the HNSW index
+    chroma_startup = time.perf_counter() - started
+    chroma_rss = rss_mb() - rss
+    chroma_mb = disk_mb(os.path.join(args.path, str(chroma_collection.id))) + disk_mb(os.path.join(args.path, 'chroma.sqlite3'))
+
+    print(f"{documents:,} documents, {manifest['dtype']} store, k={args.k}")
+    print(f"{'':<12} {'open':>10} {'first answer':>13} {'RSS after it':>13} {'on disk':>10}")
+    print(f"{'mmap store':<12} {mmap_open * 1000:7.1f} ms {mmap_startup * 1000:10.1f} ms {mmap_rss:10.0f} MB "
+          f"{disk_mb(store_path):7.0f} MB  (embeddings {vectors_mb:.0f} MB, {documents * DIMENSIONS * 4 / 2**20:.0f} MB as float32)")
+    print(f"{'chroma':<12} {chroma_open * 1000:7.1f} ms {chroma_startup * 1000:10.1f} ms {chroma_rss:10.0f} MB "
+          f"{chroma_mb:7.0f} MB")
+
+    vectors = np.load(os.path.join(args.path, 'vectors.npy'), mmap_mode='r')
+    columns = dict(np.load(os.path.join(args.path, 'columns.npz')))
+    engine = measurement_engine(args.path, columns)
+    rng = np.random.default_rng(1)
+
+    def random_query():
+        return synthetic_embeddings({'float_number': rng.integers(1, 1000, 1), 'depth': rng.choice(LEVELS, 1)}, rng)[0]
+
+    strategies = {
+        'mmap where': lambda q, c: mmap_collection.query(query_embeddings=[q], n_results=args.k,
+                                                         where=c.to_chroma_where('measurements') if c else None),
+        'chroma planned': lambda q, c: constrained_query(chroma_collection, q.tolist(), c, 'measurements', args.k, engine)
+        if c else chroma_collection.query(query_embeddings=[q.tolist()], n_results=args.k),
+    }
+    everything = np.arange(documents)
+    line = f"{'unfiltered':<58} {1:7.2%}"
+    for name, run in strategies.items():
+        latencies, recalls = [], []
+        for _ in range(args.unfiltered):
+            query = random_query()
+            start = time.perf_counter()
+            result = run(query, None)
+            latencies.append(time.perf_counter() - start)
+            exact = exact_top_k(vectors, everything, query, args.k)
+            recalls.append(len(exact & {int(i) - 1 for i in result['ids'][0]}) / len(exact))
+        line += f" | {name} {np.median(latencies) * 1000:8.1f} ms r@k {np.mean(recalls):4.2f}"
+    print(line, flush=True)
+
+    totals = {name: [] for name in strategies}
+    for question in QUESTIONS:
+        constraints = extract_query_constraints(question)
+        mask = matches(columns, constraints)
+        candidates = np.flatnonzero(mask)
+        line = f"{question[:58]:<58} {mask.mean():7.2%}"
+        for name, run in strategies.items():
+            latencies, recalls, violations = [], [], 0
+            for _ in range(args.repeats):
+                query = random_query()
+                start = time.perf_counter()
+                result = run(query, constraints)
+                latencies.append(time.perf_counter() - start)
+                returned = [int(i) - 1 for i in result['ids'][0]]
+                exact = exact_top_k(vectors, candidates, query, args.k)
+                recalls.append(len(exact & set(returned)) / len(exact) if exact else float(not returned))
+                violations += int((~mask[returned]).sum())
+            totals[name] += latencies
+            line += f" | {name} {np.median(latencies) * 1000:8.1f} ms r@k {np.mean(recalls):4.2f} bad {violations:2d}"
+        print(line, flush=True)
+    print(f"{'median over constrained questions':<67}" + ''.join(
+        f" | {name} {np.median(values) * 1000:8.1f} ms" for name, values in totals.items()))
+
+if __name__ == "__main__":
+    main()
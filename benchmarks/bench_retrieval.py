@@ -0,0 +1,99 @@
+"""
+Benchmark for the /query retrieval tiers
+Indexes the database into a per-measurement and a per-profile Chroma collection (each in its
+own persistent directory) and runs the same questions through retrieval.retrieve with
+RETRIEVAL_TIER=measurements and =profiles, reporting index size, query latency and how many
+distinct profiles each answer's context covers
+
+Usage:
+    DATABASE_URL=postgresql+psycopg2://... python benchmarks/bench_retrieval.py --queries 200
+
+Embeddings are a cheap deterministic hash (as in bench_embedding_pipeline), so this measures
+index size and search/drill-down cost, not answer quality.
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+import config
+import data_chroma_floats
+from embedding_pipeline import InlineEncoder
+from retrieval import retrieve
+
+DIMENSIONS = 384
+
+QUESTIONS = [
+    "warm surface water in the Arabian Sea", "low oxygen at intermediate depth", "salinity near the equator",
+    "cold deep water below 1000 m", "chlorophyll maximum in spring", "profiles of float {n} in cycle {c}",
+    "temperature at {d} meters", "high pH near the surface", "fresh water lens after the monsoon",
+]
+
+def hash_embed(documents):
+    digests = b''.join(hashlib.blake2b(doc.encode(), digest_size=64).digest() for doc in documents)
+    values = np.frombuffer(digests, dtype=np.uint8).reshape(len(documents), 64).astype(np.float32)
+    return np.tile(values, DIMENSIONS // 64) / 255.0
+
+class HashEmbeddingFunction(chromadb.EmbeddingFunction):
+    def __call__(self, input):
+        return hash_embed(input).tolist()
+
+def directory_mb(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files) / 1024 / 1024
+
+def build(path, sync):
+    client = chromadb.PersistentClient(path=path)
+    start = time.perf_counter()
+    stats = sync(InlineEncoder(hash_embed), client, rebuild=True)
+    return client, stats.added, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    questions = [rng.choice(QUESTIONS).format(n=rng.integers(1, 300), c=rng.integers(1, 12), d=rng.integers(5, 2000))
+                 for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as measurement_dir, tempfile.TemporaryDirectory() as profile_dir:
+        measurement_client, measurement_docs, measurement_build = build(
+            measurement_dir, data_chroma_floats.create_float_aware_embeddings)
+        profile_client, profile_docs, profile_build = build(profile_dir, data_chroma_floats.create_profile_summaries)
+        ef = HashEmbeddingFunction()
+        measurements = measurement_client.get_collection(data_chroma_floats.MEASUREMENT_COLLECTION, embedding_function=ef)
+        profiles = profile_client.get_collection(data_chroma_floats.PROFILE_COLLECTION, embedding_function=ef)
+        sizes = {'measurements': directory_mb(measurement_dir), 'profiles': directory_mb(profile_dir)}
+        docs = {'measurements': measurement_docs, 'profiles': profile_docs}
+        builds = {'measurements': measurement_build, 'profiles': profile_build}
+
+        print(f"{args.queries} questions, {len(QUESTIONS)} templates")
+        for tier in ('measurements', 'profiles'):
+            config.RETRIEVAL_TIER = tier
+            collection = profiles if tier == 'profiles' else measurements
+            searches, latencies, covered, rows = [], [], [], []
+            for question in questions:
+                start = time.perf_counter()
+                collection.query(query_texts=[question], n_results=config.RETRIEVAL_PROFILES)
+                searches.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                result = retrieve(question, profiles, measurements)
+                latencies.append(time.perf_counter() - start)
+                covered.append(len({meta['profile_id'] for meta in result.metadatas}))
+                rows.append(len(result.metadatas))
+            searches, latencies = np.array(searches) * 1000, np.array(latencies) * 1000
+            print(f"{tier:<13} {docs[tier]:>9,} vectors  {sizes[tier]:7.1f} MB  built in {builds[tier]:6.1f}s  "
+                  f"vector search p50 {np.percentile(searches, 50):5.1f} ms  "
+                  f"retrieve p50 {np.percentile(latencies, 50):5.1f} ms, p95 {np.percentile(latencies, 95):5.1f} ms  "
+                  f"{np.mean(covered):.1f} profiles / {np.mean(rows):.0f} measurements per answer")
+
+if __name__ == "__main__":
+    main()
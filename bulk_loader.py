@@ -0,0 +1,245 @@
+"""
+Bulk loading into PostgreSQL with COPY
+Streams DataFrames or Arrow batches through COPY ... FROM STDIN in bounded chunks instead of
+multi-row INSERTs, optionally dropping secondary indexes around the load and running ANALYZE
+"""
+
+import io
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+import config
+from database import get_engine
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow input is optional
+    pa = None
+
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + np.array([0, 0], dtype='>i4').tobytes()
+PGCOPY_TRAILER = np.array([-1], dtype='>i2').tobytes()
+
+POSTGRES_EPOCH = np.datetime64('2000-01-01T00:00:00', 'us')
+POSTGRES_EPOCH_DAYS = np.datetime64('2000-01-01', 'D')
+
+# Postgres type (format_type prefix) -> big-endian NumPy encoding for binary COPY
+BINARY_FIXED_TYPES = {
+    'double precision': '>f8',
+    'real': '>f4',
+    'bigint': '>i8',
+    'integer': '>i4',
+    'smallint': '>i2',
+    'boolean': '?'
+}
+BINARY_TEXT_TYPES = ('character varying', 'text', 'character')
+
+@dataclass
+class LoadStats:
+    """Outcome of one bulk load"""
+    table: str
+    rows: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+    format: str = 'csv'
+    indexes_rebuilt: List[str] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.rows:,} rows into {self.table} in {self.seconds:.2f}s "
+                f"({self.rows_per_second:,.0f} rows/s, {self.format}, {self.chunks} chunks)")
+
+def _iter_frames(source, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Yield DataFrames of at most chunk_rows rows from a frame, Arrow table/batches or an iterable of them"""
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunk_rows):
+            yield source.iloc[start:start + chunk_rows]
+        return
+
+    if pa is not None and isinstance(source, pa.Table):
+        source = source.to_batches(max_chunksize=chunk_rows)
+    elif pa is not None and isinstance(source, pa.RecordBatch):
+        source = [source]
+
+    for item in source:
+        if pa is not None and isinstance(item, (pa.RecordBatch, pa.Table)):
+            item = item.to_pandas()
+        yield from _iter_frames(item, chunk_rows)
+
+def get_column_types(conn, table: str) -> Dict[str, str]:
+    """Postgres column types of a table, as reported by format_type()"""
+    rows = conn.execute(text("""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+        FROM pg_attribute a
+        WHERE a.attrelid = CAST(:table AS regclass) AND a.attnum > 0 AND NOT a.attisdropped
+    """), {'table': table})
+    return {name: pg_type for name, pg_type in rows}
+
+def _binary_supported(pg_type: str) -> bool:
+    return (pg_type in BINARY_FIXED_TYPES or pg_type.startswith(BINARY_TEXT_TYPES)
+            or pg_type.startswith('timestamp') or pg_type == 'date')
+
+def encode_binary_rows(df: pd.DataFrame, pg_types: Dict[str, str]) -> bytes:
+    """
+    Encode a frame as PGCOPY binary tuples (no header/trailer)
+
+    Every field is laid out in a fixed-width byte matrix (length word + payload) and a keep
+    mask drops the payload of NULLs and the padding of shorter strings; reading the matrix
+    in row order through the mask yields the variable-length wire format without a Python
+    loop over rows.
+    """
+    n = len(df)
+    blocks = [np.full(n, len(df.columns), dtype='>i2').view(np.uint8).reshape(n, 2)]
+    masks = [np.ones((n, 2), dtype=bool)]
+
+    for column in df.columns:
+        pg_type = pg_types[column]
+        series = df[column]
+        null = series.isna().to_numpy()
+
+        if pg_type.startswith(BINARY_TEXT_TYPES):
+            values = series.where(~null, '').astype(str).to_numpy(dtype=str)
+            encoded = np.char.encode(values, 'utf-8')
+            lengths = np.char.str_len(encoded)
+            width = encoded.dtype.itemsize
+            payload = np.frombuffer(encoded.tobytes(), dtype=np.uint8).reshape(n, width)
+            keep = (np.arange(width) < lengths[:, None]) & ~null[:, None]
+        else:
+            if pg_type.startswith('timestamp'):
+                stamps = pd.to_datetime(series)
+                if stamps.dt.tz is not None:
+                    stamps = stamps.dt.tz_convert('UTC').dt.tz_localize(None)
+                values = (stamps.to_numpy(dtype='datetime64[us]') - POSTGRES_EPOCH).astype(np.int64)
+                values = np.where(null, 0, values).astype('>i8')
+            elif pg_type == 'date':
+                days = pd.to_datetime(series).to_numpy(dtype='datetime64[D]')
+                values = np.where(null, 0, (days - POSTGRES_EPOCH_DAYS).astype(np.int64)).astype('>i4')
+            else:
+                dtype = BINARY_FIXED_TYPES[pg_type]
+                values = series.where(~null, 0).to_numpy().astype(dtype)
+            width = values.dtype.itemsize
+            lengths = np.full(n, width)
+            payload = values.view(np.uint8).reshape(n, width)
+            keep = np.repeat(~null[:, None], width, axis=1)
+
+        blocks.append(np.where(null, -1, lengths).astype('>i4').view(np.uint8).reshape(n, 4))
+        masks.append(np.ones((n, 4), dtype=bool))
+        blocks.append(payload)
+        masks.append(keep)
+
+    return np.hstack(blocks)[np.hstack(masks)].tobytes()
+
+def _encode_csv(df: pd.DataFrame) -> io.StringIO:
+    """CSV rows for COPY (FORMAT csv); NaN/None become unquoted empty fields, i.e. NULL"""
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False, date_format='%Y-%m-%d %H:%M:%S.%f')
+    buffer.seek(0)
+    return buffer
+
+def get_secondary_indexes(conn, table: str) -> Dict[str, str]:
+    """Indexes on a table that do not back a constraint (primary key/unique), name -> definition"""
+    rows = conn.execute(text("""
+        SELECT i.indexname, i.indexdef
+        FROM pg_indexes i
+        WHERE i.schemaname = current_schema() AND i.tablename = :table
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_constraint c
+              WHERE c.conrelid = CAST(:table AS regclass) AND c.conname = i.indexname
+          )
+    """), {'table': table})
+    return {name: definition for name, definition in rows}
+
+def _copy_chunks(conn: Connection, source, table: str, columns: Optional[List[str]], chunk_rows: int,
+                 indexes_dropped: bool, analyze: bool, stats: LoadStats):
+    """COPY every chunk of source into table on conn, without committing"""
+    pg_types = get_column_types(conn, table)
+    indexes = get_secondary_indexes(conn, table) if indexes_dropped else {}
+    for name in indexes:
+        conn.execute(text(f'DROP INDEX "{name}"'))
+
+    cursor = conn.connection.cursor()
+    try:
+        for chunk in _iter_frames(source, chunk_rows):
+            chunk = chunk[columns] if columns else chunk
+            if chunk.empty:
+                continue
+            column_list = ', '.join(f'"{c}"' for c in chunk.columns)
+
+            if stats.format == 'binary' and not all(_binary_supported(pg_types.get(c, '')) for c in chunk.columns):
+                unsupported = [c for c in chunk.columns if not _binary_supported(pg_types.get(c, ''))]
+                print(f"   Binary COPY does not support columns {unsupported}; using CSV")
+                stats.format = 'csv'
+
+            if stats.format == 'binary':
+                payload = io.BytesIO(PGCOPY_HEADER + encode_binary_rows(chunk, pg_types) + PGCOPY_TRAILER)
+                cursor.copy_expert(f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT binary)", payload)
+            else:
+                cursor.copy_expert(f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv)", _encode_csv(chunk))
+
+            stats.rows += len(chunk)
+            stats.chunks += 1
+    finally:
+        cursor.close()
+
+    for name, definition in indexes.items():
+        conn.execute(text(definition))
+    stats.indexes_rebuilt = list(indexes)
+
+    if analyze:
+        conn.execute(text(f"ANALYZE {table}"))
+
+def copy_dataframe(source: Union[pd.DataFrame, Iterable], table: str, engine: Optional[Engine] = None,
+                   columns: Optional[List[str]] = None, chunk_rows: Optional[int] = None,
+                   format: Optional[str] = None, drop_indexes: bool = False,
+                   analyze: bool = True, verbose: bool = True,
+                   connection: Optional[Connection] = None) -> LoadStats:
+    """
+    Load rows into an existing table with COPY FROM STDIN
+
+    source may be a DataFrame, a pyarrow Table/RecordBatch or any iterable of DataFrames or
+    record batches; it is encoded chunk_rows at a time so memory stays bounded. format is
+    'binary' (falls back to CSV when a column type has no binary encoder) or 'csv'. With
+    drop_indexes the table's secondary indexes are dropped before and rebuilt after the
+    load, inside the same transaction. Engines other than PostgreSQL fall back to to_sql.
+
+    Pass connection to load inside the caller's transaction; it is then left uncommitted.
+    """
+    engine = connection.engine if connection is not None else (engine or get_engine())
+    chunk_rows = chunk_rows or config.COPY_CHUNK_ROWS
+    format = format or config.COPY_FORMAT
+    stats = LoadStats(table=table, format=format)
+    start = time.perf_counter()
+
+    if engine.dialect.name != 'postgresql':
+        stats.format = 'insert'
+        for chunk in _iter_frames(source, chunk_rows):
+            chunk = chunk[columns] if columns else chunk
+            chunk.to_sql(table, connection if connection is not None else engine, if_exists='append',
+                         index=False, method='multi', chunksize=config.BATCH_SIZE)
+            stats.rows += len(chunk)
+            stats.chunks += 1
+        stats.seconds = time.perf_counter() - start
+        if verbose:
+            print(f"   Loaded {stats}")
+        return stats
+
+    if connection is not None:
+        _copy_chunks(connection, source, table, columns, chunk_rows, indexes_dropped=drop_indexes,
+                     analyze=analyze, stats=stats)
+    else:
+        with engine.connect() as conn:
+            _copy_chunks(conn, source, table, columns, chunk_rows, indexes_dropped=drop_indexes,
+                         analyze=analyze, stats=stats)
+            conn.commit()
+
+    stats.seconds = time.perf_counter() - start
+    if verbose:
+        print(f"   Loaded {stats}")
+    return stats
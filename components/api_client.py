@@ -5,7 +5,7 @@ Handles all communication with the ARGO Float data backend
 
 import requests
 import pandas as pd
-from typing import Dict, List, Optional, Any, Union
+from typing import Callable, Dict, List, Optional, Any, Union
 import logging
 from dataclasses import dataclass
 from datetime import datetime
@@ -23,6 +23,7 @@ class QueryResponse:
     context_documents: List[str]
     retrieved_metadata: List[dict]
     sql_results: Optional[List[dict]] = None
+    metadata: Optional[dict] = None  # Stage times, answer source and degradation reasons
 
 @dataclass
 class FloatInfo:
@@ -147,12 +148,75 @@ class APIClient:
                 answer=data.get("answer", ""),
                 context_documents=data.get("context_documents", []),
                 retrieved_metadata=data.get("retrieved_metadata", []),
-                sql_results=data.get("sql_results")
+                sql_results=data.get("sql_results"),
+                metadata=data.get("metadata")
             )
         except APIException as e:
             logger.error(f"RAG query failed: {e}")
             raise e
     
+    def stream_rag_pipeline(self, query_text: str,
+                            on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> QueryResponse:
+        """
+        Send query to the streaming RAG endpoint, calling on_event with each event as it arrives
+
+        Events are the context (documents and metadata), answer tokens and the complete answer.
+        Falls back to query_rag_pipeline against a backend without /query/stream.
+        """
+        if not query_text or len(query_text.strip()) == 0:
+            raise APIException("Query text cannot be empty")
+        
+        if len(query_text) > 500:  # Max query length
+            raise APIException("Query text too long (max 500 characters)")
+        
+        payload = {"query_text": query_text.strip()}
+        response = self._make_request('POST', '/query/stream', json=payload, stream=True, timeout=(10, 120),
+                                      headers={'Accept': 'application/x-ndjson'})
+        if response.status_code in (404, 405):
+            response.close()
+            return self.query_rag_pipeline(query_text)
+        if response.status_code >= 400:
+            self._validate_response(response)
+        
+        context: Dict[str, Any] = {}
+        tokens: List[str] = []
+        answer = None
+        metadata = None
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except (json.JSONDecodeError, ValueError) as e:
+                    raise APIException(f"Invalid stream event: {str(e)}")
+                if on_event:
+                    on_event(event)
+                if event.get('type') == 'context':
+                    context = event
+                    metadata = event.get('metadata')
+                elif event.get('type') == 'token':
+                    tokens.append(event.get('text', ''))
+                elif event.get('type') == 'done':
+                    answer = event.get('answer', ''.join(tokens))
+                    # The final stage times and degradations replace those sent before generation
+                    metadata = event.get('metadata', metadata)
+                elif event.get('type') == 'error':
+                    logger.error(f"Streaming RAG query failed: {event.get('message')}")
+                    raise APIException(event.get('message', 'Query failed'), response_data=event)
+        except requests.exceptions.RequestException as e:
+            raise APIException(f"Stream interrupted: {str(e)}")
+        finally:
+            response.close()
+        
+        return QueryResponse(
+            answer=answer if answer is not None else ''.join(tokens),
+            context_documents=context.get("context_documents", []),
+            retrieved_metadata=context.get("retrieved_metadata", []),
+            sql_results=context.get("sql_results"),
+            metadata=metadata
+        )
+    
     def get_profiles_by_ids(self, ids: List[int]) -> List[dict]:
         """Get profile data by measurement IDs"""
         if not ids:
@@ -311,6 +375,28 @@ class APIClient:
                 'recent_activity': []
             }
     
+    def get_cube_statistics(self, group_by: List[str], parameters: Optional[List[str]] = None,
+                            **filters) -> pd.DataFrame:
+        """Get pre-aggregated statistics from the backend data cube
+        
+        filters accepts region, lat_min/lat_max, lon_min/lon_max, depth_min/depth_max
+        and time_start/time_end.
+        """
+        try:
+            params = {'group_by': ','.join(group_by)}
+            if parameters:
+                params['parameters'] = ','.join(parameters)
+            params.update({key: value for key, value in filters.items() if value is not None})
+            
+            response = self._make_request('GET', '/statistics/cube', params=params, timeout=30)
+            data = self._validate_response(response)
+            if 'error' in data:
+                raise APIException(data['error'])
+            return pd.DataFrame(data.get('rows', []))
+        except APIException as e:
+            logger.error(f"Cube statistics request failed: {e}")
+            return pd.DataFrame()
+    
     def get_available_regions(self) -> List[str]:
         """Get list of available geographic regions"""
         try:
@@ -13,6 +13,7 @@ from datetime import datetime
 import json
 import re
 from dashboard_config import dashboard_config
+from sample_queries import CHAT_SAMPLE_QUERIES
 from components.api_client import APIClient, APIException
 from components.data_transformer import DataTransformer
 from components.map_visualization import InteractiveMap
@@ -109,7 +110,10 @@ class ChatInterface:
             try:
                 if self.api_client:
                     # Send query to RAG pipeline
-                    response = self.api_client.query_rag_pipeline(query)
+                    if self.config.STREAM_ANSWERS:
+                        response = self._stream_query(query)
+                    else:
+                        response = self.api_client.query_rag_pipeline(query)
                     
                     if response:
                         # Process the response
@@ -157,6 +161,25 @@ class ChatInterface:
                 }
                 st.session_state.chat_history.append(error_message)
     
+    def _stream_query(self, query: str):
+        """Query the streaming endpoint, showing the answer as it is generated; returns the full response"""
+        placeholder = st.empty()
+        answer = []
+
+        def render(event: Dict[str, Any]) -> None:
+            if event.get('type') == 'context':
+                count = len(event.get('context_documents', []))
+                placeholder.markdown(f"🔍 Found {count} relevant document{'s' if count != 1 else ''}, writing the answer...")
+            elif event.get('type') == 'token':
+                answer.append(event.get('text', ''))
+                placeholder.markdown(''.join(answer) + " ▌")
+
+        try:
+            return self.api_client.stream_rag_pipeline(query, on_event=render)
+        finally:
+            # The finished answer is rendered with the chat history
+            placeholder.empty()
+    
     def _create_ai_response(self, query: str, response) -> Dict[str, Any]:
         """Create AI response message from RAG pipeline response"""
         
@@ -668,32 +691,7 @@ class ChatInterface:
     def _get_sample_queries(self) -> Dict[str, List[str]]:
         """Get sample queries organized by category"""
         
-        return {
-            'location': [
-                "Show me ARGO floats in the Arabian Sea",
-                "What floats are near the equator?",
-                "Find measurements in the Bay of Bengal",
-                "Where are the active floats located?"
-            ],
-            'temperature_salinity': [
-                "Show me temperature profiles near the equator in March 2023",
-                "Compare salinity patterns in different regions",
-                "What's the average temperature at 500m depth?",
-                "Find the warmest surface waters"
-            ],
-            'bgc': [
-                "Compare BGC parameters in the Arabian Sea for the last 6 months",
-                "Show me oxygen levels in deep water",
-                "Find areas with high chlorophyll concentration",
-                "What are the pH levels near the surface?"
-            ],
-            'analysis': [
-                "Give me a summary of available ARGO data",
-                "Compare data quality between different floats",
-                "Show trends in ocean temperature over time",
-                "What's the data coverage in the Indian Ocean?"
-            ]
-        }
+        return {category: list(queries) for category, queries in CHAT_SAMPLE_QUERIES.items()}
     
     def get_chat_statistics(self) -> Dict[str, Any]:
         """Get statistics about chat usage"""
@@ -390,7 +390,10 @@ class DashboardLayout:
             with tab3:
                 # Additional analysis content
                 st.subheader("📊 Advanced Analysis")
-                st.info("Advanced statistical analysis features will be expanded here")
+                
+                # Dataset-wide aggregates come pre-computed from the backend data cube
+                if st.session_state.get('api_client'):
+                    stats_manager.render_aggregate_statistics(st.session_state.api_client)
                 
                 # Show sample statistics visualization
                 if not current_data.empty:
@@ -509,7 +512,16 @@ class DashboardLayout:
                     if not float_data.empty:
                         # Create base map
                         if map_settings.get('show_density', False):
-                            fig = map_viz.create_density_heatmap(float_data)
+                            # Measurement density per cube cell, falling back to float positions
+                            cell_data = pd.DataFrame()
+                            if st.session_state.get('api_client'):
+                                cell_data = st.session_state.api_client.get_cube_statistics(['cell'], ['temperature'])
+                            if not cell_data.empty:
+                                fig = map_viz.create_density_heatmap(
+                                    map_viz.cube_cells_to_points(cell_data), weight_column='count'
+                                )
+                            else:
+                                fig = map_viz.create_density_heatmap(float_data)
                         else:
                             fig = map_viz.create_base_map()
                             
@@ -11,6 +11,7 @@ import numpy as np
 from typing import Dict, List, Optional, Tuple, Any
 import logging
 from datetime import datetime, timedelta
+import config
 from dashboard_config import dashboard_config
 
 logger = logging.getLogger(__name__)
@@ -322,8 +323,20 @@ class InteractiveMap:
         
         return pd.DataFrame(clustered_data)
     
-    def create_density_heatmap(self, float_data: pd.DataFrame, resolution: int = 50) -> go.Figure:
-        """Create a density heatmap of float locations"""
+    def cube_cells_to_points(self, cell_data: pd.DataFrame, cell_degrees: Optional[float] = None) -> pd.DataFrame:
+        """Convert data cube cells (south-west corners) to cell-center points for density maps"""
+        cell_degrees = cell_degrees or config.CUBE_CELL_DEGREES
+        if cell_data.empty or 'lat_cell' not in cell_data.columns:
+            return pd.DataFrame(columns=['lat', 'lon', 'count'])
+        
+        points = cell_data.groupby(['lat_cell', 'lon_cell'], as_index=False)['count'].sum()
+        points['lat'] = points['lat_cell'] + cell_degrees / 2
+        points['lon'] = points['lon_cell'] + cell_degrees / 2
+        return points[['lat', 'lon', 'count']]
+    
+    def create_density_heatmap(self, float_data: pd.DataFrame, resolution: int = 50,
+                               weight_column: Optional[str] = None) -> go.Figure:
+        """Create a density heatmap of float locations, optionally weighted (e.g. by cube cell counts)"""
         
         if float_data.empty or 'lat' not in float_data.columns or 'lon' not in float_data.columns:
             return self.create_base_map()
@@ -346,11 +359,11 @@ class InteractiveMap:
         fig.add_trace(go.Densitymapbox(
             lat=valid_data['lat'],
             lon=valid_data['lon'],
-            z=[1] * len(valid_data),  # Equal weight for all points
+            z=valid_data[weight_column] if weight_column else [1] * len(valid_data),  # Equal weight unless given
             radius=20,
             colorscale='Blues',
             showscale=True,
-            colorbar=dict(title="Float Density"),
+            colorbar=dict(title="Measurement Density" if weight_column else "Float Density"),
             hovertemplate='Density: %{z}<extra></extra>'
         ))
         
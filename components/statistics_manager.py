@@ -176,6 +176,40 @@ class StatisticsManager:
             logger.error(f"Error calculating statistics for {parameter}: {e}")
             return {}
     
+    def get_aggregate_statistics(self, api_client, group_by: List[str],
+                                 parameters: Optional[List[str]] = None, **filters) -> pd.DataFrame:
+        """
+        Get regional, depth or temporal aggregates from the backend data cube.
+        
+        The backend answers these from pre-aggregated cells, so the full measurement
+        set never has to be loaded into the dashboard.
+        
+        Args:
+            api_client: Connected APIClient instance
+            group_by: Cube dimensions ('hemisphere', 'depth', 'month', 'cell', 'parameter')
+            parameters: Parameters to aggregate (all cube parameters when omitted)
+            **filters: Region and lat/lon, depth and time bounds
+            
+        Returns:
+            DataFrame with count, mean, std, min and max per group and parameter
+        """
+        try:
+            if api_client is None:
+                return pd.DataFrame()
+            
+            stats = api_client.get_cube_statistics(group_by, parameters, **filters)
+            if stats.empty:
+                return stats
+            
+            if 'month' in stats.columns:
+                stats['month'] = pd.to_datetime(stats['month'])
+            stats['range'] = stats['max'] - stats['min']
+            return stats
+            
+        except Exception as e:
+            logger.error(f"Error getting aggregate statistics: {e}")
+            return pd.DataFrame()
+    
     def assess_data_quality(self, data: pd.DataFrame) -> Dict[str, Any]:
         """
         Assess data quality and identify issues.
@@ -641,4 +675,57 @@ class StatisticsManager:
             
         except Exception as e:
             logger.error(f"Error rendering parameter statistics: {e}")
-            st.error(f"Error displaying parameter statistics: {str(e)}")
\ No newline at end of file
+            st.error(f"Error displaying parameter statistics: {str(e)}")
+    
+    def render_aggregate_statistics(self, api_client) -> None:
+        """
+        Render cube-backed aggregate statistics section in Streamlit.
+        
+        Args:
+            api_client: Connected APIClient instance
+        """
+        try:
+            st.subheader("🧊 Regional, Depth and Temporal Aggregates")
+            
+            dimensions = {
+                "Hemisphere": "hemisphere",
+                "Depth Bin": "depth",
+                "Month": "month"
+            }
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                dimension_label = st.selectbox("Group by:", list(dimensions.keys()), key="cube_group_by")
+            with col2:
+                parameter = st.selectbox(
+                    "Parameter:",
+                    ['temperature', 'salinity', 'oxygen', 'ph', 'chlorophyll', 'nitrate'],
+                    key="cube_parameter"
+                )
+            
+            dimension = dimensions[dimension_label]
+            stats = self.get_aggregate_statistics(api_client, [dimension], [parameter])
+            
+            if stats.empty:
+                st.info("Aggregate statistics are not available from the backend")
+                return
+            
+            x_column = 'depth_min' if dimension == 'depth' else dimension
+            fig = go.Figure(go.Bar(
+                x=stats[x_column],
+                y=stats['mean'],
+                error_y=dict(type='data', array=stats['std'].fillna(0)),
+                name=parameter
+            ))
+            fig.update_layout(
+                title=f"Mean {parameter} by {dimension_label.lower()}",
+                xaxis_title=dimension_label,
+                yaxis_title=parameter,
+                height=400
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(stats, use_container_width=True)
+            
+        except Exception as e:
+            logger.error(f"Error rendering aggregate statistics: {e}")
+            st.error(f"Error displaying aggregate statistics: {str(e)}")
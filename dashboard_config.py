@@ -21,6 +21,7 @@ class DashboardConfig:
     # Chat Configuration
     MAX_QUERY_LENGTH: int = 500
     CHAT_HISTORY_LIMIT: int = 50
+    STREAM_ANSWERS: bool = config.CHAT_STREAMING  # Render answers token by token from /query/stream
     
     # Performance Configuration
     CACHE_TTL: int = 3600  # 1 hour in seconds
@@ -1,180 +1,278 @@
 """
 ChromaDB ingestion for proper ARGO float data structure
 Creates embeddings that understand float profiles and relationships
+Collections are synced incrementally: only new or changed documents are embedded
 """
 
-from sqlalchemy import create_engine
+import argparse
+import numpy as np
 import pandas as pd
 import chromadb
-from sentence_transformers import SentenceTransformer
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 import config
+from database import get_engine, get_data_version
+from embedding_cache import CachedEncoder, get_embedding_cache
+from lexical_index import get_lexical_index, index_path
+from mmap_store import MmapClient
+from embedding_pipeline import (
+    DocumentBatch, ProcessPoolEncoder, SyncStats, attach_content_hashes, iter_query_chunks, sync_collection
+)
 
-embed_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+MEASUREMENT_COLLECTION = "argo_measurements"
+PROFILE_COLLECTION = "argo_profiles"
 
-client = chromadb.EphemeralClient() if config.VECTOR_STORE == "memory" else chromadb.PersistentClient(path=config.CHROMA_PATH)
+# Above this many changed profiles a scoped sync is no cheaper than diffing everything
+MAX_SCOPED_PROFILES = 10000
 
-# Delete old collection and create new one
-try:
-    client.delete_collection(name="argo_measurements")
-    print("Deleted old collection")
-except:
-    pass
+# Float and profile context for every measurement. No ORDER BY, so the server-side cursor
+# starts streaming at once instead of after sorting the whole join
+MEASUREMENT_SQL = """
+SELECT 
+    m.id,
+    m.profile_id,
+    m.float_id,
+    m.time,
+    m.lat,
+    m.lon,
+    m.depth,
+    m.temperature,
+    m.salinity,
+    m.oxygen,
+    m.ph,
+    m.chlorophyll,
+    f.wmo_id,
+    f.deployment_date,
+    p.cycle_number,
+    p.profile_date,
+    p.n_levels
+FROM measurements m
+JOIN profiles p ON m.profile_id = p.profile_id
+JOIN floats f ON m.float_id = f.float_id
+{where}
+"""
 
-collection = client.get_or_create_collection(
-    name="argo_measurements",
-    embedding_function=embed_model.encode
-)
+engine = get_engine()
+
+def get_client():
+    if config.VECTOR_STORE == "memory":
+        return chromadb.EphemeralClient()
+    if config.VECTOR_STORE == "mmap":
+        return MmapClient(config.MMAP_STORE_PATH)
+    return chromadb.PersistentClient(path=config.CHROMA_PATH)
+
+def get_collection(client, name):
+    """Open or create a collection; embeddings are always supplied precomputed"""
+    return client.get_or_create_collection(name=name, embedding_function=None)
 
-engine = create_engine(config.DATABASE_URL)
-
-def create_float_aware_embeddings():
-    """Create embeddings that understand ARGO float context and profiles"""
-    
-    # Get comprehensive data with float and profile context
-    sql_query = """
-    SELECT 
-        m.id,
-        m.profile_id,
-        m.float_id,
-        m.time,
-        m.lat,
-        m.lon,
-        m.depth,
-        m.temperature,
-        m.salinity,
-        m.oxygen,
-        m.ph,
-        m.chlorophyll,
-        f.wmo_id,
-        f.deployment_date,
-        p.cycle_number,
-        p.profile_date,
-        p.n_levels
-    FROM measurements m
-    JOIN profiles p ON m.profile_id = p.profile_id
-    JOIN floats f ON m.float_id = f.float_id
-    ORDER BY m.float_id, p.cycle_number, m.depth;
+def reset_collection(client, name):
+    """Drop a collection and create it empty"""
+    try:
+        client.delete_collection(name=name)
+        print(f"Deleted old collection {name}")
+    except Exception:
+        pass
+    return get_collection(client, name)
+
+def changed_profiles_since(synced_version, current_version):
     """
+    Profile ids inserted or updated by ingests after synced_version, from the ingest change log
     
-    df_from_postgres = pd.read_sql_query(sql_query, engine)
-    print(f"Processing {len(df_from_postgres)} measurements from {df_from_postgres['float_id'].nunique()} floats...")
+    Returns None when the log cannot account for every version in between (missing
+    table, or data loaded by something other than argo_float_processor), in which case
+    the whole collection has to be diffed.
+    """
+    try:
+        with engine.connect() as conn:
+            covered = conn.execute(text("""
+                SELECT COUNT(DISTINCT data_version) FROM ingest_changes
+                WHERE data_version > :synced AND data_version <= :current
+            """), {'synced': synced_version, 'current': current_version}).scalar()
+            if covered != current_version - synced_version:
+                return None
+            rows = conn.execute(text("""
+                SELECT DISTINCT profile_id FROM ingest_changes
+                WHERE data_version > :synced AND data_version <= :current
+            """), {'synced': synced_version, 'current': current_version})
+            return [int(profile_id) for profile_id, in rows]
+    except SQLAlchemyError:
+        return None
+
+def get_encoder():
+    """SentenceTransformer worker processes, behind the embedding cache when EMBED_CACHE is on"""
+    encoder = ProcessPoolEncoder()
+    if config.EMBED_CACHE:
+        return CachedEncoder(encoder, get_embedding_cache(encoder.model_id))
+    return encoder
+
+def sync_embeddings(collection_name, sql, build, encoder=None, client=None, full_diff=False, rebuild=False):
+    """
+    Sync one collection with the rows of sql (which has a {where} placeholder); returns SyncStats
     
-    # Limit documents for testing
-    if len(df_from_postgres) > config.MAX_DOCUMENTS:
-        df_from_postgres = df_from_postgres.head(config.MAX_DOCUMENTS)
-        print(f"Limited to {config.MAX_DOCUMENTS} documents for testing")
+    After an ingest only the profiles in the change log since the collection's
+    synced_data_version are compared; full_diff compares every document and rebuild
+    drops the collection first. A scoped sync that leaves the collection with a different
+    document count than the source (e.g. after a full reload) falls back to a full diff;
+    with MAX_DOCUMENTS set every sync is a full diff.
+    """
+    client = client or get_client()
+    collection = reset_collection(client, collection_name) if rebuild else get_collection(client, collection_name)
+    lexical = get_lexical_index(collection) if config.LEXICAL_INDEX else None
+    current_version = get_data_version(engine, max_age=0)
+    synced_version = (collection.metadata or {}).get('synced_data_version')
     
-    batch_size = config.BATCH_SIZE
-    total_rows = len(df_from_postgres)
+    scope = None
+    if not full_diff and not config.MAX_DOCUMENTS and synced_version is not None and collection.count() > 0:
+        scope = changed_profiles_since(synced_version, current_version)
+        if scope is not None and len(scope) > MAX_SCOPED_PROFILES:
+            scope = None
+    if scope == []:
+        print(f"✅ {collection_name} already in sync with data version {current_version}")
+        return SyncStats()
     
-    for i in range(0, total_rows, batch_size):
-        batch_df = df_from_postgres.iloc[i:i+batch_size]
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for index, row in batch_df.iterrows():
-            # Create rich, contextual descriptions
-            temp_str = f"{row['temperature']:.2f}°C" if pd.notna(row['temperature']) else "not available"
-            sal_str = f"{row['salinity']:.2f} PSU" if pd.notna(row['salinity']) else "not available"
-            
-            # Add BGC information
-            bgc_info = ""
-            if pd.notna(row['oxygen']):
-                bgc_info += f" The dissolved oxygen was {row['oxygen']:.2f} ml/L."
-            if pd.notna(row['ph']):
-                bgc_info += f" The pH was {row['ph']:.2f}."
-            if pd.notna(row['chlorophyll']) and row['chlorophyll'] > 0.01:
-                bgc_info += f" The chlorophyll concentration was {row['chlorophyll']:.3f} mg/m³."
-            
-            # Create comprehensive document with float context
-            doc = (
-                f"ARGO float {row['float_id']} (WMO ID: {row['wmo_id']}) recorded measurements "
-                f"on {row['time'].strftime('%Y-%m-%d')} during cycle {row['cycle_number']}. "
-                f"The float was located at latitude {row['lat']:.3f}° and longitude {row['lon']:.3f}°. "
-                f"At a depth of {row['depth']:.1f} meters, the temperature was {temp_str} "
-                f"and the salinity was {sal_str}.{bgc_info} "
-                f"This measurement was part of a profile with {row['n_levels']} depth levels. "
-                f"The float was deployed on {row['deployment_date']}."
-            )
-            
-            # Rich metadata for retrieval
-            meta = {
-                'postgres_id': int(row['id']),
-                'profile_id': int(row['profile_id']),
-                'float_id': str(row['float_id']),
-                'wmo_id': int(row['wmo_id']),
-                'cycle_number': int(row['cycle_number']),
-                'time': row['time'].strftime('%Y-%m-%d'),
-                'profile_date': row['profile_date'].strftime('%Y-%m-%d'),
-                'depth': float(row['depth']),
-                'lat': float(row['lat']),
-                'lon': float(row['lon']),
-                'n_levels': int(row['n_levels']),
-                'has_bgc': bool(pd.notna(row['oxygen']) or pd.notna(row['ph']) or pd.notna(row['chlorophyll']))
-            }
-            
-            documents.append(doc)
-            metadatas.append(meta)
-            ids.append(str(row['id']))
-        
-        if documents:
-            collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
-            print(f"Added batch {i//batch_size + 1}, total documents: {collection.count()}")
-    
-    print(f"✅ Completed! There are now {collection.count()} documents in the collection")
-
-def create_profile_summaries():
-    """Create additional embeddings for profile-level summaries"""
-    
-    # Get profile summaries
-    profile_sql = """
-    SELECT 
-        p.profile_id,
-        p.float_id,
-        p.cycle_number,
-        p.profile_date,
-        p.profile_lat,
-        p.profile_lon,
-        p.n_levels,
-        f.wmo_id,
-        AVG(m.temperature) as avg_temp,
-        MIN(m.temperature) as min_temp,
-        MAX(m.temperature) as max_temp,
-        AVG(m.salinity) as avg_sal,
-        MIN(m.salinity) as min_sal,
-        MAX(m.salinity) as max_sal,
-        MIN(m.depth) as min_depth,
-        MAX(m.depth) as max_depth,
-        AVG(m.oxygen) as avg_oxygen,
-        AVG(m.ph) as avg_ph,
-        AVG(m.chlorophyll) as avg_chlorophyll
-    FROM profiles p
-    JOIN floats f ON p.float_id = f.float_id
-    JOIN measurements m ON p.profile_id = m.profile_id
-    GROUP BY p.profile_id, p.float_id, p.cycle_number, p.profile_date, 
-             p.profile_lat, p.profile_lon, p.n_levels, f.wmo_id
-    ORDER BY p.profile_date;
+    limit = f"ORDER BY 1 LIMIT {config.MAX_DOCUMENTS}" if config.MAX_DOCUMENTS > 0 else ""
+    if config.MAX_DOCUMENTS > 0:
+        print(f"Limited to {config.MAX_DOCUMENTS} documents")
+    if scope is None:
+        chunks = iter_query_chunks(sql.format(where="") + limit, engine)
+        where = None
+    else:
+        print(f"Syncing {len(scope)} profiles changed since data version {synced_version}")
+        chunks = iter_query_chunks(sql.format(where="WHERE p.profile_id = ANY(:profile_ids)"), engine,
+                                   params={'profile_ids': scope})
+        where = {'profile_id': {'$in': scope}}
+    
+    owns_encoder = encoder is None
+    encoder = encoder or get_encoder()
+    try:
+        stats = sync_collection(chunks, build, encoder, collection, where, lexical=lexical)
+        if scope is not None:
+            with engine.connect() as conn:
+                source_count = conn.execute(text(f"SELECT COUNT(*) FROM ({sql.format(where='')}) s")).scalar()
+            if collection.count() != source_count:
+                print(f"{collection_name} has {collection.count()} documents for {source_count} rows; diffing everything")
+                scoped = stats
+                stats = sync_collection(iter_query_chunks(sql.format(where=""), engine), build, encoder, collection,
+                                        lexical=lexical)
+                stats.added += scoped.added
+                stats.updated += scoped.updated
+                stats.deleted += scoped.deleted
+                stats.seconds += scoped.seconds
+    finally:
+        if owns_encoder:
+            encoder.close()
+    
+    if lexical is not None:
+        lexical.save(index_path(collection_name))
+    collection.modify(metadata={'synced_data_version': current_version})
+    print(f"✅ {collection_name}: {collection.count()} documents, synced to data version {current_version}")
+    return stats
+
+def _fixed(series, decimals):
+    """Format a numeric column with a fixed number of decimals ('nan' where missing)"""
+    return pd.Series(np.char.mod(f"%.{decimals}f", series.to_numpy(dtype=float)), index=series.index)
+
+def _dates(series):
+    return pd.to_datetime(series).dt.strftime('%Y-%m-%d')
+
+def build_measurement_documents(df) -> DocumentBatch:
     """
+    Documents, metadata and ids for a chunk of measurement rows
     
-    profiles_df = pd.read_sql_query(profile_sql, engine)
-    print(f"Creating profile summaries for {len(profiles_df)} profiles...")
+    Column-wise string operations over the whole chunk; the text is the same as the
+    per-row descriptions used so far, so existing queries retrieve the same way.
+    """
+    temperature = df['temperature'].notna()
+    salinity = df['salinity'].notna()
+    oxygen = df['oxygen'].notna()
+    ph = df['ph'].notna()
+    chlorophyll = df['chlorophyll'].notna() & (df['chlorophyll'] > 0.01)
     
-    # Create a separate collection for profile summaries
-    try:
-        client.delete_collection(name="argo_profiles")
-    except:
-        pass
+    # Create rich, contextual descriptions
+    temp_str = (_fixed(df['temperature'], 2) + "°C").where(temperature, "not available")
+    sal_str = (_fixed(df['salinity'], 2) + " PSU").where(salinity, "not available")
+    
+    # Add BGC information
+    bgc_info = (
+        (" The dissolved oxygen was " + _fixed(df['oxygen'], 2) + " ml/L.").where(oxygen, "")
+        + (" The pH was " + _fixed(df['ph'], 2) + ".").where(ph, "")
+        + (" The chlorophyll concentration was " + _fixed(df['chlorophyll'], 3) + " mg/m³.").where(chlorophyll, "")
+    )
     
-    profile_collection = client.get_or_create_collection(
-        name="argo_profiles",
-        embedding_function=embed_model.encode
+    time = _dates(df['time'])
+    documents = (
+        "ARGO float " + df['float_id'].astype(str) + " (WMO ID: " + df['wmo_id'].astype(str) + ") recorded measurements "
+        + "on " + time + " during cycle " + df['cycle_number'].astype(str) + ". "
+        + "The float was located at latitude " + _fixed(df['lat'], 3) + "° and longitude " + _fixed(df['lon'], 3) + "°. "
+        + "At a depth of " + _fixed(df['depth'], 1) + " meters, the temperature was " + temp_str + " "
+        + "and the salinity was " + sal_str + "." + bgc_info + " "
+        + "This measurement was part of a profile with " + df['n_levels'].astype(str) + " depth levels. "
+        + "The float was deployed on " + _dates(df['deployment_date']) + "."
     )
     
+    # Rich metadata for retrieval; yyyymmdd repeats the date as a number for Chroma range filters
+    metadatas = pd.DataFrame({
+        'postgres_id': df['id'].astype('int64'),
+        'profile_id': df['profile_id'].astype('int64'),
+        'float_id': df['float_id'].astype(str),
+        'wmo_id': df['wmo_id'].astype('int64'),
+        'cycle_number': df['cycle_number'].astype('int64'),
+        'time': time,
+        'profile_date': _dates(df['profile_date']),
+        'yyyymmdd': time.str.replace('-', '', regex=False).astype('int64'),
+        'depth': df['depth'].astype(float),
+        'lat': df['lat'].astype(float),
+        'lon': df['lon'].astype(float),
+        'n_levels': df['n_levels'].astype('int64'),
+        'has_bgc': oxygen | ph | df['chlorophyll'].notna()
+    }).to_dict('records')
+    
+    documents = documents.tolist()
+    attach_content_hashes(documents, metadatas)
+    return df['id'].astype(str).tolist(), documents, metadatas
+
+def create_float_aware_embeddings(encoder=None, client=None, full_diff=False, rebuild=False):
+    """
+    Embed every measurement with its float and profile context; returns SyncStats
+    
+    Rows stream from the database in chunks while earlier chunks are turned into
+    documents and encoded, and only documents that are new or changed since the last
+    sync are embedded. MAX_DOCUMENTS > 0 caps the number of measurements embedded.
+    """
+    return sync_embeddings(MEASUREMENT_COLLECTION, MEASUREMENT_SQL, build_measurement_documents,
+                           encoder, client, full_diff, rebuild)
+
+PROFILE_SQL = """
+SELECT 
+    p.profile_id,
+    p.float_id,
+    p.cycle_number,
+    p.profile_date,
+    p.profile_lat,
+    p.profile_lon,
+    p.n_levels,
+    f.wmo_id,
+    AVG(m.temperature) as avg_temp,
+    MIN(m.temperature) as min_temp,
+    MAX(m.temperature) as max_temp,
+    AVG(m.salinity) as avg_sal,
+    MIN(m.salinity) as min_sal,
+    MAX(m.salinity) as max_sal,
+    MIN(m.depth) as min_depth,
+    MAX(m.depth) as max_depth,
+    AVG(m.oxygen) as avg_oxygen,
+    AVG(m.ph) as avg_ph,
+    AVG(m.chlorophyll) as avg_chlorophyll
+FROM profiles p
+JOIN floats f ON p.float_id = f.float_id
+JOIN measurements m ON p.profile_id = m.profile_id
+{where}
+GROUP BY p.profile_id, p.float_id, p.cycle_number, p.profile_date, 
+         p.profile_lat, p.profile_lon, p.n_levels, f.wmo_id
+"""
+
+def build_profile_documents(profiles_df) -> DocumentBatch:
+    """Summary documents, metadata and ids for a chunk of profile aggregates"""
     documents = []
     metadatas = []
     ids = []
@@ -206,34 +304,52 @@ def create_profile_summaries():
             'wmo_id': int(row['wmo_id']),
             'cycle_number': int(row['cycle_number']),
             'profile_date': row['profile_date'].strftime('%Y-%m-%d'),
+            'yyyymmdd': int(row['profile_date'].strftime('%Y%m%d')),
             'lat': float(row['profile_lat']),
             'lon': float(row['profile_lon']),
             'n_levels': int(row['n_levels']),
             'min_depth': float(row['min_depth']),
             'max_depth': float(row['max_depth']),
-            'min_temp': float(row['min_temp']) if pd.notna(row['min_temp']) else None,
-            'max_temp': float(row['max_temp']) if pd.notna(row['max_temp']) else None,
             'has_bgc': bool(pd.notna(row['avg_oxygen']))
         }
+        # Chroma rejects None metadata values, so temperature bounds are only set when known
+        if pd.notna(row['min_temp']):
+            meta['min_temp'] = float(row['min_temp'])
+            meta['max_temp'] = float(row['max_temp'])
         
         documents.append(doc)
         metadatas.append(meta)
         ids.append(f"profile_{row['profile_id']}")
     
-    if documents:
-        profile_collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
-        print(f"✅ Added {len(documents)} profile summaries")
+    attach_content_hashes(documents, metadatas)
+    return ids, documents, metadatas
+
+def create_profile_summaries(encoder=None, client=None, full_diff=False, rebuild=False):
+    """Embed one summary document per profile, the index /query searches first; returns SyncStats"""
+    print("Creating profile summaries...")
+    return sync_embeddings(PROFILE_COLLECTION, PROFILE_SQL, build_profile_documents,
+                           encoder, client, full_diff, rebuild)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync the ARGO Chroma collections with PostgreSQL")
+    parser.add_argument("--full-diff", action="store_true", help="Compare every document, not just profiles changed since the last sync")
+    parser.add_argument("--rebuild", action="store_true", help="Drop the collections and embed everything again")
+    parser.add_argument("--measurements", action="store_true",
+                        help="Also sync the per-measurement collection (always done with RETRIEVAL_TIER=measurements)")
+    args = parser.parse_args()
+    
     print("🌊 Creating ARGO Float-Aware Embeddings")
     print("=" * 50)
     
-    create_float_aware_embeddings()
-    # create_profile_summaries()  # Skip for now due to metadata format issue
+    with get_encoder() as encoder:
+        # /query searches profile summaries and drills down to measurements in Postgres
+        stats = create_profile_summaries(encoder, full_diff=args.full_diff, rebuild=args.rebuild)
+        if config.RETRIEVAL_TIER == "measurements" or args.measurements:
+            stats = create_float_aware_embeddings(encoder, full_diff=args.full_diff, rebuild=args.rebuild)
+    if stats.embedding is not None:
+        print(f"Throughput: {stats.embedding.docs_per_second:,.0f} docs/s with {config.EMBED_WORKERS} encoder workers")
+    if isinstance(encoder, CachedEncoder):
+        print(f"Reused vectors: {encoder.cache}")
     
     print("\n✅ ChromaDB updated with proper ARGO float structure!")
     print("Now your queries can understand:")
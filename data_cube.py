@@ -0,0 +1,365 @@
+"""
+Pre-aggregated spatio-temporal data cube
+Stores additive statistics (count, sum, sum of squares, min, max) per depth bin, lat/lon cell,
+month and parameter, so regional, depth and temporal AVG/STD are answered from a few thousand
+cube rows instead of scanning measurements
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+import config
+from bulk_loader import copy_dataframe
+from database import get_engine
+from query_constraints import QueryConstraints
+
+CUBE_TABLE = 'measurement_cube'
+
+CUBE_PARAMETERS = [
+    'temperature', 'salinity', 'oxygen', 'ph', 'chlorophyll',
+    'nitrate', 'backscatter', 'cdom', 'downwelling_par'
+]
+
+# Depth bins are left-closed, [edge_i, edge_i+1), matching the depth-zone templates
+DEPTH_BIN_EDGES = config.CUBE_DEPTH_EDGES
+CELL_DEGREES = config.CUBE_CELL_DEGREES
+
+CUBE_KEY = ['parameter', 'month', 'depth_bin', 'lat_cell', 'lon_cell']
+CUBE_STATS = ['value_count', 'value_sum', 'value_sum_sq', 'value_min', 'value_max']
+
+# Group-by dimensions accepted by query_cube, as SQL select expressions
+CUBE_DIMENSIONS = {
+    'parameter': ['parameter'],
+    'month': ['month'],
+    'depth': ['depth_bin', 'depth_min', 'depth_max'],
+    'cell': ['lat_cell', 'lon_cell'],
+    # The templates put lat > 0 in the north; the [0, CELL_DEGREES) cell also holds lat = 0
+    # exactly, which the cube can only count as northern
+    'hemisphere': ["CASE WHEN lat_cell >= 0 THEN 'Northern Hemisphere' ELSE 'Southern Hemisphere' END AS hemisphere"]
+}
+
+CREATE_CUBE_SQL = f"""
+CREATE TABLE {CUBE_TABLE} (
+    parameter VARCHAR(32) NOT NULL,
+    month TIMESTAMP NOT NULL,
+    depth_bin INTEGER NOT NULL,
+    depth_min FLOAT,
+    depth_max FLOAT,
+    lat_cell FLOAT NOT NULL,
+    lon_cell FLOAT NOT NULL,
+    value_count BIGINT NOT NULL,
+    value_sum DOUBLE PRECISION,
+    value_sum_sq DOUBLE PRECISION,
+    value_min DOUBLE PRECISION,
+    value_max DOUBLE PRECISION,
+    PRIMARY KEY (parameter, month, depth_bin, lat_cell, lon_cell)
+)
+"""
+
+def compute_cube(measurements: pd.DataFrame, parameters: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Aggregate a measurements frame into cube rows (one per key with at least one value)
+
+    All parameters are aggregated in a single groupby over the binned keys; nulls are
+    skipped per parameter, so each parameter carries its own count.
+    """
+    parameters = [p for p in (parameters or CUBE_PARAMETERS) if p in measurements.columns]
+    if measurements.empty or not parameters:
+        return pd.DataFrame(columns=CUBE_KEY + ['depth_min', 'depth_max'] + CUBE_STATS)
+
+    edges = np.asarray(DEPTH_BIN_EDGES, dtype=float)
+    depth = measurements['depth'].to_numpy(dtype=float)
+    keys = pd.DataFrame({
+        'month': pd.to_datetime(measurements['time']).dt.to_period('M').dt.to_timestamp().to_numpy(),
+        'depth_bin': np.clip(np.searchsorted(edges, depth, side='right') - 1, 0, len(edges) - 2),
+        'lat_cell': np.floor(measurements['lat'].to_numpy(dtype=float) / CELL_DEGREES) * CELL_DEGREES,
+        'lon_cell': np.floor(measurements['lon'].to_numpy(dtype=float) / CELL_DEGREES) * CELL_DEGREES
+    })
+
+    values = measurements[parameters].astype(float).reset_index(drop=True)
+    squares = (values ** 2).add_suffix('__sq')
+    frame = pd.concat([keys, values, squares], axis=1)
+    grouped = frame.groupby(['month', 'depth_bin', 'lat_cell', 'lon_cell'], sort=False)
+
+    stats = {
+        'value_count': grouped[parameters].count(),
+        'value_sum': grouped[parameters].sum(),
+        'value_sum_sq': grouped[list(squares.columns)].sum().rename(columns=lambda c: c[:-4]),
+        'value_min': grouped[parameters].min(),
+        'value_max': grouped[parameters].max()
+    }
+
+    # Wide (one column per parameter) -> long (one row per parameter)
+    cube = pd.concat({name: df.stack(future_stack=True) for name, df in stats.items()}, axis=1)
+    cube.index = cube.index.set_names('parameter', level=-1)
+    cube = cube[cube['value_count'] > 0].reset_index()
+    return _finish_cube(cube)
+
+def merge_cubes(cubes: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Combine partial cubes (e.g. from chunks or new batches); every statistic is additive or min/max"""
+    combined = pd.concat([cube for cube in cubes if not cube.empty], ignore_index=True)
+    if combined.empty:
+        return combined
+    merged = combined.groupby(CUBE_KEY, sort=False).agg({
+        'value_count': 'sum',
+        'value_sum': 'sum',
+        'value_sum_sq': 'sum',
+        'value_min': 'min',
+        'value_max': 'max'
+    }).reset_index()
+    return _finish_cube(merged)
+
+def _finish_cube(cube: pd.DataFrame) -> pd.DataFrame:
+    """Attach bin edges and fix column order/types"""
+    edges = np.asarray(DEPTH_BIN_EDGES, dtype=float)
+    cube['depth_bin'] = cube['depth_bin'].astype(int)
+    cube['value_count'] = cube['value_count'].astype('int64')
+    cube['depth_min'] = edges[cube['depth_bin']]
+    cube['depth_max'] = edges[cube['depth_bin'] + 1]
+    return cube[CUBE_KEY + ['depth_min', 'depth_max'] + CUBE_STATS]
+
+def write_data_cube(cube: pd.DataFrame, engine: Optional[Engine] = None):
+    """
+    Replace the cube table with the given cube rows
+
+    The rows are loaded into a staging table that is renamed over the cube in the same
+    transaction, so readers see the old cube or the new one, never an empty or partial one.
+    """
+    engine = engine or get_engine()
+    staging = f"{CUBE_TABLE}_staging"
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+        conn.execute(text(CREATE_CUBE_SQL.replace(CUBE_TABLE, staging)))
+        copy_dataframe(cube, staging, connection=conn, verbose=False)
+        conn.execute(text(f"DROP TABLE IF EXISTS {CUBE_TABLE}"))
+        conn.execute(text(f"ALTER TABLE {staging} RENAME TO {CUBE_TABLE}"))
+        if conn.dialect.name == 'postgresql':
+            # The primary key index keeps the name it was created with
+            conn.execute(text(f"ALTER INDEX IF EXISTS {staging}_pkey RENAME TO {CUBE_TABLE}_pkey"))
+        conn.execute(text(f"CREATE INDEX idx_{CUBE_TABLE}_cell ON {CUBE_TABLE} (parameter, lat_cell, lon_cell)"))
+        conn.commit()
+
+def merge_into_data_cube(delta: pd.DataFrame, engine: Optional[Engine] = None) -> int:
+    """
+    Add the cube of newly inserted measurements to the stored cube; returns the rows touched
+
+    Counts and sums add and min/max combine, so appending measurements never needs a rebuild.
+    Rewritten or deleted measurements do: their old contribution cannot be subtracted from min/max.
+    """
+    if delta.empty:
+        return 0
+    engine = engine or get_engine()
+    key = ', '.join(CUBE_KEY)
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE TEMP TABLE staging_cube (LIKE {CUBE_TABLE}) ON COMMIT DROP"))
+        copy_dataframe(delta, 'staging_cube', connection=conn, analyze=False, verbose=False)
+        conn.execute(text(f"""
+            INSERT INTO {CUBE_TABLE} SELECT * FROM staging_cube
+            ON CONFLICT ({key}) DO UPDATE SET
+                value_count = {CUBE_TABLE}.value_count + EXCLUDED.value_count,
+                value_sum = {CUBE_TABLE}.value_sum + EXCLUDED.value_sum,
+                value_sum_sq = {CUBE_TABLE}.value_sum_sq + EXCLUDED.value_sum_sq,
+                value_min = LEAST({CUBE_TABLE}.value_min, EXCLUDED.value_min),
+                value_max = GREATEST({CUBE_TABLE}.value_max, EXCLUDED.value_max)
+        """))
+        conn.commit()
+    return len(delta)
+
+def build_data_cube(engine: Optional[Engine] = None, measurements: Optional[pd.DataFrame] = None,
+                    chunksize: int = 200000) -> int:
+    """
+    Build the cube and store it; returns the number of cube rows
+
+    Pass the frame that was just ingested to avoid re-reading it; otherwise measurements
+    are streamed from the database in chunks and the partial cubes merged.
+    """
+    engine = engine or get_engine()
+    if measurements is not None:
+        cube = compute_cube(measurements)
+    else:
+        columns = ', '.join(['time', 'lat', 'lon', 'depth'] + CUBE_PARAMETERS)
+        chunks = pd.read_sql_query(f"SELECT {columns} FROM measurements", engine, chunksize=chunksize)
+        cube = merge_cubes(compute_cube(chunk) for chunk in chunks)
+
+    write_data_cube(cube, engine)
+    return len(cube)
+
+def data_cube_available(engine: Optional[Engine] = None) -> bool:
+    """Whether the cube table exists"""
+    return inspect(engine or get_engine()).has_table(CUBE_TABLE)
+
+def _is_multiple(value: float, step: float) -> bool:
+    return abs(value / step - round(value / step)) < 1e-9
+
+def cube_covers(constraints: QueryConstraints) -> bool:
+    """
+    Whether the cube can answer a constrained query exactly at its resolution
+
+    Bounds must fall on cell edges, depth bin edges and month starts; float/WMO filters
+    need the raw rows.
+    """
+    if constraints.float_ids or constraints.wmo_ids:
+        return False
+    for bound in (constraints.lat_min, constraints.lat_max, constraints.lon_min, constraints.lon_max):
+        if bound is not None and not _is_multiple(bound, CELL_DEGREES):
+            return False
+    for bound in (constraints.depth_min, constraints.depth_max):
+        if bound is not None and bound not in DEPTH_BIN_EDGES:
+            return False
+    for bound in (constraints.time_start, constraints.time_end):
+        if bound is not None and (bound.day != 1 or bound.hour or bound.minute or bound.second):
+            return False
+    return True
+
+def cube_filters(constraints: QueryConstraints) -> Tuple[str, Dict]:
+    """
+    Render constraints as predicates on the cube table
+
+    Cells are selected by their south-west corner: a cell [c, c + CELL_DEGREES) is inside
+    [lat_min, lat_max] when lat_min <= c < lat_max, so the cell starting on the upper bound is
+    left out. Unlike the base templates, values exactly on lat_max/lon_max are then not
+    counted. Depth bins must lie inside the requested range; the clause starts with " AND "
+    like QueryConstraints.to_sql_filters.
+    """
+    bounds = [
+        ('lat_cell', '>=', 'lat_min', constraints.lat_min),
+        ('lat_cell', '<', 'lat_max', constraints.lat_max),
+        ('lon_cell', '>=', 'lon_min', constraints.lon_min),
+        ('lon_cell', '<', 'lon_max', constraints.lon_max),
+        ('month', '>=', 'time_start', constraints.time_start),
+        ('month', '<', 'time_end', constraints.time_end),
+        ('depth_min', '>=', 'depth_min', constraints.depth_min),
+        ('depth_max', '<=', 'depth_max', constraints.depth_max)
+    ]
+    clauses = []
+    params = {}
+    for column, operator, name, value in bounds:
+        if value is not None:
+            clauses.append(f"{column} {operator} :{name}")
+            params[name] = value
+    return ''.join(f" AND {clause}" for clause in clauses), params
+
+def query_cube(group_by: List[str], parameters: Optional[List[str]] = None,
+               constraints: Optional[QueryConstraints] = None,
+               engine: Optional[Engine] = None) -> pd.DataFrame:
+    """
+    Aggregate the cube along the given dimensions
+
+    Returns one row per group and parameter with count, mean, std (sample), min and max.
+    """
+    unknown = [dim for dim in group_by if dim not in CUBE_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown cube dimensions: {unknown}")
+
+    parameters = parameters or CUBE_PARAMETERS
+    select = [expr for dim in group_by for expr in CUBE_DIMENSIONS[dim]]
+    if 'parameter' not in group_by:
+        select.append('parameter')
+    group_columns = [expr.split(' AS ')[-1] for expr in select]
+
+    names = [f"param_{i}" for i in range(len(parameters))]
+    params = dict(zip(names, parameters))
+    filters, filter_params = cube_filters(constraints or QueryConstraints())
+    params.update(filter_params)
+
+    sql = f"""
+        SELECT {', '.join(select)},
+               SUM(value_count) AS value_count,
+               SUM(value_sum) AS value_sum,
+               SUM(value_sum_sq) AS value_sum_sq,
+               MIN(value_min) AS value_min,
+               MAX(value_max) AS value_max
+        FROM {CUBE_TABLE}
+        WHERE parameter IN ({', '.join(':' + n for n in names)}){filters}
+        GROUP BY {', '.join(group_columns)}
+        ORDER BY {', '.join(group_columns)}
+    """
+    with (engine or get_engine()).connect() as conn:
+        df = pd.read_sql_query(text(sql), conn, params=params)
+
+    count = df['value_count'].astype(float)
+    df['count'] = df['value_count'].astype('int64')
+    df['mean'] = df['value_sum'] / count
+    variance = (df['value_sum_sq'] - df['value_sum'] ** 2 / count) / (count - 1)
+    df['std'] = np.sqrt(variance.clip(lower=0)).where(count > 1)
+    df = df.rename(columns={'value_min': 'min', 'value_max': 'max'})
+    return df[group_columns + ['count', 'mean', 'std', 'min', 'max']]
+
+def _avg(parameter: str) -> str:
+    return (f"SUM(CASE WHEN parameter = '{parameter}' THEN value_sum END) / "
+            f"NULLIF(SUM(CASE WHEN parameter = '{parameter}' THEN value_count END), 0)")
+
+def _count(parameter: str) -> str:
+    return f"CAST(SUM(CASE WHEN parameter = '{parameter}' THEN value_count END) AS BIGINT)"
+
+# Cube-backed versions of the analytical templates, returning the same columns.
+# Averages are per parameter over its own non-null values; {filters} takes cube_filters().
+CUBE_TEMPLATE_QUERIES = {
+    'regional_comparison': f"""
+        SELECT
+            -- lat = 0 exactly is northern here and southern in the base template (see CUBE_DIMENSIONS)
+            CASE
+                WHEN lat_cell >= 0 THEN 'Northern Hemisphere'
+                ELSE 'Southern Hemisphere'
+            END as region,
+            {_avg('temperature')} as avg_temperature,
+            {_avg('salinity')} as avg_salinity,
+            {_avg('oxygen')} as avg_oxygen,
+            {_count('temperature')} as measurement_count
+        FROM {CUBE_TABLE}
+        WHERE parameter IN ('temperature', 'salinity', 'oxygen'){{filters}}
+        GROUP BY 1
+        ORDER BY 1;
+    """,
+
+    'depth_ranges': f"""
+        SELECT
+            CASE
+                WHEN depth_min < 100 THEN 'Surface (0-100m)'
+                WHEN depth_min < 500 THEN 'Intermediate (100-500m)'
+                WHEN depth_min < 1000 THEN 'Deep (500-1000m)'
+                ELSE 'Very Deep (>1000m)'
+            END as depth_range,
+            {_avg('temperature')} as avg_temperature,
+            {_avg('salinity')} as avg_salinity,
+            {_avg('oxygen')} as avg_oxygen,
+            {_count('temperature')} as measurement_count
+        FROM {CUBE_TABLE}
+        WHERE parameter IN ('temperature', 'salinity', 'oxygen'){{filters}}
+        GROUP BY 1
+        ORDER BY MIN(depth_min);
+    """,
+
+    'temporal_trends': f"""
+        SELECT
+            month,
+            {_avg('temperature')} as avg_temperature,
+            {_avg('salinity')} as avg_salinity,
+            {_count('temperature')} as measurement_count
+        FROM {CUBE_TABLE}
+        WHERE parameter IN ('temperature', 'salinity'){{filters}}
+        GROUP BY month
+        ORDER BY month
+        LIMIT 100;
+    """,
+
+    'bgc_analysis': f"""
+        SELECT
+            CASE
+                WHEN depth_min < 200 THEN 'Euphotic Zone'
+                WHEN depth_min < 1000 THEN 'Mesopelagic Zone'
+                ELSE 'Bathypelagic Zone'
+            END as ocean_zone,
+            {_avg('oxygen')} as avg_oxygen,
+            {_avg('ph')} as avg_ph,
+            {_avg('chlorophyll')} as avg_chlorophyll,
+            {_count('oxygen')} as measurement_count
+        FROM {CUBE_TABLE}
+        WHERE parameter IN ('oxygen', 'ph', 'chlorophyll'){{filters}}
+        GROUP BY 1
+        ORDER BY MIN(depth_min);
+    """
+}
+CUBE_TEMPLATE_QUERIES = {intent: sql.strip() for intent, sql in CUBE_TEMPLATE_QUERIES.items()}
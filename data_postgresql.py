@@ -1,19 +1,21 @@
 import xarray as xr
-from sqlalchemy import create_engine
-import config
+from sqlalchemy import inspect
+from database import get_engine
+from bulk_loader import copy_dataframe
 
 ds = xr.open_dataset("tempsal.nc")
 
 df = ds[["TEMP","SAL"]].to_dataframe().reset_index()
 df = df.rename(columns={'TAXIS': 'time', 'ZAX': 'depth', 'YAXIS': 'lat', 'XAXIS': 'lon', 'TEMP': 'temperature','SAL': 'salinity'})
 df_small = df.head(100_000)
-engine = create_engine(config.DATABASE_URL)
-df_small.to_sql(
-    "measurements",
+engine = get_engine()
+if not inspect(engine).has_table("measurements"):
+    # COPY needs the table; on a fresh database let to_sql create it from the frame's columns
+    df_small.head(0).to_sql("measurements", engine, index=False)
+copy_dataframe(
+    df_small,
+    "measurements",       # appends to the table
     engine,
-    if_exists="append",   # append to table if it exists
-    index=False,
-    method='multi',       # batch insert for speed
-    chunksize=10_000      # insert in 10k row chunks
+    chunk_rows=10_000     # COPY in 10k row chunks
 )
 print("completed")
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""
+Database access layer for the FastAPI backend
+Provides the process-wide SQLAlchemy engine with an instrumented connection pool, and runs
+blocking SQLAlchemy/pandas work on a bounded thread pool so async routes never stall the event loop
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Optional
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import QueuePool
+import config
+
+class PoolStats:
+    """Thread-safe counters for connection checkouts and time spent waiting on the pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.waits = 0
+            self.timeouts = 0
+            self.total_wait_time = 0.0
+            self.max_wait_time = 0.0
+
+    def record_checkout(self, waited: bool, elapsed: float):
+        with self._lock:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.total_wait_time += elapsed
+                self.max_wait_time = max(self.max_wait_time, elapsed)
+
+    def record_timeout(self, elapsed: float):
+        with self._lock:
+            self.timeouts += 1
+            self.waits += 1
+            self.total_wait_time += elapsed
+            self.max_wait_time = max(self.max_wait_time, elapsed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'total_wait_time_s': round(self.total_wait_time, 6),
+                'avg_wait_time_s': round(self.total_wait_time / self.waits, 6) if self.waits else 0.0,
+                'max_wait_time_s': round(self.max_wait_time, 6)
+            }
+
+pool_stats = PoolStats()
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records every checkout and whether it had to wait for a free connection"""
+
+    stats = pool_stats
+
+    def _do_get(self):
+        # The pool is exhausted when nothing is idle and no overflow slot is left
+        must_wait = (
+            self._max_overflow > -1
+            and self._overflow >= self._max_overflow
+            and self._pool.qsize() == 0
+        )
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            if must_wait:
+                self.stats.record_timeout(time.perf_counter() - start)
+            raise
+        self.stats.record_checkout(must_wait, time.perf_counter() - start)
+        return connection
+
+def build_engine(url: Optional[str] = None, **overrides) -> Engine:
+    """Create an engine using the configured pool settings"""
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config.DB_POOL_SIZE,
+        'max_overflow': config.DB_MAX_OVERFLOW,
+        'pool_timeout': config.DB_POOL_TIMEOUT,
+        'pool_recycle': config.DB_POOL_RECYCLE,
+        'pool_pre_ping': config.DB_POOL_PRE_PING
+    }
+    options.update(overrides)
+    return create_engine(url or config.DATABASE_URL, **options)
+
+_engine: Optional[Engine] = None
+_engine_pid: Optional[int] = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> Engine:
+    """Return the process-wide engine, creating it on first use"""
+    global _engine, _engine_pid
+
+    with _engine_lock:
+        if _engine is not None and _engine_pid != os.getpid():
+            # Forked worker (e.g. uvicorn --workers): never share the parent's sockets
+            _engine.dispose(close=False)
+            _engine = None
+
+        if _engine is None:
+            _engine = build_engine()
+            _engine_pid = os.getpid()
+
+        return _engine
+
+def get_pool_stats(engine: Optional[Engine] = None) -> Dict[str, Any]:
+    """Current pool occupancy plus cumulative checkout/wait counters"""
+    pool = (engine or get_engine()).pool
+
+    stats = {
+        'pool_class': type(pool).__name__,
+        'pid': os.getpid()
+    }
+
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'pool_size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'max_connections': pool.size() + max(pool._max_overflow, 0)
+        })
+
+    stats.update(pool_stats.snapshot())
+    return stats
+
+_data_version: Optional[int] = None
+_data_version_checked_at = 0.0
+_data_version_lock = threading.Lock()
+
+def get_data_version(engine: Optional[Engine] = None, max_age: Optional[float] = None) -> int:
+    """
+    Current data/schema version, bumped by every ingest
+
+    The value is cached for DATA_VERSION_TTL seconds so hot paths can compare
+    versions without a database round trip. Returns 0 before the first bump.
+    """
+    global _data_version, _data_version_checked_at
+
+    max_age = config.DATA_VERSION_TTL if max_age is None else max_age
+    now = time.monotonic()
+    if _data_version is not None and now - _data_version_checked_at < max_age:
+        return _data_version
+
+    with _data_version_lock:
+        if _data_version is None or now - _data_version_checked_at >= max_age:
+            try:
+                with (engine or get_engine()).connect() as conn:
+                    version = conn.execute(text("SELECT version FROM data_version WHERE id = 1")).scalar()
+                _data_version = int(version or 0)
+            except Exception:
+                # Table not created yet (no ingest has run) or database unreachable
+                _data_version = _data_version or 0
+            _data_version_checked_at = now
+        return _data_version
+
+def _increment_data_version(conn: Connection) -> int:
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY,
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+    return int(conn.execute(text("""
+        INSERT INTO data_version (id, version) VALUES (1, 1)
+        ON CONFLICT (id) DO UPDATE
+        SET version = data_version.version + 1, updated_at = CURRENT_TIMESTAMP
+        RETURNING version
+    """)).scalar())
+
+def bump_data_version(engine: Optional[Engine] = None, connection: Optional[Connection] = None) -> int:
+    """
+    Increment the data/schema version so caches keyed on it are invalidated
+
+    Pass connection to bump inside the caller's transaction, so the new version is published
+    together with the data it describes; it is then left uncommitted, and this process picks
+    it up like any other reader (get_data_version with max_age=0 to do so at once).
+    """
+    global _data_version, _data_version_checked_at
+
+    if connection is not None:
+        return _increment_data_version(connection)
+
+    with (engine or get_engine()).connect() as conn:
+        version = _increment_data_version(conn)
+        conn.commit()
+
+    with _data_version_lock:
+        _data_version = int(version)
+        _data_version_checked_at = time.monotonic()
+    return _data_version
+
+# Bounded pool shared by every async caller; requests beyond the worker count queue here
+# instead of blocking the event loop
+db_executor = ThreadPoolExecutor(
+    max_workers=config.DB_EXECUTOR_WORKERS,
+    thread_name_prefix="db-worker"
+)
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on the database executor and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
+
+async def read_sql_query_async(sql, con, params=None) -> pd.DataFrame:
+    """Async counterpart of pd.read_sql_query"""
+    return await run_blocking(pd.read_sql_query, sql, con, params=params)
@@ -0,0 +1,64 @@
+"""
+Per-request latency budget for /query
+A Deadline starts when the request arrives and every stage (SQL, retrieval, generation) is
+given what is left of it, so one slow stage cannot push the whole request past its budget.
+Work on executor threads cannot be interrupted, so stages are also told their share up
+front: SQL runs with a Postgres statement_timeout and the LLM gateway with a timeout.
+
+When the budget runs short the answer degrades instead of running over: a question SQL
+could not answer in time falls back to semantic search, and one with too little time left
+for the LLM gets the retrieved context as a retrieval-only answer. Each reason is recorded
+and reported with the response.
+"""
+
+import asyncio
+import math
+import time
+from typing import Awaitable, Dict, List, Optional
+
+class Deadline:
+    """What is left of a request's budget, with the time each stage took and why the answer degraded"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        # None or 0: no deadline; stages still report their times
+        self.seconds = seconds if seconds and seconds > 0 else None
+        self.started = time.monotonic()
+        self.stages: Dict[str, float] = {}
+        self.degradations: List[str] = []
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        if self.seconds is None:
+            return math.inf
+        return max(self.seconds - self.elapsed(), 0.0)
+
+    def timeout(self, reserve: float = 0.0) -> Optional[float]:
+        """Seconds a stage may take, keeping reserve for later ones; None without a deadline"""
+        if self.seconds is None:
+            return None
+        return max(self.remaining() - reserve, 0.0)
+
+    async def run(self, stage: str, awaitable: Awaitable, reserve: float = 0.0):
+        """Await within the remaining budget less reserve; asyncio.TimeoutError if it runs out"""
+        started = time.monotonic()
+        try:
+            return await asyncio.wait_for(awaitable, self.timeout(reserve))
+        finally:
+            self.stages[stage] = round((time.monotonic() - started) * 1000, 1)
+
+    def degrade(self, reason: str):
+        print(f"Degrading answer after {self.elapsed():.2f}s: {reason}")
+        self.degradations.append(reason)
+
+    def metadata(self, answer_source: str) -> Dict:
+        """Budget, stage times and degradation reasons reported with the answer"""
+        return {
+            'deadline_ms': round(self.seconds * 1000) if self.seconds is not None else None,
+            'elapsed_ms': round(self.elapsed() * 1000, 1),
+            'stages_ms': dict(self.stages),
+            'answer_source': answer_source,
+            'degraded': bool(self.degradations),
+            'degradation_reasons': list(self.degradations)
+        }
@@ -0,0 +1,220 @@
+"""
+CPU inference backends for the SentenceTransformer embedding model
+EMBED_BACKEND selects how texts are encoded: torch runs the model in fp32 as loaded,
+torch-int8 quantizes its Linear layers to int8 dynamically, and onnx / onnx-int8 run a graph
+exported from it (once, into EMBED_EXPORT_PATH; int8 weights by onnxruntime's dynamic
+quantization) on onnxruntime's CPU execution provider, with the model's pooling and
+normalization. The ONNX backends need neither torch nor sentence-transformers once exported.
+
+Before a quantized backend is used for a model, its embeddings of PARITY_TEXTS are compared
+with the fp32 model's. The result is stored next to the export, and a backend whose lowest
+cosine similarity is below EMBED_PARITY_MIN_COSINE falls back to fp32.
+"""
+
+import json
+import os
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import config
+from sample_queries import CHAT_SAMPLE_QUERIES
+
+BACKENDS = ('torch', 'torch-int8', 'onnx', 'onnx-int8')
+
+# Encoder inputs, in the positional order of BERT-style forward()
+ONNX_INPUTS = ('input_ids', 'attention_mask', 'token_type_ids')
+
+# Questions and documents of the kinds that get embedded, for the parity check
+PARITY_TEXTS: List[str] = [question for questions in CHAT_SAMPLE_QUERIES.values() for question in questions] + [
+    "ARGO float ARGO_0012 (WMO 5900012) completed profile cycle 14 on 2023-03-05 at location 8.412°, 72.950°. "
+    "This profile contains 30 measurements spanning depths from 5.0m to 2000.0m. "
+    "Temperature ranged from 2.41°C to 29.87°C and salinity from 34.52 to 36.11 PSU. Average oxygen was 4.12 ml/L.",
+    "Measurement from float ARGO_0420 at 1500.0m depth on 2021-07-19: temperature 3.95°C, salinity 34.78 PSU.",
+    "Profiles of float 2902746 in the Bay of Bengal below 1000 m",
+    "chlorophyll",
+]
+
+Encode = Callable[..., np.ndarray]
+
+def model_id(model_name: Optional[str] = None, backend: Optional[str] = None) -> str:
+    """Name embeddings of a model are cached under; quantized backends get their own"""
+    model_name = model_name or config.EMBEDDING_MODEL
+    backend = backend or config.EMBED_BACKEND
+    return model_name if backend == 'torch' else f"{model_name}#{backend}"
+
+def export_dir(model_name: str) -> str:
+    return os.path.join(config.EMBED_EXPORT_PATH, model_name.replace('/', '--'))
+
+def pool(hidden: np.ndarray, attention_mask: np.ndarray, mode: str = 'mean') -> np.ndarray:
+    """Sentence embeddings from token embeddings, ignoring padding as SentenceTransformer's Pooling does"""
+    if mode == 'cls':
+        return hidden[:, 0]
+    mask = attention_mask[:, :, None].astype(hidden.dtype)
+    if mode == 'max':
+        return np.where(mask > 0, hidden, -np.inf).max(axis=1)
+    return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+def check_parity(reference: Encode, candidate: Encode, texts: Optional[List[str]] = None) -> Dict:
+    """Cosine similarity between two encoders' embeddings of the same texts"""
+    texts = texts or PARITY_TEXTS
+    expected = np.asarray(reference(texts), dtype=np.float64)
+    found = np.asarray(candidate(texts), dtype=np.float64)
+    cosines = (expected * found).sum(axis=1) / np.maximum(
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(found, axis=1), 1e-12)
+    return {'min_cosine': round(float(cosines.min()), 6), 'mean_cosine': round(float(cosines.mean()), 6),
+            'texts': len(texts)}
+
+def load_parity(model_name: str) -> Dict[str, Dict]:
+    try:
+        with open(os.path.join(export_dir(model_name), 'parity.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_parity(model_name: str, backend: str, parity: Dict):
+    results = load_parity(model_name)
+    results[backend] = parity
+    os.makedirs(export_dir(model_name), exist_ok=True)
+    path = os.path.join(export_dir(model_name), 'parity.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(results, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def resolve_backend(model_name: Optional[str] = None, backend: Optional[str] = None) -> str:
+    """
+    The backend to encode with: the requested one, or fp32 torch if it failed its parity check
+
+    The check runs the first time a quantized backend is requested for a model (loading the
+    fp32 model too) and its result is stored; later calls only read it. Without torch the
+    check cannot run and the backend is used unverified.
+    """
+    model_name = model_name or config.EMBEDDING_MODEL
+    backend = backend or config.EMBED_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    if backend == 'torch':
+        return backend
+
+    parity = load_parity(model_name).get(backend)
+    if parity is None:
+        try:
+            reference = load_encoder(model_name, 'torch')
+            candidate = load_encoder(model_name, backend)
+        except ImportError as e:
+            print(f"⚠️ Cannot compare {backend} with fp32 for {model_name} ({e}); using it unverified")
+            return backend
+        parity = check_parity(reference, candidate)
+        _save_parity(model_name, backend, parity)
+        print(f"Parity of {backend} with fp32 for {model_name}: min cosine {parity['min_cosine']:.4f}, "
+              f"mean {parity['mean_cosine']:.4f}")
+    if parity['min_cosine'] < config.EMBED_PARITY_MIN_COSINE:
+        print(f"⚠️ {backend} embeddings of {model_name} are only {parity['min_cosine']:.4f} cosine-similar to fp32 "
+              f"(EMBED_PARITY_MIN_COSINE={config.EMBED_PARITY_MIN_COSINE}); using fp32")
+        return 'torch'
+    return backend
+
+def load_encoder(model_name: Optional[str] = None, backend: Optional[str] = None,
+                 threads: Optional[int] = None) -> Encode:
+    """encode(texts, batch_size=None) -> float32 array for a model on a backend, exporting it to ONNX if needed"""
+    model_name = model_name or config.EMBEDDING_MODEL
+    backend = backend or config.EMBED_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    if backend.startswith('onnx'):
+        directory = export_dir(model_name)
+        if not os.path.exists(os.path.join(directory, 'encoder.json')):
+            export_onnx(model_name, directory)
+        return OnnxEncoder(directory, quantized=backend == 'onnx-int8', threads=threads)
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+    if threads:
+        torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device='cpu')
+    if backend == 'torch-int8':
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode(texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        return np.asarray(model.encode(list(texts), batch_size=batch_size or 32, convert_to_numpy=True),
+                          dtype=np.float32)
+    return encode
+
+def export_onnx(model_name: str, directory: Optional[str] = None) -> str:
+    """Export a SentenceTransformer's encoder to directory as model.onnx and model_int8.onnx with its tokenizer"""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    directory = directory or export_dir(model_name)
+    os.makedirs(directory, exist_ok=True)
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    sample = tokenizer(["sea surface temperature"], return_tensors='pt')
+    inputs = [name for name in ONNX_INPUTS if name in sample]
+    axes = {0: 'batch', 1: 'tokens'}
+    path = os.path.join(directory, 'model.onnx')
+    print(f"Exporting {model_name} to {path}")
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(sample[name] for name in inputs), path, input_names=inputs,
+                          output_names=['last_hidden_state'], opset_version=14,
+                          dynamic_axes={**{name: axes for name in inputs}, 'last_hidden_state': axes})
+    quantize_dynamic(path, os.path.join(directory, 'model_int8.onnx'), weight_type=QuantType.QInt8)
+    tokenizer.backend_tokenizer.save(os.path.join(directory, 'tokenizer.json'))
+
+    pooling = next((module.get_config_dict() for module in model if type(module).__name__ == 'Pooling'), {})
+    settings = {
+        'model': model_name,
+        'inputs': inputs,
+        'pooling': 'cls' if pooling.get('pooling_mode_cls_token') else 'max' if pooling.get('pooling_mode_max_tokens') else 'mean',
+        'normalize': any(type(module).__name__ == 'Normalize' for module in model),
+        'max_length': model.max_seq_length,
+        'pad_token': tokenizer.pad_token,
+        'pad_id': tokenizer.pad_token_id,
+    }
+    with open(os.path.join(directory, 'encoder.json'), 'w') as f:
+        json.dump(settings, f, indent=2)
+    return directory
+
+class OnnxEncoder:
+    """An exported encoder run by onnxruntime on the CPU, pooled and normalized like the SentenceTransformer"""
+
+    def __init__(self, directory: str, quantized: bool = False, threads: Optional[int] = None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(directory, 'encoder.json')) as f:
+            self.settings = json.load(f)
+        self.tokenizer = Tokenizer.from_file(os.path.join(directory, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=self.settings['max_length'])
+        self.tokenizer.enable_padding(pad_id=self.settings['pad_id'], pad_token=self.settings['pad_token'])
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(directory, 'model_int8.onnx' if quantized else 'model.onnx'), options,
+            providers=['CPUExecutionProvider'])
+
+    def __call__(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        texts = list(texts)
+        batch_size = batch_size or 32
+        # Texts of similar length share a batch, so little of each batch is padding
+        order = np.argsort([len(text) for text in texts], kind='stable')
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch([texts[i] for i in order[start:start + batch_size]])
+            feeds = {
+                'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                'attention_mask': np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+                'token_type_ids': np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {name: feeds[name] for name in self.settings['inputs']})[0]
+            pooled = pool(hidden, feeds['attention_mask'], self.settings['pooling'])
+            if self.settings['normalize']:
+                pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            batches.append(pooled.astype(np.float32))
+        if not batches:
+            return np.empty((0, 0), dtype=np.float32)
+        embeddings = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.concatenate(batches)
+        return embeddings
@@ -0,0 +1,331 @@
+"""
+Content-addressed on-disk embedding cache
+Vectors are keyed by (model name, sha256 of the document text) and stored as float16 rows in
+fixed-size memory-mapped shard files, with an SQLite index mapping each key to its shard and
+row. Indexing runs and query-time embedding both consult it before calling a model, so
+re-embedding unchanged text (a rebuild, a metadata-only change, a repeated question) is a
+lookup. Once the shards pass the disk budget the least recently used ones are deleted.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from chromadb import EmbeddingFunction
+import config
+
+INDEX_FILE = 'index.sqlite'
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    capacity INTEGER NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    model TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    shard INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (model, digest)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_entries_shard ON entries(shard);
+"""
+
+# Keys per IN (...) lookup, below SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+# Seconds a shard's last_used may lag before a hit rewrites it; eviction order only needs it roughly
+TOUCH_INTERVAL = 60
+
+def text_digest(document: str) -> bytes:
+    return hashlib.sha256(document.encode('utf-8')).digest()
+
+class EmbeddingCache:
+    """
+    float16 vectors of one model, shared with every other process using the same path
+
+    Rows are reserved and indexed inside an SQLite write transaction, after the vectors are
+    flushed to the shard, so concurrent writers never overlap and readers never see a row
+    before its data. Vectors come back as float32; the float16 round trip changes them by
+    about 1e-3 relative, well below what moves a nearest-neighbour ranking.
+    """
+
+    def __init__(self, model_name: str, path: Optional[str] = None, max_bytes: Optional[int] = None,
+                 shard_rows: Optional[int] = None):
+        self.model_name = model_name
+        self.path = path or config.EMBED_CACHE_PATH
+        self.max_bytes = int(max_bytes if max_bytes is not None else config.EMBED_CACHE_MAX_MB * 1024 * 1024)
+        self.shard_rows = shard_rows or config.EMBED_CACHE_SHARD_ROWS
+        self.hits = 0
+        self.misses = 0
+        self.evicted_shards = 0
+        self._lock = threading.Lock()
+        self._shards: Dict[int, np.memmap] = {}
+
+        os.makedirs(self.path, exist_ok=True)
+        # Autocommit mode: write transactions are opened explicitly with BEGIN IMMEDIATE
+        self._db = sqlite3.connect(os.path.join(self.path, INDEX_FILE), timeout=30,
+                                   isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # A cache can lose its last commits on power loss; WAL keeps it consistent without an fsync each
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA_SQL)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _shard_file(self, shard_id: int) -> str:
+        return os.path.join(self.path, f"shard_{shard_id:06d}.f16")
+
+    def _open_shard(self, shard_id: int, dim: int, capacity: int, create: bool = False) -> np.memmap:
+        shard = self._shards.get(shard_id)
+        if shard is None:
+            shard = np.memmap(self._shard_file(shard_id), dtype=np.float16, mode='w+' if create else 'r+',
+                              shape=(capacity, dim))
+            self._shards[shard_id] = shard
+        return shard
+
+    def _lookup(self, digests: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Cached vectors among digests; marks their shards as used, at most once per TOUCH_INTERVAL"""
+        locations = []
+        for start in range(0, len(digests), LOOKUP_CHUNK):
+            chunk = digests[start:start + LOOKUP_CHUNK]
+            locations += self._db.execute(f"""
+                SELECT e.digest, e.shard, e.row, s.dim, s.capacity, s.last_used
+                FROM entries e JOIN shards s ON s.id = e.shard
+                WHERE e.model = ? AND e.digest IN ({','.join('?' * len(chunk))})
+            """, [self.model_name, *chunk]).fetchall()
+
+        found = {}
+        by_shard: Dict[tuple, list] = {}
+        now = time.time()
+        stale = set()
+        for digest, shard_id, row, dim, capacity, last_used in locations:
+            by_shard.setdefault((shard_id, dim, capacity), []).append((digest, row))
+            if now - last_used >= TOUCH_INTERVAL:
+                stale.add(shard_id)
+        for (shard_id, dim, capacity), rows in by_shard.items():
+            try:
+                vectors = self._open_shard(shard_id, dim, capacity)[[row for _, row in rows]]
+            except (FileNotFoundError, ValueError):
+                continue  # evicted by another process since the lookup
+            for (digest, _), vector in zip(rows, vectors.astype(np.float32)):
+                found[digest] = vector
+
+        if stale:
+            self._db.execute(f"UPDATE shards SET last_used = ? WHERE id IN ({','.join('?' * len(stale))})",
+                             [now, *stale])
+        return found
+
+    def get(self, documents: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached vector of each document, None where it has not been embedded yet"""
+        digests = [text_digest(document) for document in documents]
+        with self._lock:
+            found = self._lookup(digests)
+            self.hits += sum(digest in found for digest in digests)
+            self.misses += sum(digest not in found for digest in digests)
+        return [found.get(digest) for digest in digests]
+
+    def put(self, documents: List[str], embeddings):
+        """Store vectors for documents, then evict shards if the cache is over budget"""
+        embeddings = np.asarray(embeddings, dtype=np.float16)
+        if not len(documents):
+            return
+        unique = {}
+        for document, vector in zip(documents, embeddings):
+            unique.setdefault(text_digest(document), vector)
+        dim = embeddings.shape[1]
+
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                digests = list(unique)
+                for start in range(0, len(digests), LOOKUP_CHUNK):
+                    chunk = digests[start:start + LOOKUP_CHUNK]
+                    for (digest,) in self._db.execute(
+                        f"SELECT digest FROM entries WHERE model = ? AND digest IN ({','.join('?' * len(chunk))})",
+                        [self.model_name, *chunk]
+                    ):
+                        unique.pop(digest, None)
+
+                pending = list(unique.items())
+                while pending:
+                    row = self._db.execute(
+                        "SELECT id, rows, capacity FROM shards WHERE model = ? AND dim = ? AND rows < capacity "
+                        "ORDER BY id DESC LIMIT 1", (self.model_name, dim)
+                    ).fetchone()
+                    if row is None:
+                        shard_id = self._db.execute(
+                            "INSERT INTO shards (model, dim, capacity, rows, last_used) VALUES (?, ?, ?, 0, ?)",
+                            (self.model_name, dim, self.shard_rows, time.time())
+                        ).lastrowid
+                        used, capacity = 0, self.shard_rows
+                        shard = self._open_shard(shard_id, dim, capacity, create=True)
+                    else:
+                        shard_id, used, capacity = row
+                        shard = self._open_shard(shard_id, dim, capacity)
+
+                    take, pending = pending[:capacity - used], pending[capacity - used:]
+                    shard[used:used + len(take)] = np.stack([vector for _, vector in take])
+                    shard.flush()
+                    self._db.executemany(
+                        "INSERT INTO entries (model, digest, shard, row) VALUES (?, ?, ?, ?)",
+                        [(self.model_name, digest, shard_id, used + i) for i, (digest, _) in enumerate(take)]
+                    )
+                    self._db.execute("UPDATE shards SET rows = ?, last_used = ? WHERE id = ?",
+                                     (used + len(take), time.time(), shard_id))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._evict()
+
+    def _evict(self):
+        """Delete least recently used full shards until the cache fits max_bytes"""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            total = self._db.execute("SELECT COALESCE(SUM(capacity * dim * 2), 0) FROM shards").fetchone()[0]
+            victims = []
+            if total > self.max_bytes:
+                # Shards still being filled are kept, or every put would evict its own rows
+                for shard_id, size in self._db.execute(
+                    "SELECT id, capacity * dim * 2 FROM shards WHERE rows >= capacity ORDER BY last_used, id"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    victims.append(shard_id)
+                    total -= size
+                for shard_id in victims:
+                    self._db.execute("DELETE FROM entries WHERE shard = ?", (shard_id,))
+                    self._db.execute("DELETE FROM shards WHERE id = ?", (shard_id,))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+        for shard_id in victims:
+            self._shards.pop(shard_id, None)
+            try:
+                os.remove(self._shard_file(shard_id))
+            except FileNotFoundError:
+                pass
+        self.evicted_shards += len(victims)
+
+    def encode(self, documents: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Embeddings for documents, calling encode only for the ones not cached yet"""
+        cached = self.get(documents)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            computed = np.asarray(encode([documents[i] for i in missing]), dtype=np.float32)
+            self.put([documents[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                cached[i] = vector
+        return np.stack(cached) if cached else np.empty((0, 0), dtype=np.float32)
+
+    def stats(self) -> Dict:
+        """Hit rate of this process plus the size of the shared cache"""
+        with self._lock:
+            entries, shards, size = self._db.execute("""
+                SELECT (SELECT COUNT(*) FROM entries WHERE model = ?), COUNT(*), COALESCE(SUM(capacity * dim * 2), 0)
+                FROM shards
+            """, (self.model_name,)).fetchone()
+        return {
+            'model': self.model_name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate, 4),
+            'entries': entries,
+            'shards': shards,
+            'disk_mb': round(size / 1024 / 1024, 1),
+            'max_mb': round(self.max_bytes / 1024 / 1024, 1),
+            'evicted_shards': self.evicted_shards
+        }
+
+    def __str__(self) -> str:
+        return (f"embedding cache {self.hit_rate:.1%} hit rate "
+                f"({self.hits:,} hits, {self.misses:,} misses) for {self.model_name}")
+
+    def close(self):
+        with self._lock:
+            self._shards.clear()
+            self._db.close()
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_pid: Optional[int] = None
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(model_name: Optional[str] = None) -> EmbeddingCache:
+    """Return the process-wide cache for a model, opening it on first use"""
+    global _caches_pid
+    model_name = model_name or config.EMBEDDING_MODEL
+
+    with _caches_lock:
+        if _caches_pid != os.getpid():
+            # Forked worker: SQLite connections must not cross a fork
+            _caches.clear()
+            _caches_pid = os.getpid()
+        if model_name not in _caches:
+            _caches[model_name] = EmbeddingCache(model_name)
+        return _caches[model_name]
+
+class CachedEncoder:
+    """Pipeline encoder that serves cached vectors and sends only the rest to the wrapped encoder"""
+
+    def __init__(self, encoder, cache: EmbeddingCache):
+        self.encoder = encoder
+        self.cache = cache
+
+    def submit(self, documents: List[str]) -> Future:
+        future = Future()
+        try:
+            cached = self.cache.get(documents)
+        except Exception as e:
+            future.set_exception(e)
+            return future
+
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if not missing:
+            future.set_result(np.stack(cached))
+            return future
+
+        def combine(inner: Future):
+            try:
+                computed = np.asarray(inner.result(), dtype=np.float32)
+                self.cache.put([documents[i] for i in missing], computed)
+                for i, vector in zip(missing, computed):
+                    cached[i] = vector
+                future.set_result(np.stack(cached))
+            except BaseException as e:
+                future.set_exception(e)
+
+        self.encoder.submit([documents[i] for i in missing]).add_done_callback(combine)
+        return future
+
+    def close(self):
+        self.encoder.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """Chroma embedding function that consults the cache before calling encode"""
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], cache: EmbeddingCache):
+        self.encode = encode
+        self.cache = cache
+
+    def __call__(self, input):
+        return self.cache.encode(list(input), self.encode).tolist()
@@ -0,0 +1,341 @@
+"""
+Streaming embedding pipeline for the Chroma collections
+Rows are read through a server-side cursor, turned into documents and metadata a chunk at a
+time and encoded in batches on SentenceTransformer worker processes. The stages run
+concurrently and hand work over through bounded queues, so memory stays flat no matter
+how many rows are indexed. sync_collection runs the same pipeline as a diff against a
+collection, embedding only documents whose content hash changed.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+import config
+from database import get_engine
+from embedding_backends import load_encoder, model_id, resolve_backend
+
+# ids, documents and metadata dicts of one batch, aligned by position
+DocumentBatch = Tuple[List[str], List[str], List[dict]]
+
+_DONE = object()
+
+# Encode function set up once per encoder worker process
+_worker_encode = None
+
+def _init_encoder_worker(model_name: str, backend: str, threads: int):
+    """Load the model in a fresh worker; inference threads are split between the workers"""
+    global _worker_encode
+    try:
+        _worker_encode = load_encoder(model_name, backend, threads)
+    except ImportError:
+        # Same fallback as the API: chromadb's ONNX build of all-MiniLM-L6-v2
+        from chromadb.utils import embedding_functions
+        print(f"sentence-transformers not installed; encoding with chromadb's default model instead of {model_name}")
+        default_ef = embedding_functions.DefaultEmbeddingFunction()
+        _worker_encode = lambda documents, batch_size: default_ef(documents)
+
+def _encode_in_worker(documents: List[str], batch_size: int) -> np.ndarray:
+    return np.asarray(_worker_encode(documents, batch_size), dtype=np.float32)
+
+class ProcessPoolEncoder:
+    """SentenceTransformer encoding on worker processes, each holding its own copy of the model"""
+
+    def __init__(self, model_name: Optional[str] = None, workers: Optional[int] = None,
+                 batch_size: Optional[int] = None, backend: Optional[str] = None):
+        self.model_name = model_name or config.EMBEDDING_MODEL
+        self.backend = resolve_backend(self.model_name, backend or config.EMBED_BACKEND)
+        self.model_id = model_id(self.model_name, self.backend)
+        self.workers = max(1, workers or config.EMBED_WORKERS)
+        self.batch_size = batch_size or config.EMBED_BATCH_SIZE
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        # spawn, not fork: torch state must not be inherited from the parent (resolve_backend may load it)
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_encoder_worker,
+            initargs=(self.model_name, self.backend, threads)
+        )
+
+    def submit(self, documents: List[str]) -> Future:
+        return self._pool.submit(_encode_in_worker, documents, self.batch_size)
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class InlineEncoder:
+    """Encode with a plain function in the calling thread, for tests and small loads"""
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray]):
+        self.encode = encode
+
+    def submit(self, documents: List[str]) -> Future:
+        future = Future()
+        try:
+            future.set_result(np.asarray(self.encode(documents), dtype=np.float32))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_query_chunks(sql: str, engine: Optional[Engine] = None, chunk_rows: Optional[int] = None,
+                      params: Optional[Dict] = None) -> Iterator[pd.DataFrame]:
+    """Stream a query's rows as DataFrames of chunk_rows rows through a server-side cursor"""
+    engine = engine or get_engine()
+    chunk_rows = chunk_rows or config.EMBED_READ_CHUNK_ROWS
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_rows) as conn:
+        yield from pd.read_sql_query(text(sql), conn, params=params, chunksize=chunk_rows)
+
+@dataclass
+class PipelineStats:
+    """Outcome of one embedding run; stage seconds are busy time, so they overlap"""
+    documents: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    read_seconds: float = 0.0
+    build_seconds: float = 0.0
+    encode_wait_seconds: float = 0.0
+    write_seconds: float = 0.0
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.documents / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.documents:,} documents in {self.seconds:.1f}s ({self.docs_per_second:,.0f} docs/s; "
+                f"read {self.read_seconds:.1f}s, build {self.build_seconds:.1f}s, "
+                f"waiting on encoders {self.encode_wait_seconds:.1f}s, write {self.write_seconds:.1f}s)")
+
+class _PipelineError:
+    """Carries an exception from a stage thread to the writer"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up once the pipeline is stopping"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """Blocking get that returns _DONE once the pipeline is stopping"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def run_embedding_pipeline(chunks: Iterable[pd.DataFrame], build: Callable[[pd.DataFrame], DocumentBatch],
+                           encoder, collection, batch_size: Optional[int] = None,
+                           queue_depth: Optional[int] = None, verbose: bool = True,
+                           upsert: bool = False) -> PipelineStats:
+    """
+    Embed and store every row of chunks; returns throughput statistics
+
+    A reader thread pulls chunks (e.g. from iter_query_chunks), a builder thread turns
+    each into documents with build and submits batch_size slices to the encoder, and
+    this thread adds the finished batches to the collection with precomputed embeddings,
+    in order. Both queues are bounded by queue_depth, so a slow stage holds back the
+    ones before it. With upsert, existing ids are overwritten instead of rejected.
+    """
+    batch_size = batch_size or config.EMBED_BATCH_SIZE
+    queue_depth = queue_depth or config.EMBED_QUEUE_DEPTH
+    stats = PipelineStats()
+    stop = threading.Event()
+    raw = queue.Queue(maxsize=queue_depth)
+    encoded = queue.Queue(maxsize=queue_depth)
+    write = collection.upsert if upsert else collection.add
+
+    def read():
+        iterator = iter(chunks)
+        try:
+            while True:
+                start = time.perf_counter()
+                chunk = next(iterator, _DONE)
+                stats.read_seconds += time.perf_counter() - start
+                if chunk is _DONE or not _put(raw, chunk, stop):
+                    break
+        except BaseException as e:
+            _put(raw, _PipelineError(e), stop)
+        finally:
+            # Closes a streaming cursor left open when the pipeline stops early
+            if hasattr(iterator, 'close'):
+                iterator.close()
+        _put(raw, _DONE, stop)
+
+    def build_batches():
+        try:
+            while True:
+                chunk = _get(raw, stop)
+                if chunk is _DONE or isinstance(chunk, _PipelineError):
+                    _put(encoded, chunk, stop)
+                    return
+                start = time.perf_counter()
+                ids, documents, metadatas = build(chunk)
+                stats.build_seconds += time.perf_counter() - start
+                for i in range(0, len(ids), batch_size):
+                    future = encoder.submit(documents[i:i + batch_size])
+                    item = (ids[i:i + batch_size], documents[i:i + batch_size], metadatas[i:i + batch_size], future)
+                    if not _put(encoded, item, stop):
+                        return
+        except BaseException as e:
+            _put(encoded, _PipelineError(e), stop)
+
+    threads = [threading.Thread(target=read, daemon=True), threading.Thread(target=build_batches, daemon=True)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = encoded.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _PipelineError):
+                raise item.error
+
+            ids, documents, metadatas, future = item
+            start = time.perf_counter()
+            embeddings = future.result()
+            stats.encode_wait_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            write(ids=ids, embeddings=embeddings.tolist(), documents=documents, metadatas=metadatas)
+            stats.write_seconds += time.perf_counter() - start
+
+            stats.documents += len(ids)
+            stats.batches += 1
+            if verbose and stats.batches % 20 == 0:
+                elapsed = time.perf_counter() - started
+                print(f"   {stats.documents:,} documents embedded ({stats.documents / elapsed:,.0f} docs/s)")
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    stats.seconds = time.perf_counter() - started
+    if verbose:
+        print(f"   Embedded {stats}")
+    return stats
+
+def content_hash(document: str, metadata: dict) -> str:
+    """Hash of a document's text and metadata (without its own content_hash key)"""
+    fields = {key: value for key, value in metadata.items() if key != 'content_hash'}
+    payload = document + '\x00' + json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def attach_content_hashes(documents: List[str], metadatas: List[dict]):
+    """Store each document's content hash in its metadata, for sync_collection"""
+    for document, metadata in zip(documents, metadatas):
+        metadata['content_hash'] = content_hash(document, metadata)
+
+def collection_hashes(collection, where: Optional[Dict] = None, page_size: Optional[int] = None) -> Dict[str, Optional[str]]:
+    """Stored content hash of every document in a collection (None if it has none), by id"""
+    page_size = page_size or config.EMBED_READ_CHUNK_ROWS
+    hashes = {}
+    offset = 0
+    while True:
+        page = collection.get(where=where, include=['metadatas'], limit=page_size, offset=offset)
+        for doc_id, metadata in zip(page['ids'], page['metadatas']):
+            hashes[doc_id] = (metadata or {}).get('content_hash')
+        if len(page['ids']) < page_size:
+            return hashes
+        offset += page_size
+
+@dataclass
+class SyncStats:
+    """Outcome of one incremental sync of a collection"""
+    added: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    seconds: float = 0.0
+    embedding: Optional[PipelineStats] = None
+
+    def __str__(self) -> str:
+        return (f"{self.added:,} added, {self.updated:,} updated, {self.deleted:,} deleted, "
+                f"{self.unchanged:,} unchanged in {self.seconds:.1f}s")
+
+def sync_collection(chunks: Iterable[pd.DataFrame], build: Callable[[pd.DataFrame], DocumentBatch],
+                    encoder, collection, where: Optional[Dict] = None, verbose: bool = True,
+                    lexical=None) -> SyncStats:
+    """
+    Bring a collection in line with the source rows; returns what changed
+
+    chunks are the current source rows, and build must set a content_hash in every
+    metadata dict (see attach_content_hashes). Documents whose id and hash are already
+    stored are skipped before encoding, new or changed ones are upserted through the
+    pipeline and stored ids that no longer appear in the source are deleted. where
+    limits the comparison to part of the collection, e.g. the profiles of one ingest.
+    The same changes are applied to lexical, a LexicalIndex of the collection, if given.
+    """
+    started = time.perf_counter()
+    stats = SyncStats()
+    stored = collection_hashes(collection, where)
+    seen: Set[str] = set()
+
+    def build_changed(chunk: pd.DataFrame) -> DocumentBatch:
+        ids, documents, metadatas = build(chunk)
+        changed = []
+        for i, doc_id in enumerate(ids):
+            seen.add(doc_id)
+            stored_hash = stored.get(doc_id, False)
+            if stored_hash == metadatas[i]['content_hash']:
+                stats.unchanged += 1
+                continue
+            if stored_hash is False:
+                stats.added += 1
+            else:
+                stats.updated += 1
+            changed.append(i)
+        batch = ([ids[i] for i in changed], [documents[i] for i in changed], [metadatas[i] for i in changed])
+        if lexical is not None:
+            lexical.add(*batch)
+        return batch
+
+    # Into an empty collection plain adds are cheaper than upserts
+    stats.embedding = run_embedding_pipeline(chunks, build_changed, encoder, collection,
+                                             verbose=verbose, upsert=bool(stored))
+
+    removed = [doc_id for doc_id in stored if doc_id not in seen]
+    page_size = config.EMBED_READ_CHUNK_ROWS
+    for i in range(0, len(removed), page_size):
+        collection.delete(ids=removed[i:i + page_size])
+    stats.deleted = len(removed)
+    if lexical is not None:
+        lexical.remove(removed)
+
+    stats.seconds = time.perf_counter() - started
+    if verbose:
+        print(f"   Synced {collection.name}: {stats}")
+    return stats
@@ -0,0 +1,179 @@
+"""
+Micro-batching embedding service for query traffic
+Concurrent /query requests each embed one short question. Rather than running one forward
+pass per question, callers put their texts on an asyncio queue and a single batcher task
+takes everything queued within EMBED_SERVICE_MAX_WAIT_MS (up to EMBED_SERVICE_MAX_BATCH
+texts) into one encode call on a dedicated thread. While that call runs the next batch
+fills up, so under load batches grow without any extra waiting; a lone request after a
+batch of one is sent at once, so light traffic never waits.
+Retrieval runs on the database executor threads, so the service is also usable
+synchronously: encode() hands the texts to the service's event loop and blocks on the
+result, which makes it a drop-in encode callable for CachedEmbeddingFunction.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from chromadb import EmbeddingFunction
+import config
+
+# Recent per-request and per-batch timings kept for the latency percentiles
+LATENCY_WINDOW = 1000
+
+def _percentile_ms(samples, q: float) -> float:
+    return round(float(np.percentile(samples, q)) * 1000, 2) if samples else 0.0
+
+class EmbeddingService:
+    """Coalesces concurrent embedding requests into batched calls of encode"""
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None):
+        self.encode_batch = encode
+        self.max_batch = max_batch or config.EMBED_SERVICE_MAX_BATCH
+        self.max_wait = (config.EMBED_SERVICE_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # One forward pass at a time: the model already uses every core for a batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-service")
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self._last_batch_requests = 1
+        self.encode_seconds = 0.0
+        self.started_at = time.monotonic()
+        self._request_latencies = deque(maxlen=LATENCY_WINDOW)
+        self._encode_latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self):
+        """Start the batcher on the running event loop (call from the app's startup)"""
+        self.loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = self.loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.loop = self._queue = self._task = None
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embeddings of texts, computed in a batch with whatever else is queued"""
+        if not self.running:
+            raise RuntimeError("embedding service is not started")
+        future = self.loop.create_future()
+        await self._queue.put((list(texts), future, time.perf_counter()))
+        return await future
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Blocking embed for threads other than the service's event loop; encodes directly when not started"""
+        loop = self.loop
+        if loop is None or not self.running:
+            return np.asarray(self.encode_batch(list(texts)), dtype=np.float32)
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            raise RuntimeError("EmbeddingService.encode would block its own event loop; await embed() instead")
+        return asyncio.run_coroutine_threadsafe(self.embed(texts), loop).result()
+
+    async def _collect(self) -> list:
+        """The next batch: the first queued request plus any arriving within max_wait, up to max_batch texts"""
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = self.loop.time() + self.max_wait
+        while size < self.max_batch:
+            if self._queue.empty():
+                if self._last_batch_requests == 1 and len(batch) == 1:
+                    break
+                remaining = deadline - self.loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                request = self._queue.get_nowait()
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            self._last_batch_requests = len(batch)
+            texts = [text for request_texts, _, _ in batch for text in request_texts]
+            started = time.perf_counter()
+            try:
+                embeddings = np.asarray(
+                    await self.loop.run_in_executor(self._executor, self.encode_batch, texts), dtype=np.float32)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            offset = 0
+            for request_texts, future, queued in batch:
+                if not future.done():
+                    future.set_result(embeddings[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+            with self._lock:
+                self.requests += len(batch)
+                self.texts += len(texts)
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, len(texts))
+                self.encode_seconds += finished - started
+                self._encode_latencies.append(finished - started)
+                self._request_latencies.extend(finished - queued for _, _, queued in batch)
+
+    def stats(self) -> Dict:
+        """Batching, throughput and latency counters for this process"""
+        with self._lock:
+            requests = list(self._request_latencies)
+            encodes = list(self._encode_latencies)
+            return {
+                'running': self.running,
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000,
+                'requests': self.requests,
+                'texts': self.texts,
+                'batches': self.batches,
+                'mean_batch': round(self.texts / self.batches, 2) if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+                'queued': self._queue.qsize() if self._queue is not None else 0,
+                'texts_per_second': round(self.texts / (time.monotonic() - self.started_at), 2),
+                'encode_texts_per_second': round(self.texts / self.encode_seconds, 2) if self.encode_seconds else 0.0,
+                'request_ms_p50': _percentile_ms(requests, 50),
+                'request_ms_p95': _percentile_ms(requests, 95),
+                'encode_ms_p50': _percentile_ms(encodes, 50),
+                'encode_ms_p95': _percentile_ms(encodes, 95)
+            }
+
+class ServiceEmbeddingFunction(EmbeddingFunction):
+    """Chroma embedding function that embeds through an EmbeddingService"""
+
+    def __init__(self, service: EmbeddingService):
+        self.service = service
+
+    def __call__(self, input):
+        return self.service.encode(list(input)).tolist()
@@ -7,10 +7,9 @@ import xarray as xr
 import numpy as np
 from io import StringIO, BytesIO
 from datetime import datetime
-from sqlalchemy import create_engine
-import config
+from database import get_engine
 
-engine = create_engine(config.DATABASE_URL)
+engine = get_engine()
 
 def export_to_ascii(data_ids: list) -> str:
     """Export ARGO data to ASCII format following oceanographic standards"""
@@ -6,8 +6,9 @@ Supports future integration of BGC, glider, buoys, and satellite datasets
 from abc import ABC, abstractmethod
 from typing import Dict, List, Any, Optional
 import pandas as pd
-from sqlalchemy import create_engine, text
-import config
+from sqlalchemy import text
+from database import get_engine
+from bulk_loader import copy_dataframe
 
 class DatasetProcessor(ABC):
     """Abstract base class for different oceanographic dataset processors"""
@@ -345,7 +346,7 @@ class ExtensibilityManager:
             "buoy": BuoyProcessor(),
             "satellite": SatelliteProcessor()
         }
-        self.engine = create_engine(config.DATABASE_URL)
+        self.engine = get_engine()
     
     def register_processor(self, name: str, processor: DatasetProcessor):
         """Register a new dataset processor"""
@@ -475,8 +476,8 @@ class ExtensibilityManager:
             # Standardize column names for unified schema
             standardized_df = self._standardize_dataframe(df, dataset_type)
             
-            # Insert into unified tables
-            standardized_df.to_sql('observations', self.engine, if_exists='append', index=False)
+            # Bulk load into unified tables (COPY on PostgreSQL)
+            copy_dataframe(standardized_df, 'observations', self.engine)
             
             return True
             
@@ -0,0 +1,164 @@
+"""
+In-process BM25 index over the documents of a Chroma collection
+Float ids, WMO numbers, cycle numbers and dates are single tokens, so identifier lookups
+such as "float ARGO_0012 cycle 4" are answered from posting lists without an embedding
+call. data_chroma_floats updates one index per collection with the same documents on every
+sync and saves it under LEXICAL_INDEX_PATH, where the API picks it up.
+"""
+
+import heapq
+import math
+import os
+import pickle
+import re
+from collections import Counter
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+import config
+
+# Words joined by _ - . or : stay one token: argo_0012, 2023-03-05, 35.12
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[_\-.:][a-z0-9]+)*')
+FLOAT_ID_PATTERN = re.compile(r'\bargo[_\- ]?(\d{1,6})\b')
+CYCLE_PATTERN = re.compile(r'\bcycle(?:\s+number)?\s+(\d+)\b')
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'at', 'by', 'for', 'from', 'in', 'is', 'me', 'of', 'on', 'or', 'show',
+    'than', 'the', 'to', 'was', 'were', 'what', 'which', 'with'
+])
+
+# Terms in more than this share of documents add little to BM25 and are skipped when rarer ones match
+COMMON_TERM_SHARE = 0.5
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase tokens with float ids as argo_NNNN and 'cycle 4' as cycle_4"""
+    text = FLOAT_ID_PATTERN.sub(lambda m: f"argo_{int(m.group(1)):04d}", text.lower())
+    text = CYCLE_PATTERN.sub(lambda m: f"cycle_{int(m.group(1))}", text)
+    return [token for token in TOKEN_PATTERN.findall(text) if token not in STOP_WORDS]
+
+class LexicalIndex:
+    """BM25 posting lists plus the documents and metadata they were built from, keyed by collection id"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.slots: Dict[str, int] = {}
+        self.ids: List[Optional[str]] = []
+        self.documents: List[Optional[str]] = []
+        self.metadatas: List[Optional[dict]] = []
+        self.lengths: List[int] = []
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def add(self, ids: List[str], documents: List[str], metadatas: Optional[List[dict]] = None):
+        """Index documents, replacing any stored under the same ids"""
+        self.remove([doc_id for doc_id in ids if doc_id in self.slots])
+        for doc_id, document, metadata in zip(ids, documents, metadatas or [None] * len(ids)):
+            terms = Counter(tokenize(document))
+            slot = len(self.ids)
+            self.slots[doc_id] = slot
+            self.ids.append(doc_id)
+            self.documents.append(document)
+            self.metadatas.append(metadata)
+            self.lengths.append(sum(terms.values()))
+            self.total_length += self.lengths[slot]
+            for term, count in terms.items():
+                self.postings.setdefault(term, {})[slot] = count
+
+    def remove(self, ids: List[str]):
+        for doc_id in ids:
+            slot = self.slots.pop(doc_id, None)
+            if slot is None:
+                continue
+            for term in set(tokenize(self.documents[slot])):
+                postings = self.postings[term]
+                del postings[slot]
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= self.lengths[slot]
+            self.ids[slot] = self.documents[slot] = self.metadatas[slot] = None
+            self.lengths[slot] = 0
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """Best matching ids with their BM25 scores, highest first"""
+        count = len(self.slots)
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not count or not terms:
+            return []
+        rare = [term for term in terms if len(self.postings[term]) <= count * COMMON_TERM_SHARE]
+        average_length = self.total_length / count
+        scores: Dict[int, float] = {}
+        for term in rare or terms:
+            postings = self.postings[term]
+            idf = math.log((count - len(postings) + 0.5) / (len(postings) + 0.5) + 1)
+            for slot, frequency in postings.items():
+                weight = frequency * (self.k1 + 1) / (
+                    frequency + self.k1 * (1 - self.b + self.b * self.lengths[slot] / average_length))
+                scores[slot] = scores.get(slot, 0.0) + idf * weight
+        best = heapq.nlargest(n_results, scores.items(), key=itemgetter(1))
+        return [(self.ids[slot], score) for slot, score in best]
+
+    def get(self, ids: List[str]) -> Tuple[List[str], List[Optional[dict]]]:
+        """Documents and metadata of indexed ids, in the given order"""
+        slots = [self.slots[doc_id] for doc_id in ids]
+        return [self.documents[slot] for slot in slots], [self.metadatas[slot] for slot in slots]
+
+    def save(self, path: str):
+        """Write the index atomically, dropping the slots of removed documents"""
+        if len(self.ids) > len(self.slots):
+            live = [slot for slot in range(len(self.ids)) if self.ids[slot] is not None]
+            compacted = LexicalIndex(self.k1, self.b)
+            compacted.add([self.ids[s] for s in live], [self.documents[s] for s in live],
+                          [self.metadatas[s] for s in live])
+            self.__dict__.update(compacted.__dict__)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path: str) -> 'LexicalIndex':
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    @classmethod
+    def from_collection(cls, collection, page_size: Optional[int] = None) -> 'LexicalIndex':
+        """An index of every document stored in a Chroma collection"""
+        index = cls()
+        page_size = page_size or config.EMBED_READ_CHUNK_ROWS
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=['documents', 'metadatas'])
+            index.add(page['ids'], page['documents'], page['metadatas'])
+            if len(page['ids']) < page_size:
+                return index
+            offset += page_size
+
+def index_path(collection_name: str) -> str:
+    return os.path.join(config.LEXICAL_INDEX_PATH, f"{collection_name}.pkl")
+
+# Saved indexes loaded by this process, with the file modification time they were read at
+_loaded: Dict[str, Tuple[int, LexicalIndex]] = {}
+
+def load_lexical_index(collection_name: str) -> Optional[LexicalIndex]:
+    """The saved index of a collection, reloaded after a sync replaces it; None if none was saved"""
+    path = index_path(collection_name)
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != modified:
+        cached = _loaded[path] = (modified, LexicalIndex.load(path))
+    return cached[1]
+
+def get_lexical_index(collection) -> LexicalIndex:
+    """The saved index of a collection, rebuilt from its documents when missing or out of step with it"""
+    index = load_lexical_index(collection.name)
+    if index is None or len(index) != collection.count():
+        index = LexicalIndex.from_collection(collection)
+        path = index_path(collection.name)
+        index.save(path)
+        _loaded[path] = (os.stat(path).st_mtime_ns, index)
+    return index
@@ -0,0 +1,311 @@
+"""
+LLM gateway: every generation in the API goes through one per-process gateway
+It keeps one client per provider for the life of the process (so connections to Ollama or
+the Hugging Face endpoint are reused instead of re-opened per request) and runs at most
+LLM_MAX_CONCURRENT generations at once on its own threads. Requests beyond that wait in a
+queue of at most LLM_MAX_QUEUE; past it new requests are refused with LLMOverloaded
+rather than piling up behind a provider that is already saturated.
+
+Each request has a deadline (LLM_TIMEOUT seconds by default, queueing included). A caller
+whose deadline passes gets LLMTimeout; a generation nobody is waiting for any more is
+dropped from the queue if it has not started.
+
+Identical prompts with identical options that arrive while one is already queued or
+running share that generation (single flight) instead of each starting their own.
+Streamed answers are not shared, since each stream must start from the first token.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Iterator, Optional, Tuple
+import numpy as np
+import config
+
+# Recent queue waits and generation times kept for the latency percentiles
+LATENCY_WINDOW = 1000
+
+# Hugging Face text_generation settings when the caller gives none
+HF_DEFAULTS = {'max_new_tokens': 500, 'temperature': 0.1}
+
+class LLMOverloaded(RuntimeError):
+    """The gateway's wait queue is full"""
+
+class LLMTimeout(TimeoutError):
+    """A request's deadline passed before its answer was complete"""
+
+def _percentile_ms(samples, q: float) -> float:
+    return round(float(np.percentile(samples, q)) * 1000, 2) if samples else 0.0
+
+class _Flight:
+    """One queued or running generation and the number of callers waiting for it"""
+
+    def __init__(self, key):
+        self.key = key
+        self.future: Optional[Future] = None
+        self.waiters = 1
+        self.submitted = time.monotonic()
+
+class LLMGateway:
+    """Pooled, rate-limited access to the configured LLM provider"""
+
+    def __init__(self, provider: Optional[str] = None, model: Optional[str] = None,
+                 max_concurrent: Optional[int] = None, max_queue: Optional[int] = None,
+                 timeout: Optional[float] = None, host: Optional[str] = None):
+        self.provider = provider or config.LLM_PROVIDER
+        self.model = model or config.LLM_MODEL
+        self.max_concurrent = max_concurrent or config.LLM_MAX_CONCURRENT
+        self.max_queue = config.LLM_MAX_QUEUE if max_queue is None else max_queue
+        self.timeout = timeout or config.LLM_TIMEOUT
+        self.host = host or config.OLLAMA_HOST
+        # The executor's workers are the concurrency slots; its work queue is the wait queue
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="llm-gateway")
+        self._client = None
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple, _Flight] = {}
+        self.queued = 0
+        self.running = 0
+        self.requests = 0
+        self.generations = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._queue_latencies = deque(maxlen=LATENCY_WINDOW)
+        self._generation_latencies = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def client(self):
+        """The provider's client, created on first use and kept for the life of the gateway"""
+        with self._lock:
+            if self._client is None:
+                if self.provider == "huggingface":
+                    from huggingface_hub import InferenceClient
+                    self._client = InferenceClient(model=self.model, token=config.HUGGINGFACE_API_KEY,
+                                                   timeout=self.timeout)
+                elif self.provider == "ollama":
+                    import ollama
+                    self._client = ollama.Client(host=self.host, timeout=self.timeout)
+            return self._client
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        client, self._client = self._client, None
+        http = getattr(client, '_client', None)  # ollama.Client wraps an httpx.Client
+        if hasattr(http, 'close'):
+            http.close()
+
+    # Provider calls (run on the gateway's threads)
+
+    def _complete(self, prompt: str, options: Dict) -> str:
+        if self.provider == "huggingface":
+            return self.client.text_generation(prompt, **self._hf_options(options))
+        elif self.provider == "ollama":
+            response = self.client.chat(model=self.model, messages=[{"role": "user", "content": prompt}],
+                                        options=self._ollama_options(options))
+            return response["message"]["content"]
+        return "LLM provider not configured."
+
+    def _stream(self, prompt: str, options: Dict) -> Iterator[str]:
+        if self.provider == "huggingface":
+            yield from self.client.text_generation(prompt, stream=True, **self._hf_options(options))
+        elif self.provider == "ollama":
+            for chunk in self.client.chat(model=self.model, messages=[{"role": "user", "content": prompt}],
+                                          options=self._ollama_options(options), stream=True):
+                yield chunk["message"]["content"]
+        else:
+            yield "LLM provider not configured."
+
+    @staticmethod
+    def _hf_options(options: Dict) -> Dict:
+        settings = dict(HF_DEFAULTS)
+        if options.get('max_tokens'):
+            settings['max_new_tokens'] = options['max_tokens']
+        settings.update({name: options[name] for name in ('temperature', 'top_p') if name in options})
+        return settings
+
+    @staticmethod
+    def _ollama_options(options: Dict) -> Optional[Dict]:
+        settings = {name: options[name] for name in ('temperature', 'top_p') if name in options}
+        if options.get('max_tokens'):
+            settings['num_predict'] = options['max_tokens']
+        return settings or None
+
+    # Queueing
+
+    def _submit(self, key, work: Callable) -> _Flight:
+        """Join the flight for key, or queue work as a new one"""
+        with self._lock:
+            self.requests += 1
+            flight = self._inflight.get(key) if key is not None else None
+            if flight is not None:
+                flight.waiters += 1
+                self.coalesced += 1
+                return flight
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise LLMOverloaded(f"{self.queued} LLM requests are already waiting (LLM_MAX_QUEUE={self.max_queue})")
+            flight = _Flight(key)
+            self.queued += 1
+            if key is not None:
+                self._inflight[key] = flight
+            flight.future = self._executor.submit(self._run, flight, work)
+            return flight
+
+    def _run(self, flight: _Flight, work: Callable):
+        started = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self._queue_latencies.append(started - flight.submitted)
+        try:
+            return work()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.generations += 1
+                self._generation_latencies.append(time.monotonic() - started)
+                if self._inflight.get(flight.key) is flight:
+                    del self._inflight[flight.key]
+
+    def _leave(self, flight: _Flight, timed_out: bool):
+        """A caller stops waiting; the last one to leave drops the generation if it has not started"""
+        with self._lock:
+            flight.waiters -= 1
+            if timed_out:
+                self.timeouts += 1
+            if flight.waiters == 0 and flight.future.cancel():
+                self.queued -= 1
+                if self._inflight.get(flight.key) is flight:
+                    del self._inflight[flight.key]
+
+    def _timeout(self, timeout: Optional[float]) -> float:
+        # 0 is a deadline that has already passed, not "use the default"
+        return self.timeout if timeout is None else max(timeout, 0.0)
+
+    # Public API
+
+    def generate(self, prompt: str, timeout: Optional[float] = None, **options) -> str:
+        """
+        The whole answer to prompt, waiting at most timeout seconds (LLM_TIMEOUT) including the queue
+
+        options: temperature, top_p, max_tokens. Blocks the calling thread; async code should
+        use agenerate.
+        """
+        timeout = self._timeout(timeout)
+        deadline = time.monotonic() + timeout
+        key = ('generate', prompt, tuple(sorted(options.items())))
+        flight = self._submit(key, lambda: self._complete(prompt, options))
+        timed_out = False
+        try:
+            return flight.future.result(timeout=max(deadline - time.monotonic(), 0))
+        except (FutureTimeout, CancelledError):
+            timed_out = True
+            raise LLMTimeout(f"No answer from {self.model} within {timeout:g}s") from None
+        finally:
+            self._leave(flight, timed_out)
+
+    async def agenerate(self, prompt: str, timeout: Optional[float] = None, **options) -> str:
+        """generate for the event loop: waits without holding a thread"""
+        timeout = self._timeout(timeout)
+        deadline = time.monotonic() + timeout
+        key = ('generate', prompt, tuple(sorted(options.items())))
+        flight = self._submit(key, lambda: self._complete(prompt, options))
+        timed_out = False
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(flight.future)),
+                                          max(deadline - time.monotonic(), 0))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            if timed_out:
+                raise LLMTimeout(f"No answer from {self.model} within {timeout:g}s") from None
+            raise
+        finally:
+            self._leave(flight, timed_out)
+
+    def stream(self, prompt: str, timeout: Optional[float] = None, **options) -> Iterator[str]:
+        """
+        The answer to prompt piece by piece (blocking iterator), within the same slots and deadline
+
+        Closing the iterator early stops the generation at its next piece.
+        """
+        timeout = self._timeout(timeout)
+        deadline = time.monotonic() + timeout
+        pieces: queue.Queue = queue.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for piece in self._stream(prompt, options):
+                    if stop.is_set():
+                        break
+                    pieces.put((piece, None))
+            except Exception as e:
+                pieces.put((done, e))
+                raise
+            pieces.put((done, None))
+
+        flight = self._submit(None, produce)
+        timed_out = False
+        try:
+            while True:
+                try:
+                    piece, error = pieces.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    timed_out = True
+                    raise LLMTimeout(f"Answer from {self.model} not complete within {timeout:g}s") from None
+                if piece is done:
+                    if error is not None:
+                        raise error
+                    return
+                yield piece
+        finally:
+            stop.set()
+            self._leave(flight, timed_out)
+
+    def stats(self) -> Dict:
+        """Queue depth, coalescing and latency counters for this process"""
+        with self._lock:
+            waits = list(self._queue_latencies)
+            generations = list(self._generation_latencies)
+            return {
+                'provider': self.provider,
+                'model': self.model,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'running': self.running,
+                'queued': self.queued,
+                'requests': self.requests,
+                'generations': self.generations,
+                'coalesced': self.coalesced,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'errors': self.errors,
+                'queue_ms_p50': _percentile_ms(waits, 50),
+                'queue_ms_p95': _percentile_ms(waits, 95),
+                'generation_ms_p50': _percentile_ms(generations, 50),
+                'generation_ms_p95': _percentile_ms(generations, 95)
+            }
+
+_gateway: Optional[LLMGateway] = None
+_gateway_pid: Optional[int] = None
+_gateway_lock = threading.Lock()
+
+def get_gateway() -> LLMGateway:
+    """Return the process-wide gateway, creating it on first use"""
+    global _gateway, _gateway_pid
+    with _gateway_lock:
+        if _gateway is None or _gateway_pid != os.getpid():
+            # Forked worker: the parent's threads and connections did not come along
+            _gateway = LLMGateway()
+            _gateway_pid = os.getpid()
+        return _gateway
@@ -1,24 +1,38 @@
 from fastapi import FastAPI
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import chromadb
 from chromadb.utils import embedding_functions
 import pandas as pd
 from datetime import datetime
-from sqlalchemy import create_engine
 from export_utils import export_to_ascii, export_to_netcdf, export_to_csv
-from fastapi.responses import Response
-from nl_to_sql import NLToSQLTranslator, process_analytical_query
+from fastapi.responses import Response, StreamingResponse
+from nl_to_sql import SQL_TIMEOUT_STATUS, get_translator, process_analytical_query_async
+from database import run_blocking, read_sql_query_async, get_engine, get_pool_stats, get_data_version
+from data_cube import CUBE_PARAMETERS, query_cube
+from embedding_backends import load_encoder, model_id, resolve_backend
+from embedding_cache import CachedEmbeddingFunction, get_embedding_cache
+from embedding_service import EmbeddingService, ServiceEmbeddingFunction
+from lexical_index import get_lexical_index
+from llm_gateway import LLMOverloaded, LLMTimeout, get_gateway
+from deadline import Deadline
+from data_chroma_floats import MEASUREMENT_COLLECTION, PROFILE_COLLECTION
+from retrieval_cache import RetrievalCache, cached_retrieve
+from answer_cache import get_answer_cache
+from sql_cache import get_translation_cache
+from mmap_store import MmapClient
+from streaming import MEDIA_TYPE as STREAM_MEDIA_TYPE, answer_events, encode_event, iterate_blocking
+from sample_queries import CHAT_SAMPLE_QUERIES, MULTI_DATASET_SAMPLE_QUERIES, SEMANTIC_SAMPLE_QUERIES
+from query_constraints import NAMED_REGIONS, QueryConstraints
+from typing import Optional, Tuple
 import config
 import uuid
+import asyncio
+import time
 
-# Conditional imports for LLM providers
-if config.LLM_PROVIDER == "huggingface":
-    from huggingface_hub import InferenceClient
-    from sentence_transformers import SentenceTransformer
-elif config.LLM_PROVIDER == "ollama":
-    import ollama
+# Generations go through one gateway per process: persistent client, bounded concurrency
+llm_gateway = get_gateway()
 
-engine = create_engine(config.DATABASE_URL)
+engine = get_engine()
 
 app = FastAPI(
     title="Ocean Data RAG API",
@@ -31,153 +45,317 @@ async def health_check():
     return {
         "status": "healthy",
         "database": "connected" if engine else "disconnected",
-        "chromadb": "connected" if collection else "disconnected"
+        "chromadb": "connected" if profile_collection or collection else "disconnected"
     }
 
+@app.get("/metrics/db-pool")
+async def db_pool_metrics():
+    """Connection pool statistics for this worker process (use to size Postgres max_connections)"""
+    return get_pool_stats(engine)
+
+@app.get("/metrics/embedding-cache")
+async def embedding_cache_metrics():
+    """Query embedding cache hit rate for this worker process, plus the size of the shared cache"""
+    if embedding_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_cache.stats()}
+
+@app.get("/metrics/embedding-service")
+async def embedding_service_metrics():
+    """Batch sizes, throughput and latency of query embedding in this worker process"""
+    if embedding_service is None:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_service.stats()}
+
+@app.get("/metrics/retrieval-cache")
+async def retrieval_cache_metrics():
+    """Hit rate of the retrieval cache in this worker process"""
+    if retrieval_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **retrieval_cache.stats()}
+
+@app.get("/metrics/answer-cache")
+async def answer_cache_metrics():
+    """Hit rate of the LLM answer cache in this worker process, plus the size of the shared cache"""
+    if answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **answer_cache.stats()}
+
+@app.get("/metrics/sql-cache")
+async def sql_cache_metrics():
+    """Hit rate of the NL-to-SQL translation cache in this worker process, plus the size of the shared cache"""
+    if nl_sql_translator.translation_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **nl_sql_translator.translation_cache.stats()}
+
+@app.get("/metrics/llm")
+async def llm_metrics():
+    """Queue depth, coalesced requests and generation latency of the LLM gateway in this worker process"""
+    return llm_gateway.stats()
+
+@app.on_event("startup")
+async def start_embedding_service():
+    if embedding_service is not None:
+        embedding_service.start()
+
+@app.on_event("shutdown")
+async def stop_embedding_service():
+    if embedding_service is not None:
+        await embedding_service.stop()
+        embedding_service.close()
+
+@app.on_event("shutdown")
+async def close_llm_gateway():
+    llm_gateway.close()
+
 # Initialize NL-to-SQL translator
-nl_sql_translator = NLToSQLTranslator()
+nl_sql_translator = get_translator()
 
 class QueryRequest(BaseModel):
     query_text: str
+    deadline_seconds: Optional[float] = Field(None, gt=0)  # A shorter deadline than QUERY_DEADLINE for this request
 
 class QueryResponse(BaseModel):
     answer: str
     context_documents: list[str]
     retrieved_metadata: list[dict]
     sql_results: list[dict] = None  # Optional SQL results for analytical queries
-
+    metadata: dict = None  # Deadline, stage times, where the answer came from and why it degraded
+
+def request_deadline(request: QueryRequest) -> Deadline:
+    """QUERY_DEADLINE, or a shorter one the client asked for; only the server can lift the deadline"""
+    seconds = config.QUERY_DEADLINE if config.QUERY_DEADLINE > 0 else None
+    if request.deadline_seconds is not None:
+        seconds = request.deadline_seconds if seconds is None else min(request.deadline_seconds, seconds)
+    return Deadline(seconds)
+
+embedding_cache = None
+embedding_service = None
+retrieval_cache = None
+answer_cache = None
 try:
     if config.VECTOR_STORE == "memory":
         client = chromadb.Client()
         print("Using in-memory ChromaDB")
+    elif config.VECTOR_STORE == "mmap":
+        client = MmapClient(config.MMAP_STORE_PATH)
+        print("Using memory-mapped vector store")
     else:
         client = chromadb.PersistentClient(path=config.CHROMA_PATH)
         print("Using persistent ChromaDB")
 
     if config.LLM_PROVIDER == "huggingface":
-        # Use sentence-transformers for embeddings
-        embedding_model = SentenceTransformer(config.EMBEDDING_MODEL)
+        # Use sentence-transformers for embeddings, on the configured CPU backend
+        embedding_backend = resolve_backend(config.EMBEDDING_MODEL, config.EMBED_BACKEND)
+        embedding_model = load_encoder(config.EMBEDDING_MODEL, embedding_backend)
         def hf_embedding_function(texts):
-            embeddings = embedding_model.encode(texts)
+            embeddings = embedding_model(texts)
             return embeddings.tolist()
         ef = hf_embedding_function
+        embedding_model_name = model_id(config.EMBEDDING_MODEL, embedding_backend)
+        print(f"Embedding with {config.EMBEDDING_MODEL} on the {embedding_backend} backend")
     else:
         # Fallback to default
         ef = embedding_functions.DefaultEmbeddingFunction()
+        embedding_model_name = "chromadb-default-all-MiniLM-L6-v2"
+
+    if config.EMBED_SERVICE:
+        # Concurrent questions share one forward pass
+        embedding_service = EmbeddingService(ef)
+        ef = ServiceEmbeddingFunction(embedding_service)
+
+    if config.EMBED_CACHE:
+        # Repeated questions and texts embedded at indexing time skip the model
+        embedding_cache = get_embedding_cache(embedding_model_name)
+        ef = CachedEmbeddingFunction(embedding_service.encode if embedding_service else ef, embedding_cache)
 
-    collection = client.get_or_create_collection(
-        name="argo_measurements",
+    if config.SQL_CACHE:
+        # Questions the LLM already translated, and their paraphrases, skip SQL generation
+        nl_sql_translator.translation_cache = get_translation_cache(f"{llm_gateway.provider}:{llm_gateway.model}", ef)
+
+    # Profile summaries are the primary index; per-measurement documents only for RETRIEVAL_TIER=measurements
+    profile_collection = client.get_or_create_collection(
+        name=PROFILE_COLLECTION,
         embedding_function=ef
     )
+    collection = None
+    if config.RETRIEVAL_TIER == "measurements":
+        collection = client.get_or_create_collection(
+            name=MEASUREMENT_COLLECTION,
+            embedding_function=ef
+        )
+    if config.RETRIEVAL_CACHE:
+        retrieval_cache = RetrievalCache(client)
+    if config.ANSWER_CACHE:
+        # Questions retrieving the same context from the same data reuse the answer
+        answer_cache = get_answer_cache(f"{llm_gateway.provider}:{llm_gateway.model}")
     print("successfully connected to chromadb collection")
 except Exception as e:
     print(f"failed to connect to chromadb: {e}")
+    profile_collection = None
     collection = None
 
+if config.LEXICAL_INDEX:
+    try:
+        # Loaded now, or built from the stored documents if no sync has saved one yet
+        for lexical_collection in (profile_collection, collection):
+            if lexical_collection is not None:
+                get_lexical_index(lexical_collection)
+    except Exception as e:
+        print(f"failed to build the lexical index: {e}")
+
+def sample_questions() -> list[str]:
+    """Every question offered by /sample-queries and the chat interface, once each"""
+    from nl_to_sql import get_sample_analytical_queries
+    groups = [*get_sample_analytical_queries().values(), MULTI_DATASET_SAMPLE_QUERIES,
+              *SEMANTIC_SAMPLE_QUERIES.values(), *CHAT_SAMPLE_QUERIES.values()]
+    return list(dict.fromkeys(question for group in groups for question in group))
+
+async def prewarm_retrieval_cache():
+    """Retrieve every sample question so the first user to click one gets a cached answer"""
+    questions = sample_questions()
+    # A few at a time: user requests arriving during startup share the database executor
+    slots = asyncio.Semaphore(max(config.RETRIEVAL_CACHE_PREWARM_CONCURRENCY, 1))
+
+    async def prewarm(question):
+        async with slots:
+            return await run_blocking(cached_retrieve, retrieval_cache, question, profile_collection, collection, engine)
+
+    results = await asyncio.gather(*(prewarm(question) for question in questions), return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    print(f"retrieval cache pre-warmed with {len(questions) - failed} sample questions ({failed} failed)")
+
+prewarm_task = None
+
+@app.on_event("startup")
+async def start_prewarm():
+    global prewarm_task
+    if retrieval_cache is not None and config.RETRIEVAL_CACHE_PREWARM and (profile_collection or collection):
+        # In the background, so the server accepts requests while the cache fills
+        prewarm_task = asyncio.create_task(prewarm_retrieval_cache())
+
 @app.post("/query", response_model=QueryResponse)
 async def query_rag_pipeline(request: QueryRequest):
     """
     Enhanced query endpoint that handles both analytical (SQL) and semantic (RAG) queries
     """
-    if collection is None:
+    if profile_collection is None and collection is None:
         return {"answer": "Error: ChromaDB collection not available.", "context_documents": [], "retrieved_metadata": []}
+    deadline = request_deadline(request)
     
     # Check if this is an analytical query that needs SQL
     if nl_sql_translator.is_analytical_query(request.query_text):
+        result = await analytical_query(request.query_text, deadline)
+        if result is not None:
+            return {**result, "metadata": deadline.metadata('sql')}
+
+    # Use semantic search for descriptive queries, and for analytical ones SQL could not answer
+    return await semantic_search_query(request.query_text, deadline)
+
+async def analytical_query(query_text: str, deadline: Optional[Deadline] = None) -> Optional[dict]:
+    """Answer an analytical query with NL-to-SQL; None when it should fall back to semantic search"""
+    deadline = deadline or Deadline()
+    try:
+        # Process with enhanced NL-to-SQL, leaving time for semantic search should SQL not answer
+        reserve = config.QUERY_RETRIEVAL_RESERVE
         try:
-            # Process with enhanced NL-to-SQL
-            sql_result, error = process_analytical_query(request.query_text)
-            
-            if error:
-                # Fall back to semantic search if SQL fails
-                print(f"SQL processing failed: {error}")
-                return await semantic_search_query(request.query_text)
-            
-            # Extract enhanced SQL results
-            sql_query = sql_result['sql_query']
-            results_df = sql_result['results']
-            intent = sql_result['intent']
-            summary_stats = sql_result['summary_stats']
+            sql_result, error = await deadline.run(
+                'sql', process_analytical_query_async(query_text, deadline.timeout(reserve)), reserve)
+        except asyncio.TimeoutError:
+            sql_result, error = None, SQL_TIMEOUT_STATUS
+        
+        if error:
+            # Fall back to semantic search if SQL fails
+            print(f"SQL processing failed: {error}")
+            if SQL_TIMEOUT_STATUS in error:
+                deadline.degrade('sql_timeout')
+            return None
+        
+        # Extract enhanced SQL results
+        sql_query = sql_result['sql_query']
+        results_df = sql_result['results']
+        intent = sql_result['intent']
+        summary_stats = sql_result['summary_stats']
+        
+        if results_df.empty:
+            answer = f"Your analytical query executed successfully but returned no results. This might mean the data doesn't match your criteria. SQL executed: {sql_query}"
+            return {
+                "answer": answer, 
+                "context_documents": [f"SQL Query: {sql_query}"], 
+                "retrieved_metadata": [{"query_type": "analytical", "intent": intent, "status": "no_results"}]
+            }
+        
+        # Generate a simple summary without LLM (faster)
+        results_preview = results_df.head(5).to_string(index=False)
+        
+        # Create a readable, formatted summary
+        def format_results_for_display(df, intent_type):
+            """Format results in a human-readable way based on query intent"""
             
-            if results_df.empty:
-                answer = f"Your analytical query executed successfully but returned no results. This might mean the data doesn't match your criteria. SQL executed: {sql_query}"
-                return {
-                    "answer": answer, 
-                    "context_documents": [f"SQL Query: {sql_query}"], 
-                    "retrieved_metadata": [{"query_type": "analytical", "intent": intent, "status": "no_results"}]
-                }
+            if intent_type == 'avg_by_depth':
+                formatted_text = "**Temperature and Salinity by Depth Analysis:**\n\n"
+                for _, row in df.head(10).iterrows():
+                    depth = f"{row['depth']:.0f}m"
+                    temp = f"{row['avg_temperature']:.2f}°C" if pd.notna(row['avg_temperature']) else "N/A"
+                    sal = f"{row['avg_salinity']:.2f} PSU" if pd.notna(row['avg_salinity']) else "N/A"
+                    count = f"{row['measurement_count']:.0f}" if pd.notna(row['measurement_count']) else "0"
+                    formatted_text += f"• **{depth} depth**: Temperature {temp}, Salinity {sal} ({count} measurements)\n"
+                
+            elif intent_type == 'regional_comparison':
+                formatted_text = "**Regional Ocean Analysis:**\n\n"
+                for _, row in df.iterrows():
+                    region = row.get('region', 'Unknown Region')
+                    temp = f"{row['avg_temperature']:.2f}°C" if pd.notna(row['avg_temperature']) else "N/A"
+                    sal = f"{row['avg_salinity']:.2f} PSU" if pd.notna(row['avg_salinity']) else "N/A"
+                    count = f"{row['measurement_count']:.0f}" if pd.notna(row['measurement_count']) else "0"
+                    formatted_text += f"• **{region}**: Avg Temperature {temp}, Avg Salinity {sal} ({count} measurements)\n"
             
-            # Generate a simple summary without LLM (faster)
-            results_preview = results_df.head(5).to_string(index=False)
+            elif intent_type == 'temporal_trends':
+                formatted_text = "**Temporal Ocean Trends:**\n\n"
+                for _, row in df.head(10).iterrows():
+                    month = row['month'].strftime('%B %Y') if hasattr(row['month'], 'strftime') else str(row['month'])
+                    temp = f"{row['avg_temperature']:.2f}°C" if pd.notna(row['avg_temperature']) else "N/A"
+                    sal = f"{row['avg_salinity']:.2f} PSU" if pd.notna(row['avg_salinity']) else "N/A"
+                    count = f"{row['measurement_count']:.0f}" if pd.notna(row['measurement_count']) else "0"
+                    formatted_text += f"• **{month}**: Temperature {temp}, Salinity {sal} ({count} measurements)\n"
             
-            # Create a readable, formatted summary
-            def format_results_for_display(df, intent_type):
-                """Format results in a human-readable way based on query intent"""
-                
-                if intent_type == 'avg_by_depth':
-                    formatted_text = "**Temperature and Salinity by Depth Analysis:**\n\n"
-                    for _, row in df.head(10).iterrows():
-                        depth = f"{row['depth']:.0f}m"
-                        temp = f"{row['avg_temperature']:.2f}°C" if pd.notna(row['avg_temperature']) else "N/A"
-                        sal = f"{row['avg_salinity']:.2f} PSU" if pd.notna(row['avg_salinity']) else "N/A"
-                        count = f"{row['measurement_count']:.0f}" if pd.notna(row['measurement_count']) else "0"
-                        formatted_text += f"• **{depth} depth**: Temperature {temp}, Salinity {sal} ({count} measurements)\n"
-                    
-                elif intent_type == 'regional_comparison':
-                    formatted_text = "**Regional Ocean Analysis:**\n\n"
-                    for _, row in df.iterrows():
-                        region = row.get('region', 'Unknown Region')
-                        temp = f"{row['avg_temperature']:.2f}°C" if pd.notna(row['avg_temperature']) else "N/A"
-                        sal = f"{row['avg_salinity']:.2f} PSU" if pd.notna(row['avg_salinity']) else "N/A"
-                        count = f"{row['measurement_count']:.0f}" if pd.notna(row['measurement_count']) else "0"
-                        formatted_text += f"• **{region}**: Avg Temperature {temp}, Avg Salinity {sal} ({count} measurements)\n"
-                
-                elif intent_type == 'temporal_trends':
-                    formatted_text = "**Temporal Ocean Trends:**\n\n"
-                    for _, row in df.head(10).iterrows():
-                        month = row['month'].strftime('%B %Y') if hasattr(row['month'], 'strftime') else str(row['month'])
-                        temp = f"{row['avg_temperature']:.2f}°C" if pd.notna(row['avg_temperature']) else "N/A"
-                        sal = f"{row['avg_salinity']:.2f} PSU" if pd.notna(row['avg_salinity']) else "N/A"
-                        count = f"{row['measurement_count']:.0f}" if pd.notna(row['measurement_count']) else "0"
-                        formatted_text += f"• **{month}**: Temperature {temp}, Salinity {sal} ({count} measurements)\n"
-                
-                elif intent_type == 'float_summary':
-                    formatted_text = "**ARGO Float Performance Summary:**\n\n"
-                    for _, row in df.head(10).iterrows():
-                        float_id = row['float_id']
-                        profiles = f"{row['total_profiles']:.0f}" if pd.notna(row['total_profiles']) else "0"
-                        measurements = f"{row['total_measurements']:.0f}" if pd.notna(row['total_measurements']) else "0"
-                        temp = f"{row['avg_temperature']:.2f}°C" if pd.notna(row['avg_temperature']) else "N/A"
-                        depth_range = f"{row['min_depth']:.0f}-{row['max_depth']:.0f}m" if pd.notna(row['min_depth']) else "N/A"
-                        formatted_text += f"• **{float_id}**: {profiles} profiles, {measurements} measurements, Avg temp {temp}, Depth range {depth_range}\n"
-                
-                else:
-                    # Generic formatting for other query types
-                    formatted_text = "**Analysis Results:**\n\n"
-                    for i, (_, row) in enumerate(df.head(10).iterrows()):
-                        formatted_text += f"**Result {i+1}:**\n"
-                        for col, val in row.items():
-                            if pd.notna(val):
-                                if 'temperature' in col.lower():
-                                    formatted_text += f"  - {col.replace('_', ' ').title()}: {val:.2f}°C\n"
-                                elif 'salinity' in col.lower():
-                                    formatted_text += f"  - {col.replace('_', ' ').title()}: {val:.2f} PSU\n"
-                                elif 'depth' in col.lower():
-                                    formatted_text += f"  - {col.replace('_', ' ').title()}: {val:.0f}m\n"
-                                elif 'count' in col.lower():
-                                    formatted_text += f"  - {col.replace('_', ' ').title()}: {val:.0f}\n"
-                                else:
-                                    formatted_text += f"  - {col.replace('_', ' ').title()}: {val}\n"
-                        formatted_text += "\n"
-                
-                return formatted_text
+            elif intent_type == 'float_summary':
+                formatted_text = "**ARGO Float Performance Summary:**\n\n"
+                for _, row in df.head(10).iterrows():
+                    float_id = row['float_id']
+                    profiles = f"{row['total_profiles']:.0f}" if pd.notna(row['total_profiles']) else "0"
+                    measurements = f"{row['total_measurements']:.0f}" if pd.notna(row['total_measurements']) else "0"
+                    temp = f"{row['avg_temperature']:.2f}°C" if pd.notna(row['avg_temperature']) else "N/A"
+                    depth_range = f"{row['min_depth']:.0f}-{row['max_depth']:.0f}m" if pd.notna(row['min_depth']) else "N/A"
+                    formatted_text += f"• **{float_id}**: {profiles} profiles, {measurements} measurements, Avg temp {temp}, Depth range {depth_range}\n"
             
-            # Generate readable summary
-            formatted_results = format_results_for_display(results_df, intent)
+            else:
+                # Generic formatting for other query types
+                formatted_text = "**Analysis Results:**\n\n"
+                for i, (_, row) in enumerate(df.head(10).iterrows()):
+                    formatted_text += f"**Result {i+1}:**\n"
+                    for col, val in row.items():
+                        if pd.notna(val):
+                            if 'temperature' in col.lower():
+                                formatted_text += f"  - {col.replace('_', ' ').title()}: {val:.2f}°C\n"
+                            elif 'salinity' in col.lower():
+                                formatted_text += f"  - {col.replace('_', ' ').title()}: {val:.2f} PSU\n"
+                            elif 'depth' in col.lower():
+                                formatted_text += f"  - {col.replace('_', ' ').title()}: {val:.0f}m\n"
+                            elif 'count' in col.lower():
+                                formatted_text += f"  - {col.replace('_', ' ').title()}: {val:.0f}\n"
+                            else:
+                                formatted_text += f"  - {col.replace('_', ' ').title()}: {val}\n"
+                    formatted_text += "\n"
             
-            answer = f"""**Analytical Query Results**
+            return formatted_text
+        
+        # Generate readable summary
+        formatted_results = format_results_for_display(results_df, intent)
+        
+        answer = f"""**Analytical Query Results**
 
-**Query:** {request.query_text}
+**Query:** {query_text}
 **Analysis Type:** {intent.replace('_', ' ').title()}
 **Total Results:** {len(results_df)} data points
 
@@ -189,75 +367,61 @@ async def query_rag_pipeline(request: QueryRequest):
 - Results show oceanographic patterns in the selected region
 
 *Note: This analysis is based on ARGO float data from the Indian Ocean region.*"""
-            
-            # Enhanced metadata for frontend (ensure JSON serializable)
-            sql_metadata = [{
-                'query_type': 'analytical',
-                'intent': str(intent),
-                'sql_query': str(sql_query),
-                'row_count': int(len(results_df)),
-                'column_count': int(len(results_df.columns)),
-                'columns': [str(col) for col in results_df.columns],
-                'execution_status': str(sql_result['execution_status']),
-                'summary_stats': summary_stats
-            }]
-            
-            # Convert DataFrame to JSON-serializable format
-            def convert_numpy_types(obj):
-                """Convert numpy types to Python native types"""
-                if hasattr(obj, 'dtype'):
-                    if 'int' in str(obj.dtype):
-                        return int(obj)
-                    elif 'float' in str(obj.dtype):
-                        return float(obj)
-                    elif 'bool' in str(obj.dtype):
-                        return bool(obj)
-                    else:
-                        return str(obj)
-                return obj
-            
-            # Limit results and convert numpy types
-            limited_df = results_df.head(200) if len(results_df) > 200 else results_df
-            limited_results = []
-            
-            for _, row in limited_df.iterrows():
-                row_dict = {}
-                for col, val in row.items():
-                    if pd.isna(val):
-                        row_dict[str(col)] = None
-                    else:
-                        row_dict[str(col)] = convert_numpy_types(val)
-                limited_results.append(row_dict)
-            
-            return {
-                "answer": answer,
-                "context_documents": [f"SQL Analysis ({intent}): {sql_query}"],
-                "retrieved_metadata": sql_metadata,
-                "sql_results": limited_results
-            }
-            
-        except (TimeoutError, Exception) as e:
-            print(f"SQL processing error: {e}")
-            # Fall back to semantic search for any error including timeouts
-            return await semantic_search_query(request.query_text)
-    
-    else:
-        # Use semantic search for descriptive queries
-        return await semantic_search_query(request.query_text)
-
-async def semantic_search_query(query_text: str):
-    """Handle semantic search queries using ChromaDB"""
-
-    results = collection.query(
-        query_texts=[query_text],
-        n_results=5
-    )
-
-    retrieved_documents = results['documents'][0]
-    retrieved_metadata = results['metadatas'][0]
-    context = "\n".join(retrieved_documents)
+        
+        # Enhanced metadata for frontend (ensure JSON serializable)
+        sql_metadata = [{
+            'query_type': 'analytical',
+            'intent': str(intent),
+            'sql_query': str(sql_query),
+            'row_count': int(len(results_df)),
+            'column_count': int(len(results_df.columns)),
+            'columns': [str(col) for col in results_df.columns],
+            'execution_status': str(sql_result['execution_status']),
+            'constraints': sql_result.get('constraints', {}),
+            'summary_stats': summary_stats
+        }]
+        
+        # Convert DataFrame to JSON-serializable format
+        def convert_numpy_types(obj):
+            """Convert numpy types to Python native types"""
+            if hasattr(obj, 'dtype'):
+                if 'int' in str(obj.dtype):
+                    return int(obj)
+                elif 'float' in str(obj.dtype):
+                    return float(obj)
+                elif 'bool' in str(obj.dtype):
+                    return bool(obj)
+                else:
+                    return str(obj)
+            return obj
+        
+        # Limit results and convert numpy types
+        limited_df = results_df.head(200) if len(results_df) > 200 else results_df
+        limited_results = []
+        
+        for _, row in limited_df.iterrows():
+            row_dict = {}
+            for col, val in row.items():
+                if pd.isna(val):
+                    row_dict[str(col)] = None
+                else:
+                    row_dict[str(col)] = convert_numpy_types(val)
+            limited_results.append(row_dict)
+        
+        return {
+            "answer": answer,
+            "context_documents": [f"SQL Analysis ({intent}): {sql_query}"],
+            "retrieved_metadata": sql_metadata,
+            "sql_results": limited_results
+        }
+        
+    except (TimeoutError, Exception) as e:
+        print(f"SQL processing error: {e}")
+        # Fall back to semantic search for any error including timeouts
+        return None
 
-    prompt = f"""
+def semantic_prompt(context: str, query_text: str) -> str:
+    return f"""
     You are an expert oceanographic AI assistant.
     Your task is to answer the user's question using only the facts present in the provided Context.
     Be concise and factual. If the information is not in the context, say so.
@@ -271,25 +435,180 @@ async def semantic_search_query(query_text: str):
     Answer:
     """
 
-    if config.LLM_PROVIDER == "huggingface":
-        client = InferenceClient(model=config.LLM_MODEL, token=config.HUGGINGFACE_API_KEY)
-        response = client.text_generation(prompt, max_new_tokens=500, temperature=0.1)
-        answer = response
-    elif config.LLM_PROVIDER == "ollama":
-        response = ollama.chat(
-            model=config.LLM_MODEL,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        answer = response["message"]["content"]
-    else:
-        answer = "LLM provider not configured."
+def lookup_answer(query_text: str, retrieval) -> Tuple[Optional[str], Optional[int]]:
+    """The cached answer for a question with this context (None if there is none), and the current data version"""
+    if answer_cache is None:
+        return None, None
+    try:
+        data_version = get_data_version(engine)
+        return answer_cache.get(query_text, retrieval.document_ids, data_version, retrieval.query_embedding), data_version
+    except Exception as e:
+        print(f"Answer cache lookup failed: {e}")
+        return None, None
+
+def remember_answer(query_text: str, retrieval, data_version: Optional[int], answer: str):
+    if answer_cache is not None and data_version is not None:
+        try:
+            answer_cache.put(query_text, retrieval.document_ids, data_version, answer, retrieval.query_embedding)
+        except Exception as e:
+            print(f"Failed to cache the answer: {e}")
+
+async def single_token(answer: str):
+    yield answer
+
+# Longest document quoted in a retrieval-only answer
+RETRIEVAL_ONLY_DOCUMENT_CHARS = 500
+
+def retrieval_only_answer(retrieval) -> str:
+    """The retrieved context as the answer, for when there is no time to have the LLM summarize it"""
+    if not retrieval.documents:
+        return "No matching data was found for this question."
+    documents = [document if len(document) <= RETRIEVAL_ONLY_DOCUMENT_CHARS
+                 else document[:RETRIEVAL_ONLY_DOCUMENT_CHARS].rstrip() + "…" for document in retrieval.documents]
+    return ("**Most relevant data found** (no summary could be generated in the time available):\n\n"
+            + "\n".join(f"{i}. {document}" for i, document in enumerate(documents, start=1)))
+
+async def generate_within(deadline: Deadline, query_text: str, retrieval) -> Tuple[str, str]:
+    """(answer, source): the LLM's answer within what is left of the budget, or a retrieval-only one"""
+    if deadline.remaining() < config.QUERY_MIN_GENERATION:
+        deadline.degrade('generation_budget')
+        return retrieval_only_answer(retrieval), 'retrieval'
+    prompt = semantic_prompt("\n".join(retrieval.documents), query_text)
+    try:
+        return await deadline.run('generation', llm_gateway.agenerate(prompt, timeout=deadline.timeout())), 'llm'
+    except (asyncio.TimeoutError, LLMTimeout):
+        deadline.degrade('llm_timeout')
+    except LLMOverloaded:
+        deadline.degrade('llm_overloaded')
+    except Exception as e:
+        print(f"Answer generation failed: {e}")
+        deadline.degrade('llm_error')
+    return retrieval_only_answer(retrieval), 'retrieval'
+
+async def semantic_search_query(query_text: str, deadline: Optional[Deadline] = None):
+    """Handle semantic search queries: matching profiles from ChromaDB, their measurements from PostgreSQL"""
+    deadline = deadline or Deadline()
+
+    try:
+        retrieval = await deadline.run('retrieval', run_blocking(
+            cached_retrieve, retrieval_cache, query_text, profile_collection, collection, engine))
+    except asyncio.TimeoutError:
+        deadline.degrade('retrieval_timeout')
+        return {
+            "answer": "No data could be retrieved for this question in the time available. Please try again.",
+            "context_documents": [],
+            "retrieved_metadata": [],
+            "metadata": deadline.metadata('none')
+        }
+    except Exception as e:
+        print(f"Retrieval failed: {e}")
+        return {
+            "answer": f"Error: Retrieval failed: {e}",
+            "context_documents": [],
+            "retrieved_metadata": [],
+            "metadata": deadline.metadata('none')
+        }
+    answer, data_version = await run_blocking(lookup_answer, query_text, retrieval)
+    source = 'cache'
+    if answer is None:
+        answer, source = await generate_within(deadline, query_text, retrieval)
+        if source == 'llm':
+            await run_blocking(remember_answer, query_text, retrieval, data_version, answer)
 
     return {
         "answer": answer,
-        "context_documents": retrieved_documents,
-        "retrieved_metadata": retrieved_metadata
+        "context_documents": retrieval.documents,
+        "retrieved_metadata": retrieval.metadatas,
+        "metadata": deadline.metadata(source)
     }
 
+@app.post("/query/stream")
+async def query_rag_pipeline_stream(request: QueryRequest):
+    """
+    /query as NDJSON events (see streaming.py): the retrieved context first, then the answer as it is generated
+    """
+    return StreamingResponse(query_events(request.query_text, request_deadline(request)), media_type=STREAM_MEDIA_TYPE)
+
+async def query_events(query_text: str, deadline: Optional[Deadline] = None):
+    deadline = deadline or Deadline()
+    if profile_collection is None and collection is None:
+        yield encode_event('error', message="ChromaDB collection not available.", answer="")
+        return
+
+    if nl_sql_translator.is_analytical_query(query_text):
+        result = await analytical_query(query_text, deadline)
+        if result is not None:
+            # Formatted from SQL results without the LLM: the whole answer is one token
+            answer = result.pop("answer")
+            async for event in answer_events({**result, "metadata": deadline.metadata('sql')}, single_token(answer)):
+                yield event
+            return
+
+    try:
+        retrieval = await deadline.run('retrieval', run_blocking(
+            cached_retrieve, retrieval_cache, query_text, profile_collection, collection, engine))
+    except asyncio.TimeoutError:
+        deadline.degrade('retrieval_timeout')
+        yield encode_event('error', message="No data could be retrieved in the time available.", answer="",
+                           metadata=deadline.metadata('none'))
+        return
+    except Exception as e:
+        print(f"Retrieval failed: {e}")
+        yield encode_event('error', message=f"Retrieval failed: {e}", answer="")
+        return
+    context = {"context_documents": retrieval.documents, "retrieved_metadata": retrieval.metadatas}
+    answer, data_version = await run_blocking(lookup_answer, query_text, retrieval)
+    source = 'llm'
+
+    async def generated_tokens():
+        """
+        The LLM's answer within the rest of the budget, degrading to a retrieval-only answer
+        like generate_within when generation fails before its first token; failing after it
+        ends with an error carrying the partial answer
+        """
+        nonlocal source
+        prompt = semantic_prompt("\n".join(retrieval.documents), query_text)
+        tokens = remembered_tokens(query_text, retrieval, data_version,
+                                   iterate_blocking(llm_gateway.stream, prompt, deadline.timeout()))
+        started, answered = time.monotonic(), False
+        try:
+            async for token in tokens:
+                answered = answered or bool(token)
+                yield token
+        except Exception as e:
+            if isinstance(e, LLMTimeout):
+                deadline.degrade('llm_timeout')
+            elif isinstance(e, LLMOverloaded):
+                deadline.degrade('llm_overloaded')
+            else:
+                print(f"Answer generation failed: {e}")
+                deadline.degrade('llm_error')
+            if answered:
+                raise
+            source = 'retrieval'
+            yield retrieval_only_answer(retrieval)
+        finally:
+            deadline.stages['generation'] = round((time.monotonic() - started) * 1000, 1)
+
+    if answer is not None:
+        source, tokens = 'cache', single_token(answer)
+    elif deadline.remaining() < config.QUERY_MIN_GENERATION:
+        deadline.degrade('generation_budget')
+        source, tokens = 'retrieval', single_token(retrieval_only_answer(retrieval))
+    else:
+        tokens = generated_tokens()
+    async for event in answer_events({**context, "metadata": deadline.metadata(source)}, tokens,
+                                     lambda: deadline.metadata(source)):
+        yield event
+
+async def remembered_tokens(query_text: str, retrieval, data_version: Optional[int], tokens):
+    """tokens, with the whole answer cached once the last one has arrived"""
+    parts = []
+    async for token in tokens:
+        parts.append(token)
+        yield token
+    await run_blocking(remember_answer, query_text, retrieval, data_version, ''.join(parts))
+
 class ProfileRequest(BaseModel):
     ids: list[int]
 
@@ -338,7 +657,7 @@ async def get_profiles_by_ids(request: ProfileRequest):
     
     try:
         # Execute the query and load results into a DataFrame
-        df = pd.read_sql_query(sql_query, engine, params=(ids_tuple,))
+        df = await read_sql_query_async(sql_query, engine, params=(ids_tuple,))
         
         # Convert DataFrame to a list of dictionaries to match the Pydantic model
         return df.to_dict(orient='records')
@@ -354,11 +673,6 @@ async def get_float_info(float_id: str):
     try:
         # Get float basic info
         float_sql = "SELECT * FROM floats WHERE float_id = %s;"
-        float_df = pd.read_sql_query(float_sql, engine, params=(float_id,))
-        
-        if float_df.empty:
-            return {"error": "Float not found"}
-        
         # Get profile summary
         profiles_sql = """
         SELECT COUNT(*) as total_profiles, 
@@ -367,8 +681,6 @@ async def get_float_info(float_id: str):
                COUNT(DISTINCT DATE(profile_date)) as active_days
         FROM profiles WHERE float_id = %s;
         """
-        profile_summary = pd.read_sql_query(profiles_sql, engine, params=(float_id,))
-        
         # Get measurement summary  
         measurements_sql = """
         SELECT COUNT(*) as total_measurements,
@@ -378,7 +690,16 @@ async def get_float_info(float_id: str):
                AVG(salinity) as avg_sal
         FROM measurements WHERE float_id = %s;
         """
-        measurement_summary = pd.read_sql_query(measurements_sql, engine, params=(float_id,))
+        
+        # Independent lookups run concurrently on the database executor
+        float_df, profile_summary, measurement_summary = await asyncio.gather(
+            read_sql_query_async(float_sql, engine, params=(float_id,)),
+            read_sql_query_async(profiles_sql, engine, params=(float_id,)),
+            read_sql_query_async(measurements_sql, engine, params=(float_id,))
+        )
+        
+        if float_df.empty:
+            return {"error": "Float not found"}
         
         return {
             "float_info": float_df.to_dict(orient='records')[0],
@@ -408,12 +729,54 @@ async def get_float_profiles(float_id: str):
         ORDER BY p.cycle_number;
         """
         
-        df = pd.read_sql_query(sql_query, engine, params=(float_id,))
+        df = await read_sql_query_async(sql_query, engine, params=(float_id,))
         return df.to_dict(orient='records')
         
     except Exception as e:
         return {"error": f"Failed to get profiles: {str(e)}"}
 
+@app.get("/statistics/cube")
+async def get_cube_statistics(group_by: str = "month", parameters: Optional[str] = None,
+                              region: Optional[str] = None,
+                              lat_min: Optional[float] = None, lat_max: Optional[float] = None,
+                              lon_min: Optional[float] = None, lon_max: Optional[float] = None,
+                              depth_min: Optional[float] = None, depth_max: Optional[float] = None,
+                              time_start: Optional[datetime] = None, time_end: Optional[datetime] = None):
+    """
+    Regional, depth and temporal aggregates from the pre-aggregated data cube
+    
+    group_by and parameters are comma-separated (e.g. group_by=cell or group_by=month,depth);
+    a named region fills any lat/lon bound that is not given explicitly.
+    """
+    try:
+        bounds = NAMED_REGIONS.get(region.lower(), (None,) * 4) if region else (None,) * 4
+        constraints = QueryConstraints(
+            lat_min=lat_min if lat_min is not None else bounds[0],
+            lat_max=lat_max if lat_max is not None else bounds[1],
+            lon_min=lon_min if lon_min is not None else bounds[2],
+            lon_max=lon_max if lon_max is not None else bounds[3],
+            regions=[region.lower()] if region else [],
+            time_start=time_start,
+            time_end=time_end,
+            depth_min=depth_min,
+            depth_max=depth_max
+        )
+        dimensions = [dim.strip() for dim in group_by.split(',') if dim.strip()]
+        selected = [p.strip() for p in parameters.split(',')] if parameters else CUBE_PARAMETERS
+        
+        df = await run_blocking(query_cube, dimensions, selected, constraints, engine)
+        df = df.astype(object).where(df.notna(), None)
+        
+        return {
+            "group_by": dimensions,
+            "parameters": selected,
+            "constraints": constraints.describe(),
+            "rows": df.to_dict(orient='records')
+        }
+    
+    except Exception as e:
+        return {"error": f"Failed to query data cube: {str(e)}"}
+
 @app.post("/export")
 async def export_data(request: ExportRequest):
     """
@@ -421,21 +784,21 @@ async def export_data(request: ExportRequest):
     """
     try:
         if request.format.lower() == "ascii":
-            content = export_to_ascii(request.data_ids)
+            content = await run_blocking(export_to_ascii, request.data_ids)
             return Response(
                 content=content,
                 media_type="text/plain",
                 headers={"Content-Disposition": "attachment; filename=argo_data.txt"}
             )
         elif request.format.lower() == "netcdf":
-            content = export_to_netcdf(request.data_ids)
+            content = await run_blocking(export_to_netcdf, request.data_ids)
             return Response(
                 content=content,
                 media_type="application/octet-stream",
                 headers={"Content-Disposition": "attachment; filename=argo_data.nc"}
             )
         elif request.format.lower() == "csv":
-            content = export_to_csv(request.data_ids)
+            content = await run_blocking(export_to_csv, request.data_ids)
             return Response(
                 content=content,
                 media_type="text/csv",
@@ -455,35 +818,9 @@ async def get_sample_queries():
     analytical_queries = get_sample_analytical_queries()
     
     # Add extensibility-focused queries
-    analytical_queries["Multi-Dataset Analysis"] = [
-        "Compare ARGO floats with glider observations",
-        "Show satellite vs in-situ temperature differences", 
-        "Analyze buoy and float data in the same region",
-        "Cross-validate different sensor platforms"
-    ]
+    analytical_queries["Multi-Dataset Analysis"] = MULTI_DATASET_SAMPLE_QUERIES
     
-    semantic_queries = {
-        "Current Data (ARGO)": [
-            "Show me temperature measurements near the equator",
-            "Tell me about salinity profiles in deep water",
-            "What ARGO floats are active in the Indian Ocean?",
-            "Find measurements with high oxygen levels"
-        ],
-        
-        "Future Capabilities": [
-            "How would glider data complement ARGO observations?",
-            "What advantages do satellite measurements provide?",
-            "Explain the role of moored buoys in ocean monitoring",
-            "Describe BGC sensor capabilities across platforms"
-        ],
-        
-        "Contextual Queries": [
-            "How do different platforms collect ocean data?",
-            "What is the significance of multi-platform validation?",
-            "Tell me about ocean observation networks",
-            "Explain the importance of data integration"
-        ]
-    }
+    semantic_queries = SEMANTIC_SAMPLE_QUERIES
     
     return {
         "analytical_queries": analytical_queries,
@@ -534,19 +871,17 @@ async def get_extensibility_status():
 async def test_nl_sql_system():
     """Test endpoint for NL-to-SQL system validation"""
     try:
-        from nl_to_sql import NLToSQLTranslator
-        
-        translator = NLToSQLTranslator()
+        translator = get_translator()
         
         # Test a simple query
         query = "What is the average temperature at different depths?"
         intent = translator.detect_query_intent(query)
         
         if intent in translator.query_templates:
-            sql = translator.query_templates[intent]
+            sql = translator.get_template_sql(intent)
             
             # Test SQL execution
-            result_df, status = translator.execute_sql_query(sql)
+            result_df, status = await translator.execute_sql_query_async(sql)
             
             return {
                 "status": "success",
@@ -574,17 +909,15 @@ async def test_nl_sql_system():
 async def simple_query(request: QueryRequest):
     """Simplified query endpoint for testing"""
     try:
-        from nl_to_sql import NLToSQLTranslator
-        
-        translator = NLToSQLTranslator()
+        translator = get_translator()
         
         # Check if analytical
         if translator.is_analytical_query(request.query_text):
             intent = translator.detect_query_intent(request.query_text)
             
             if intent in translator.query_templates:
-                sql = translator.query_templates[intent]
-                result_df, status = translator.execute_sql_query(sql)
+                sql = translator.get_template_sql(intent)
+                result_df, status = await translator.execute_sql_query_async(sql)
                 
                 return {
                     "answer": f"Executed SQL query with {len(result_df)} results",
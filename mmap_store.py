@@ -0,0 +1,642 @@
+"""
+Memory-mapped vector store with quantized embeddings and brute-force search
+An alternative to Chroma for VECTOR_STORE=mmap, with the client and collection methods the
+API, retrieval and data_chroma_floats use. Each collection is a directory of NumPy files:
+embeddings quantized to int8 (one scale per row) or float16, their squared norms, a live
+flag per row, ids and documents as UTF-8 blobs with end offsets, and one column per
+metadata key. Opening a collection maps the files, so startup does not depend on its size,
+and int8 rows take a quarter of the memory of float32.
+
+Queries are exact: each block of MMAP_STORE_BLOCK_ROWS rows is dequantized and multiplied
+with the query embeddings, and the k nearest are partitioned out of the distances. where filters are evaluated on the
+metadata columns as NumPy masks; when few rows match, only those rows are scanned.
+
+Writes append rows and mark replaced or deleted ones dead, then publish a new manifest;
+growing past capacity, or more dead rows than live ones, rewrites the live rows into a new
+generation directory. One process writes a collection (the sync); any number read it and
+pick up its changes when the manifest is replaced.
+"""
+
+import json
+import mmap
+import os
+import re
+import shutil
+import threading
+import uuid
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+import numpy as np
+import config
+
+MANIFEST = 'manifest.json'
+MIN_CAPACITY = 1024
+COLLECTION_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_\-.]{1,61}[A-Za-z0-9]$')
+
+# Below this share of matching rows a filtered query gathers just those rows instead of masking every block
+SPARSE_MATCH_SHARE = 0.25
+
+# Metadata value types; numbers of any type share a float64 column
+NUMERIC_TYPES = ('int', 'float', 'bool')
+
+def _value_type(value) -> str:
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, np.integer)):
+        return 'int'
+    if isinstance(value, (float, np.floating)):
+        return 'float'
+    if isinstance(value, str):
+        return 'str'
+    raise ValueError(f"Metadata values must be str, int, float or bool, got {type(value).__name__}")
+
+def _merge_types(current: Optional[str], new: str, key: str) -> str:
+    if current is None or current == new:
+        return new
+    if {current, new} == {'int', 'float'}:
+        return 'float'
+    raise ValueError(f"Metadata key {key!r} mixes {current} and {new} values")
+
+def _convert(value, value_type: str):
+    if value_type == 'int':
+        return int(value)
+    if value_type == 'bool':
+        return bool(value)
+    if value_type == 'float':
+        return float(value)
+    return str(value)
+
+def quantize(embeddings: np.ndarray, dtype: str):
+    """Stored rows and per-row scales for float32 embeddings (int8: symmetric per-row scale)"""
+    if dtype == 'float16':
+        return embeddings.astype(np.float16), np.ones(len(embeddings), dtype=np.float32)
+    scales = np.abs(embeddings).max(axis=1) / 127
+    scales[scales == 0] = 1
+    stored = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+    return stored, scales.astype(np.float32)
+
+def _distances(scores: np.ndarray, row_norms: np.ndarray, query_norms: np.ndarray, space: str) -> np.ndarray:
+    """Chroma's distances from inner products: squared l2, cosine or inner product"""
+    if space == 'cosine':
+        return 1 - scores / np.maximum(np.sqrt(row_norms)[:, None] * np.sqrt(query_norms)[None, :], 1e-12)
+    if space == 'ip':
+        return 1 - scores
+    return row_norms[:, None] - 2 * scores + query_norms[None, :]
+
+class _Store:
+    """The files of one collection, shared by every MmapCollection handle opened on it"""
+
+    ARRAYS = {'vectors': None, 'scales': np.float32, 'sqnorms': np.float32, 'live': np.bool_,
+              'id_ends': np.int64, 'doc_ends': np.int64, 'has_doc': np.bool_}
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.state = None
+        self._stamp = None
+        self._id_rows: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def create(cls, path: str, name: str, metadata: Optional[dict]) -> '_Store':
+        os.makedirs(path)
+        store = cls(path)
+        store._publish({'id': str(uuid.uuid4()), 'name': name, 'metadata': metadata or None,
+                        'dtype': config.MMAP_STORE_DTYPE, 'dim': None, 'rows': 0, 'count': 0, 'capacity': 0,
+                        'generation': 0, 'columns': [], 'id_bytes': 0, 'document_bytes': 0})
+        return store
+
+    # Reading
+
+    def current(self) -> SimpleNamespace:
+        """The collection as last published, reopened if another handle or process replaced the manifest"""
+        stat = os.stat(os.path.join(self.path, MANIFEST))
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp:
+            with self.lock:
+                if stamp != self._stamp:
+                    with open(os.path.join(self.path, MANIFEST)) as f:
+                        manifest = json.load(f)
+                    self.state = self._open(manifest)
+                    self._stamp = stamp
+                    self._id_rows = None
+        return self.state
+
+    def _generation(self, manifest: dict) -> str:
+        return os.path.join(self.path, f"gen_{manifest['generation']:06d}")
+
+    def _open(self, manifest: dict) -> SimpleNamespace:
+        state = SimpleNamespace(manifest=manifest, arrays={}, columns={}, blobs={})
+        if not manifest['capacity']:
+            return state
+        directory = self._generation(manifest)
+        for name in self.ARRAYS:
+            state.arrays[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r+')
+        for i, column in enumerate(manifest['columns']):
+            state.columns[column['key']] = SimpleNamespace(
+                type=column['type'], values=np.load(os.path.join(directory, f"col{i}.npy"), mmap_mode='r+'),
+                present=np.load(os.path.join(directory, f"col{i}_present.npy"), mmap_mode='r+'))
+        for name, size_key in (('ids', 'id_bytes'), ('documents', 'document_bytes')):
+            state.blobs[name] = self._map_blob(os.path.join(directory, f"{name}.bin"), manifest[size_key])
+        return state
+
+    @staticmethod
+    def _map_blob(path: str, size: int):
+        if not size:
+            return b''
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+    def id_rows(self, state: SimpleNamespace) -> Dict[str, int]:
+        """Row of every live id, decoded from the id blob on first use"""
+        id_rows = self._id_rows
+        if id_rows is None:
+            rows = state.manifest['rows']
+            id_rows = {}
+            if rows:
+                ends = state.arrays['id_ends'][:rows].tolist()
+                live = state.arrays['live'][:rows]
+                data = state.blobs['ids'][:ends[-1]]
+                start = 0
+                for row, end in enumerate(ends):
+                    if live[row]:
+                        id_rows[data[start:end].decode('utf-8')] = row
+                    start = end
+            self._id_rows = id_rows
+        return id_rows
+
+    def strings(self, state: SimpleNamespace, blob: str, rows: np.ndarray) -> List[str]:
+        ends = state.arrays['id_ends' if blob == 'ids' else 'doc_ends']
+        data = state.blobs[blob]
+        return [data[(ends[row - 1] if row else 0):ends[row]].decode('utf-8') for row in rows.tolist()]
+
+    def metadatas(self, state: SimpleNamespace, rows: np.ndarray) -> List[Optional[dict]]:
+        found = [{} for _ in range(len(rows))]
+        for key, column in state.columns.items():
+            present = column.present[rows]
+            if not present.any():
+                continue
+            for i, value in zip(np.flatnonzero(present).tolist(), column.values[rows[present]].tolist()):
+                found[i][key] = _convert(value, column.type)
+        return [metadata or None for metadata in found]
+
+    def embeddings(self, state: SimpleNamespace, rows: np.ndarray) -> np.ndarray:
+        return state.arrays['vectors'][rows].astype(np.float32) * state.arrays['scales'][rows][:, None]
+
+    def where_mask(self, state: SimpleNamespace, where: Dict[str, Any]) -> np.ndarray:
+        """Rows matching a Chroma where filter, with Chroma's rule that a missing key never matches"""
+        rows = state.manifest['rows']
+        if len(where) != 1:
+            raise ValueError(f"Expected where to have exactly one operator, got {where}")
+        if '$and' in where or '$or' in where:
+            combine = np.logical_and if '$and' in where else np.logical_or
+            masks = [self.where_mask(state, condition) for condition in next(iter(where.values()))]
+            return combine.reduce(masks) if masks else np.ones(rows, dtype=bool)
+        key, condition = next(iter(where.items()))
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        operator, operand = next(iter(condition.items()))
+        column = state.columns.get(key)
+        if column is None:
+            return np.zeros(rows, dtype=bool)
+        present = np.asarray(column.present[:rows])
+        values = column.values[:rows]
+        numeric = column.type in NUMERIC_TYPES
+
+        def comparable(value) -> bool:
+            return isinstance(value, (int, float)) if numeric else isinstance(value, str)
+
+        if operator in ('$in', '$nin'):
+            operands = [value for value in operand if comparable(value)]
+            found = np.isin(values, operands) if operands else np.zeros(rows, dtype=bool)
+            return present & (found if operator == '$in' else ~found)
+        if not comparable(operand):
+            # Python comparison of mismatched types: only != holds
+            return present.copy() if operator == '$ne' else np.zeros(rows, dtype=bool)
+        compare = {'$eq': np.equal, '$ne': np.not_equal, '$gt': np.greater, '$gte': np.greater_equal,
+                   '$lt': np.less, '$lte': np.less_equal}.get(operator)
+        if compare is None:
+            raise ValueError(f"Unsupported where operator {operator}")
+        return present & compare(values, operand)
+
+    def search(self, state: SimpleNamespace, queries: np.ndarray, n_results: int,
+               where: Optional[Dict[str, Any]] = None):
+        """Rows and distances of the n_results nearest live rows to each query, nearest first"""
+        rows = state.manifest['rows']
+        empty = [np.empty(0, dtype=np.int64)] * len(queries), [np.empty(0, dtype=np.float32)] * len(queries)
+        if not rows or n_results <= 0:
+            return empty
+        valid = np.array(state.arrays['live'][:rows])
+        if where:
+            valid &= self.where_mask(state, where)
+        matches = int(np.count_nonzero(valid))
+        k = min(n_results, matches)
+        if not k:
+            return empty
+
+        space = (state.manifest['metadata'] or {}).get('hnsw:space', 'l2')
+        queries = np.asarray(queries, dtype=np.float32)
+        query_norms = (queries * queries).sum(axis=1)
+        vectors, scales, sqnorms = state.arrays['vectors'], state.arrays['scales'], state.arrays['sqnorms']
+        candidates = np.flatnonzero(valid) if matches < rows * SPARSE_MATCH_SHARE else None
+        scanned = candidates if candidates is not None else np.arange(rows)
+        distances = np.empty((len(queries), len(scanned)), dtype=np.float32)
+        block = config.MMAP_STORE_BLOCK_ROWS
+        for start in range(0, len(scanned), block):
+            if candidates is None:
+                stop = min(start + block, rows)
+                stored, block_scales, block_norms = vectors[start:stop], scales[start:stop], sqnorms[start:stop]
+            else:
+                block_rows = candidates[start:start + block]
+                stored, block_scales, block_norms = vectors[block_rows], scales[block_rows], sqnorms[block_rows]
+            scores = (stored.astype(np.float32) @ queries.T) * block_scales[:, None]
+            distances[:, start:start + len(stored)] = _distances(scores, block_norms, query_norms, space).T
+        if candidates is None:
+            distances[:, ~valid] = np.inf
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k] if len(scanned) > k else \
+            np.broadcast_to(np.arange(len(scanned)), (len(queries), len(scanned)))
+        nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1, kind='stable')
+        return (list(scanned[np.take_along_axis(nearest, order, axis=1)]),
+                list(np.take_along_axis(nearest_distances, order, axis=1)))
+
+    # Writing (callers hold self.lock)
+
+    def _publish(self, manifest: dict):
+        path = os.path.join(self.path, MANIFEST)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(path + '.tmp', path)
+
+    def _rewrite(self, state: SimpleNamespace, keep: np.ndarray, capacity: int, dim: int) -> SimpleNamespace:
+        """Copy the rows in keep into a new generation of the given capacity and publish it"""
+        manifest = dict(state.manifest)
+        old_directory = self._generation(manifest) if manifest['capacity'] else None
+        manifest['generation'] += 1
+        directory = self._generation(manifest)
+        os.makedirs(directory)
+        dtypes = {**self.ARRAYS, 'vectors': manifest['dtype']}
+        chunk = config.MMAP_STORE_BLOCK_ROWS
+
+        def copy(name: str, dtype, old: Optional[np.ndarray], shape=()):
+            new = np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode='w+', dtype=dtype,
+                                            shape=(capacity, *shape))
+            if old is not None:
+                for start in range(0, len(keep), chunk):
+                    rows = keep[start:start + chunk]
+                    new[start:start + len(rows)] = old[rows]
+            new.flush()
+
+        for name, dtype in dtypes.items():
+            if name.endswith('_ends'):
+                continue
+            copy(name, dtype, state.arrays.get(name), (dim,) if name == 'vectors' else ())
+        for i, column in enumerate(manifest['columns']):
+            old = state.columns.get(column['key'])
+            copy(f"col{i}", np.float64 if column['type'] in NUMERIC_TYPES else f"<U{column['width']}",
+                 old.values if old else None)
+            copy(f"col{i}_present", np.bool_, old.present if old else None)
+
+        for blob, ends_name, size_key in (('ids', 'id_ends', 'id_bytes'), ('documents', 'doc_ends', 'document_bytes')):
+            ends = np.lib.format.open_memmap(os.path.join(directory, f"{ends_name}.npy"), mode='w+',
+                                             dtype=np.int64, shape=(capacity,))
+            written = 0
+            with open(os.path.join(directory, f"{blob}.bin"), 'wb') as f:
+                if len(keep):
+                    old_ends = state.arrays[ends_name]
+                    data = state.blobs[blob]
+                    for start in range(0, len(keep), chunk):
+                        rows = keep[start:start + chunk]
+                        starts = np.where(rows > 0, old_ends[np.maximum(rows - 1, 0)], 0)
+                        lengths = old_ends[rows] - starts
+                        f.write(b''.join(data[s:s + n] for s, n in zip(starts.tolist(), lengths.tolist())))
+                        ends[start:start + len(rows)] = written + np.cumsum(lengths)
+                        written += int(lengths.sum())
+            ends.flush()
+            manifest[size_key] = written
+
+        manifest.update(rows=len(keep), count=len(keep), capacity=capacity, dim=dim)
+        self._publish(manifest)
+        self.current()
+        if old_directory is not None:
+            shutil.rmtree(old_directory, ignore_errors=True)  # readers still holding its maps keep them on POSIX
+        return self.state
+
+    def _column(self, state: SimpleNamespace, key: str, value_type: str, width: int) -> SimpleNamespace:
+        """The column for key, added or widened in the current generation as needed"""
+        manifest = state.manifest
+        position = next((i for i, column in enumerate(manifest['columns']) if column['key'] == key), None)
+        if position is None:
+            manifest['columns'].append({'key': key, 'type': value_type, 'width': width})
+            position = len(manifest['columns']) - 1
+            old = None
+        else:
+            entry = manifest['columns'][position]
+            merged = _merge_types(entry['type'], value_type, key)
+            if merged == entry['type'] and width <= entry['width']:
+                return state.columns[key]
+            entry['type'], entry['width'] = merged, max(width, entry['width'])
+            old = state.columns[key]
+        entry = manifest['columns'][position]
+        directory = self._generation(manifest)
+        dtype = np.float64 if entry['type'] in NUMERIC_TYPES else f"<U{entry['width']}"
+        path = os.path.join(directory, f"col{position}.npy")
+        values = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=dtype, shape=(manifest['capacity'],))
+        if old is not None:
+            values[:manifest['rows']] = old.values[:manifest['rows']]
+        values.flush()
+        os.replace(path + '.tmp', path)
+        present_path = os.path.join(directory, f"col{position}_present.npy")
+        if old is None:
+            np.lib.format.open_memmap(present_path, mode='w+', dtype=np.bool_, shape=(manifest['capacity'],)).flush()
+        state.columns[key] = SimpleNamespace(type=entry['type'], values=np.load(path, mmap_mode='r+'),
+                                             present=np.load(present_path, mmap_mode='r+'))
+        return state.columns[key]
+
+    def append(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Optional[dict]],
+               documents: List[Optional[str]]):
+        state = self.current()
+        manifest = state.manifest
+        dim = embeddings.shape[1]
+        if manifest['dim'] is not None and manifest['dim'] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match collection dimensionality {manifest['dim']}")
+        rows = manifest['rows']
+        if rows + len(ids) > manifest['capacity']:
+            live = np.flatnonzero(state.arrays['live'][:rows]) if rows else np.empty(0, dtype=np.int64)
+            capacity = max(MIN_CAPACITY, 2 * (len(live) + len(ids)))
+            state = self._rewrite(state, live, capacity, dim)
+            manifest = state.manifest
+            rows = manifest['rows']
+        manifest = state.manifest = json.loads(json.dumps(manifest))
+        end = rows + len(ids)
+        arrays = state.arrays
+
+        stored, scales = quantize(embeddings, manifest['dtype'])
+        arrays['vectors'][rows:end] = stored
+        arrays['scales'][rows:end] = scales
+        restored = stored.astype(np.float32) * scales[:, None]
+        arrays['sqnorms'][rows:end] = (restored * restored).sum(axis=1)
+
+        directory = self._generation(manifest)
+        for blob, ends_name, size_key, values in (('ids', 'id_ends', 'id_bytes', ids),
+                                                  ('documents', 'doc_ends', 'document_bytes', documents)):
+            encoded = [(value or '').encode('utf-8') for value in values]
+            with open(os.path.join(directory, f"{blob}.bin"), 'r+b' if manifest[size_key] else 'wb') as f:
+                f.seek(manifest[size_key])
+                f.write(b''.join(encoded))
+            arrays[ends_name][rows:end] = manifest[size_key] + np.cumsum([len(value) for value in encoded])
+            manifest[size_key] += sum(len(value) for value in encoded)
+        arrays['has_doc'][rows:end] = [document is not None for document in documents]
+
+        keys: Dict[str, tuple] = {}
+        for metadata in metadatas:
+            for key, value in (metadata or {}).items():
+                value_type, width = keys.get(key, (None, 1))
+                keys[key] = (_merge_types(value_type, _value_type(value), key),
+                             max(width, len(value)) if isinstance(value, str) else width)
+        for key, (value_type, width) in keys.items():
+            column = self._column(state, key, value_type, width)
+            present = np.array([metadata is not None and key in metadata for metadata in metadatas])
+            values = [metadata[key] for metadata in metadatas if metadata is not None and key in metadata]
+            column.values[rows:end][present] = values
+            column.present[rows:end] = present
+
+        arrays['live'][rows:end] = True
+        for array in [*arrays.values(), *(c.values for c in state.columns.values()),
+                      *(c.present for c in state.columns.values())]:
+            array.flush()
+        id_rows = self._id_rows
+        manifest.update(rows=end, count=manifest['count'] + len(ids), dim=dim)
+        self._publish(manifest)
+        self.current()
+        if id_rows is not None:
+            id_rows.update(zip(ids, range(rows, end)))
+            self._id_rows = id_rows
+
+    def kill(self, rows: List[int]):
+        """Mark rows dead; rewrites the collection once dead rows outnumber live ones"""
+        state = self.current()
+        if not rows:
+            return
+        arrays = state.arrays
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        rows = rows[arrays['live'][rows]]
+        id_rows = self.id_rows(state)
+        for doc_id in self.strings(state, 'ids', rows):
+            id_rows.pop(doc_id, None)
+        arrays['live'][rows] = False
+        arrays['live'].flush()
+        manifest = json.loads(json.dumps(state.manifest))
+        manifest['count'] -= len(rows)
+        if manifest['rows'] > MIN_CAPACITY and manifest['count'] < manifest['rows'] / 2:
+            state.manifest = manifest
+            live = np.flatnonzero(arrays['live'][:manifest['rows']])
+            self._rewrite(state, live, max(MIN_CAPACITY, 2 * len(live)), manifest['dim'])
+            return
+        self._publish(manifest)
+        self.current()
+        self._id_rows = id_rows
+
+class MmapCollection:
+    """A collection of the memory-mapped store, with the Chroma Collection methods this project uses"""
+
+    # Filters are NumPy masks, cheap enough to apply on every query (see retrieval.constrained_query)
+    filters_cheaply = True
+
+    def __init__(self, store: _Store, embedding_function=None):
+        self._store = store
+        self._embedding_function = embedding_function
+
+    @property
+    def name(self) -> str:
+        return self._store.current().manifest['name']
+
+    @property
+    def id(self) -> uuid.UUID:
+        return uuid.UUID(self._store.current().manifest['id'])
+
+    @property
+    def metadata(self) -> Optional[dict]:
+        return self._store.current().manifest['metadata']
+
+    def __repr__(self) -> str:
+        return f"MmapCollection(name={self.name})"
+
+    def count(self) -> int:
+        return self._store.current().manifest['count']
+
+    def modify(self, name: Optional[str] = None, metadata: Optional[dict] = None):
+        if name is not None:
+            raise ValueError("Renaming is not supported by the memory-mapped store")
+        with self._store.lock:
+            manifest = dict(self._store.current().manifest)
+            manifest['metadata'] = metadata
+            self._store._publish(manifest)
+
+    def _embed(self, input: List[str]) -> List[List[float]]:
+        if self._embedding_function is None:
+            raise ValueError("You must provide an embedding function to compute embeddings")
+        return self._embedding_function(list(input))
+
+    def _prepare(self, ids, embeddings, metadatas, documents):
+        ids = [ids] if isinstance(ids, str) else list(ids)
+        if len(set(ids)) != len(ids):
+            raise ValueError("Expected IDs to be unique")
+        if embeddings is None:
+            if documents is None:
+                raise ValueError("You must provide embeddings or documents")
+            embeddings = self._embed(documents)
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        if not len(embeddings) == len(metadatas) == len(documents) == len(ids):
+            raise ValueError("ids, embeddings, metadatas and documents must have the same length")
+        return ids, embeddings, metadatas, documents
+
+    def add(self, ids, embeddings=None, metadatas=None, documents=None):
+        """Add new ids; ids already stored are skipped, as Chroma does"""
+        ids, embeddings, metadatas, documents = self._prepare(ids, embeddings, metadatas, documents)
+        with self._store.lock:
+            existing = self._store.id_rows(self._store.current())
+            new = [i for i, doc_id in enumerate(ids) if doc_id not in existing]
+            if new:
+                self._store.append([ids[i] for i in new], embeddings[new], [metadatas[i] for i in new],
+                                   [documents[i] for i in new])
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None):
+        ids, embeddings, metadatas, documents = self._prepare(ids, embeddings, metadatas, documents)
+        with self._store.lock:
+            existing = self._store.id_rows(self._store.current())
+            self._store.kill([existing[doc_id] for doc_id in ids if doc_id in existing])
+            self._store.append(ids, embeddings, metadatas, documents)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        with self._store.lock:
+            state = self._store.current()
+            rows = self._rows(state, ids, where)
+            self._store.kill(rows.tolist())
+
+    def _rows(self, state: SimpleNamespace, ids: Optional[List[str]], where: Optional[Dict[str, Any]]) -> np.ndarray:
+        if ids is not None:
+            id_rows = self._store.id_rows(state)
+            rows = np.array([id_rows[doc_id] for doc_id in ([ids] if isinstance(ids, str) else ids)
+                             if doc_id in id_rows], dtype=np.int64)
+            if where:
+                rows = rows[self._store.where_mask(state, where)[rows]]
+            return rows
+        live = np.array(state.arrays['live'][:state.manifest['rows']]) if state.manifest['rows'] else np.zeros(0, bool)
+        if where:
+            live &= self._store.where_mask(state, where)
+        return np.flatnonzero(live)
+
+    def _results(self, state: SimpleNamespace, rows: np.ndarray, include: List[str]) -> dict:
+        if not len(rows):
+            return {'ids': [], **{key: [] if key in include else None for key in ('embeddings', 'metadatas', 'documents')}}
+        documents = None
+        if 'documents' in include:
+            has_doc = state.arrays['has_doc'][rows]
+            documents = [document if present else None
+                         for document, present in zip(self._store.strings(state, 'documents', rows), has_doc)]
+        return {
+            'ids': self._store.strings(state, 'ids', rows),
+            'embeddings': self._store.embeddings(state, rows).tolist() if 'embeddings' in include else None,
+            'metadatas': self._store.metadatas(state, rows) if 'metadatas' in include else None,
+            'documents': documents
+        }
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: List[str] = ['metadatas', 'documents']) -> dict:
+        """Stored entries by id and/or filter, in insertion order when not given ids"""
+        state = self._store.current()
+        rows = self._rows(state, ids, where)
+        start = offset or 0
+        rows = rows[start:start + limit if limit is not None else None]
+        return self._results(state, rows, include)
+
+    def peek(self, limit: int = 10) -> dict:
+        return self.get(limit=limit, include=['embeddings', 'metadatas', 'documents'])
+
+    def query(self, query_embeddings=None, query_texts=None, n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None, where_document: Optional[Dict[str, Any]] = None,
+              include: List[str] = ['metadatas', 'documents', 'distances']) -> dict:
+        """Exact nearest neighbours of each query, optionally among the entries matching where"""
+        if where_document:
+            raise ValueError("where_document is not supported by the memory-mapped store")
+        if query_embeddings is None:
+            if query_texts is None:
+                raise ValueError("You must provide query_embeddings or query_texts")
+            query_embeddings = self._embed([query_texts] if isinstance(query_texts, str) else query_texts)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries.reshape(1, -1) if queries.ndim == 1 else queries
+        state = self._store.current()
+        if state.manifest['dim'] is not None and queries.shape[1] != state.manifest['dim']:
+            raise ValueError(f"Embedding dimension {queries.shape[1]} does not match collection "
+                             f"dimensionality {state.manifest['dim']}")
+        found_rows, found_distances = self._store.search(state, queries, n_results, where)
+        results = {'ids': [], 'embeddings': [] if 'embeddings' in include else None,
+                   'metadatas': [] if 'metadatas' in include else None,
+                   'documents': [] if 'documents' in include else None,
+                   'distances': [] if 'distances' in include else None}
+        for rows, distances in zip(found_rows, found_distances):
+            found = self._results(state, rows, include)
+            for key in ('ids', 'embeddings', 'metadatas', 'documents'):
+                if results[key] is not None:
+                    results[key].append(found[key])
+            if results['distances'] is not None:
+                results['distances'].append(distances.astype(float).tolist())
+        return results
+
+class MmapClient:
+    """Client of a directory of memory-mapped collections, with the chromadb client methods this project uses"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or config.MMAP_STORE_PATH
+        os.makedirs(self.path, exist_ok=True)
+        self._stores: Dict[str, _Store] = {}
+        self._lock = threading.Lock()
+
+    def _store(self, name: str) -> Optional[_Store]:
+        path = os.path.join(self.path, name)
+        store = self._stores.get(name)
+        if store is not None and os.path.exists(os.path.join(path, MANIFEST)):
+            return store
+        self._stores.pop(name, None)
+        if not os.path.exists(os.path.join(path, MANIFEST)):
+            return None
+        store = self._stores[name] = _Store(path)
+        return store
+
+    def create_collection(self, name: str, metadata: Optional[dict] = None, embedding_function=None,
+                          get_or_create: bool = False) -> MmapCollection:
+        if not COLLECTION_NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid collection name {name!r}: 3-63 characters, alphanumerics, '_', '-' or '.'")
+        with self._lock:
+            store = self._store(name)
+            if store is not None:
+                if get_or_create:
+                    return MmapCollection(store, embedding_function)
+                raise ValueError(f"Collection {name} already exists.")
+            store = self._stores[name] = _Store.create(os.path.join(self.path, name), name, metadata)
+            return MmapCollection(store, embedding_function)
+
+    def get_or_create_collection(self, name: str, metadata: Optional[dict] = None,
+                                 embedding_function=None) -> MmapCollection:
+        return self.create_collection(name, metadata, embedding_function, get_or_create=True)
+
+    def get_collection(self, name: str, embedding_function=None) -> MmapCollection:
+        with self._lock:
+            store = self._store(name)
+        if store is None:
+            raise ValueError(f"Collection {name} does not exist.")
+        return MmapCollection(store, embedding_function)
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            if self._store(name) is None:
+                raise ValueError(f"Collection {name} does not exist.")
+            self._stores.pop(name, None)
+            shutil.rmtree(os.path.join(self.path, name))
+
+    def list_collections(self) -> List[MmapCollection]:
+        return [self.get_collection(name) for name in sorted(os.listdir(self.path))
+                if os.path.exists(os.path.join(self.path, name, MANIFEST))]
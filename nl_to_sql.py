@@ -3,20 +3,163 @@ Production-Ready Natural Language to SQL Translation System
 Handles analytical queries for ARGO oceanographic data
 """
 
-import ollama
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import pandas as pd
 import config
 import re
+import threading
+import time
 from typing import Dict, List, Tuple, Optional
+from llm_gateway import LLMTimeout, get_gateway
+from database import run_blocking, get_engine, get_data_version
+from summary_views import SUMMARY_VIEWS, SUMMARY_VIEW_QUERIES, get_available_summary_views
+from query_constraints import QueryConstraints, extract_query_constraints
+from data_cube import CUBE_TEMPLATE_QUERIES, cube_covers, cube_filters, data_cube_available
+
+SUMMARY_VIEW_NAMES = {spec['view'] for spec in SUMMARY_VIEWS.values()}
+
+# Routing patterns are compiled once at import so classification never touches the database
+ANALYTICAL_PATTERN = re.compile('|'.join([
+    # Statistical operations
+    r'\b(average|mean|avg|sum|count|total|maximum|max|minimum|min)\b',
+    # Comparative operations
+    r'\b(compare|comparison|versus|vs|between|difference)\b',
+    # Aggregation terms
+    r'\b(group|aggregate|distribution|range|trend|correlation)\b',
+    # Quantitative terms
+    r'\b(how many|how much|statistics|statistical|percentage|percent)\b',
+    # Relational terms
+    r'\b(greater than|less than|higher|lower|above|below|top|bottom)\b',
+    # Temporal analysis
+    r'\b(over time|temporal|monthly|yearly|seasonal)\b'
+]))
+
+def _keywords(*words: str) -> re.Pattern:
+    """Substring matcher for any of the given keywords"""
+    return re.compile('|'.join(re.escape(word) for word in words))
+
+DEPTH_KEYWORDS = _keywords('depth', 'profile', 'vertical')
+AVERAGE_KEYWORDS = _keywords('average', 'mean')
+
+# Ordered (intent, matcher) rules; the first match wins
+INTENT_RULES = [
+    ('regional_comparison', _keywords('region', 'compare', 'hemisphere', 'north', 'south')),
+    ('depth_ranges', _keywords('depth range', 'surface', 'deep', 'zone')),
+    ('float_summary', _keywords('float', 'summary', 'overview')),
+    ('temporal_trends', _keywords('time', 'temporal', 'trend', 'month', 'year')),
+    ('bgc_analysis', _keywords('oxygen', 'ph', 'chlorophyll', 'bgc', 'biogeochemical'))
+]
+
+# Templates mark where extracted constraints are appended with {filters}; these use a table alias
+TEMPLATE_FILTER_ALIASES = {
+    'float_summary': 'm',
+    'temporal_trends': 'm'
+}
+
+# Status of a query that ran but matched nothing: not a failure of its SQL
+EMPTY_RESULT_STATUS = "Query executed successfully but returned no results"
+# Status of a query stopped by its time budget: not a failure of its SQL either
+SQL_TIMEOUT_STATUS = "Query exceeded its time budget"
 
 class NLToSQLTranslator:
     """Advanced NL-to-SQL translator with enhanced query understanding"""
     
     def __init__(self):
-        self.engine = create_engine(config.DATABASE_URL)
-        self.schema_info = self._get_schema_info()
-        self.query_templates = self._load_query_templates()
+        self.engine = get_engine()
+        self.parameterized_templates = self._load_query_templates()
+        self.query_templates = {
+            intent: sql.replace('{filters}', '') for intent, sql in self.parameterized_templates.items()
+        }
+        
+        # Schema introspection is loaded lazily and cached per data version
+        self._schema_info = None
+        self._schema_version = None
+        self._schema_lock = threading.Lock()
+        
+        # Summary views that exist, cached per data version like the schema; a missing view or
+        # cube is looked for again after DATA_VERSION_TTL, since they are rebuilt after the
+        # ingest that bumped the version has committed
+        self._available_views = None
+        self._views_version = None
+        self._views_checked_at = 0.0
+        self._cube_available = None
+        self._cube_version = None
+        self._cube_checked_at = 0.0
+        
+        # Generated SQL that has run successfully (sql_cache.TranslationCache), attached by the API
+        self.translation_cache = None
+    
+    @property
+    def schema_info(self) -> Dict[str, List[Dict]]:
+        """Cached schema information, reloaded after a data/schema version bump"""
+        version = get_data_version(self.engine)
+        if self._schema_info is None or self._schema_version != version:
+            with self._schema_lock:
+                if self._schema_info is None or self._schema_version != version:
+                    self._schema_info = self._get_schema_info()
+                    self._schema_version = version
+        return self._schema_info
+    
+    def invalidate_schema_cache(self):
+        """Force the next schema access to re-query information_schema"""
+        with self._schema_lock:
+            self._schema_info = None
+            self._schema_version = None
+            self._available_views = None
+            self._views_version = None
+            self._views_checked_at = 0.0
+            self._cube_available = None
+            self._cube_version = None
+            self._cube_checked_at = 0.0
+    
+    def _summary_views_available(self) -> set:
+        """Materialized summary views present for the current data version"""
+        version = get_data_version(self.engine)
+        if self._availability_stale(self._available_views, SUMMARY_VIEW_NAMES, self._views_version,
+                                    self._views_checked_at, version):
+            with self._schema_lock:
+                if self._availability_stale(self._available_views, SUMMARY_VIEW_NAMES, self._views_version,
+                                            self._views_checked_at, version):
+                    try:
+                        self._available_views = get_available_summary_views(self.engine)
+                    except Exception as e:
+                        print(f"Summary views unavailable, using base tables: {e}")
+                        self._available_views = set()
+                    self._views_version = version
+                    self._views_checked_at = time.monotonic()
+        return self._available_views
+    
+    def _data_cube_available(self) -> bool:
+        """Whether the pre-aggregated data cube exists for the current data version"""
+        version = get_data_version(self.engine)
+        if self._availability_stale(self._cube_available, {True}, self._cube_version,
+                                    self._cube_checked_at, version):
+            with self._schema_lock:
+                if self._availability_stale(self._cube_available, {True}, self._cube_version,
+                                            self._cube_checked_at, version):
+                    try:
+                        self._cube_available = data_cube_available(self.engine)
+                    except Exception as e:
+                        print(f"Data cube unavailable, using base tables: {e}")
+                        self._cube_available = False
+                    self._cube_version = version
+                    self._cube_checked_at = time.monotonic()
+        return self._cube_available
+    
+    @staticmethod
+    def _availability_stale(found, expected: set, found_version, checked_at, version) -> bool:
+        """Whether a cached view/cube lookup must be repeated: new version, or something missing for DATA_VERSION_TTL"""
+        if found is None or found_version != version:
+            return True
+        if expected <= (found if isinstance(found, set) else {found}):
+            return False
+        return time.monotonic() - checked_at >= config.DATA_VERSION_TTL
+    
+    def get_template_sql(self, intent: str) -> str:
+        """SQL for a template intent, reading its materialized summary view when one exists"""
+        if intent in SUMMARY_VIEWS and SUMMARY_VIEWS[intent]['view'] in self._summary_views_available():
+            return SUMMARY_VIEW_QUERIES[intent]
+        return self.query_templates[intent]
     
     def _get_schema_info(self):
         """Get comprehensive database schema information"""
@@ -45,14 +188,14 @@ class NLToSQLTranslator:
     
     def _load_query_templates(self) -> Dict[str, str]:
         """Pre-defined SQL templates for common query patterns"""
-        return {
+        templates = {
             'avg_by_depth': """
                 SELECT depth, 
                        AVG(temperature) as avg_temperature,
                        AVG(salinity) as avg_salinity,
                        COUNT(*) as measurement_count
                 FROM measurements 
-                WHERE temperature IS NOT NULL AND salinity IS NOT NULL
+                WHERE temperature IS NOT NULL AND salinity IS NOT NULL{filters}
                 GROUP BY depth 
                 ORDER BY depth
                 LIMIT 100;
@@ -82,7 +225,7 @@ class NLToSQLTranslator:
                     AVG(oxygen) as avg_oxygen,
                     COUNT(*) as measurement_count
                 FROM measurements 
-                WHERE temperature IS NOT NULL
+                WHERE temperature IS NOT NULL{filters}
                 GROUP BY CASE WHEN lat > 0 THEN 'Northern Hemisphere' ELSE 'Southern Hemisphere' END;
             """,
             
@@ -99,7 +242,7 @@ class NLToSQLTranslator:
                     AVG(oxygen) as avg_oxygen,
                     COUNT(*) as measurement_count
                 FROM measurements 
-                WHERE temperature IS NOT NULL
+                WHERE temperature IS NOT NULL{filters}
                 GROUP BY CASE 
                     WHEN depth < 100 THEN 'Surface (0-100m)'
                     WHEN depth < 500 THEN 'Intermediate (100-500m)'
@@ -123,7 +266,7 @@ class NLToSQLTranslator:
                 FROM floats f
                 JOIN profiles p ON f.float_id = p.float_id
                 JOIN measurements m ON p.profile_id = m.profile_id
-                WHERE m.temperature IS NOT NULL
+                WHERE m.temperature IS NOT NULL{filters}
                 GROUP BY f.float_id, f.wmo_id, f.deployment_date
                 ORDER BY total_measurements DESC
                 LIMIT 50;
@@ -136,7 +279,7 @@ class NLToSQLTranslator:
                     AVG(m.salinity) as avg_salinity,
                     COUNT(*) as measurement_count
                 FROM measurements m
-                WHERE m.temperature IS NOT NULL
+                WHERE m.temperature IS NOT NULL{filters}
                 GROUP BY DATE_TRUNC('month', m.time)
                 ORDER BY month
                 LIMIT 100;
@@ -154,7 +297,7 @@ class NLToSQLTranslator:
                     AVG(chlorophyll) as avg_chlorophyll,
                     COUNT(*) as measurement_count
                 FROM measurements 
-                WHERE oxygen IS NOT NULL AND ph IS NOT NULL
+                WHERE oxygen IS NOT NULL AND ph IS NOT NULL{filters}
                 GROUP BY CASE 
                     WHEN depth < 200 THEN 'Euphotic Zone'
                     WHEN depth < 1000 THEN 'Mesopelagic Zone'
@@ -163,74 +306,97 @@ class NLToSQLTranslator:
                 ORDER BY MIN(depth);
             """
         }
+        
+        # Strip once here so routing hands out ready-to-run SQL
+        return {intent: sql.strip() for intent, sql in templates.items()}
     
     def is_analytical_query(self, query: str) -> bool:
         """Enhanced analytical query detection"""
-        analytical_patterns = [
-            # Statistical operations
-            r'\b(average|mean|avg|sum|count|total|maximum|max|minimum|min)\b',
-            # Comparative operations  
-            r'\b(compare|comparison|versus|vs|between|difference)\b',
-            # Aggregation terms
-            r'\b(group|aggregate|distribution|range|trend|correlation)\b',
-            # Quantitative terms
-            r'\b(how many|how much|statistics|statistical|percentage|percent)\b',
-            # Relational terms
-            r'\b(greater than|less than|higher|lower|above|below|top|bottom)\b',
-            # Temporal analysis
-            r'\b(over time|temporal|monthly|yearly|seasonal)\b'
-        ]
-        
-        query_lower = query.lower()
-        return any(re.search(pattern, query_lower) for pattern in analytical_patterns)
+        return ANALYTICAL_PATTERN.search(query.lower()) is not None
     
     def detect_query_intent(self, query: str) -> str:
         """Detect the intent/type of analytical query"""
         query_lower = query.lower()
         
-        if any(word in query_lower for word in ['depth', 'profile', 'vertical']):
-            if any(word in query_lower for word in ['average', 'mean']):
-                return 'avg_by_depth'
-        
-        if any(word in query_lower for word in ['region', 'compare', 'hemisphere', 'north', 'south']):
-            return 'regional_comparison'
-        
-        if any(word in query_lower for word in ['depth range', 'surface', 'deep', 'zone']):
-            return 'depth_ranges'
+        if DEPTH_KEYWORDS.search(query_lower) and AVERAGE_KEYWORDS.search(query_lower):
+            return 'avg_by_depth'
         
-        if any(word in query_lower for word in ['float', 'summary', 'overview']):
-            return 'float_summary'
+        for intent, matcher in INTENT_RULES:
+            if matcher.search(query_lower):
+                return intent
         
-        if any(word in query_lower for word in ['time', 'temporal', 'trend', 'month', 'year']):
-            return 'temporal_trends'
+        return 'custom'
+    
+    def generate_sql(self, nl_query: str, timeout: Optional[float] = None) -> Tuple[str, str]:
+        """Generate SQL query with intent detection; timeout bounds the LLM call (LLM_TIMEOUT by default)"""
+        sql_query, intent = self._sql_without_llm(nl_query)
+        if sql_query:
+            return sql_query, intent
         
-        if any(word in query_lower for word in ['oxygen', 'ph', 'chlorophyll', 'bgc', 'biogeochemical']):
-            return 'bgc_analysis'
+        try:
+            # Shares the API's LLM slots and deadline; identical questions in flight share one generation
+            response = get_gateway().generate(self._sql_prompt(nl_query), timeout=timeout,
+                                              temperature=0.1, top_p=0.9)  # More deterministic, faster
+            return self._clean_generated_sql(response), 'custom'
+        except LLMTimeout as e:
+            print(f"SQL generation ran out of time: {e}")
+            return None, 'timeout'
+        except Exception as e:
+            print(f"Error generating SQL: {e}")
+            return None, 'error'
+    
+    async def generate_sql_async(self, nl_query: str, timeout: Optional[float] = None) -> Tuple[str, str]:
+        """generate_sql for async callers: lookups run on the database executor, the LLM is awaited off it"""
+        sql_query, intent = await run_blocking(self._sql_without_llm, nl_query)
+        if sql_query:
+            return sql_query, intent
         
-        return 'custom'
+        try:
+            prompt = await run_blocking(self._sql_prompt, nl_query)
+            response = await get_gateway().agenerate(prompt, timeout=timeout, temperature=0.1, top_p=0.9)
+            return self._clean_generated_sql(response), 'custom'
+        except LLMTimeout as e:
+            print(f"SQL generation ran out of time: {e}")
+            return None, 'timeout'
+        except Exception as e:
+            print(f"Error generating SQL: {e}")
+            return None, 'error'
     
-    def generate_sql(self, nl_query: str) -> Tuple[str, str]:
-        """Generate SQL query with intent detection"""
+    def _sql_without_llm(self, nl_query: str) -> Tuple[Optional[str], str]:
+        """Template or cached SQL for a question, or (None, 'custom') when the LLM has to write it"""
         
         # First, try template matching (faster)
         intent = self.detect_query_intent(nl_query)
         
         if intent != 'custom' and intent in self.query_templates:
-            return self.query_templates[intent].strip(), intent
+            return self.get_template_sql(intent), intent
         
         # For common patterns, use simple mapping instead of LLM
         query_lower = nl_query.lower()
         
         if 'average temperature' in query_lower and 'depth' in query_lower:
-            return self.query_templates['avg_by_depth'].strip(), 'avg_by_depth'
+            return self.get_template_sql('avg_by_depth'), 'avg_by_depth'
         
         if 'compare' in query_lower and ('region' in query_lower or 'hemisphere' in query_lower):
-            return self.query_templates['regional_comparison'].strip(), 'regional_comparison'
+            return self.get_template_sql('regional_comparison'), 'regional_comparison'
         
         if 'float' in query_lower and ('summary' in query_lower or 'count' in query_lower):
-            return self.query_templates['float_summary'].strip(), 'float_summary'
+            return self.get_template_sql('float_summary'), 'float_summary'
+        
+        # SQL the LLM already wrote for this question or a paraphrase, and that has run
+        if self.translation_cache is not None:
+            try:
+                cached_sql = self.translation_cache.get(nl_query)
+                if cached_sql:
+                    return cached_sql, 'custom'
+            except Exception as e:
+                print(f"Translation cache lookup failed: {e}")
         
         # Fall back to LLM generation for custom queries
+        return None, 'custom'
+    
+    def _sql_prompt(self, nl_query: str) -> str:
+        """Prompt asking the LLM to translate a question, with the database schema"""
         schema_context = self._format_schema_for_prompt()
         
         prompt = f"""
@@ -261,31 +427,66 @@ Natural Language Query: {nl_query}
 
 Return ONLY the SQL query without explanations or formatting:
 """
+        return prompt
+    
+    @staticmethod
+    def _clean_generated_sql(response: str) -> str:
+        """The SQL in an LLM response, without markdown fences and with a row limit"""
+        sql_query = response.strip()
+        
+        # Clean up formatting
+        sql_query = re.sub(r'```sql\n?', '', sql_query)
+        sql_query = re.sub(r'```\n?', '', sql_query)
+        sql_query = sql_query.strip()
         
+        # Add safety limit if not present
+        if 'limit' not in sql_query.lower():
+            sql_query += ' LIMIT 1000'
+        
+        return sql_query
+    
+    def build_sql(self, nl_query: str, constraints: Optional[QueryConstraints] = None,
+                  timeout: Optional[float] = None) -> Tuple[Optional[str], Dict, str]:
+        """
+        Generate SQL with the query's region, date, depth and float constraints bound as parameters
+        
+        Returns (sql, params, intent). Unconstrained template queries keep using the summary
+        views; constrained ones read the data cube when the constraints fall on its grid, and
+        otherwise run the base template with indexed predicates appended.
+        """
+        if constraints is None:
+            constraints = extract_query_constraints(nl_query)
+        
+        sql_query, intent = self.generate_sql(nl_query, timeout)
+        sql_query, params = self.bind_constraints(sql_query, intent, constraints)
+        return sql_query, params, intent
+    
+    def bind_constraints(self, sql_query: Optional[str], intent: str,
+                         constraints: QueryConstraints) -> Tuple[Optional[str], Dict]:
+        """(sql, params): generated SQL rewritten to apply the constraints, as build_sql describes"""
+        if (sql_query and intent in CUBE_TEMPLATE_QUERIES and not constraints.is_empty()
+                and cube_covers(constraints) and self._data_cube_available()):
+            filters, params = cube_filters(constraints)
+            return CUBE_TEMPLATE_QUERIES[intent].replace('{filters}', filters), params
+        
+        template = self.parameterized_templates.get(intent)
+        if sql_query and template and '{filters}' in template and not constraints.is_empty():
+            filters, params = constraints.to_sql_filters(TEMPLATE_FILTER_ALIASES.get(intent, ''))
+            return template.replace('{filters}', filters), params
+        
+        return sql_query, {}
+    
+    def record_translation(self, nl_query: str, sql_query: str, execution_status: str, seconds: float, row_count: int):
+        """Cache generated SQL that ran successfully; evict cached SQL that failed"""
+        if self.translation_cache is None:
+            return
         try:
-            # Add timeout and simpler prompt for faster processing
-            response = ollama.chat(
-                model=config.LLM_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                options={"temperature": 0.1, "top_p": 0.9}  # More deterministic, faster
-            )
-            
-            sql_query = response["message"]["content"].strip()
-            
-            # Clean up formatting
-            sql_query = re.sub(r'```sql\n?', '', sql_query)
-            sql_query = re.sub(r'```\n?', '', sql_query)
-            sql_query = sql_query.strip()
-            
-            # Add safety limit if not present
-            if 'limit' not in sql_query.lower():
-                sql_query += ' LIMIT 1000'
-            
-            return sql_query, 'custom'
-            
+            if execution_status == "success":
+                self.translation_cache.put(nl_query, sql_query, seconds, row_count)
+            elif execution_status not in (EMPTY_RESULT_STATUS, SQL_TIMEOUT_STATUS) and self.translation_cache.evict(sql_query):
+                print(f"Evicted cached SQL that failed ({execution_status}): {sql_query}")
         except Exception as e:
-            print(f"Error generating SQL: {e}")
-            return None, 'error'
+            print(f"Translation cache update failed: {e}")
     
     def validate_sql(self, sql_query: str) -> bool:
         """Basic SQL validation before execution"""
@@ -302,18 +503,22 @@ Return ONLY the SQL query without explanations or formatting:
         
         return True
     
-    def execute_sql_query(self, sql_query: str) -> Tuple[pd.DataFrame, str]:
-        """Execute SQL with comprehensive error handling"""
+    def execute_sql_query(self, sql_query: str, params: Optional[Dict] = None,
+                          timeout: Optional[float] = None) -> Tuple[pd.DataFrame, str]:
+        """Execute SQL with comprehensive error handling; on Postgres, timeout (seconds) cancels it server-side"""
         
         if not self.validate_sql(sql_query):
             return pd.DataFrame(), "Invalid or unsafe SQL query"
         
         try:
             with self.engine.connect() as conn:
-                result_df = pd.read_sql_query(text(sql_query), conn)
+                if timeout is not None and conn.dialect.name == 'postgresql':
+                    # For this transaction only; the pooled connection keeps its default
+                    conn.execute(text(f"SET LOCAL statement_timeout = {max(int(timeout * 1000), 1)}"))
+                result_df = pd.read_sql_query(text(sql_query), conn, params=params or None)
             
             if result_df.empty:
-                return result_df, "Query executed successfully but returned no results"
+                return result_df, EMPTY_RESULT_STATUS
             
             return result_df, "success"
             
@@ -321,13 +526,20 @@ Return ONLY the SQL query without explanations or formatting:
             error_msg = str(e)
             
             # Provide helpful error messages
-            if "column" in error_msg.lower() and "does not exist" in error_msg.lower():
+            if "statement timeout" in error_msg.lower():
+                return pd.DataFrame(), SQL_TIMEOUT_STATUS
+            elif "column" in error_msg.lower() and "does not exist" in error_msg.lower():
                 return pd.DataFrame(), f"Column not found. Available columns: {self._get_available_columns()}"
             elif "syntax error" in error_msg.lower():
                 return pd.DataFrame(), "SQL syntax error. Please check the query structure."
             else:
                 return pd.DataFrame(), f"Database error: {error_msg}"
     
+    async def execute_sql_query_async(self, sql_query: str, params: Optional[Dict] = None,
+                                      timeout: Optional[float] = None) -> Tuple[pd.DataFrame, str]:
+        """Execute SQL on the database executor without blocking the event loop"""
+        return await run_blocking(self.execute_sql_query, sql_query, params, timeout)
+    
     def _get_available_columns(self) -> str:
         """Get list of available columns for error messages"""
         all_columns = []
@@ -366,46 +578,108 @@ COMMON QUERY PATTERNS:
         
         return schema_text
 
-def process_analytical_query(nl_query: str) -> Tuple[Optional[Dict], Optional[str]]:
-    """Enhanced analytical query processing with comprehensive error handling"""
+_translator: Optional[NLToSQLTranslator] = None
+_translator_lock = threading.Lock()
+
+def get_translator() -> NLToSQLTranslator:
+    """Return the process-wide translator, creating it on first use"""
+    global _translator
+    
+    if _translator is None:
+        with _translator_lock:
+            if _translator is None:
+                _translator = NLToSQLTranslator()
+    return _translator
+
+def process_analytical_query(nl_query: str, timeout: Optional[float] = None) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Enhanced analytical query processing with comprehensive error handling
+    
+    timeout (seconds) bounds SQL generation and execution together; what generation leaves
+    is the statement timeout.
+    """
     
     try:
-        translator = NLToSQLTranslator()
+        expires = time.monotonic() + timeout if timeout is not None else None
+        translator = get_translator()
         
         # Check if query is analytical
         if not translator.is_analytical_query(nl_query):
             return None, "Not an analytical query - use semantic search instead"
         
-        # Generate SQL
-        sql_query, intent = translator.generate_sql(nl_query)
-        if not sql_query:
-            return None, "Failed to generate SQL query"
-        
-        # Execute SQL
-        result_df, execution_status = translator.execute_sql_query(sql_query)
-        
-        if execution_status != "success":
-            return None, f"SQL execution failed: {execution_status}"
-        
-        # Prepare comprehensive response
-        response = {
-            'sql_query': sql_query,
-            'results': result_df,
-            'row_count': len(result_df),
-            'column_count': len(result_df.columns) if not result_df.empty else 0,
-            'query_type': 'analytical',
-            'intent': intent,
-            'execution_status': execution_status,
-            'summary_stats': _generate_summary_stats(result_df) if not result_df.empty else {}
-        }
+        # Generate SQL with extracted constraints bound as parameters
+        constraints = extract_query_constraints(nl_query)
+        sql_query, sql_params, intent = translator.build_sql(nl_query, constraints, timeout)
+        return _run_analytical_sql(translator, nl_query, constraints, sql_query, sql_params, intent, expires)
+        
+    except Exception as e:
+        return _unexpected_error(e)
+
+async def process_analytical_query_async(nl_query: str, timeout: Optional[float] = None) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    process_analytical_query for FastAPI routes
+    
+    Database work runs on the bounded database executor while SQL generation awaits the LLM
+    gateway, so a slow LLM does not hold a database thread.
+    """
+    
+    try:
+        expires = time.monotonic() + timeout if timeout is not None else None
+        translator = get_translator()
+        
+        if not translator.is_analytical_query(nl_query):
+            return None, "Not an analytical query - use semantic search instead"
         
-        return response, None
+        constraints = extract_query_constraints(nl_query)
+        sql_query, intent = await translator.generate_sql_async(nl_query, timeout)
+        sql_query, sql_params = await run_blocking(translator.bind_constraints, sql_query, intent, constraints)
+        return await run_blocking(_run_analytical_sql, translator, nl_query, constraints, sql_query, sql_params,
+                                  intent, expires)
         
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error in process_analytical_query: {error_details}")
-        return None, f"Unexpected error in analytical query processing: {str(e)}"
+        return _unexpected_error(e)
+
+def _run_analytical_sql(translator: NLToSQLTranslator, nl_query: str, constraints: QueryConstraints,
+                        sql_query: Optional[str], sql_params: Dict, intent: str,
+                        expires: Optional[float]) -> Tuple[Optional[Dict], Optional[str]]:
+    """Execute built SQL within what is left of the budget and shape the analytical response"""
+    if not sql_query:
+        return None, SQL_TIMEOUT_STATUS if intent == 'timeout' else "Failed to generate SQL query"
+    
+    # Execute SQL
+    remaining = expires - time.monotonic() if expires is not None else None
+    if remaining is not None and remaining <= 0:
+        return None, f"SQL execution failed: {SQL_TIMEOUT_STATUS}"
+    started = time.perf_counter()
+    result_df, execution_status = translator.execute_sql_query(sql_query, sql_params, remaining)
+    if intent == 'custom':
+        translator.record_translation(nl_query, sql_query, execution_status, time.perf_counter() - started,
+                                      len(result_df))
+    
+    if execution_status != "success":
+        return None, f"SQL execution failed: {execution_status}"
+    
+    # Prepare comprehensive response
+    response = {
+        'sql_query': sql_query,
+        'results': result_df,
+        'row_count': len(result_df),
+        'column_count': len(result_df.columns) if not result_df.empty else 0,
+        'query_type': 'analytical',
+        'intent': intent,
+        'constraints': constraints.describe(),
+        'sql_params': sql_params,
+        'execution_status': execution_status,
+        'summary_stats': _generate_summary_stats(result_df) if not result_df.empty else {}
+    }
+    
+    return response, None
+
+def _unexpected_error(e: Exception) -> Tuple[None, str]:
+    import traceback
+    error_details = traceback.format_exc()
+    print(f"Error in process_analytical_query: {error_details}")
+    return None, f"Unexpected error in analytical query processing: {str(e)}"
 
 def _generate_summary_stats(df: pd.DataFrame) -> Dict:
     """Generate summary statistics for query results"""
@@ -493,7 +767,7 @@ def test_nl_to_sql_system():
     print("🧪 Testing NL-to-SQL System")
     print("=" * 50)
     
-    translator = NLToSQLTranslator()
+    translator = get_translator()
     
     # Test 1: Query classification
     test_queries = [
@@ -1,5 +1,6 @@
 import chromadb
 from chromadb.utils import embedding_functions
+from embedding_cache import CachedEmbeddingFunction, get_embedding_cache
 
 client = chromadb.PersistentClient(path="./chroma_db")
 
@@ -10,7 +11,7 @@ ollama_ef = embedding_functions.OllamaEmbeddingFunction(
 
 collection = client.get_collection(
     name="argo_measurements",
-    embedding_function=ollama_ef
+    embedding_function=CachedEmbeddingFunction(ollama_ef, get_embedding_cache("ollama/nomic-embed-text"))
 )
 
 query_text= str(input("enter query: "))
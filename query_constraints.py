@@ -0,0 +1,388 @@
+"""
+Query constraint extraction for natural language ARGO questions
+Pulls geographic boxes, named basins, date ranges, depth ranges and float identifiers
+out of a query so they can be bound as parameters instead of being ignored
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Named regions as (lat_min, lat_max, lon_min, lon_max); None leaves that bound open
+NAMED_REGIONS = {
+    'equator': (-5.0, 5.0, None, None),
+    'equatorial': (-5.0, 5.0, None, None),
+    'tropics': (-23.5, 23.5, None, None),
+    'tropical': (-23.5, 23.5, None, None),
+    'arabian sea': (0.0, 25.0, 50.0, 78.0),
+    'bay of bengal': (5.0, 23.0, 78.0, 100.0),
+    'andaman sea': (5.0, 20.0, 92.0, 99.0),
+    'laccadive sea': (0.0, 14.0, 70.0, 78.0),
+    'southern ocean': (-90.0, -50.0, None, None),
+    'indian ocean': (-50.0, 30.0, 20.0, 120.0)
+}
+
+MONTHS = {
+    'january': 1, 'jan': 1, 'february': 2, 'feb': 2, 'march': 3, 'mar': 3,
+    'april': 4, 'apr': 4, 'may': 5, 'june': 6, 'jun': 6, 'july': 7, 'jul': 7,
+    'august': 8, 'aug': 8, 'september': 9, 'sept': 9, 'sep': 9, 'october': 10, 'oct': 10,
+    'november': 11, 'nov': 11, 'december': 12, 'dec': 12
+}
+
+NUMBER = r'(-?\d+(?:\.\d+)?)'
+DEPTH_UNIT = r'\s*(?:m|meters|metres|meter|metre|dbar)\b'
+
+# Patterns are compiled once; they run on every analytical and semantic query
+REGION_PATTERN = re.compile(r'\b(' + '|'.join(sorted(map(re.escape, NAMED_REGIONS), key=len, reverse=True)) + r')\b')
+SENTENCE_PATTERN = re.compile(r'[.!?;]+')
+HEMISPHERE_PATTERN = re.compile(r'\bhemispheres?\b')
+NORTH_PATTERN = re.compile(r'\bnorth(?:ern)?\b')
+SOUTH_PATTERN = re.compile(r'\bsouth(?:ern)?\b')
+FLOAT_ID_PATTERN = re.compile(r'\bargo[_-](\d{1,6})\b', re.IGNORECASE)
+WMO_PATTERN = re.compile(r'\b(\d{7})\b')
+DEPTH_RANGE_PATTERN = re.compile(
+    r'\b(?:between|from)?\s*' + NUMBER + r'\s*(?:m|meters|metres)?\s*(?:and|to|-)\s*' + NUMBER + DEPTH_UNIT
+)
+DEPTH_MIN_PATTERN = re.compile(
+    r'\b(?:below|deeper than|greater than|more than|beyond|under)\s+' + NUMBER + DEPTH_UNIT
+)
+DEPTH_MAX_PATTERN = re.compile(
+    r'\b(?:above|shallower than|less than|upper|top|within|within the top)\s+' + NUMBER + DEPTH_UNIT
+)
+DEPTH_POINT_PATTERN = re.compile(r'\b(?:at|around|near)\s+' + NUMBER + DEPTH_UNIT)
+COORDINATE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*°?\s*([nsew])\b')
+LAT_RANGE_PATTERN = re.compile(r'\blat(?:itude)?s?\s*(?:between|from)?\s*' + NUMBER + r'\s*(?:and|to)\s*' + NUMBER)
+LON_RANGE_PATTERN = re.compile(r'\blon(?:gitude)?s?\s*(?:between|from)?\s*' + NUMBER + r'\s*(?:and|to)\s*' + NUMBER)
+ISO_DATE_PATTERN = re.compile(r'\b((?:19|20)\d{2})-(\d{1,2})(?:-(\d{1,2}))?\b')
+MONTH_YEAR_PATTERN = re.compile(
+    r'\b(' + '|'.join(sorted(MONTHS, key=len, reverse=True)) + r')\.?\s+(?:of\s+)?((?:19|20)\d{2})\b'
+)
+YEAR_PATTERN = re.compile(r'\b((?:19|20)\d{2})\b')
+SINCE_PATTERN = re.compile(r'\b(?:since|after|from)\s+$')
+BEFORE_PATTERN = re.compile(r'\b(?:before|prior to)\s+$')
+
+# Half-width of the box used for a single coordinate such as "near 10N"
+POINT_TOLERANCE_DEG = 2.5
+# Relative tolerance for a single depth such as "at 500 m"
+POINT_TOLERANCE_DEPTH = 0.05
+
+@dataclass
+class QueryConstraints:
+    """Structured constraints extracted from a natural language query"""
+    lat_min: Optional[float] = None
+    lat_max: Optional[float] = None
+    lon_min: Optional[float] = None
+    lon_max: Optional[float] = None
+    regions: List[str] = field(default_factory=list)
+    time_start: Optional[datetime] = None  # inclusive
+    time_end: Optional[datetime] = None    # exclusive
+    depth_min: Optional[float] = None
+    depth_max: Optional[float] = None
+    float_ids: List[str] = field(default_factory=list)
+    wmo_ids: List[int] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not any([
+            self.lat_min is not None, self.lat_max is not None,
+            self.lon_min is not None, self.lon_max is not None,
+            self.time_start is not None, self.time_end is not None,
+            self.depth_min is not None, self.depth_max is not None,
+            self.float_ids, self.wmo_ids
+        ])
+
+    def to_sql_filters(self, alias: str = '') -> Tuple[str, Dict[str, Any]]:
+        """
+        Render the constraints as AND-ed predicates on measurements columns
+
+        Returns a clause starting with " AND " (empty when unconstrained) plus the bind
+        parameters, so it can be appended to an existing WHERE clause.
+        """
+        prefix = f"{alias}." if alias else ''
+        clauses = []
+        params = {}
+
+        bounds = [
+            ('lat', '>=', 'lat_min', self.lat_min),
+            ('lat', '<=', 'lat_max', self.lat_max),
+            ('lon', '>=', 'lon_min', self.lon_min),
+            ('lon', '<=', 'lon_max', self.lon_max),
+            ('time', '>=', 'time_start', self.time_start),
+            ('time', '<', 'time_end', self.time_end),
+            ('depth', '>=', 'depth_min', self.depth_min),
+            ('depth', '<=', 'depth_max', self.depth_max)
+        ]
+        for column, operator, name, value in bounds:
+            if value is not None:
+                clauses.append(f"{prefix}{column} {operator} :{name}")
+                params[name] = value
+
+        platform_clauses = []
+        if self.float_ids:
+            names = [f"float_id_{i}" for i in range(len(self.float_ids))]
+            platform_clauses.append(f"{prefix}float_id IN ({', '.join(':' + n for n in names)})")
+            params.update(zip(names, self.float_ids))
+        if self.wmo_ids:
+            names = [f"wmo_id_{i}" for i in range(len(self.wmo_ids))]
+            platform_clauses.append(
+                f"{prefix}float_id IN (SELECT float_id FROM floats WHERE wmo_id IN ({', '.join(':' + n for n in names)}))"
+            )
+            params.update(zip(names, self.wmo_ids))
+        if platform_clauses:
+            clauses.append('(' + ' OR '.join(platform_clauses) + ')')
+
+        if not clauses:
+            return '', {}
+        return ' AND ' + ' AND '.join(clauses), params
+
+    def to_chroma_where(self, level: str = 'measurements') -> Optional[Dict[str, Any]]:
+        """
+        Render the constraints as a Chroma metadata filter for the measurement or profile collection
+
+        Dates compare on the numeric yyyymmdd key because Chroma only applies range operators to
+        numbers, and a profile matches a depth range its min_depth..max_depth overlaps. Returns
+        None when unconstrained, since Chroma rejects an empty filter.
+        """
+        bounds = [
+            ('lat', '$gte', self.lat_min),
+            ('lat', '$lte', self.lat_max),
+            ('lon', '$gte', self.lon_min),
+            ('lon', '$lte', self.lon_max)
+        ]
+        if level == 'profiles':
+            bounds += [('max_depth', '$gte', self.depth_min), ('min_depth', '$lte', self.depth_max)]
+        else:
+            bounds += [('depth', '$gte', self.depth_min), ('depth', '$lte', self.depth_max)]
+        conditions = [{key: {operator: value}} for key, operator, value in bounds if value is not None]
+        if self.time_start is not None:
+            conditions.append({'yyyymmdd': {'$gte': _date_key(self.time_start)}})
+        if self.time_end is not None:
+            conditions.append({'yyyymmdd': {'$lt': _date_key(self.time_end)}})
+
+        platforms = []
+        if self.float_ids:
+            platforms.append({'float_id': {'$in': list(self.float_ids)}})
+        if self.wmo_ids:
+            platforms.append({'wmo_id': {'$in': list(self.wmo_ids)}})
+        if len(platforms) > 1:
+            conditions.append({'$or': platforms})
+        else:
+            conditions.extend(platforms)
+
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+
+    def describe(self) -> Dict[str, Any]:
+        """JSON-serializable summary of the non-empty constraints"""
+        summary = {}
+        for name in ['lat_min', 'lat_max', 'lon_min', 'lon_max', 'depth_min', 'depth_max']:
+            value = getattr(self, name)
+            if value is not None:
+                summary[name] = value
+        if self.time_start is not None:
+            summary['time_start'] = self.time_start.isoformat()
+        if self.time_end is not None:
+            summary['time_end'] = self.time_end.isoformat()
+        if self.regions:
+            summary['regions'] = list(self.regions)
+        if self.float_ids:
+            summary['float_ids'] = list(self.float_ids)
+        if self.wmo_ids:
+            summary['wmo_ids'] = list(self.wmo_ids)
+        return summary
+
+WHERE_OPERATORS = {
+    '$eq': lambda value, operand: value == operand,
+    '$ne': lambda value, operand: value != operand,
+    '$gt': lambda value, operand: value > operand,
+    '$gte': lambda value, operand: value >= operand,
+    '$lt': lambda value, operand: value < operand,
+    '$lte': lambda value, operand: value <= operand,
+    '$in': lambda value, operand: value in operand,
+    '$nin': lambda value, operand: value not in operand
+}
+
+def matches_where(where: Optional[Dict[str, Any]], metadata: Dict[str, Any]) -> bool:
+    """Evaluate a Chroma metadata filter against one metadata dict, as Chroma would"""
+    if not where:
+        return True
+    if '$and' in where:
+        return all(matches_where(condition, metadata) for condition in where['$and'])
+    if '$or' in where:
+        return any(matches_where(condition, metadata) for condition in where['$or'])
+    key, condition = next(iter(where.items()))
+    if not isinstance(condition, dict):
+        condition = {'$eq': condition}
+    operator, operand = next(iter(condition.items()))
+    if key not in metadata:
+        return False  # Chroma never matches a document without the key, even for $ne
+    try:
+        return WHERE_OPERATORS[operator](metadata[key], operand)
+    except TypeError:
+        return False
+
+def _date_key(value: datetime) -> int:
+    return value.year * 10000 + value.month * 100 + value.day
+
+def _add_months(year: int, month: int, months: int) -> datetime:
+    index = year * 12 + (month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def _intersect(current: Optional[float], value: Optional[float], keep_max: bool) -> Optional[float]:
+    """Tighten a bound: the larger of two minimums or the smaller of two maximums"""
+    if value is None:
+        return current
+    if current is None:
+        return value
+    return max(current, value) if keep_max else min(current, value)
+
+def _extract_platforms(text: str, constraints: QueryConstraints) -> str:
+    for match in FLOAT_ID_PATTERN.finditer(text):
+        float_id = f"ARGO_{int(match.group(1)):04d}"
+        if float_id not in constraints.float_ids:
+            constraints.float_ids.append(float_id)
+    text = FLOAT_ID_PATTERN.sub(' ', text)
+
+    for match in WMO_PATTERN.finditer(text):
+        wmo_id = int(match.group(1))
+        if wmo_id not in constraints.wmo_ids:
+            constraints.wmo_ids.append(wmo_id)
+    return WMO_PATTERN.sub(' ', text)
+
+def _extract_depths(text: str, constraints: QueryConstraints) -> str:
+    match = DEPTH_RANGE_PATTERN.search(text)
+    if match:
+        low, high = sorted([abs(float(match.group(1))), abs(float(match.group(2)))])
+        constraints.depth_min, constraints.depth_max = low, high
+        text = text[:match.start()] + ' ' + text[match.end():]
+
+    for match in DEPTH_MIN_PATTERN.finditer(text):
+        constraints.depth_min = _intersect(constraints.depth_min, abs(float(match.group(1))), keep_max=True)
+    text = DEPTH_MIN_PATTERN.sub(' ', text)
+
+    for match in DEPTH_MAX_PATTERN.finditer(text):
+        constraints.depth_max = _intersect(constraints.depth_max, abs(float(match.group(1))), keep_max=False)
+    text = DEPTH_MAX_PATTERN.sub(' ', text)
+
+    match = DEPTH_POINT_PATTERN.search(text)
+    if match and constraints.depth_min is None and constraints.depth_max is None:
+        depth = abs(float(match.group(1)))
+        tolerance = max(depth * POINT_TOLERANCE_DEPTH, 5.0)
+        constraints.depth_min, constraints.depth_max = max(depth - tolerance, 0.0), depth + tolerance
+    return DEPTH_POINT_PATTERN.sub(' ', text)
+
+def _extract_locations(text: str, constraints: QueryConstraints) -> str:
+    for match in REGION_PATTERN.finditer(text):
+        name = match.group(1)
+        lat_min, lat_max, lon_min, lon_max = NAMED_REGIONS[name]
+        constraints.regions.append(name)
+        constraints.lat_min = _intersect(constraints.lat_min, lat_min, keep_max=True)
+        constraints.lat_max = _intersect(constraints.lat_max, lat_max, keep_max=False)
+        constraints.lon_min = _intersect(constraints.lon_min, lon_min, keep_max=True)
+        constraints.lon_max = _intersect(constraints.lon_max, lon_max, keep_max=False)
+
+    # A single hemisphere is a filter; naming both is a comparison and constrains nothing.
+    # "northern and southern hemisphere" names both, so any sentence mentioning a hemisphere
+    # is searched, with named regions ("southern ocean") taken out first.
+    northern = southern = False
+    for sentence in SENTENCE_PATTERN.split(text):
+        if HEMISPHERE_PATTERN.search(sentence):
+            sentence = REGION_PATTERN.sub(' ', sentence)
+            northern = northern or bool(NORTH_PATTERN.search(sentence))
+            southern = southern or bool(SOUTH_PATTERN.search(sentence))
+    if northern and not southern:
+        constraints.regions.append('northern hemisphere')
+        constraints.lat_min = _intersect(constraints.lat_min, 0.0, keep_max=True)
+    elif southern and not northern:
+        constraints.regions.append('southern hemisphere')
+        constraints.lat_max = _intersect(constraints.lat_max, 0.0, keep_max=False)
+
+    match = LAT_RANGE_PATTERN.search(text)
+    if match:
+        low, high = sorted([float(match.group(1)), float(match.group(2))])
+        constraints.lat_min, constraints.lat_max = low, high
+        text = text[:match.start()] + ' ' + text[match.end():]
+
+    match = LON_RANGE_PATTERN.search(text)
+    if match:
+        low, high = sorted([float(match.group(1)), float(match.group(2))])
+        constraints.lon_min, constraints.lon_max = low, high
+        text = text[:match.start()] + ' ' + text[match.end():]
+
+    lats, lons = [], []
+    for match in COORDINATE_PATTERN.finditer(text):
+        value, hemisphere = float(match.group(1)), match.group(2)
+        if hemisphere in 'ns':
+            lats.append(value if hemisphere == 'n' else -value)
+        else:
+            lons.append(value if hemisphere == 'e' else -value)
+    text = COORDINATE_PATTERN.sub(' ', text)
+
+    for values, low_name, high_name in [(lats, 'lat_min', 'lat_max'), (lons, 'lon_min', 'lon_max')]:
+        if len(values) >= 2:
+            setattr(constraints, low_name, min(values))
+            setattr(constraints, high_name, max(values))
+        elif len(values) == 1:
+            setattr(constraints, low_name, values[0] - POINT_TOLERANCE_DEG)
+            setattr(constraints, high_name, values[0] + POINT_TOLERANCE_DEG)
+    return text
+
+def _extract_dates(text: str, constraints: QueryConstraints):
+    # Each mention becomes a [start, end) period along with the text preceding it
+    periods = []
+
+    for match in ISO_DATE_PATTERN.finditer(text):
+        year, month, day = int(match.group(1)), int(match.group(2)), match.group(3)
+        if not 1 <= month <= 12:
+            continue
+        if day:
+            try:
+                start = datetime(year, month, int(day))
+            except ValueError:
+                # No such day in that month (2023-02-30)
+                continue
+            end = datetime.fromordinal(start.toordinal() + 1)
+        else:
+            start, end = datetime(year, month, 1), _add_months(year, month, 1)
+        periods.append((match.start(), start, end))
+    text = ISO_DATE_PATTERN.sub(lambda m: ' ' * len(m.group(0)), text)
+
+    for match in MONTH_YEAR_PATTERN.finditer(text):
+        year, month = int(match.group(2)), MONTHS[match.group(1)]
+        periods.append((match.start(), datetime(year, month, 1), _add_months(year, month, 1)))
+    text = MONTH_YEAR_PATTERN.sub(lambda m: ' ' * len(m.group(0)), text)
+
+    for match in YEAR_PATTERN.finditer(text):
+        year = int(match.group(1))
+        periods.append((match.start(), datetime(year, 1, 1), datetime(year + 1, 1, 1)))
+
+    if not periods:
+        return
+
+    periods.sort(key=lambda period: period[0])
+    if len(periods) == 1:
+        position, start, end = periods[0]
+        preceding = text[:position]
+        if SINCE_PATTERN.search(preceding):
+            constraints.time_start = start
+        elif BEFORE_PATTERN.search(preceding):
+            constraints.time_end = start
+        else:
+            constraints.time_start, constraints.time_end = start, end
+    else:
+        constraints.time_start = min(period[1] for period in periods)
+        constraints.time_end = max(period[2] for period in periods)
+
+def extract_query_constraints(query: str) -> QueryConstraints:
+    """Extract every recognised constraint from a natural language query"""
+    constraints = QueryConstraints()
+    text = query.lower()
+
+    # Identifiers and depths go first so their digits are not read as years or coordinates
+    text = _extract_platforms(text, constraints)
+    text = _extract_depths(text, constraints)
+    text = _extract_locations(text, constraints)
+    _extract_dates(text, constraints)
+
+    return constraints
@@ -0,0 +1,286 @@
+"""
+Semantic retrieval for /query
+Questions are matched against the profile summary collection, one document per profile and
+so about 50x fewer vectors than one per depth measurement, and the measurements of the
+winning profiles are then read from PostgreSQL. The per-measurement collection is only
+built and searched with RETRIEVAL_TIER=measurements. Regions, dates, depths and floats
+named in the question restrict either search, and matches from the collection's BM25
+index are fused with the vector results.
+"""
+
+from dataclasses import dataclass, field
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+import config
+from database import get_engine
+from lexical_index import LexicalIndex, load_lexical_index
+from query_constraints import QueryConstraints, extract_query_constraints, matches_where
+
+PROFILE_MEASUREMENTS_SQL = text("""
+SELECT m.id, m.profile_id, m.time, m.lat, m.lon, m.depth,
+       m.temperature, m.salinity, m.oxygen, m.ph, m.chlorophyll
+FROM measurements m
+WHERE m.profile_id IN :profile_ids
+ORDER BY m.profile_id, m.depth
+""").bindparams(bindparam('profile_ids', expanding=True))
+
+# Documents matching a question's constraints, by the ids data_chroma_floats gives them
+CANDIDATE_QUERIES = {
+    'measurements': ("SELECT m.id FROM measurements m WHERE 1=1{filters} LIMIT :candidate_limit", str),
+    'profiles': ("SELECT DISTINCT m.profile_id FROM measurements m WHERE 1=1{filters} LIMIT :candidate_limit",
+                 lambda profile_id: f"profile_{profile_id}")
+}
+
+# Profile metadata repeated on every drilled-down measurement
+PROFILE_METADATA_KEYS = ['profile_id', 'float_id', 'wmo_id', 'cycle_number', 'profile_date']
+
+@dataclass
+class RetrievalResult:
+    """Context documents and per-measurement metadata for one question"""
+    documents: List[str] = field(default_factory=list)
+    metadatas: List[dict] = field(default_factory=list)
+    tier: str = 'profiles'
+    profile_ids: List[int] = field(default_factory=list)
+    document_ids: List[str] = field(default_factory=list)  # Chroma ids of the retrieved documents, best first
+    query_embedding: Optional[List[float]] = None  # None when the question was answered without embedding it
+
+def fetch_profile_measurements(profile_ids: List[int], engine: Optional[Engine] = None) -> pd.DataFrame:
+    """Measurements of the given profiles, shallowest first within each profile"""
+    if not profile_ids:
+        return pd.DataFrame()
+    with (engine or get_engine()).connect() as conn:
+        return pd.read_sql_query(PROFILE_MEASUREMENTS_SQL, conn, params={'profile_ids': list(profile_ids)})
+
+def level_phrases(measurements: pd.DataFrame) -> List[str]:
+    """One 'depth: values' phrase per measurement row"""
+    phrases = []
+    for depth, temperature, salinity, oxygen, ph, chlorophyll in zip(
+        *(measurements[column].tolist() for column in ['depth', 'temperature', 'salinity', 'oxygen', 'ph', 'chlorophyll'])
+    ):
+        values = []
+        if pd.notna(temperature):
+            values.append(f"{temperature:.2f}°C")
+        if pd.notna(salinity):
+            values.append(f"{salinity:.2f} PSU")
+        if pd.notna(oxygen):
+            values.append(f"O2 {oxygen:.2f} ml/L")
+        if pd.notna(ph):
+            values.append(f"pH {ph:.2f}")
+        if pd.notna(chlorophyll) and chlorophyll > 0.01:
+            values.append(f"chl {chlorophyll:.3f} mg/m³")
+        phrases.append(f"{depth:.0f} m: {', '.join(values) or 'no values'}")
+    return phrases
+
+def profile_context(summary: str, phrases: List[str], max_levels: Optional[int] = None) -> str:
+    """A profile's summary document followed by its level phrases (evenly thinned to max_levels)"""
+    max_levels = config.RETRIEVAL_LEVELS_PER_PROFILE if max_levels is None else max_levels
+    if not phrases:
+        return summary
+    if max_levels and len(phrases) > max_levels:
+        phrases = [phrases[i] for i in np.unique(np.linspace(0, len(phrases) - 1, max_levels).round().astype(int))]
+    return f"{summary} Measured levels: {'; '.join(phrases)}."
+
+def measurement_metadata(measurements: pd.DataFrame) -> List[dict]:
+    """Per-row metadata of drilled-down measurements, with the keys the measurement collection uses"""
+    if measurements.empty:
+        return []
+    times = pd.to_datetime(measurements['time']).dt.strftime('%Y-%m-%d').tolist()
+    return [
+        {'postgres_id': int(postgres_id), 'time': time, 'depth': float(depth), 'lat': float(lat), 'lon': float(lon)}
+        for postgres_id, time, depth, lat, lon in zip(measurements['id'].tolist(), times, measurements['depth'].tolist(),
+                                                      measurements['lat'].tolist(), measurements['lon'].tolist())
+    ]
+
+def question_constraints(query_text: str) -> QueryConstraints:
+    """Constraints named in a question, or none when RETRIEVAL_FILTERS is off"""
+    if not config.RETRIEVAL_FILTERS:
+        return QueryConstraints()
+    try:
+        return extract_query_constraints(query_text)
+    except Exception as e:
+        # An unfiltered search beats no answer
+        print(f"Constraint extraction failed, searching unfiltered: {e}")
+        return QueryConstraints()
+
+def embed_question(collection, query_text: str) -> List[float]:
+    """The question embedded once with the collection's own embedding function"""
+    # Collection._embed is what query(query_texts=...) calls (chromadb is pinned)
+    return np.asarray(collection._embed(input=[query_text])[0], dtype=float).tolist()
+
+def candidate_ids(constraints: QueryConstraints, level: str, limit: int, engine: Optional[Engine] = None) -> List[str]:
+    """Ids of up to limit documents of the level's collection matching the constraints, from PostgreSQL"""
+    filters, params = constraints.to_sql_filters('m')
+    sql, document_id = CANDIDATE_QUERIES[level]
+    with (engine or get_engine()).connect() as conn:
+        rows = conn.execute(text(sql.format(filters=filters)), {**params, 'candidate_limit': limit}).scalars().all()
+    return [document_id(row) for row in rows]
+
+def rank_candidates(collection, query_embedding: List[float], ids: List[str], n_results: int) -> dict:
+    """Exact nearest neighbours among the given ids, shaped like a collection.query result"""
+    # An empty id list would make get() return the whole collection
+    stored = collection.get(ids=ids, include=['embeddings']) if ids else {'ids': []}
+    if not stored['ids']:
+        return {'ids': [[]], 'distances': [[]], 'metadatas': [[]], 'documents': [[]]}
+    vectors = np.asarray(stored['embeddings'], dtype=np.float32)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    space = (collection.metadata or {}).get('hnsw:space', 'l2')
+    if space == 'cosine':
+        distances = 1 - vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    elif space == 'ip':
+        distances = 1 - vectors @ query
+    else:
+        distances = ((vectors - query) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind='stable')[:n_results]
+    top = [stored['ids'][i] for i in order]
+
+    found = collection.get(ids=top, include=['documents', 'metadatas'])
+    position = {document_id: i for i, document_id in enumerate(found['ids'])}
+    return {'ids': [top], 'distances': [[float(distances[i]) for i in order]],
+            'metadatas': [[found['metadatas'][position[document_id]] for document_id in top]],
+            'documents': [[found['documents'][position[document_id]] for document_id in top]]}
+
+def _filtered_search(collection, query_embedding: List[float], where: dict, n_results: int):
+    """An unfiltered search of n_results and the positions in it that match where"""
+    results = collection.query(query_embeddings=[query_embedding], n_results=n_results)
+    return results, [i for i, meta in enumerate(results['metadatas'][0]) if matches_where(where, meta)]
+
+def _select(results: dict, positions: List[int]) -> dict:
+    """The given positions of a single-query Chroma result"""
+    return {key: [[value[0][i] for i in positions]] if isinstance(value, list) and value and isinstance(value[0], list)
+            else value for key, value in results.items()}
+
+def constrained_query(collection, query_embedding: List[float], constraints: QueryConstraints, level: str,
+                      n_results: int, engine: Optional[Engine] = None) -> dict:
+    """
+    Nearest documents to query_embedding among those matching the constraints
+
+    Chroma evaluates a where filter by scanning its metadata table, which on a collection of
+    a million measurements takes seconds where the search itself takes milliseconds, so the
+    filter is the last resort. An over-fetched search is filtered here; when that finds too
+    few, questions matching at most RETRIEVAL_MAX_CANDIDATES documents in PostgreSQL are
+    ranked exactly over those, and broader ones search deeper, up to RETRIEVAL_MAX_FETCH,
+    before the filter is pushed into Chroma. Stores that filter cheaply (the memory-mapped
+    store's masks) get the filter straight away.
+    """
+    where = constraints.to_chroma_where(level)
+    if where is None:
+        return collection.query(query_embeddings=[query_embedding], n_results=n_results)
+    if getattr(collection, 'filters_cheaply', False):
+        return collection.query(query_embeddings=[query_embedding], n_results=n_results, where=where)
+
+    fetch = n_results * config.RETRIEVAL_OVERFETCH
+    results, keep = _filtered_search(collection, query_embedding, where, fetch)
+    if len(keep) >= n_results or len(results['ids'][0]) < fetch:
+        return _select(results, keep[:n_results])
+
+    ids = candidate_ids(constraints, level, config.RETRIEVAL_MAX_CANDIDATES + 1, engine)
+    if len(ids) <= config.RETRIEVAL_MAX_CANDIDATES:
+        return rank_candidates(collection, query_embedding, ids, n_results)
+
+    # Many documents match but few are near the question: deep enough to expect n_results at the rate seen
+    while fetch < config.RETRIEVAL_MAX_FETCH:
+        fetch = min(max(int(fetch * n_results / max(len(keep), 1) * 1.5), fetch * 4), config.RETRIEVAL_MAX_FETCH)
+        results, keep = _filtered_search(collection, query_embedding, where, fetch)
+        if len(keep) >= n_results or len(results['ids'][0]) < fetch:
+            return _select(results, keep[:n_results])
+    return collection.query(query_embeddings=[query_embedding], n_results=n_results, where=where)
+
+def lexical_query(index: LexicalIndex, query_text: str, constraints: QueryConstraints, level: str,
+                  n_results: int) -> dict:
+    """BM25 matches of a question that satisfy its constraints, shaped like a collection.query result"""
+    where = constraints.to_chroma_where(level)
+    hits = index.search(query_text, n_results if where is None else n_results * config.RETRIEVAL_OVERFETCH)
+    ids = [doc_id for doc_id, _ in hits]
+    documents, metadatas = index.get(ids)
+    keep = [i for i, meta in enumerate(metadatas) if matches_where(where, meta or {})][:n_results]
+    return {'ids': [[ids[i] for i in keep]], 'documents': [[documents[i] for i in keep]],
+            'metadatas': [[metadatas[i] for i in keep]]}
+
+def fuse(rankings: List[dict], n_results: int, k: Optional[int] = None) -> dict:
+    """Reciprocal-rank fusion of collection.query-shaped results: each document scores the sum of 1 / (k + rank)"""
+    k = config.RRF_K if k is None else k
+    scores, found = {}, {}
+    for results in rankings:
+        for rank, (doc_id, document, metadata) in enumerate(
+                zip(results['ids'][0], results['documents'][0], results['metadatas'][0]), start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+            found.setdefault(doc_id, (document, metadata))
+    # Ties keep the order documents were first seen in, so the first ranking wins them
+    best = sorted(scores, key=scores.get, reverse=True)[:n_results]
+    return {'ids': [best], 'documents': [[found[doc_id][0] for doc_id in best]],
+            'metadatas': [[found[doc_id][1] for doc_id in best]]}
+
+def hybrid_query(collection, query_text: str, level: str, n_results: int, engine: Optional[Engine] = None,
+                 query_embedding: Optional[List[float]] = None) -> dict:
+    """
+    Vector and BM25 results for a question, fused by reciprocal rank
+
+    A question naming a float or WMO id is an identifier lookup, which embeddings match
+    poorly: when the lexical index has matches they are the answer, and the question is
+    never embedded. The embedding used, if any, is returned under 'query_embedding';
+    pass it back in to search again without re-embedding.
+    """
+    constraints = question_constraints(query_text)
+    index = load_lexical_index(collection.name) if config.LEXICAL_INDEX else None
+    depth = max(n_results, config.RRF_DEPTH)
+    lexical = lexical_query(index, query_text, constraints, level, depth) if index is not None else None
+    if lexical is not None and lexical['ids'][0] and (constraints.float_ids or constraints.wmo_ids):
+        return {**_select(lexical, list(range(min(n_results, len(lexical['ids'][0]))))), 'query_embedding': None}
+    query_embedding = query_embedding or embed_question(collection, query_text)
+    if lexical is None or not lexical['ids'][0]:
+        results = constrained_query(collection, query_embedding, constraints, level, n_results, engine)
+    else:
+        vector = constrained_query(collection, query_embedding, constraints, level, depth, engine)
+        results = fuse([vector, lexical], n_results)
+    return {**results, 'query_embedding': query_embedding}
+
+def search_measurements(collection, query_text: str, n_results: int = 5, engine: Optional[Engine] = None,
+                        query_embedding: Optional[List[float]] = None) -> RetrievalResult:
+    """The per-measurement search used before profile retrieval"""
+    results = hybrid_query(collection, query_text, 'measurements', n_results, engine, query_embedding)
+    return RetrievalResult(documents=results['documents'][0], metadatas=results['metadatas'][0],
+                           tier='measurements', document_ids=results['ids'][0],
+                           query_embedding=results['query_embedding'])
+
+def search_profiles(collection, query_text: str, n_profiles: Optional[int] = None, engine: Optional[Engine] = None,
+                    query_embedding: Optional[List[float]] = None) -> RetrievalResult:
+    """Best matching profile summaries, each expanded with its measurements from PostgreSQL"""
+    results = hybrid_query(collection, query_text, 'profiles', n_profiles or config.RETRIEVAL_PROFILES, engine,
+                           query_embedding)
+    summaries = results['documents'][0]
+    profiles = results['metadatas'][0]
+    profile_ids = [int(meta['profile_id']) for meta in profiles]
+
+    # Formatted once for all retrieved profiles; per-profile pandas slicing costs more than the rows
+    measurements = fetch_profile_measurements(profile_ids, engine)
+    phrases = level_phrases(measurements) if not measurements.empty else []
+    row_metadata = measurement_metadata(measurements)
+    positions = measurements.groupby('profile_id').indices if not measurements.empty else {}
+
+    result = RetrievalResult(tier='profiles', profile_ids=profile_ids, document_ids=results['ids'][0],
+                             query_embedding=results['query_embedding'])
+    for summary, meta, profile_id in zip(summaries, profiles, profile_ids):
+        rows = positions.get(profile_id, [])
+        shared = {key: meta[key] for key in PROFILE_METADATA_KEYS if key in meta}
+        result.documents.append(profile_context(summary, [phrases[i] for i in rows]))
+        result.metadatas.extend({**shared, **row_metadata[i]} for i in rows)
+    return result
+
+def searched_collection(profile_collection=None, measurement_collection=None):
+    """The collection retrieve() searches: the RETRIEVAL_TIER one, or whichever is available"""
+    if measurement_collection is not None and (config.RETRIEVAL_TIER == 'measurements' or profile_collection is None):
+        return measurement_collection
+    return profile_collection
+
+def retrieve(query_text: str, profile_collection=None, measurement_collection=None,
+             engine: Optional[Engine] = None, query_embedding: Optional[List[float]] = None) -> RetrievalResult:
+    """Context for a question from the RETRIEVAL_TIER index, or from whichever collection is available"""
+    collection = searched_collection(profile_collection, measurement_collection)
+    if collection is None:
+        return RetrievalResult()
+    if collection is measurement_collection:
+        return search_measurements(measurement_collection, query_text, engine=engine, query_embedding=query_embedding)
+    return search_profiles(profile_collection, query_text, engine=engine, query_embedding=query_embedding)
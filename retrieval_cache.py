@@ -0,0 +1,183 @@
+"""
+LRU cache of retrieval results for repeated questions
+Users mostly click the offered sample questions, and each one used to be embedded and
+searched again. Results are kept per normalized question text (case, spacing and
+punctuation ignored) together with the question's embedding, and tagged with the version
+of the index they came from: each Chroma collection's id, which changes on a rebuild, and
+the data version its last sync recorded, plus the database's data version, since results
+include measurements read from PostgreSQL that an ingest can change before Chroma is
+synced. Once either moves on the next lookup finds the entry stale and searches again,
+reusing the stored embedding.
+
+With RETRIEVAL_CACHE_SEMANTIC, a near-duplicate question ("warmest water?" after "where is
+the water warmest") is served a cached result when its embedding is within
+RETRIEVAL_CACHE_MIN_COSINE of the cached question's and it has the same region, date,
+depth and float constraints, which the embedding barely reflects but the search applies.
+The question is embedded only when a cached one has the same constraints.
+"""
+
+import json
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import config
+from database import get_data_version
+from retrieval import RetrievalResult, embed_question, question_constraints, retrieve, searched_collection
+
+# Punctuation that does not change what a question asks; decimals, dates and ids keep theirs
+IGNORED_PUNCTUATION = re.compile(r"[?!,;\"'`()\[\]]+")
+
+def normalize_query(query_text: str) -> str:
+    """Lowercase question text with punctuation and repeated whitespace removed"""
+    text = IGNORED_PUNCTUATION.sub(' ', query_text.lower())
+    return ' '.join(text.split()).strip('. ')
+
+def constraint_signature(query_text: str) -> str:
+    """The constraints the search applies for a question, which a near-duplicate must share"""
+    return json.dumps(question_constraints(query_text).describe(), sort_keys=True)
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+class RetrievalCache:
+    """Least recently used retrieval results keyed by normalized question, and by near-duplicate"""
+
+    def __init__(self, client, max_entries: Optional[int] = None,
+                 semantic: Optional[bool] = None, min_cosine: Optional[float] = None):
+        self.client = client
+        self.max_entries = max_entries or config.RETRIEVAL_CACHE_SIZE
+        self.semantic = config.RETRIEVAL_CACHE_SEMANTIC if semantic is None else semantic
+        self.min_cosine = config.RETRIEVAL_CACHE_MIN_COSINE if min_cosine is None else min_cosine
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def index_version(self, collections: Iterable, engine=None) -> Optional[tuple]:
+        """
+        Id and synced data version of each collection, read fresh, and the database's data
+        version (get_data_version, cached for DATA_VERSION_TTL); None if a collection cannot be read
+        """
+        version = []
+        try:
+            for collection in collections:
+                if collection is not None:
+                    current = self.client.get_collection(collection.name, embedding_function=None)
+                    version.append((current.name, str(current.id), (current.metadata or {}).get('synced_data_version')))
+        except Exception:
+            return None
+        version.append(('database', get_data_version(engine)))
+        return tuple(version)
+
+    def get(self, query_text: str, version: tuple,
+            embed: Optional[Callable[[], List[float]]] = None) -> Tuple[Optional[RetrievalResult], Optional[List[float]]]:
+        """
+        The cached result for a question or a near-duplicate of it, and the question's embedding
+
+        A result from another index version is dropped, but its embedding is still returned
+        so the question need not be embedded again. embed, which embeds the question, enables
+        the near-duplicate tier; it is called only when a cached question could match.
+        Results are shared: do not modify them.
+        """
+        key = normalize_query(query_text)
+        query_embedding = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != version:
+                del self._entries[key]
+                self.stale += 1
+                query_embedding = entry[1].query_embedding
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[1].query_embedding
+            candidates = []
+            if self.semantic and embed is not None:
+                signature = constraint_signature(query_text)
+                candidates = [(cached_key, result) for cached_key, (cached_version, result, cached_signature)
+                              in self._entries.items() if cached_version == version
+                              and cached_signature == signature and result.query_embedding is not None]
+
+        # Embedded only when some cached question could match, and outside the lock
+        if candidates:
+            if query_embedding is None:
+                query_embedding = np.asarray(embed(), dtype=float).tolist()
+            target = _unit(query_embedding)
+            cosines = [float(_unit(result.query_embedding) @ target)
+                       if len(result.query_embedding) == len(target) else -1.0 for _, result in candidates]
+            best = int(np.argmax(cosines))
+            if cosines[best] >= self.min_cosine:
+                cached_key, result = candidates[best]
+                # Kept under this question too, so asking it again skips the embedding
+                result = replace(result, query_embedding=query_embedding)
+                with self._lock:
+                    if cached_key in self._entries:
+                        self._entries.move_to_end(cached_key)
+                    self._insert(key, (version, result, signature))
+                    self.hits += 1
+                    self.semantic_hits += 1
+                return result, query_embedding
+        with self._lock:
+            self.misses += 1
+        return None, query_embedding
+
+    def put(self, query_text: str, version: tuple, result: RetrievalResult):
+        key = normalize_query(query_text)
+        signature = constraint_signature(query_text) if self.semantic else None
+        with self._lock:
+            self._insert(key, (version, result, signature))
+
+    def _insert(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """Hit rate and size of this process's cache"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'semantic': self.semantic,
+                'min_cosine': self.min_cosine,
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hit_rate, 4),
+                'stale': self.stale,
+                'evictions': self.evictions
+            }
+
+def cached_retrieve(cache: Optional[RetrievalCache], query_text: str, profile_collection=None,
+                    measurement_collection=None, engine=None) -> RetrievalResult:
+    """retrieval.retrieve, answered from cache when the same question, or a near-duplicate, was asked of the same index"""
+    if cache is None:
+        return retrieve(query_text, profile_collection, measurement_collection, engine)
+    version = cache.index_version([profile_collection, measurement_collection], engine)
+    if version is None:
+        return retrieve(query_text, profile_collection, measurement_collection, engine)
+    collection = searched_collection(profile_collection, measurement_collection)
+    embed = (lambda: embed_question(collection, query_text)) if collection is not None else None
+    result, query_embedding = cache.get(query_text, version, embed)
+    if result is None:
+        result = retrieve(query_text, profile_collection, measurement_collection, engine, query_embedding)
+        cache.put(query_text, version, result)
+    return result
@@ -0,0 +1,67 @@
+"""
+Sample questions offered by the API and the chat interface
+Kept in one place so the API can pre-warm its retrieval cache with exactly the questions
+users are offered.
+"""
+
+from typing import Dict, List
+
+# Descriptive questions listed by /sample-queries
+SEMANTIC_SAMPLE_QUERIES: Dict[str, List[str]] = {
+    "Current Data (ARGO)": [
+        "Show me temperature measurements near the equator",
+        "Tell me about salinity profiles in deep water",
+        "What ARGO floats are active in the Indian Ocean?",
+        "Find measurements with high oxygen levels"
+    ],
+
+    "Future Capabilities": [
+        "How would glider data complement ARGO observations?",
+        "What advantages do satellite measurements provide?",
+        "Explain the role of moored buoys in ocean monitoring",
+        "Describe BGC sensor capabilities across platforms"
+    ],
+
+    "Contextual Queries": [
+        "How do different platforms collect ocean data?",
+        "What is the significance of multi-platform validation?",
+        "Tell me about ocean observation networks",
+        "Explain the importance of data integration"
+    ]
+}
+
+# Extensibility-focused questions added to the analytical ones by /sample-queries
+MULTI_DATASET_SAMPLE_QUERIES: List[str] = [
+    "Compare ARGO floats with glider observations",
+    "Show satellite vs in-situ temperature differences",
+    "Analyze buoy and float data in the same region",
+    "Cross-validate different sensor platforms"
+]
+
+# Questions offered by ChatInterface, by category
+CHAT_SAMPLE_QUERIES: Dict[str, List[str]] = {
+    'location': [
+        "Show me ARGO floats in the Arabian Sea",
+        "What floats are near the equator?",
+        "Find measurements in the Bay of Bengal",
+        "Where are the active floats located?"
+    ],
+    'temperature_salinity': [
+        "Show me temperature profiles near the equator in March 2023",
+        "Compare salinity patterns in different regions",
+        "What's the average temperature at 500m depth?",
+        "Find the warmest surface waters"
+    ],
+    'bgc': [
+        "Compare BGC parameters in the Arabian Sea for the last 6 months",
+        "Show me oxygen levels in deep water",
+        "Find areas with high chlorophyll concentration",
+        "What are the pH levels near the surface?"
+    ],
+    'analysis': [
+        "Give me a summary of available ARGO data",
+        "Compare data quality between different floats",
+        "Show trends in ocean temperature over time",
+        "What's the data coverage in the Indian Ocean?"
+    ]
+}
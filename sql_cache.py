@@ -0,0 +1,248 @@
+"""
+Persistent cache of NL-to-SQL translations written by the LLM
+Questions that match no template send the schema prompt to the LLM, the slowest path in
+the backend. Once a generated query has been validated and executed successfully, it is
+kept with its execution time and row count, and the same question (normalized as for the
+retrieval cache) reuses it. If a cached query later fails (the schema changed, or it was
+never valid for some data), every entry holding it is evicted.
+
+With SQL_CACHE_SEMANTIC, paraphrases reuse a translation too: a question whose embedding is
+within SQL_CACHE_MIN_COSINE of a cached one's gets its SQL. Embeddings barely separate
+"in 2019" from "in 2020" or "maximum" from "minimum", so a paraphrase must also have the same
+signature: the same extracted region/date/depth/float constraints, numbers, measured
+variables and aggregates. Only entries with that signature are compared.
+
+Entries live in SQLite, shared by the API's worker processes and kept across restarts.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import config
+from query_constraints import extract_query_constraints
+from retrieval_cache import normalize_query
+
+TRANSLATIONS_FILE = 'translations.sqlite'
+
+# Seconds an entry's last_used may lag before a hit rewrites it; eviction order only needs it roughly
+TOUCH_INTERVAL = 60
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS translations (
+    query TEXT NOT NULL,
+    model TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    sql TEXT NOT NULL,
+    embedding BLOB,
+    executions INTEGER NOT NULL,
+    mean_ms REAL NOT NULL,
+    last_ms REAL NOT NULL,
+    row_count INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (query, model)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_translations_signature ON translations(signature, model);
+CREATE INDEX IF NOT EXISTS idx_translations_sql ON translations(sql);
+CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations(last_used);
+"""
+
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+# Words that change the SQL a question needs, mapped to one spelling per meaning
+SIGNATURE_WORDS = {
+    'temperature': 'temperature', 'temp': 'temperature', 'salinity': 'salinity', 'oxygen': 'oxygen',
+    'ph': 'ph', 'chlorophyll': 'chlorophyll', 'nitrate': 'nitrate', 'backscatter': 'backscatter',
+    'cdom': 'cdom', 'par': 'par', 'pressure': 'pressure', 'depth': 'depth', 'depths': 'depth',
+    'average': 'avg', 'mean': 'avg', 'avg': 'avg',
+    'maximum': 'max', 'max': 'max', 'highest': 'max', 'warmest': 'max', 'deepest': 'max',
+    'minimum': 'min', 'min': 'min', 'lowest': 'min', 'coldest': 'min', 'shallowest': 'min',
+    'count': 'count', 'number': 'count', 'many': 'count', 'total': 'sum', 'sum': 'sum',
+    'median': 'median', 'trend': 'trend', 'trends': 'trend', 'monthly': 'month', 'month': 'month',
+    'yearly': 'year', 'year': 'year', 'annual': 'year', 'daily': 'day', 'day': 'day',
+}
+
+def question_signature(query_text: str) -> str:
+    """What a paraphrase must share with a cached question: constraints, numbers, variables and aggregates"""
+    words = normalize_query(query_text).split()
+    return json.dumps({
+        'constraints': extract_query_constraints(query_text).describe(),
+        'numbers': sorted(set(NUMBER_PATTERN.findall(' '.join(words)))),
+        'words': sorted({SIGNATURE_WORDS[word] for word in words if word in SIGNATURE_WORDS}),
+    }, sort_keys=True)
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+class TranslationCache:
+    """SQL of one LLM's translations, by question and by paraphrase"""
+
+    def __init__(self, model_name: str, embed: Optional[Callable[[List[str]], List]] = None,
+                 path: Optional[str] = None, max_entries: Optional[int] = None,
+                 semantic: Optional[bool] = None, min_cosine: Optional[float] = None):
+        self.model_name = model_name
+        self.embed = embed
+        self.path = path or config.SQL_CACHE_PATH
+        self.max_entries = max_entries or config.SQL_CACHE_SIZE
+        self.semantic = config.SQL_CACHE_SEMANTIC if semantic is None else semantic
+        self.min_cosine = config.SQL_CACHE_MIN_COSINE if min_cosine is None else min_cosine
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.path, exist_ok=True)
+        # Autocommit mode: each statement is its own transaction
+        self._db = sqlite3.connect(os.path.join(self.path, TRANSLATIONS_FILE), timeout=30,
+                                   isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # A cache can lose its last commits on power loss; WAL keeps it consistent without an fsync each
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA_SQL)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _embedding(self, query_text: str) -> Optional[np.ndarray]:
+        if self.embed is None:
+            return None
+        return _unit(self.embed([query_text])[0])
+
+    def get(self, query_text: str) -> Optional[str]:
+        """Cached SQL for the question or a paraphrase of it, or None"""
+        query = normalize_query(query_text)
+        with self._lock:
+            row = self._db.execute("SELECT sql, last_used FROM translations WHERE query = ? AND model = ?",
+                                   (query, self.model_name)).fetchone()
+            if row is not None:
+                self._touch(query, row[1])
+                self.hits += 1
+                return row[0]
+            candidates = []
+            if self.semantic and self.embed is not None:
+                candidates = self._db.execute("""
+                    SELECT query, sql, embedding, last_used FROM translations
+                    WHERE signature = ? AND model = ? AND embedding IS NOT NULL
+                """, (question_signature(query_text), self.model_name)).fetchall()
+
+        # Embedded only when some cached question could match, and outside the lock
+        if candidates:
+            target = self._embedding(query_text)
+            cosines = [float(np.frombuffer(embedding, dtype=np.float32) @ target)
+                       if len(embedding) == target.nbytes else -1.0 for _, _, embedding, _ in candidates]
+            best = int(np.argmax(cosines))
+            if cosines[best] >= self.min_cosine:
+                with self._lock:
+                    self._touch(candidates[best][0], candidates[best][3])
+                    self.hits += 1
+                    self.semantic_hits += 1
+                return candidates[best][1]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _touch(self, query: str, last_used: float):
+        """Mark an entry as used, at most once per TOUCH_INTERVAL"""
+        now = time.time()
+        if now - last_used >= TOUCH_INTERVAL:
+            self._db.execute("UPDATE translations SET last_used = ? WHERE query = ? AND model = ?",
+                             (now, query, self.model_name))
+
+    def put(self, query_text: str, sql_query: str, seconds: float, row_count: int):
+        """Record a successful execution of sql_query for the question"""
+        query = normalize_query(query_text)
+        milliseconds = seconds * 1000
+        with self._lock:
+            updated = self._db.execute("""
+                UPDATE translations SET executions = executions + 1,
+                    mean_ms = mean_ms + (? - mean_ms) / (executions + 1),
+                    last_ms = ?, row_count = ?, last_used = ?
+                WHERE query = ? AND model = ? AND sql = ?
+            """, (milliseconds, milliseconds, int(row_count), time.time(), query, self.model_name, sql_query)).rowcount
+        if updated:
+            return
+
+        embedding = self._embedding(query_text)
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?, ?)",
+                             (query, self.model_name, question_signature(query_text), sql_query,
+                              embedding.tobytes() if embedding is not None else None,
+                              milliseconds, milliseconds, int(row_count), now, now))
+            excess = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._db.execute("""
+                    DELETE FROM translations WHERE (query, model) IN
+                        (SELECT query, model FROM translations ORDER BY last_used LIMIT ?)
+                """, (excess,))
+
+    def evict(self, sql_query: str) -> int:
+        """Drop every cached question translated to sql_query; returns how many"""
+        with self._lock:
+            removed = self._db.execute("DELETE FROM translations WHERE sql = ? AND model = ?",
+                                       (sql_query, self.model_name)).rowcount
+            self.evictions += removed
+            return removed
+
+    def entry(self, query_text: str) -> Optional[Dict]:
+        """Execution record of a question's cached translation"""
+        with self._lock:
+            row = self._db.execute("""
+                SELECT sql, executions, mean_ms, last_ms, row_count FROM translations WHERE query = ? AND model = ?
+            """, (normalize_query(query_text), self.model_name)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['sql', 'executions', 'mean_ms', 'last_ms', 'row_count'], row))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM translations WHERE model = ?",
+                                    (self.model_name,)).fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Hit rate of this process's lookups and the size of the shared cache"""
+        entries = len(self)
+        with self._lock:
+            return {
+                'model': self.model_name,
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'semantic': self.semantic and self.embed is not None,
+                'min_cosine': self.min_cosine,
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hit_rate, 4),
+                'evictions': self.evictions
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+_caches: Dict[str, TranslationCache] = {}
+_caches_pid: Optional[int] = None
+_caches_lock = threading.Lock()
+
+def get_translation_cache(model_name: str, embed: Optional[Callable[[List[str]], List]] = None) -> TranslationCache:
+    """Return the process-wide translation cache for an LLM, opening it on first use"""
+    global _caches_pid
+    with _caches_lock:
+        if _caches_pid != os.getpid():
+            # Forked worker: SQLite connections must not cross a fork
+            _caches.clear()
+            _caches_pid = os.getpid()
+        if model_name not in _caches:
+            _caches[model_name] = TranslationCache(model_name, embed)
+        elif embed is not None:
+            _caches[model_name].embed = embed
+        return _caches[model_name]
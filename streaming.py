@@ -0,0 +1,85 @@
+"""
+Streaming /query answers as newline-delimited JSON events
+/query/stream sends one JSON object per line, so the chat UI can show what it has as soon
+as it has it:
+    {"type": "context", "context_documents": [...], "retrieved_metadata": [...]}   retrieval finished
+    {"type": "token", "text": "..."}                                                 each piece of the answer
+    {"type": "done", "answer": "..."}                                                the complete answer
+    {"type": "error", "message": "...", "answer": "..."}                             generation failed part way
+done and error also carry the final "metadata" when the caller supplies it, since how the
+answer was produced (stage times, degradations) is only known once it has been.
+LLM clients stream from blocking iterators; iterate_blocking runs one on a worker thread
+and hands its items to the event loop as they arrive.
+"""
+
+import asyncio
+import json
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+MEDIA_TYPE = "application/x-ndjson"
+
+_DONE = object()
+
+def encode_event(event_type: str, **fields: Any) -> bytes:
+    """One NDJSON line; values JSON cannot represent (dates, numpy scalars) are sent as strings"""
+    return (json.dumps({'type': event_type, **fields}, default=str) + "\n").encode('utf-8')
+
+async def iterate_blocking(make_iterator: Callable[..., Iterator], *args) -> AsyncIterator:
+    """
+    Items of make_iterator(*args), produced on a worker thread
+
+    If the consumer stops early (the client disconnected), the thread stops at the next item
+    instead of running the generation to its end.
+    """
+    loop = asyncio.get_running_loop()
+    items: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in make_iterator(*args):
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(items.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(items.put_nowait, (_DONE, e))
+        else:
+            loop.call_soon_threadsafe(items.put_nowait, (_DONE, None))
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item, error = await items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        if producer.done():
+            producer.result()
+
+async def answer_events(context: dict, tokens: AsyncIterator[str],
+                        metadata: Optional[Callable[[], Dict]] = None) -> AsyncIterator[bytes]:
+    """
+    The context event, then a token event per piece of text, then done (or error) with the whole answer
+
+    metadata, when given, is called once the tokens are exhausted and its result sent with
+    the done or error event.
+    """
+    yield encode_event('context', **context)
+    parts = []
+    try:
+        async for token in tokens:
+            if token:
+                parts.append(token)
+                yield encode_event('token', text=token)
+    except Exception as e:
+        print(f"Answer generation failed while streaming: {e}")
+        final = {'metadata': metadata()} if metadata else {}
+        yield encode_event('error', message=str(e), answer=''.join(parts), **final)
+        return
+    final = {'metadata': metadata()} if metadata else {}
+    yield encode_event('done', answer=''.join(parts), **final)
@@ -0,0 +1,222 @@
+"""
+Materialized summary views for the fixed analytical templates
+Each parameter-free NL-to-SQL template gets a pre-aggregated view that is refreshed after
+ingestion, so the common chat questions read a few rows instead of scanning measurements
+"""
+
+from typing import Dict, Optional, Set
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from database import get_engine
+
+# intent -> view definition (name, aggregation SQL, unique key, read query)
+SUMMARY_VIEWS = {
+    'avg_by_depth': {
+        'view': 'mv_avg_by_depth',
+        'definition': """
+            SELECT depth,
+                   AVG(temperature) as avg_temperature,
+                   AVG(salinity) as avg_salinity,
+                   COUNT(*) as measurement_count
+            FROM measurements
+            WHERE temperature IS NOT NULL AND salinity IS NOT NULL
+            GROUP BY depth
+        """,
+        'unique_key': 'depth',
+        'query': """
+            SELECT depth, avg_temperature, avg_salinity, measurement_count
+            FROM mv_avg_by_depth
+            ORDER BY depth
+            LIMIT 100;
+        """
+    },
+
+    'regional_comparison': {
+        'view': 'mv_regional_comparison',
+        'definition': """
+            SELECT
+                CASE
+                    WHEN lat > 0 THEN 'Northern Hemisphere'
+                    ELSE 'Southern Hemisphere'
+                END as region,
+                AVG(temperature) as avg_temperature,
+                AVG(salinity) as avg_salinity,
+                AVG(oxygen) as avg_oxygen,
+                COUNT(*) as measurement_count
+            FROM measurements
+            WHERE temperature IS NOT NULL
+            GROUP BY CASE WHEN lat > 0 THEN 'Northern Hemisphere' ELSE 'Southern Hemisphere' END
+        """,
+        'unique_key': 'region',
+        'query': """
+            SELECT region, avg_temperature, avg_salinity, avg_oxygen, measurement_count
+            FROM mv_regional_comparison;
+        """
+    },
+
+    'depth_ranges': {
+        'view': 'mv_depth_ranges',
+        'definition': """
+            SELECT
+                CASE
+                    WHEN depth < 100 THEN 'Surface (0-100m)'
+                    WHEN depth < 500 THEN 'Intermediate (100-500m)'
+                    WHEN depth < 1000 THEN 'Deep (500-1000m)'
+                    ELSE 'Very Deep (>1000m)'
+                END as depth_range,
+                AVG(temperature) as avg_temperature,
+                AVG(salinity) as avg_salinity,
+                AVG(oxygen) as avg_oxygen,
+                COUNT(*) as measurement_count,
+                MIN(depth) as sort_depth
+            FROM measurements
+            WHERE temperature IS NOT NULL
+            GROUP BY CASE
+                WHEN depth < 100 THEN 'Surface (0-100m)'
+                WHEN depth < 500 THEN 'Intermediate (100-500m)'
+                WHEN depth < 1000 THEN 'Deep (500-1000m)'
+                ELSE 'Very Deep (>1000m)'
+            END
+        """,
+        'unique_key': 'depth_range',
+        'query': """
+            SELECT depth_range, avg_temperature, avg_salinity, avg_oxygen, measurement_count
+            FROM mv_depth_ranges
+            ORDER BY sort_depth;
+        """
+    },
+
+    'float_summary': {
+        'view': 'mv_float_summary',
+        'definition': """
+            SELECT
+                f.float_id,
+                f.wmo_id,
+                f.deployment_date,
+                COUNT(DISTINCT p.profile_id) as total_profiles,
+                COUNT(m.id) as total_measurements,
+                AVG(m.temperature) as avg_temperature,
+                AVG(m.salinity) as avg_salinity,
+                MIN(m.depth) as min_depth,
+                MAX(m.depth) as max_depth
+            FROM floats f
+            JOIN profiles p ON f.float_id = p.float_id
+            JOIN measurements m ON p.profile_id = m.profile_id
+            WHERE m.temperature IS NOT NULL
+            GROUP BY f.float_id, f.wmo_id, f.deployment_date
+        """,
+        'unique_key': 'float_id',
+        'query': """
+            SELECT float_id, wmo_id, deployment_date, total_profiles, total_measurements,
+                   avg_temperature, avg_salinity, min_depth, max_depth
+            FROM mv_float_summary
+            ORDER BY total_measurements DESC
+            LIMIT 50;
+        """
+    },
+
+    'temporal_trends': {
+        'view': 'mv_temporal_trends',
+        'definition': """
+            SELECT
+                DATE_TRUNC('month', m.time) as month,
+                AVG(m.temperature) as avg_temperature,
+                AVG(m.salinity) as avg_salinity,
+                COUNT(*) as measurement_count
+            FROM measurements m
+            WHERE m.temperature IS NOT NULL
+            GROUP BY DATE_TRUNC('month', m.time)
+        """,
+        'unique_key': 'month',
+        'query': """
+            SELECT month, avg_temperature, avg_salinity, measurement_count
+            FROM mv_temporal_trends
+            ORDER BY month
+            LIMIT 100;
+        """
+    },
+
+    'bgc_analysis': {
+        'view': 'mv_bgc_analysis',
+        'definition': """
+            SELECT
+                CASE
+                    WHEN depth < 200 THEN 'Euphotic Zone'
+                    WHEN depth < 1000 THEN 'Mesopelagic Zone'
+                    ELSE 'Bathypelagic Zone'
+                END as ocean_zone,
+                AVG(oxygen) as avg_oxygen,
+                AVG(ph) as avg_ph,
+                AVG(chlorophyll) as avg_chlorophyll,
+                COUNT(*) as measurement_count,
+                MIN(depth) as sort_depth
+            FROM measurements
+            WHERE oxygen IS NOT NULL AND ph IS NOT NULL
+            GROUP BY CASE
+                WHEN depth < 200 THEN 'Euphotic Zone'
+                WHEN depth < 1000 THEN 'Mesopelagic Zone'
+                ELSE 'Bathypelagic Zone'
+            END
+        """,
+        'unique_key': 'ocean_zone',
+        'query': """
+            SELECT ocean_zone, avg_oxygen, avg_ph, avg_chlorophyll, measurement_count
+            FROM mv_bgc_analysis
+            ORDER BY sort_depth;
+        """
+    }
+}
+
+# Ready-to-run read queries keyed by intent
+SUMMARY_VIEW_QUERIES = {intent: spec['query'].strip() for intent, spec in SUMMARY_VIEWS.items()}
+
+def get_available_summary_views(engine: Optional[Engine] = None) -> Set[str]:
+    """Names of the summary views that currently exist and are populated"""
+    with (engine or get_engine()).connect() as conn:
+        rows = conn.execute(text(
+            "SELECT matviewname FROM pg_matviews WHERE schemaname = 'public' AND ispopulated"
+        ))
+        return {row[0] for row in rows}
+
+def create_summary_views(engine: Optional[Engine] = None, intents=None):
+    """(Re)create the summary views, populating them from the base tables"""
+    intents = intents or list(SUMMARY_VIEWS.keys())
+
+    with (engine or get_engine()).connect() as conn:
+        for intent in intents:
+            spec = SUMMARY_VIEWS[intent]
+            conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {spec['view']}"))
+            conn.execute(text(f"CREATE MATERIALIZED VIEW {spec['view']} AS {spec['definition']}"))
+            # A unique index is what allows REFRESH ... CONCURRENTLY later on
+            conn.execute(text(
+                f"CREATE UNIQUE INDEX idx_{spec['view']}_key ON {spec['view']} ({spec['unique_key']})"
+            ))
+        conn.commit()
+
+def refresh_summary_views(engine: Optional[Engine] = None, concurrently: bool = False) -> Dict[str, str]:
+    """
+    Refresh every summary view, creating any that are missing
+
+    After a full reload the base tables were dropped (taking the views with them), so
+    the views are simply recreated. Use concurrently=True for incremental refreshes
+    while the API is serving reads.
+    """
+    engine = engine or get_engine()
+    existing = get_available_summary_views(engine)
+    status = {}
+
+    missing = [intent for intent, spec in SUMMARY_VIEWS.items() if spec['view'] not in existing]
+    if missing:
+        create_summary_views(engine, missing)
+        status.update({intent: 'created' for intent in missing})
+
+    with engine.connect() as conn:
+        for intent, spec in SUMMARY_VIEWS.items():
+            if intent in status:
+                continue
+            mode = "CONCURRENTLY " if concurrently else ""
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW {mode}{spec['view']}"))
+            status[intent] = 'refreshed'
+        conn.commit()
+
+    return status
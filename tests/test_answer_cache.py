@@ -0,0 +1,118 @@
+"""
+Unit tests for the LLM answer cache
+"""
+
+import pytest
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import answer_cache
+from answer_cache import AnswerCache, context_key
+
+CONTEXT = ['profile_7', 'profile_3', 'profile_12']
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AnswerCache('ollama:test', path=str(tmp_path), min_cosine=0.95)
+    yield cache
+    cache.close()
+
+class TestExactTier:
+    """Test cases for answers reused by question, context and model."""
+
+    def test_hit(self, cache):
+        """Test that a reworded-only-in-case-and-punctuation question with the same context is a hit."""
+        cache.put("Where is the warm water?", CONTEXT, 3, "Near the equator.")
+        assert cache.get("where is the WARM water", CONTEXT, 3) == "Near the equator."
+        assert cache.stats()['hits'] == 1
+
+    def test_context_must_match(self, cache):
+        """Test that the same question retrieving other documents, or the same ones in another order, misses."""
+        cache.put("warm water", CONTEXT, 3, "Near the equator.")
+        assert cache.get("warm water", CONTEXT[:2], 3) is None
+        assert cache.get("warm water", list(reversed(CONTEXT)), 3) is None
+        assert context_key(CONTEXT) != context_key(list(reversed(CONTEXT)))
+
+    def test_model_must_match(self, cache, tmp_path):
+        """Test that another LLM's answers are not served."""
+        cache.put("warm water", CONTEXT, 3, "Near the equator.")
+        other = AnswerCache('ollama:other', path=str(tmp_path))
+        assert other.get("warm water", CONTEXT, 3) is None
+        other.close()
+
+    def test_stale_data_version(self, cache):
+        """Test that an answer written against older data is dropped."""
+        cache.put("warm water", CONTEXT, 3, "Near the equator.")
+        assert cache.get("warm water", CONTEXT, 4) is None
+        assert cache.stats()['stale'] == 1
+        assert len(cache) == 0
+
+    def test_persists(self, cache, tmp_path):
+        """Test that answers survive a restart."""
+        cache.put("warm water", CONTEXT, 3, "Near the equator.")
+        cache.close()
+        reopened = AnswerCache('ollama:test', path=str(tmp_path))
+        assert reopened.get("warm water", CONTEXT, 3) == "Near the equator."
+        reopened.close()
+
+    def test_eviction(self, tmp_path, monkeypatch):
+        """Test that the least recently used answers are evicted past max_entries."""
+        monkeypatch.setattr(answer_cache, 'TOUCH_INTERVAL', 0)
+        cache = AnswerCache('ollama:test', path=str(tmp_path), max_entries=2)
+        cache.put("a", CONTEXT, 1, "A")
+        cache.put("b", CONTEXT, 1, "B")
+        cache.get("a", CONTEXT, 1)
+        cache.put("c", CONTEXT, 1, "C")
+        assert len(cache) == 2
+        assert cache.get("b", CONTEXT, 1) is None
+        assert cache.get("a", CONTEXT, 1) == "A"
+        cache.close()
+
+    def test_hits_touch_rarely(self, cache):
+        """Test that a hit only rewrites last_used once TOUCH_INTERVAL has passed."""
+        cache.put("warm water", CONTEXT, 3, "Near the equator.")
+        cache._db.execute("UPDATE answers SET last_used = 1")
+        cache.get("warm water", CONTEXT, 3)
+        touched = cache._db.execute("SELECT last_used FROM answers").fetchone()[0]
+        assert touched > 1
+        cache.get("warm water", CONTEXT, 3)
+        assert cache._db.execute("SELECT last_used FROM answers").fetchone()[0] == touched
+
+    def test_empty_answer_not_cached(self, cache):
+        """Test that an empty answer is not stored."""
+        cache.put("warm water", CONTEXT, 3, "")
+        assert len(cache) == 0
+
+class TestSemanticTier:
+    """Test cases for answers reused by similar questions with the same context."""
+
+    def test_similar_question(self, cache):
+        """Test that a question embedded close to a cached one with the same context is a hit."""
+        cache.put("where is the water warmest", CONTEXT, 3, "Near the equator.", [1.0, 0.0, 0.1])
+        assert cache.get("which region has the warmest water", CONTEXT, 3, [0.99, 0.0, 0.12]) == "Near the equator."
+        assert cache.stats()['semantic_hits'] == 1
+
+    def test_dissimilar_question(self, cache):
+        """Test that a question below the cosine threshold misses."""
+        cache.put("where is the water warmest", CONTEXT, 3, "Near the equator.", [1.0, 0.0, 0.1])
+        assert cache.get("where is the water coldest", CONTEXT, 3, [0.5, 0.8, 0.1]) is None
+
+    def test_similar_question_other_context(self, cache):
+        """Test that a similar question retrieving other documents misses."""
+        cache.put("where is the water warmest", CONTEXT, 3, "Near the equator.", [1.0, 0.0, 0.1])
+        assert cache.get("which region has the warmest water", ['profile_1'], 3, [1.0, 0.0, 0.1]) is None
+
+    def test_similar_question_old_data(self, cache):
+        """Test that a similar question is not served an answer from older data."""
+        cache.put("where is the water warmest", CONTEXT, 3, "Near the equator.", [1.0, 0.0, 0.1])
+        assert cache.get("which region has the warmest water", CONTEXT, 4, [1.0, 0.0, 0.1]) is None
+
+    def test_disabled(self, tmp_path):
+        """Test that only exact matches are served when the semantic tier is off."""
+        cache = AnswerCache('ollama:test', path=str(tmp_path), semantic=False)
+        cache.put("where is the water warmest", CONTEXT, 3, "Near the equator.", [1.0, 0.0, 0.1])
+        assert cache.get("which region has the warmest water", CONTEXT, 3, [1.0, 0.0, 0.1]) is None
+        cache.close()
@@ -78,6 +78,82 @@ class TestAPIClient:
         with pytest.raises(APIException, match="Query text too long"):
             self.client.query_rag_pipeline(long_query)
     
+    @patch('requests.Session.request')
+    def test_stream_rag_pipeline_success(self, mock_request):
+        """Test streaming RAG query events and the assembled response"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.iter_lines.return_value = [
+            json.dumps({"type": "context", "context_documents": ["doc1"], "retrieved_metadata": [{"id": 1}]}),
+            "",
+            json.dumps({"type": "token", "text": "Warm "}),
+            json.dumps({"type": "token", "text": "water"}),
+            json.dumps({"type": "done", "answer": "Warm water"})
+        ]
+        mock_request.return_value = mock_response
+        events = []
+        
+        result = self.client.stream_rag_pipeline("test query", on_event=events.append)
+        
+        assert [event["type"] for event in events] == ["context", "token", "token", "done"]
+        assert result.answer == "Warm water"
+        assert result.context_documents == ["doc1"]
+        assert result.retrieved_metadata == [{"id": 1}]
+        assert mock_request.call_args.kwargs["stream"] is True
+        mock_response.close.assert_called()
+    
+    @patch('requests.Session.request')
+    def test_stream_rag_pipeline_final_metadata(self, mock_request):
+        """Test that metadata sent with the done event replaces the context event's"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.iter_lines.return_value = [
+            json.dumps({"type": "context", "context_documents": [], "retrieved_metadata": [],
+                        "metadata": {"answer_source": "llm", "degraded": False}}),
+            json.dumps({"type": "token", "text": "Retrieved data"}),
+            json.dumps({"type": "done", "answer": "Retrieved data",
+                        "metadata": {"answer_source": "retrieval", "degraded": True}})
+        ]
+        mock_request.return_value = mock_response
+        
+        result = self.client.stream_rag_pipeline("test query")
+        
+        assert result.metadata == {"answer_source": "retrieval", "degraded": True}
+    
+    @patch('requests.Session.request')
+    def test_stream_rag_pipeline_error_event(self, mock_request):
+        """Test that an error event raises APIException"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.iter_lines.return_value = [
+            json.dumps({"type": "context", "context_documents": [], "retrieved_metadata": []}),
+            json.dumps({"type": "error", "message": "generation timed out", "answer": ""})
+        ]
+        mock_request.return_value = mock_response
+        
+        with pytest.raises(APIException, match="generation timed out"):
+            self.client.stream_rag_pipeline("test query")
+    
+    @patch('requests.Session.request')
+    def test_stream_rag_pipeline_fallback(self, mock_request):
+        """Test fallback to /query when the backend has no streaming endpoint"""
+        not_found = Mock()
+        not_found.status_code = 404
+        answered = Mock()
+        answered.status_code = 200
+        answered.json.return_value = {"answer": "Test answer", "context_documents": [], "retrieved_metadata": []}
+        mock_request.side_effect = [not_found, answered]
+        
+        result = self.client.stream_rag_pipeline("test query")
+        
+        assert result.answer == "Test answer"
+        assert mock_request.call_args.args[1].endswith("/query")
+    
+    def test_stream_rag_pipeline_empty_query(self):
+        """Test streaming RAG query with empty input"""
+        with pytest.raises(APIException, match="Query text cannot be empty"):
+            self.client.stream_rag_pipeline(" ")
+    
     @patch('requests.Session.request')
     def test_get_profiles_by_ids_success(self, mock_request):
         """Test successful profile data retrieval"""
@@ -183,6 +259,32 @@ class TestAPIClient:
         assert result["status"] == "error"
         assert mock_request.call_count == 4  # Initial + 3 retries
     
+    @patch('requests.Session.request')
+    def test_get_cube_statistics_success(self, mock_request):
+        """Test cube statistics request and parameters"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            "rows": [{"hemisphere": "Northern Hemisphere", "parameter": "temperature", "count": 10, "mean": 20.0}]
+        }
+        mock_request.return_value = mock_response
+        
+        result = self.client.get_cube_statistics(['hemisphere'], ['temperature'], region='equator', lat_min=None)
+        
+        assert result['mean'].tolist() == [20.0]
+        params = mock_request.call_args.kwargs['params']
+        assert params == {'group_by': 'hemisphere', 'parameters': 'temperature', 'region': 'equator'}
+    
+    @patch('requests.Session.request')
+    def test_get_cube_statistics_backend_error(self, mock_request):
+        """Test that backend errors yield an empty frame"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"error": "Failed to query data cube"}
+        mock_request.return_value = mock_response
+        
+        assert self.client.get_cube_statistics(['month']).empty
+    
     def test_connection_status(self):
         """Test connection status tracking"""
         assert not self.client.is_connected
@@ -0,0 +1,217 @@
+"""
+Unit tests for the ARGO float ingestion helpers
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xarray as xr
+from argo_float_processor import (
+    ChangeSet, add_realistic_bgc_data, build_float_structure, classify_profiles,
+    compute_profile_hashes, read_gridded_measurements
+)
+
+BGC_COLUMNS = ['oxygen', 'ph', 'chlorophyll', 'nitrate', 'backscatter', 'cdom', 'downwelling_par']
+
+class TestBgcSynthesis:
+    """Test cases for vectorized BGC parameter generation."""
+
+    @pytest.fixture
+    def measurements(self):
+        """Create measurements covering every depth regime."""
+        depths = np.repeat([10.0, 75.0, 120.0, 175.0, 600.0, 1500.0], 5000)
+        return pd.DataFrame({'depth': depths, 'lat': 0.0, 'lon': 80.0, 'temperature': 20.0})
+
+    def test_columns_added_without_mutating_input(self, measurements):
+        """Test that every BGC column is added to a copy."""
+        result = add_realistic_bgc_data(measurements, seed=1)
+        assert all(column in result.columns for column in BGC_COLUMNS)
+        assert 'oxygen' not in measurements.columns
+        assert len(result) == len(measurements)
+
+    def test_seed_reproducible(self, measurements):
+        """Test that the same seed yields the same values."""
+        first = add_realistic_bgc_data(measurements, seed=3)
+        second = add_realistic_bgc_data(measurements, seed=3)
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_clipped_ranges(self, measurements):
+        """Test clipping of physically bounded parameters."""
+        result = add_realistic_bgc_data(measurements, seed=1)
+        assert result['ph'].between(7.5, 8.3).all()
+        for column in ['oxygen', 'chlorophyll', 'nitrate', 'backscatter', 'cdom', 'downwelling_par']:
+            assert (result[column] >= 0).all()
+
+    def test_depth_regimes(self, measurements):
+        """Test that regime means follow the oceanographic profiles."""
+        means = add_realistic_bgc_data(measurements, seed=1).groupby('depth')[BGC_COLUMNS].mean()
+        assert means.loc[10.0, 'oxygen'] == pytest.approx(6.5, abs=0.05)
+        assert means.loc[600.0, 'oxygen'] == pytest.approx(3.5, abs=0.05)
+        assert means.loc[1500.0, 'oxygen'] == pytest.approx(4.8, abs=0.05)
+        assert means.loc[10.0, 'chlorophyll'] == pytest.approx(0.8, rel=0.05)
+        assert means.loc[120.0, 'chlorophyll'] == pytest.approx(0.15, rel=0.05)
+        assert means.loc[600.0, 'chlorophyll'] == pytest.approx(0.015, rel=0.05)
+        assert means.loc[1500.0, 'nitrate'] == pytest.approx(2 + 1500 / 80, abs=0.1)
+        assert means.loc[120.0, 'downwelling_par'] == pytest.approx(1800 * np.exp(-120 / 45), abs=2)
+        assert (means.loc[[175.0, 600.0, 1500.0], 'downwelling_par'] == 0).all()
+
+class TestFloatStructure:
+    """Test cases for building virtual floats from gridded data."""
+
+    @pytest.fixture
+    def grid(self):
+        """Create a 3 time x 2 depth x 2 lat x 2 lon grid with one masked column."""
+        temp = np.arange(24, dtype=float).reshape(3, 2, 2, 2)
+        temp[:, :, 1, 1] = np.nan
+        dims = ('TAXIS', 'ZAX', 'YAXIS', 'XAXIS')
+        return xr.Dataset(
+            {'TEMP': (dims, temp), 'SAL': (dims, temp + 30)},
+            coords={
+                'TAXIS': pd.date_range('2023-01-01', periods=3, freq='D'),
+                'ZAX': [10.0, 100.0],
+                'YAXIS': [-1.0, 1.0],
+                'XAXIS': [60.0, 61.0]
+            }
+        )
+
+    def test_read_matches_full_conversion(self, grid):
+        """Test that sliced reading gives the same rows as one to_dataframe call."""
+        rows = read_gridded_measurements(grid, max_rows=1000)
+        full = grid.to_dataframe().reset_index().dropna()
+        assert len(rows) == len(full) == 18
+        assert rows['temperature'].tolist() == full['TEMP'].tolist()
+
+    def test_read_cap(self, grid):
+        """Test that the cap keeps the first valid rows."""
+        rows = read_gridded_measurements(grid, max_rows=5)
+        assert rows['temperature'].tolist() == [0.0, 1.0, 2.0, 4.0, 5.0]
+
+    def test_structure(self, grid):
+        """Test float, profile and measurement numbering."""
+        floats_df, profiles_df, measurements_df = build_float_structure(
+            read_gridded_measurements(grid, max_rows=1000), max_floats=1000
+        )
+        assert floats_df['float_id'].tolist() == ['ARGO_0001', 'ARGO_0002', 'ARGO_0003']
+        assert floats_df['wmo_id'].tolist() == [5900001, 5900002, 5900003]
+        assert str(floats_df.loc[0, 'deployment_date']) == '2023-01-01'
+        assert str(floats_df.loc[0, 'last_contact']) == '2023-01-03'
+
+        assert profiles_df['profile_id'].tolist() == list(range(1, 10))
+        assert profiles_df['cycle_number'].tolist() == [1, 2, 3] * 3
+        assert (profiles_df['n_levels'] == 2).all()
+
+        first_profile = measurements_df[measurements_df['profile_id'] == 1]
+        assert first_profile['depth'].tolist() == [10.0, 100.0]
+        assert (first_profile['float_id'] == 'ARGO_0001').all()
+        assert measurements_df['pressure'].tolist() == pytest.approx((measurements_df['depth'] * 1.025).tolist())
+
+    def test_max_floats(self, grid):
+        """Test that only the first floats are kept."""
+        floats_df, profiles_df, measurements_df = build_float_structure(
+            read_gridded_measurements(grid, max_rows=1000), max_floats=2
+        )
+        assert len(floats_df) == 2
+        assert set(measurements_df['float_id']) == {'ARGO_0001', 'ARGO_0002'}
+        assert len(measurements_df) == 12
+
+class TestIncrementalIngest:
+    """Test cases for change detection in incremental ingestion."""
+
+    @pytest.fixture
+    def batch(self):
+        """Create 2 floats x 2 cycles x 3 levels of measurements."""
+        profiles_df = pd.DataFrame({
+            'profile_id': [1, 2, 3, 4],
+            'float_id': ['ARGO_0001', 'ARGO_0001', 'ARGO_0002', 'ARGO_0002'],
+            'cycle_number': [1, 2, 1, 2]
+        })
+        measurements_df = pd.DataFrame({
+            'profile_id': np.repeat([1, 2, 3, 4], 3),
+            'time': pd.Timestamp('2023-01-01'),
+            'lat': 0.0,
+            'lon': 80.0,
+            'depth': np.tile([10.0, 50.0, 100.0], 4),
+            'temperature': np.arange(12, dtype=float),
+            'salinity': 35.0
+        })
+        return profiles_df, measurements_df
+
+    def test_hashes_per_profile(self, batch):
+        """Test that every profile gets a distinct 16-digit hash."""
+        _, measurements_df = batch
+        hashes = compute_profile_hashes(measurements_df)
+        assert hashes.index.tolist() == [1, 2, 3, 4]
+        assert hashes.str.len().eq(16).all()
+        assert hashes.nunique() == 4
+
+    def test_hash_ignores_bgc_and_row_position(self, batch):
+        """Test that synthetic BGC values and frame order do not change the hash."""
+        _, measurements_df = batch
+        expected = compute_profile_hashes(measurements_df)
+        with_bgc = add_realistic_bgc_data(measurements_df, seed=7)
+        assert compute_profile_hashes(with_bgc).equals(expected)
+        shuffled = measurements_df.iloc[[9, 10, 11, 0, 1, 2, 6, 7, 8, 3, 4, 5]]
+        assert compute_profile_hashes(shuffled).equals(expected)
+
+    def test_hash_detects_changes(self, batch):
+        """Test that a changed value or swapped levels change only that profile's hash."""
+        _, measurements_df = batch
+        expected = compute_profile_hashes(measurements_df)
+
+        edited = measurements_df.copy()
+        edited.loc[4, 'temperature'] += 0.01
+        changed = compute_profile_hashes(edited) != expected
+        assert changed.tolist() == [False, True, False, False]
+
+        swapped = measurements_df.iloc[[1, 0, 2] + list(range(3, 12))]
+        assert (compute_profile_hashes(swapped) != expected).tolist() == [True, False, False, False]
+
+    def test_classify(self, batch):
+        """Test insert/update/unchanged labels against stored profiles."""
+        profiles_df, measurements_df = batch
+        profiles_df = profiles_df.assign(content_hash=compute_profile_hashes(measurements_df).to_numpy())
+        stored = pd.DataFrame({
+            'profile_id': [11, 12, 13],
+            'float_id': ['ARGO_0001', 'ARGO_0001', 'ARGO_0002'],
+            'cycle_number': [1, 2, 1],
+            'content_hash': [profiles_df.loc[0, 'content_hash'], 'stale', profiles_df.loc[2, 'content_hash']]
+        })
+        watermarks = pd.Series({'ARGO_0001': 2, 'ARGO_0002': 1})
+
+        classified = classify_profiles(profiles_df, stored, watermarks)
+        assert classified['change_type'].tolist() == ['unchanged', 'update', 'unchanged', 'insert']
+        assert classified['stored_profile_id'].tolist()[:3] == [11, 12, 13]
+        assert classified['profile_id'].tolist() == [1, 2, 3, 4]
+
+        classified = classify_profiles(profiles_df, stored, watermarks, recheck=False)
+        assert classified['change_type'].tolist() == ['unchanged', 'unchanged', 'unchanged', 'insert']
+
+    def test_classify_empty_database(self, batch):
+        """Test that everything is inserted when nothing is stored."""
+        profiles_df, measurements_df = batch
+        profiles_df = profiles_df.assign(content_hash=compute_profile_hashes(measurements_df).to_numpy())
+        stored = pd.DataFrame(columns=['profile_id', 'float_id', 'cycle_number', 'content_hash'])
+        classified = classify_profiles(profiles_df, stored, pd.Series(dtype=float))
+        assert (classified['change_type'] == 'insert').all()
+
+    def test_change_set(self):
+        """Test change set accessors and serialization."""
+        change_set = ChangeSet(batch_id='abc')
+        assert change_set.is_empty
+        assert change_set.profile_ids == []
+
+        change_set.inserted = pd.DataFrame({'float_id': ['ARGO_0002'], 'cycle_number': [3], 'profile_id': [np.int64(7)]})
+        change_set.updated = pd.DataFrame({'float_id': ['ARGO_0001'], 'cycle_number': [1], 'profile_id': [np.int64(2)]})
+        assert not change_set.is_empty
+        assert change_set.profile_ids == [7, 2]
+        assert change_set.float_ids == ['ARGO_0001', 'ARGO_0002']
+
+        payload = change_set.to_dict()
+        assert payload['inserted'] == [{'float_id': 'ARGO_0002', 'cycle_number': 3, 'profile_id': 7}]
+        assert type(payload['updated'][0]['profile_id']) is int
@@ -0,0 +1,103 @@
+"""
+Unit tests for the float-aware Chroma document builders
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_chroma_floats import build_measurement_documents, build_profile_documents
+
+@pytest.fixture
+def measurement_rows():
+    """Create two measurement rows as returned by MEASUREMENT_SQL, the second with gaps."""
+    return pd.DataFrame({
+        'id': [101, 102],
+        'profile_id': [7, 7],
+        'float_id': ['ARGO_0003', 'ARGO_0003'],
+        'time': pd.to_datetime(['2023-03-05 12:00', '2023-03-05 12:00']),
+        'lat': [-12.3456, -12.3456],
+        'lon': [80.5, 80.5],
+        'depth': [10.04, 500.0],
+        'temperature': [28.456, np.nan],
+        'salinity': [35.1, 34.9],
+        'oxygen': [6.123, np.nan],
+        'ph': [8.1, np.nan],
+        'chlorophyll': [0.5, 0.005],
+        'wmo_id': [5900003, 5900003],
+        'deployment_date': [date(2023, 1, 1), date(2023, 1, 1)],
+        'cycle_number': [4, 4],
+        'profile_date': pd.to_datetime(['2023-03-05', '2023-03-05']),
+        'n_levels': [30, 30]
+    })
+
+class TestBuildMeasurementDocuments:
+    """Test cases for vectorized measurement documents."""
+
+    def test_document_text(self, measurement_rows):
+        """Test the full description of a complete row."""
+        ids, documents, _ = build_measurement_documents(measurement_rows)
+        assert ids == ['101', '102']
+        assert documents[0] == (
+            "ARGO float ARGO_0003 (WMO ID: 5900003) recorded measurements on 2023-03-05 during cycle 4. "
+            "The float was located at latitude -12.346° and longitude 80.500°. "
+            "At a depth of 10.0 meters, the temperature was 28.46°C and the salinity was 35.10 PSU. "
+            "The dissolved oxygen was 6.12 ml/L. The pH was 8.10. The chlorophyll concentration was 0.500 mg/m³. "
+            "This measurement was part of a profile with 30 depth levels. The float was deployed on 2023-01-01."
+        )
+
+    def test_missing_values(self, measurement_rows):
+        """Test that missing values and negligible chlorophyll are described like before."""
+        _, documents, _ = build_measurement_documents(measurement_rows)
+        assert "the temperature was not available and the salinity was 34.90 PSU. This measurement" in documents[1]
+        assert "oxygen" not in documents[1]
+        assert "chlorophyll" not in documents[1]
+
+    def test_metadata(self, measurement_rows):
+        """Test metadata values and that they are plain Python types accepted by Chroma."""
+        _, _, metadatas = build_measurement_documents(measurement_rows)
+        assert len(metadatas[0].pop('content_hash')) == 16
+        assert metadatas[0] == {
+            'postgres_id': 101, 'profile_id': 7, 'float_id': 'ARGO_0003', 'wmo_id': 5900003,
+            'cycle_number': 4, 'time': '2023-03-05', 'profile_date': '2023-03-05', 'yyyymmdd': 20230305,
+            'depth': 10.04, 'lat': -12.3456, 'lon': 80.5, 'n_levels': 30, 'has_bgc': True
+        }
+        assert metadatas[1]['has_bgc'] is True  # chlorophyll present, even if below the text threshold
+        for value in metadatas[0].values():
+            assert type(value) in (str, int, float, bool)
+
+    def test_content_hash_tracks_values(self, measurement_rows):
+        """Test that the content hash changes with the measured values only."""
+        _, _, before = build_measurement_documents(measurement_rows)
+        _, _, again = build_measurement_documents(measurement_rows.copy())
+        measurement_rows.loc[1, 'salinity'] = 34.95
+        _, _, after = build_measurement_documents(measurement_rows)
+        assert [m['content_hash'] for m in before] == [m['content_hash'] for m in again]
+        assert before[0]['content_hash'] == after[0]['content_hash']
+        assert before[1]['content_hash'] != after[1]['content_hash']
+
+class TestBuildProfileDocuments:
+    """Test cases for profile summary documents."""
+
+    def test_unknown_temperature_omitted(self):
+        """Test that missing temperature bounds are left out of the metadata."""
+        profiles = pd.DataFrame({
+            'profile_id': [7], 'float_id': ['ARGO_0003'], 'cycle_number': [4],
+            'profile_date': pd.to_datetime(['2023-03-05']), 'profile_lat': [-12.3], 'profile_lon': [80.5],
+            'n_levels': [30], 'wmo_id': [5900003], 'avg_temp': [np.nan], 'min_temp': [np.nan],
+            'max_temp': [np.nan], 'avg_sal': [35.0], 'min_sal': [34.9], 'max_sal': [35.1],
+            'min_depth': [5.0], 'max_depth': [2000.0], 'avg_oxygen': [np.nan], 'avg_ph': [np.nan],
+            'avg_chlorophyll': [np.nan]
+        })
+        ids, documents, metadatas = build_profile_documents(profiles)
+        assert ids == ['profile_7']
+        assert "Temperature ranged from not available" in documents[0]
+        assert 'min_temp' not in metadatas[0]
+        assert metadatas[0]['yyyymmdd'] == 20230305
+        assert None not in metadatas[0].values()
@@ -0,0 +1,170 @@
+"""
+Unit tests for the pre-aggregated spatio-temporal data cube
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from sqlalchemy import text
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import build_engine
+from nl_to_sql import NLToSQLTranslator
+from query_constraints import QueryConstraints
+from data_cube import (
+    CUBE_PARAMETERS, CUBE_TEMPLATE_QUERIES, build_data_cube, compute_cube, cube_covers, cube_filters,
+    data_cube_available, merge_cubes, query_cube, write_data_cube
+)
+
+@pytest.fixture
+def measurements():
+    """Create synthetic measurements spanning hemispheres, depth zones and months."""
+    rng = np.random.default_rng(7)
+    n = 600
+    df = pd.DataFrame({
+        'time': pd.to_datetime('2023-01-01') + pd.to_timedelta(rng.integers(0, 120, n), unit='D'),
+        'lat': rng.uniform(-10, 10, n),
+        'lon': rng.uniform(60, 70, n),
+        'depth': rng.choice([5.0, 50.0, 150.0, 600.0, 1500.0], n),
+        'temperature': rng.normal(20, 3, n),
+        'salinity': rng.normal(35, 0.5, n),
+        'oxygen': rng.normal(5, 1, n)
+    })
+    df.loc[::7, 'salinity'] = np.nan
+    return df
+
+class TestComputeCube:
+    """Test cases for cube aggregation."""
+
+    def test_totals_match_raw(self, measurements):
+        """Test that counts and sums add back up to the raw data."""
+        cube = compute_cube(measurements)
+        by_parameter = cube.groupby('parameter')
+        assert by_parameter['value_count'].sum()['salinity'] == measurements['salinity'].count()
+        assert by_parameter['value_sum'].sum()['temperature'] == pytest.approx(measurements['temperature'].sum())
+        assert by_parameter['value_max'].max()['oxygen'] == measurements['oxygen'].max()
+        assert set(cube['parameter']) == {'temperature', 'salinity', 'oxygen'}
+
+    def test_left_closed_depth_bins(self):
+        """Test that a depth on a bin edge belongs to the deeper bin."""
+        df = pd.DataFrame({'time': [datetime(2023, 1, 5)], 'lat': [1.5], 'lon': [60.2],
+                           'depth': [100.0], 'temperature': [20.0]})
+        cube = compute_cube(df)
+        assert cube.loc[0, 'depth_min'] == 100.0
+        assert (cube.loc[0, 'lat_cell'], cube.loc[0, 'lon_cell']) == (1.0, 60.0)
+        assert cube.loc[0, 'month'] == pd.Timestamp('2023-01-01')
+
+    def test_merge_equals_single_pass(self, measurements):
+        """Test that merging chunk cubes gives the same cube as one pass."""
+        whole = compute_cube(measurements)
+        merged = merge_cubes(compute_cube(measurements.iloc[i:i + 250]) for i in range(0, len(measurements), 250))
+        key = ['parameter', 'month', 'depth_bin', 'lat_cell', 'lon_cell']
+        whole = whole.sort_values(key).reset_index(drop=True)
+        merged = merged.sort_values(key).reset_index(drop=True)
+        pd.testing.assert_frame_equal(whole, merged, check_dtype=False)
+
+class TestCoverage:
+    """Test cases for deciding whether the cube can answer constraints."""
+
+    @pytest.mark.parametrize("constraints,expected", [
+        (QueryConstraints(lat_min=-5.0, lat_max=5.0), True),
+        (QueryConstraints(lat_min=-23.5, lat_max=23.5), False),
+        (QueryConstraints(depth_max=200.0), True),
+        (QueryConstraints(depth_min=475.0, depth_max=525.0), False),
+        (QueryConstraints(time_start=datetime(2023, 3, 1), time_end=datetime(2023, 4, 1)), True),
+        (QueryConstraints(time_start=datetime(2023, 3, 15)), False),
+        (QueryConstraints(float_ids=['ARGO_0001']), False)
+    ])
+    def test_cube_covers(self, constraints, expected):
+        """Test grid alignment checks."""
+        assert cube_covers(constraints) is expected
+
+    def test_cube_filters(self):
+        """Test that filters target cube columns."""
+        clause, params = cube_filters(QueryConstraints(lat_min=0.0, depth_max=200.0))
+        assert clause == ' AND lat_cell >= :lat_min AND depth_max <= :depth_max'
+        assert params == {'lat_min': 0.0, 'depth_max': 200.0}
+
+class TestCubeQueries:
+    """Test cases for reading aggregates back from a stored cube."""
+
+    @pytest.fixture
+    def engine(self, tmp_path, measurements):
+        """Create a SQLite database holding the raw measurements and their cube."""
+        engine = build_engine(f"sqlite:///{tmp_path / 'cube.db'}")
+        columns = ['time', 'lat', 'lon', 'depth'] + CUBE_PARAMETERS
+        measurements.reindex(columns=columns).to_sql('measurements', engine, index=False)
+        build_data_cube(engine, measurements=measurements)
+        yield engine
+        engine.dispose()
+
+    def test_available(self, engine):
+        """Test cube table detection."""
+        assert data_cube_available(engine)
+
+    def test_build_from_database(self, engine, measurements):
+        """Test that streaming chunks from the database builds the same cube."""
+        rows = build_data_cube(engine, chunksize=250)
+        assert rows == len(compute_cube(measurements))
+
+    def test_failed_rebuild_keeps_cube(self, engine, measurements):
+        """Test that a rebuild failing mid-load leaves the previous cube in place."""
+        cube = compute_cube(measurements)
+        with pytest.raises(Exception):
+            write_data_cube(pd.concat([cube, cube]), engine)
+        assert pd.read_sql_query("SELECT COUNT(*) AS n FROM measurement_cube", engine)['n'][0] == len(cube)
+        write_data_cube(cube.head(10), engine)
+        assert pd.read_sql_query("SELECT COUNT(*) AS n FROM measurement_cube", engine)['n'][0] == 10
+
+    def test_mean_and_std_by_month(self, engine, measurements):
+        """Test that cube aggregates reproduce raw AVG and STD."""
+        stats = query_cube(['month'], ['temperature'], engine=engine)
+        raw = measurements.groupby(measurements['time'].dt.to_period('M'))['temperature']
+        assert stats['count'].tolist() == raw.count().tolist()
+        assert stats['mean'].to_numpy() == pytest.approx(raw.mean().to_numpy())
+        assert stats['std'].to_numpy() == pytest.approx(raw.std().to_numpy())
+
+    def test_constrained_hemisphere(self, engine, measurements):
+        """Test filtering and the hemisphere dimension."""
+        constraints = QueryConstraints(lat_min=0.0, depth_max=100.0)
+        stats = query_cube(['hemisphere'], ['oxygen'], constraints, engine)
+        raw = measurements[(measurements['lat'] >= 0) & (measurements['depth'] < 100)]['oxygen']
+        assert stats['hemisphere'].tolist() == ['Northern Hemisphere']
+        assert stats.loc[0, 'mean'] == pytest.approx(raw.mean())
+
+    def test_unknown_dimension(self, engine):
+        """Test that unknown dimensions are rejected."""
+        with pytest.raises(ValueError):
+            query_cube(['float'], engine=engine)
+
+    def test_depth_ranges_template_matches_raw(self, engine, measurements):
+        """Test that the cube template reproduces the depth-zone aggregates."""
+        with engine.connect() as conn:
+            cube = pd.read_sql_query(text(CUBE_TEMPLATE_QUERIES['depth_ranges'].replace('{filters}', '')), conn)
+        raw = measurements.groupby(pd.cut(measurements['depth'], [0, 100, 500, 1000, np.inf], right=False),
+                                   observed=True)['temperature']
+        assert cube['measurement_count'].tolist() == raw.count().tolist()
+        assert cube['avg_temperature'].to_numpy() == pytest.approx(raw.mean().to_numpy())
+
+    @pytest.mark.parametrize("intent", ['regional_comparison', 'depth_ranges'])
+    def test_bounded_region_matches_base_template(self, engine, intent):
+        """Test that cube and base template agree on a region, without the cell above its upper bound."""
+        constraints = QueryConstraints(lat_min=-5.0, lat_max=5.0, lon_min=60.0, lon_max=65.0)
+        translator = NLToSQLTranslator()
+        base_filters, base_params = constraints.to_sql_filters()
+        cube_clause, cube_params = cube_filters(constraints)
+        with engine.connect() as conn:
+            base = pd.read_sql_query(text(translator.parameterized_templates[intent].replace('{filters}', base_filters)),
+                                     conn, params=base_params)
+            cube = pd.read_sql_query(text(CUBE_TEMPLATE_QUERIES[intent].replace('{filters}', cube_clause)),
+                                     conn, params=cube_params)
+        key = cube.columns[0]
+        base, cube = base.sort_values(key).reset_index(drop=True), cube.sort_values(key).reset_index(drop=True)
+        assert cube[key].tolist() == base[key].tolist()
+        assert cube['measurement_count'].tolist() == base['measurement_count'].tolist()
+        assert cube['avg_temperature'].to_numpy() == pytest.approx(base['avg_temperature'].to_numpy())
@@ -0,0 +1,153 @@
+"""
+Unit tests for the shared database access layer
+"""
+
+import pytest
+import asyncio
+import threading
+import time
+import sys
+import os
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import build_engine, get_pool_stats, pool_stats, run_blocking, read_sql_query_async
+
+class TestInstrumentedPool:
+    """Test cases for the instrumented connection pool."""
+
+    @pytest.fixture
+    def engine(self, tmp_path):
+        """Create a single-connection SQLite engine using the instrumented pool."""
+        engine = build_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}",
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.2,
+            pool_recycle=-1
+        )
+        pool_stats.reset()
+        yield engine
+        engine.dispose()
+
+    def test_checkout_counted(self, engine):
+        """Test that every checkout is recorded without a wait."""
+        for _ in range(3):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+
+        stats = get_pool_stats(engine)
+        assert stats['checkouts'] == 3
+        assert stats['waits'] == 0
+        assert stats['pool_size'] == 1
+        assert stats['checked_out'] == 0
+
+    def test_wait_recorded_when_pool_exhausted(self, engine):
+        """Test that a checkout blocked on an exhausted pool counts as a wait."""
+        holder = engine.connect()
+
+        def release_later():
+            time.sleep(0.05)
+            holder.close()
+
+        thread = threading.Thread(target=release_later)
+        thread.start()
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        thread.join()
+
+        stats = get_pool_stats(engine)
+        assert stats['waits'] == 1
+        assert stats['max_wait_time_s'] > 0
+
+    def test_timeout_recorded(self, engine):
+        """Test that pool timeouts are counted."""
+        holder = engine.connect()
+        try:
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+        finally:
+            holder.close()
+
+        assert get_pool_stats(engine)['timeouts'] == 1
+
+class TestGetEngine:
+    """Test cases for the process-wide engine factory."""
+
+    def test_singleton(self):
+        """Test that repeated calls share one engine."""
+        assert database.get_engine() is database.get_engine()
+
+    def test_recreated_after_fork(self, monkeypatch):
+        """Test that a different PID gets a fresh engine."""
+        first = database.get_engine()
+        monkeypatch.setattr(database, '_engine_pid', -1)
+        second = database.get_engine()
+        assert first is not second
+
+class TestAsyncHelpers:
+    """Test cases for the async executor helpers."""
+
+    def test_run_blocking_off_loop_thread(self):
+        """Test that blocking work runs on a database worker thread."""
+        async def run():
+            return await run_blocking(lambda: threading.current_thread().name)
+
+        assert asyncio.run(run()).startswith("db-worker")
+
+    def test_read_sql_query_async(self, tmp_path):
+        """Test the async read_sql_query wrapper."""
+        engine = build_engine(f"sqlite:///{tmp_path / 'read.db'}")
+        df = asyncio.run(read_sql_query_async("SELECT 1 AS value", engine))
+        assert df['value'].tolist() == [1]
+        engine.dispose()
+
+class TestDataVersion:
+    """Test cases for the data/schema version used to invalidate caches."""
+
+    @pytest.fixture
+    def engine(self, tmp_path, monkeypatch):
+        """Create a SQLite engine and reset the cached version."""
+        engine = build_engine(f"sqlite:///{tmp_path / 'version.db'}")
+        monkeypatch.setattr(database, '_data_version', None)
+        yield engine
+        engine.dispose()
+
+    def test_missing_table_is_version_zero(self, engine):
+        """Test that a database that was never ingested reports version 0."""
+        assert database.get_data_version(engine, max_age=0) == 0
+
+    def test_bump_increments(self, engine):
+        """Test that bumps are persisted and visible to readers."""
+        assert database.bump_data_version(engine) == 1
+        assert database.bump_data_version(engine) == 2
+        assert database.get_data_version(engine, max_age=0) == 2
+
+    def test_bump_in_callers_transaction(self, engine):
+        """Test that a bump on a connection is published only when the caller commits."""
+        database.bump_data_version(engine)
+        with engine.connect() as conn:
+            assert database.bump_data_version(connection=conn) == 2
+            conn.rollback()
+        assert database.get_data_version(engine, max_age=0) == 1
+
+        with engine.connect() as conn:
+            assert database.bump_data_version(connection=conn) == 2
+            conn.commit()
+        assert database.get_data_version(engine, max_age=0) == 2
+
+    def test_cached_within_ttl(self, engine):
+        """Test that reads within the TTL avoid the database."""
+        database.bump_data_version(engine)
+        assert database.get_data_version(engine, max_age=60) == 1
+
+        with engine.connect() as conn:
+            conn.execute(text("UPDATE data_version SET version = 5"))
+            conn.commit()
+
+        assert database.get_data_version(engine, max_age=60) == 1
+        assert database.get_data_version(engine, max_age=0) == 5
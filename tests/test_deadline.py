@@ -0,0 +1,120 @@
+"""
+Unit tests for per-request deadlines and the SQL stage's time budget
+"""
+
+import pytest
+import asyncio
+import math
+import time
+import pandas as pd
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nl_to_sql
+from deadline import Deadline
+from llm_gateway import LLMTimeout
+from nl_to_sql import SQL_TIMEOUT_STATUS, NLToSQLTranslator, process_analytical_query
+from sql_cache import TranslationCache
+
+SQL = "SELECT float_id, MAX(salinity) AS max_salinity FROM measurements GROUP BY float_id LIMIT 1000"
+
+class TestDeadline:
+    """Test cases for the budget, stage times and degradation reasons."""
+
+    def test_no_deadline(self):
+        """Test that None and 0 mean no deadline."""
+        for seconds in (None, 0):
+            deadline = Deadline(seconds)
+            assert deadline.remaining() == math.inf
+            assert deadline.timeout(5) is None
+            assert deadline.metadata('llm')['deadline_ms'] is None
+
+    def test_timeout_keeps_reserve(self):
+        """Test that a stage's timeout leaves the reserve for later stages, and is never negative."""
+        deadline = Deadline(10)
+        assert 6.5 < deadline.timeout(3) <= 7
+        assert deadline.timeout(20) == 0.0
+
+    def test_run_records_stage(self):
+        """Test that a stage finishing in time returns its result and records its time."""
+        deadline = Deadline(5)
+        assert asyncio.run(deadline.run('retrieval', asyncio.sleep(0.05, result="documents"))) == "documents"
+        assert deadline.stages['retrieval'] >= 50
+
+    def test_run_times_out(self):
+        """Test that a stage outlasting the budget is cancelled."""
+        deadline = Deadline(0.1)
+        started = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(deadline.run('generation', asyncio.sleep(1)))
+        assert time.monotonic() - started < 0.5
+        assert 'generation' in deadline.stages
+
+    def test_metadata(self):
+        """Test that degradation reasons are reported with the answer's source."""
+        deadline = Deadline(2)
+        deadline.degrade('generation_budget')
+        metadata = deadline.metadata('retrieval')
+        assert metadata['deadline_ms'] == 2000
+        assert metadata['answer_source'] == 'retrieval'
+        assert metadata['degraded'] and metadata['degradation_reasons'] == ['generation_budget']
+        assert not Deadline(2).metadata('llm')['degraded']
+
+class TestSQLBudget:
+    """Test cases for analytical queries running out of time."""
+
+    @pytest.fixture
+    def translator(self, tmp_path, monkeypatch):
+        """A translator with a translation cache, a fake LLM and a fake database."""
+        translator = NLToSQLTranslator()
+        translator.translation_cache = TranslationCache('ollama:test', path=str(tmp_path))
+        monkeypatch.setattr(translator, '_format_schema_for_prompt', lambda: "SCHEMA")
+        self.timeouts = []
+        self.llm_timeout = False
+        class FakeGateway:
+            def generate(gateway, prompt, timeout=None, **options):
+                self.timeouts.append(timeout)
+                if self.llm_timeout:
+                    raise LLMTimeout("No generation slot within 0s")
+                return f"```sql\n{SQL}\n```"
+        monkeypatch.setattr(nl_to_sql, 'get_gateway', lambda: FakeGateway())
+        monkeypatch.setattr(nl_to_sql, '_translator', translator)
+        self.status = "success"
+        monkeypatch.setattr(translator, 'execute_sql_query',
+                            lambda sql, params=None, timeout=None: (pd.DataFrame({'max_salinity': [37.1]})
+                                                                    if self.status == "success" else pd.DataFrame(),
+                                                                    self.status))
+        yield translator
+        translator.translation_cache.close()
+
+    def test_budget_reaches_the_llm(self, translator):
+        """Test that SQL generation is given the query's time budget."""
+        process_analytical_query("What is the maximum salinity recorded?", timeout=4)
+        assert 3 < self.timeouts[0] <= 4
+
+    def test_llm_timeout(self, translator):
+        """Test that running out of time while generating SQL is reported as a timeout."""
+        self.llm_timeout = True
+        result, error = process_analytical_query("What is the maximum salinity recorded?", timeout=1)
+        assert result is None and error == SQL_TIMEOUT_STATUS
+
+    def test_statement_timeout_keeps_cached_sql(self, translator):
+        """Test that cached SQL cancelled for time is not evicted as if it had failed."""
+        process_analytical_query("What is the maximum salinity recorded?")
+        self.status = SQL_TIMEOUT_STATUS
+        _, error = process_analytical_query("What is the maximum salinity recorded?", timeout=1)
+        assert SQL_TIMEOUT_STATUS in error
+        assert len(translator.translation_cache) == 1
+
+    def test_statement_timeout_error(self):
+        """Test that PostgreSQL cancelling a statement is reported as a timeout."""
+        class CancellingEngine:
+            def connect(engine):
+                raise Exception("canceling statement due to statement timeout")
+        translator = NLToSQLTranslator()
+        translator.engine = CancellingEngine()
+        _, status = translator.execute_sql_query("SELECT 1", timeout=1)
+        assert status == SQL_TIMEOUT_STATUS
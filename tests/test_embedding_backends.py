@@ -0,0 +1,138 @@
+"""
+Unit tests for the CPU embedding backends
+"""
+
+import pytest
+import json
+import numpy as np
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import onnxruntime
+from tokenizers import Tokenizer, models, pre_tokenizers
+import config
+import embedding_backends
+from embedding_backends import OnnxEncoder, check_parity, model_id, pool, resolve_backend
+
+WORDS = ['[PAD]', '[UNK]', 'warm', 'cold', 'water', 'deep', 'surface', 'oxygen']
+
+class FakeSession:
+    """Stands in for an onnxruntime session: token i embeds as i * [1, 2] and records the batches it ran."""
+
+    def __init__(self, path, options, providers):
+        self.path = path
+        self.options = options
+        self.providers = providers
+        self.feeds = []
+
+    def run(self, outputs, feeds):
+        self.feeds.append(feeds)
+        ids = feeds['input_ids'].astype(np.float32)
+        return [np.stack([ids, 2 * ids], axis=-1)]
+
+@pytest.fixture
+def export(tmp_path):
+    """An export directory with a word-level tokenizer and mean-pooled, normalized settings."""
+    tokenizer = Tokenizer(models.WordLevel({word: i for i, word in enumerate(WORDS)}, unk_token='[UNK]'))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.save(str(tmp_path / 'tokenizer.json'))
+    with open(tmp_path / 'encoder.json', 'w') as f:
+        json.dump({'model': 'test/model', 'inputs': ['input_ids', 'attention_mask'], 'pooling': 'mean',
+                   'normalize': True, 'max_length': 4, 'pad_token': '[PAD]', 'pad_id': 0}, f)
+    return str(tmp_path)
+
+@pytest.fixture
+def export_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'EMBED_EXPORT_PATH', str(tmp_path / 'exports'))
+    return tmp_path / 'exports'
+
+class TestPooling:
+    """Test cases for pooling token embeddings."""
+
+    def test_modes(self):
+        """Test that mean and max ignore padding and cls takes the first token."""
+        hidden = np.array([[[1.0, 0.0], [3.0, 4.0], [100.0, 100.0]]])
+        mask = np.array([[1, 1, 0]])
+        assert pool(hidden, mask, 'mean').tolist() == [[2.0, 2.0]]
+        assert pool(hidden, mask, 'max').tolist() == [[3.0, 4.0]]
+        assert pool(hidden, mask, 'cls').tolist() == [[1.0, 0.0]]
+
+class TestOnnxEncoder:
+    """Test cases for running an exported encoder."""
+
+    def test_encode(self, export, monkeypatch):
+        """Test that texts are batched by length, pooled, normalized and returned in their order."""
+        monkeypatch.setattr(onnxruntime, 'InferenceSession', FakeSession)
+        encoder = OnnxEncoder(export, quantized=True, threads=2)
+        texts = ["warm surface water", "cold", "deep cold oxygen water surface", "warm"]
+        embeddings = encoder(texts, batch_size=2)
+
+        assert encoder.session.path.endswith('model_int8.onnx')
+        assert encoder.session.providers == ['CPUExecutionProvider']
+        assert encoder.session.options.intra_op_num_threads == 2
+        assert [sorted(feeds) for feeds in encoder.session.feeds] == [['attention_mask', 'input_ids']] * 2
+        # The two one-word texts share a batch; the longest is truncated to max_length
+        assert [feeds['input_ids'].tolist() for feeds in encoder.session.feeds] == [[[3], [2]], [[2, 6, 4, 0], [5, 3, 7, 4]]]
+        assert embeddings.dtype == np.float32
+        assert embeddings == pytest.approx(np.tile([1, 2] / np.sqrt(5), (4, 1)), abs=1e-6)
+
+    def test_empty(self, export, monkeypatch):
+        """Test that no texts encode to an empty array without running the model."""
+        monkeypatch.setattr(onnxruntime, 'InferenceSession', FakeSession)
+        encoder = OnnxEncoder(export)
+        assert encoder([]).shape[0] == 0
+        assert encoder.session.feeds == []
+
+class TestParity:
+    """Test cases for comparing quantized backends with fp32."""
+
+    def test_check_parity(self):
+        """Test the cosine similarity reported between two encoders."""
+        reference = lambda texts: np.array([[1.0, 0.0], [0.0, 1.0]])
+        assert check_parity(reference, reference, ["a", "b"]) == {'min_cosine': 1.0, 'mean_cosine': 1.0, 'texts': 2}
+        rotated = lambda texts: np.array([[1.0, 0.0], [1.0, 1.0]])
+        assert check_parity(reference, rotated, ["a", "b"])['min_cosine'] == pytest.approx(np.sqrt(0.5), abs=1e-6)
+
+    def test_checked_once(self, export_path, monkeypatch):
+        """Test that the first request runs the check and stores its result for later ones."""
+        loaded = []
+        def fake_load(model_name, backend, threads=None):
+            loaded.append(backend)
+            scale = 1.0 if backend == 'torch' else 1.01
+            return lambda texts: np.array([[scale * len(text), 1.0] for text in texts])
+        monkeypatch.setattr(embedding_backends, 'load_encoder', fake_load)
+
+        assert resolve_backend('test/model', 'onnx-int8') == 'onnx-int8'
+        assert resolve_backend('test/model', 'onnx-int8') == 'onnx-int8'
+        assert loaded == ['torch', 'onnx-int8']
+        with open(export_path / 'test--model' / 'parity.json') as f:
+            assert json.load(f)['onnx-int8']['min_cosine'] > 0.99
+
+    def test_falls_back_below_threshold(self, export_path):
+        """Test that a backend with poor stored parity is replaced by fp32."""
+        os.makedirs(export_path / 'test--model')
+        with open(export_path / 'test--model' / 'parity.json', 'w') as f:
+            json.dump({'torch-int8': {'min_cosine': 0.95, 'mean_cosine': 0.98, 'texts': 20}}, f)
+        assert resolve_backend('test/model', 'torch-int8') == 'torch'
+        assert resolve_backend('test/model', 'torch') == 'torch'
+
+    def test_unverifiable(self, export_path, monkeypatch):
+        """Test that a backend is used unverified when the fp32 model cannot be loaded."""
+        def missing(model_name, backend, threads=None):
+            raise ImportError("No module named 'torch'")
+        monkeypatch.setattr(embedding_backends, 'load_encoder', missing)
+        assert resolve_backend('test/model', 'onnx') == 'onnx'
+        assert not os.path.exists(export_path / 'test--model' / 'parity.json')
+
+    def test_unknown_backend(self):
+        """Test that a misspelt backend is rejected."""
+        with pytest.raises(ValueError):
+            resolve_backend('test/model', 'int4')
+
+    def test_model_id(self):
+        """Test that only quantized backends get their own cache namespace."""
+        assert model_id('test/model', 'torch') == 'test/model'
+        assert model_id('test/model', 'onnx-int8') == 'test/model#onnx-int8'
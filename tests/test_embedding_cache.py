@@ -0,0 +1,144 @@
+"""
+Unit tests for the on-disk embedding cache
+"""
+
+import pytest
+import numpy as np
+import uuid
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+import embedding_cache
+from embedding_cache import CachedEmbeddingFunction, CachedEncoder, EmbeddingCache
+from embedding_pipeline import InlineEncoder
+
+DIM = 8
+
+def fake_encode(documents):
+    """Deterministic embeddings derived from document length."""
+    lengths = np.array([len(doc) for doc in documents], dtype=float)
+    return np.stack([lengths / 10 + i for i in range(DIM)], axis=1)
+
+class CountingEncode:
+    """Encode function that records every document it is asked to embed."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, documents):
+        self.calls.append(list(documents))
+        return fake_encode(documents)
+
+@pytest.fixture
+def cache(tmp_path):
+    """Create an empty cache with small shards and no practical disk limit."""
+    return EmbeddingCache('test-model', path=str(tmp_path), max_bytes=10**9, shard_rows=10)
+
+class TestEmbeddingCache:
+    """Test cases for lookups, storage and eviction."""
+
+    def test_miss_then_hit(self, cache):
+        """Test that a second encode of the same texts does not call the model."""
+        encode = CountingEncode()
+        documents = [f"document {i}" for i in range(25)]
+        first = cache.encode(documents, encode)
+        second = cache.encode(documents, encode)
+
+        assert len(encode.calls) == 1
+        assert first.shape == (25, DIM)
+        assert second == pytest.approx(fake_encode(documents), rel=1e-3)
+        assert (cache.hits, cache.misses) == (25, 25)
+        assert cache.hit_rate == pytest.approx(0.5)
+
+    def test_partial_hits(self, cache):
+        """Test that only uncached documents reach the model, in order."""
+        cache.encode(["a", "bb"], fake_encode)
+        encode = CountingEncode()
+        result = cache.encode(["bb", "ccc", "a", "dddd"], encode)
+        assert encode.calls == [["ccc", "dddd"]]
+        assert result == pytest.approx(fake_encode(["bb", "ccc", "a", "dddd"]), rel=1e-3)
+
+    def test_persistent_and_shared(self, cache, tmp_path):
+        """Test that another cache instance on the same path sees stored vectors."""
+        cache.encode(["shared text"], fake_encode)
+        other = EmbeddingCache('test-model', path=str(tmp_path), max_bytes=10**9, shard_rows=10)
+        assert other.get(["shared text"])[0] == pytest.approx(fake_encode(["shared text"])[0], rel=1e-3)
+
+    def test_keyed_by_model(self, cache, tmp_path):
+        """Test that vectors are not shared between models."""
+        cache.encode(["text"], fake_encode)
+        other_model = EmbeddingCache('other-model', path=str(tmp_path), max_bytes=10**9, shard_rows=10)
+        assert other_model.get(["text"]) == [None]
+
+    def test_stored_as_float16(self, cache, tmp_path):
+        """Test that shards are float16 files of shard_rows x dim."""
+        cache.encode([f"doc {i}" for i in range(15)], fake_encode)
+        shards = sorted(name for name in os.listdir(tmp_path) if name.endswith('.f16'))
+        assert len(shards) == 2
+        assert os.path.getsize(tmp_path / shards[0]) == 10 * DIM * 2
+        stats = cache.stats()
+        assert (stats['entries'], stats['shards']) == (15, 2)
+
+    def test_lru_eviction(self, tmp_path, monkeypatch):
+        """Test that the least recently used full shards are evicted past the budget."""
+        monkeypatch.setattr(embedding_cache, 'TOUCH_INTERVAL', 0)
+        cache = EmbeddingCache('test-model', path=str(tmp_path), max_bytes=3 * 10 * DIM * 2, shard_rows=10)
+        old = [f"old {i}" for i in range(10)]
+        recent = [f"recent {i}" for i in range(10)]
+        cache.encode(old, fake_encode)
+        cache.encode(recent, fake_encode)
+        cache.get(old)  # old is now more recently used than recent
+        cache.encode([f"new {i}" for i in range(15)], fake_encode)
+
+        assert cache.evicted_shards == 1
+        assert all(vector is not None for vector in cache.get(old))
+        assert all(vector is None for vector in cache.get(recent))
+        assert cache.stats()['disk_mb'] <= cache.stats()['max_mb']
+
+    def test_hits_touch_shards_rarely(self, cache):
+        """Test that a hit only rewrites its shard's last_used once TOUCH_INTERVAL has passed."""
+        cache.encode(["text"], fake_encode)
+        cache._db.execute("UPDATE shards SET last_used = 1")
+        cache.get(["text"])
+        touched = cache._db.execute("SELECT last_used FROM shards").fetchone()[0]
+        assert touched > 1
+        cache.get(["text"])
+        assert cache._db.execute("SELECT last_used FROM shards").fetchone()[0] == touched
+
+class TestCachedEncoders:
+    """Test cases for the pipeline and Chroma wrappers."""
+
+    def test_cached_encoder(self, cache):
+        """Test that the pipeline encoder only submits misses to the wrapped encoder."""
+        encode = CountingEncode()
+        encoder = CachedEncoder(InlineEncoder(encode), cache)
+        encoder.submit(["x", "yy"]).result()
+        result = encoder.submit(["yy", "x", "zzz"]).result()
+        assert encode.calls == [["x", "yy"], ["zzz"]]
+        assert result.dtype == np.float32
+        assert result == pytest.approx(fake_encode(["yy", "x", "zzz"]), rel=1e-3)
+
+    def test_cached_encoder_error(self, cache):
+        """Test that an encoding failure is raised from the future and nothing is cached."""
+        def broken(documents):
+            raise ValueError("model not loaded")
+
+        future = CachedEncoder(InlineEncoder(broken), cache).submit(["x"])
+        with pytest.raises(ValueError, match="model not loaded"):
+            future.result()
+        assert cache.get(["x"]) == [None]
+
+    def test_chroma_embedding_function(self, cache):
+        """Test that queries through a collection reuse cached vectors."""
+        encode = CountingEncode()
+        client = chromadb.EphemeralClient()
+        collection = client.get_or_create_collection(name=f"test_{uuid.uuid4().hex[:12]}",
+                                                      embedding_function=CachedEmbeddingFunction(encode, cache))
+        collection.add(ids=['1', '2'], documents=["warm water", "cold deep water"])
+        collection.query(query_texts=["warm water"], n_results=1)
+        collection.query(query_texts=["warm water"], n_results=1)
+        assert encode.calls == [["warm water", "cold deep water"]]
@@ -0,0 +1,183 @@
+"""
+Unit tests for the streaming embedding pipeline
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+import uuid
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from database import build_engine
+from embedding_pipeline import (InlineEncoder, attach_content_hashes, content_hash, iter_query_chunks,
+                                run_embedding_pipeline, sync_collection)
+from lexical_index import LexicalIndex
+
+def fake_encode(documents):
+    """Deterministic 8-dimensional embeddings derived from document length."""
+    lengths = np.array([len(doc) for doc in documents], dtype=float)
+    return np.stack([lengths + i for i in range(8)], axis=1)
+
+def build(chunk):
+    """Build documents for a chunk of id/value rows."""
+    ids = chunk['id'].astype(str).tolist()
+    documents = ("value " + chunk['value'].astype(str)).tolist()
+    metadatas = pd.DataFrame({'row': chunk['id'].astype('int64')}).to_dict('records')
+    return ids, documents, metadatas
+
+@pytest.fixture
+def collection():
+    """Create an empty in-memory collection without an embedding function."""
+    client = chromadb.EphemeralClient()
+    return client.get_or_create_collection(name=f"test_{uuid.uuid4().hex[:12]}", embedding_function=None)
+
+@pytest.fixture
+def chunks():
+    """Create 2,500 rows split into uneven chunks."""
+    df = pd.DataFrame({'id': np.arange(2500), 'value': np.arange(2500) * 10})
+    return [df.iloc[0:1000], df.iloc[1000:1100], df.iloc[1100:2500]]
+
+class TestRunEmbeddingPipeline:
+    """Test cases for the reader/builder/encoder/writer pipeline."""
+
+    def test_all_rows_written(self, collection, chunks):
+        """Test that every row is embedded with its document and metadata."""
+        stats = run_embedding_pipeline(iter(chunks), build, InlineEncoder(fake_encode), collection,
+                                       batch_size=300, queue_depth=2, verbose=False)
+        assert stats.documents == 2500
+        assert stats.batches == 4 + 1 + 5
+        assert collection.count() == 2500
+
+        stored = collection.get(ids=['1234'], include=['documents', 'metadatas', 'embeddings'])
+        assert stored['documents'] == ['value 12340']
+        assert stored['metadatas'] == [{'row': 1234}]
+        assert stored['embeddings'][0] == pytest.approx(fake_encode(['value 12340'])[0].tolist())
+
+    def test_stats(self, collection, chunks):
+        """Test throughput accounting."""
+        stats = run_embedding_pipeline(iter(chunks), build, InlineEncoder(fake_encode), collection, verbose=False)
+        assert stats.seconds > 0
+        assert stats.docs_per_second == pytest.approx(2500 / stats.seconds)
+        assert "2,500 documents" in str(stats)
+
+    def test_empty_source(self, collection):
+        """Test that an empty source writes nothing."""
+        stats = run_embedding_pipeline(iter([]), build, InlineEncoder(fake_encode), collection, verbose=False)
+        assert stats.documents == 0
+        assert collection.count() == 0
+
+    def test_reader_error_propagates(self, collection, chunks):
+        """Test that a failing source raises in the caller."""
+        def failing():
+            yield chunks[0]
+            raise RuntimeError("cursor lost")
+
+        with pytest.raises(RuntimeError, match="cursor lost"):
+            run_embedding_pipeline(failing(), build, InlineEncoder(fake_encode), collection,
+                                   queue_depth=1, verbose=False)
+
+    def test_encoder_error_propagates(self, collection, chunks):
+        """Test that an encoding failure stops the pipeline and raises."""
+        def broken(documents):
+            raise ValueError("model not loaded")
+
+        with pytest.raises(ValueError, match="model not loaded"):
+            run_embedding_pipeline(iter(chunks * 20), build, InlineEncoder(broken), collection,
+                                   batch_size=100, queue_depth=1, verbose=False)
+        assert collection.count() == 0
+
+def build_hashed(chunk):
+    """Build documents with content hashes, grouped under a profile of ten rows."""
+    ids = chunk['id'].astype(str).tolist()
+    documents = ("value " + chunk['value'].astype(str)).tolist()
+    metadatas = pd.DataFrame({'profile_id': (chunk['id'] // 10).astype('int64')}).to_dict('records')
+    attach_content_hashes(documents, metadatas)
+    return ids, documents, metadatas
+
+class TestSyncCollection:
+    """Test cases for incremental collection syncs."""
+
+    def test_initial_sync_adds_everything(self, collection, chunks):
+        """Test that an empty collection receives every document."""
+        stats = sync_collection(iter(chunks), build_hashed, InlineEncoder(fake_encode), collection, verbose=False)
+        assert (stats.added, stats.updated, stats.deleted, stats.unchanged) == (2500, 0, 0, 0)
+        assert stats.embedding.documents == 2500
+        assert collection.count() == 2500
+
+    def test_changes_only(self, collection, chunks):
+        """Test that only new and changed documents are encoded and stale ones deleted."""
+        sync_collection(iter(chunks), build_hashed, InlineEncoder(fake_encode), collection, verbose=False)
+
+        df = pd.concat(chunks)
+        df = df[df['id'] >= 10].copy()                          # profile 0 removed
+        df.loc[df['id'] == 500, 'value'] = -1                   # one changed
+        df = pd.concat([df, pd.DataFrame({'id': [9000, 9001], 'value': [1, 2]})])  # two new
+        encoded = []
+        def tracking_encode(documents):
+            encoded.extend(documents)
+            return fake_encode(documents)
+
+        stats = sync_collection(iter([df]), build_hashed, InlineEncoder(tracking_encode), collection, verbose=False)
+        assert (stats.added, stats.updated, stats.deleted, stats.unchanged) == (2, 1, 10, 2489)
+        assert sorted(encoded) == ['value -1', 'value 1', 'value 2']
+        assert collection.count() == 2492
+        assert collection.get(ids=['500'])['documents'] == ['value -1']
+        assert collection.get(ids=['5'])['ids'] == []
+
+    def test_unchanged_rerun(self, collection, chunks):
+        """Test that a second sync of the same rows writes nothing."""
+        sync_collection(iter(chunks), build_hashed, InlineEncoder(fake_encode), collection, verbose=False)
+        stats = sync_collection(iter(chunks), build_hashed, InlineEncoder(fake_encode), collection, verbose=False)
+        assert (stats.added, stats.updated, stats.deleted, stats.unchanged) == (0, 0, 0, 2500)
+
+    def test_lexical_index_follows(self, collection, chunks):
+        """Test that a lexical index receives the same adds, updates and deletes as the collection."""
+        lexical = LexicalIndex()
+        sync_collection(iter(chunks), build_hashed, InlineEncoder(fake_encode), collection, verbose=False,
+                        lexical=lexical)
+        assert len(lexical) == 2500
+
+        df = pd.concat(chunks)
+        df = df[df['id'] >= 10].copy()
+        df.loc[df['id'] == 500, 'value'] = -1
+        sync_collection(iter([df]), build_hashed, InlineEncoder(fake_encode), collection, verbose=False,
+                        lexical=lexical)
+        assert len(lexical) == collection.count() == 2490
+        assert lexical.get(['500'])[0] == ['value -1']
+        assert lexical.search("5000") == []
+        assert lexical.search("4990")[0][0] == '499'
+
+    def test_where_limits_deletes(self, collection, chunks):
+        """Test that a scoped sync only deletes within its scope."""
+        sync_collection(iter(chunks), build_hashed, InlineEncoder(fake_encode), collection, verbose=False)
+        df = pd.concat(chunks)
+        scope = df[df['id'].between(20, 25)]                    # profile 2, rows 26-29 gone
+        stats = sync_collection(iter([scope]), build_hashed, InlineEncoder(fake_encode), collection,
+                                where={'profile_id': {'$in': [2]}}, verbose=False)
+        assert (stats.added, stats.updated, stats.deleted, stats.unchanged) == (0, 0, 4, 6)
+        assert collection.count() == 2496
+
+    def test_content_hash(self):
+        """Test that the hash covers the document and metadata but not a stored hash."""
+        digest = content_hash("doc", {'a': 1, 'b': 'x'})
+        assert len(digest) == 16
+        assert content_hash("doc", {'b': 'x', 'a': 1}) == digest
+        assert content_hash("doc", {'b': 'x', 'a': 1, 'content_hash': 'old'}) == digest
+        assert content_hash("doc", {'a': 2, 'b': 'x'}) != digest
+        assert content_hash("doc2", {'a': 1, 'b': 'x'}) != digest
+
+class TestIterQueryChunks:
+    """Test cases for streaming query results."""
+
+    def test_chunks(self, tmp_path):
+        """Test that a query is returned in chunks of the requested size."""
+        engine = build_engine(f"sqlite:///{tmp_path / 'rows.db'}")
+        pd.DataFrame({'id': range(25), 'value': range(25)}).to_sql('rows', engine, index=False)
+        chunks = list(iter_query_chunks("SELECT id, value FROM rows ORDER BY id", engine, chunk_rows=10))
+        assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+        assert pd.concat(chunks)['id'].tolist() == list(range(25))
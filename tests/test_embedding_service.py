@@ -0,0 +1,144 @@
+"""
+Unit tests for the micro-batching embedding service
+"""
+
+import pytest
+import asyncio
+import threading
+import time
+import os
+import sys
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_service import EmbeddingService, ServiceEmbeddingFunction
+
+class RecordingEncoder:
+    """Embeds each text as [its length, its number] and records the batches it was called with."""
+
+    def __init__(self, fail=False, delay=0.0):
+        self.calls = []
+        self.threads = set()
+        self.fail = fail
+        self.delay = delay
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        if self.fail:
+            raise ValueError("model failed")
+        return [[float(len(text)), float(text.split()[-1])] for text in texts]
+
+@pytest.fixture
+def encoder():
+    return RecordingEncoder()
+
+def run_with_service(service, body):
+    """Run body(service) on a fresh event loop with the service started"""
+    async def run():
+        service.start()
+        try:
+            return await body(service)
+        finally:
+            await service.stop()
+    try:
+        return asyncio.run(run())
+    finally:
+        service.close()
+
+class TestEmbeddingService:
+    """Test cases for coalescing concurrent embedding requests."""
+
+    def test_concurrent_requests_share_a_batch(self, encoder):
+        """Test that requests queued together are encoded in one call and split back per caller."""
+        service = EmbeddingService(encoder, max_batch=32, max_wait_ms=20)
+
+        async def body(service):
+            return await asyncio.gather(*(service.embed([f"question {i}"]) for i in range(5)))
+
+        results = run_with_service(service, body)
+        assert encoder.calls == [[f"question {i}" for i in range(5)]]
+        assert [result.tolist() for result in results] == [[[10.0, float(i)]] for i in range(5)]
+        assert encoder.threads == {'embed-service_0'}
+
+    def test_max_batch(self, encoder):
+        """Test that no encode call exceeds max_batch texts."""
+        service = EmbeddingService(encoder, max_batch=4, max_wait_ms=20)
+
+        async def body(service):
+            return await asyncio.gather(*(service.embed([f"q {i}", f"q {i + 10}"]) for i in range(5)))
+
+        results = run_with_service(service, body)
+        assert [len(call) for call in encoder.calls] == [4, 4, 2]
+        assert results[4].tolist() == [[3.0, 4.0], [4.0, 14.0]]
+
+    def test_blocking_callers(self):
+        """Test that threads calling encode while a batch is being encoded are batched together."""
+        encoder = RecordingEncoder(delay=0.2)
+        service = EmbeddingService(encoder, max_batch=32, max_wait_ms=50)
+
+        async def body(service):
+            loop = asyncio.get_running_loop()
+            return await asyncio.gather(*(loop.run_in_executor(None, service.encode, [f"thread {i}"])
+                                          for i in range(4)))
+
+        results = run_with_service(service, body)
+        assert len(encoder.calls) <= 2
+        assert sorted(result[0, 1] for result in results) == [0.0, 1.0, 2.0, 3.0]
+        assert service.stats()['requests'] == 4
+
+    def test_lone_request_does_not_wait(self, encoder):
+        """Test that a single request under light traffic is encoded without waiting out max_wait."""
+        service = EmbeddingService(encoder, max_wait_ms=1000)
+
+        async def body(service):
+            started = time.perf_counter()
+            await service.embed(["lone 1"])
+            return time.perf_counter() - started
+
+        assert run_with_service(service, body) < 0.5
+
+    def test_not_started(self, encoder):
+        """Test that encode works before the service is started, without batching."""
+        service = EmbeddingService(encoder)
+        assert service.encode(["alone 7"]).tolist() == [[7.0, 7.0]]
+        with pytest.raises(RuntimeError):
+            asyncio.run(service.embed(["alone 7"]))
+        service.close()
+
+    def test_failure_reaches_every_caller(self):
+        """Test that a failed encode is raised to each request in the batch and the service carries on."""
+        encoder = RecordingEncoder(fail=True)
+        service = EmbeddingService(encoder, max_wait_ms=20)
+
+        async def body(service):
+            results = await asyncio.gather(service.embed(["a 1"]), service.embed(["b 2"]), return_exceptions=True)
+            encoder.fail = False
+            return results, await service.embed(["c 3"])
+
+        (first, second), after = run_with_service(service, body)
+        assert isinstance(first, ValueError) and isinstance(second, ValueError)
+        assert after.tolist() == [[3.0, 3.0]]
+
+    def test_stats(self, encoder):
+        """Test the batching and latency counters."""
+        service = EmbeddingService(encoder, max_batch=8, max_wait_ms=20)
+
+        async def body(service):
+            await asyncio.gather(*(service.embed([f"q {i}"]) for i in range(6)))
+            return service.stats()
+
+        stats = run_with_service(service, body)
+        assert stats['running'] is True
+        assert (stats['requests'], stats['texts'], stats['batches'], stats['largest_batch']) == (6, 6, 1, 6)
+        assert stats['mean_batch'] == 6.0
+        assert stats['request_ms_p95'] >= stats['encode_ms_p50'] > 0
+        assert service.stats()['running'] is False
+
+    def test_embedding_function(self, encoder):
+        """Test the Chroma embedding function adapter."""
+        service = EmbeddingService(encoder)
+        assert ServiceEmbeddingFunction(service)(["x 1", "yy 2"]) == [[3.0, 1.0], [4.0, 2.0]]
+        service.close()
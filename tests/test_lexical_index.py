@@ -0,0 +1,122 @@
+"""
+Unit tests for the BM25 lexical index
+"""
+
+import pytest
+import os
+import sys
+import time
+import uuid
+from unittest.mock import patch
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+import config
+from lexical_index import LexicalIndex, get_lexical_index, index_path, load_lexical_index, tokenize
+
+def profile_document(n, cycle, date, words=""):
+    return (f"ARGO float ARGO_{n:04d} (WMO {5900000 + n}) completed profile cycle {cycle} on {date} "
+            f"at location -12.300°, 80.500°.{words}")
+
+@pytest.fixture
+def index():
+    """Create an index of six profiles from three floats."""
+    index = LexicalIndex()
+    ids = [f"profile_{i}" for i in range(1, 7)]
+    documents = [profile_document(1 + i // 2, i % 2 + 1, f"2023-03-0{i + 1}", " Warm water." if i == 5 else "")
+                 for i in range(6)]
+    index.add(ids, documents, [{'profile_id': i} for i in range(1, 7)])
+    return index
+
+class TestTokenize:
+    """Test cases for tokenization."""
+
+    def test_identifiers_are_single_tokens(self):
+        """Test that float ids, WMO ids, cycles and dates survive as one token each."""
+        assert tokenize("Float argo-12, cycle 4 on 2023-03-05 (WMO 5900012)") == [
+            'float', 'argo_0012', 'cycle_4', '2023-03-05', 'wmo', '5900012']
+
+    def test_decimals_and_stop_words(self):
+        """Test that decimals stay whole and stop words are dropped."""
+        assert tokenize("The temperature was 28.50°C at the surface.") == ['temperature', '28.50', 'c', 'surface']
+
+class TestLexicalIndex:
+    """Test cases for indexing and BM25 search."""
+
+    def test_identifier_lookup(self, index):
+        """Test that a float id finds exactly that float's profiles."""
+        hits = index.search("profiles of float ARGO_0002")
+        assert sorted(doc_id for doc_id, _ in hits) == ['profile_3', 'profile_4']
+
+    def test_rarer_terms_rank_higher(self, index):
+        """Test that matching more specific terms scores higher."""
+        hits = index.search("ARGO_0002 cycle 2")
+        assert hits[0][0] == 'profile_4'
+        assert hits[0][1] > hits[1][1]
+
+    def test_wmo_and_date(self, index):
+        """Test WMO number and date lookups."""
+        assert index.search("WMO 5900003")[0][0] in ('profile_5', 'profile_6')
+        assert [doc_id for doc_id, _ in index.search("2023-03-04")] == ['profile_4']
+
+    def test_no_match(self, index):
+        """Test that unknown terms match nothing."""
+        assert index.search("chlorophyll") == []
+
+    def test_replace_and_remove(self, index):
+        """Test that re-adding replaces a document and removing drops its postings."""
+        index.add(['profile_1'], [profile_document(9, 1, "2024-01-01")], [{'profile_id': 1}])
+        index.remove(['profile_2', 'profile_unknown'])
+        assert len(index) == 5
+        assert [doc_id for doc_id, _ in index.search("ARGO_0001")] == []
+        assert [doc_id for doc_id, _ in index.search("ARGO_0009")] == ['profile_1']
+        assert index.get(['profile_1'])[1] == [{'profile_id': 1}]
+
+    def test_save_compacts(self, index, tmp_path):
+        """Test that a saved index drops removed slots and searches the same after loading."""
+        index.remove(['profile_1', 'profile_2'])
+        path = str(tmp_path / 'profiles.pkl')
+        index.save(path)
+        loaded = LexicalIndex.load(path)
+        assert len(loaded.ids) == len(loaded) == 4
+        assert loaded.search("warm water") == index.search("warm water")
+        assert loaded.search("warm")[0][0] == 'profile_6'
+
+class TestPersistence:
+    """Test cases for building, saving and reloading the index of a collection."""
+
+    @pytest.fixture
+    def collection(self):
+        client = chromadb.EphemeralClient()
+        collection = client.get_or_create_collection(name=f"test_{uuid.uuid4().hex[:12]}", embedding_function=None)
+        collection.add(ids=['a', 'b', 'c'], embeddings=[[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]],
+                       documents=["float ARGO_0001", "float ARGO_0002", "float ARGO_0003"],
+                       metadatas=[{'n': 1}, {'n': 2}, {'n': 3}])
+        return collection
+
+    def test_from_collection_pages(self, collection):
+        """Test that every document is read, across pages."""
+        index = LexicalIndex.from_collection(collection, page_size=2)
+        assert len(index) == 3
+        assert index.get(['c']) == (["float ARGO_0003"], [{'n': 3}])
+
+    def test_rebuilt_when_out_of_step(self, collection, tmp_path):
+        """Test that a missing or stale saved index is rebuilt from the collection."""
+        with patch.object(config, 'LEXICAL_INDEX_PATH', str(tmp_path)):
+            assert load_lexical_index(collection.name) is None
+            assert len(get_lexical_index(collection)) == 3
+            collection.delete(ids=['c'])
+            assert len(get_lexical_index(collection)) == 2
+
+    def test_reloaded_after_save(self, collection, tmp_path):
+        """Test that a process picks up an index a sync saved after it was first loaded."""
+        with patch.object(config, 'LEXICAL_INDEX_PATH', str(tmp_path)):
+            first = get_lexical_index(collection)
+            assert load_lexical_index(collection.name) is first
+            updated = LexicalIndex()
+            updated.add(['z'], ["float ARGO_0026"])
+            time.sleep(0.01)
+            updated.save(index_path(collection.name))
+            assert load_lexical_index(collection.name).search("ARGO_0026")[0][0] == 'z'
@@ -0,0 +1,242 @@
+"""
+Unit tests for the LLM gateway, run against a local fake Ollama server
+"""
+
+import pytest
+import asyncio
+import json
+import threading
+import time
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_gateway import LLMGateway, LLMOverloaded, LLMTimeout
+
+class FakeOllama(ThreadingHTTPServer):
+    """Answers /api/chat with "answer: <prompt>" after a delay, recording requests, connections and concurrency."""
+
+    daemon_threads = True
+
+    def __init__(self, delay=0.0):
+        super().__init__(('127.0.0.1', 0), FakeOllamaHandler)
+        self.delay = delay
+        self.requests = []
+        self.connections = set()
+        self.active = 0
+        self.most_active = 0
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass  # Clients that gave up on a slow answer reset their connection
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.requests.append(body)
+            server.connections.add(self.client_address)
+            server.active += 1
+            server.most_active = max(server.most_active, server.active)
+        try:
+            time.sleep(server.delay)
+            answer = "answer: " + body['messages'][-1]['content']
+            if body.get('stream', True):
+                pieces = [answer[:8], answer[8:]]
+                payload = b''.join(json.dumps({'message': {'role': 'assistant', 'content': piece}, 'done': False}).encode() + b"\n"
+                                   for piece in pieces)
+                payload += json.dumps({'message': {'role': 'assistant', 'content': ''}, 'done': True}).encode() + b"\n"
+                content_type = 'application/x-ndjson'
+            else:
+                payload = json.dumps({'message': {'role': 'assistant', 'content': answer}, 'done': True}).encode()
+                content_type = 'application/json'
+        finally:
+            with server.lock:
+                server.active -= 1
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+@pytest.fixture
+def fake_ollama():
+    servers = []
+    def start(delay=0.0):
+        server = FakeOllama(delay)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def make_gateway(server, **kwargs):
+    settings = {'provider': 'ollama', 'model': 'fake', 'max_concurrent': 2, 'max_queue': 8, 'timeout': 5}
+    settings.update(kwargs)
+    return LLMGateway(host=server.url, **settings)
+
+class TestGenerate:
+    """Test cases for whole answers through the gateway."""
+
+    def test_answer_and_options(self, fake_ollama):
+        """Test that the prompt and options reach the provider and its answer comes back."""
+        server = fake_ollama()
+        gateway = make_gateway(server)
+        assert gateway.generate("warm water?", temperature=0.1, max_tokens=50) == "answer: warm water?"
+        assert server.requests[0]['model'] == 'fake'
+        assert server.requests[0]['options'] == {'temperature': 0.1, 'num_predict': 50}
+        gateway.close()
+
+    def test_client_is_reused(self, fake_ollama):
+        """Test that successive requests share one client and its connection."""
+        server = fake_ollama()
+        gateway = make_gateway(server, max_concurrent=1)
+        client = gateway.client
+        for i in range(3):
+            gateway.generate(f"question {i}")
+        assert gateway.client is client
+        assert len(server.connections) == 1
+        gateway.close()
+
+    def test_concurrency_is_bounded(self, fake_ollama):
+        """Test that no more than max_concurrent generations reach the provider at once."""
+        server = fake_ollama(delay=0.2)
+        gateway = make_gateway(server, max_concurrent=2)
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            answers = list(pool.map(gateway.generate, [f"question {i}" for i in range(6)]))
+        assert answers == [f"answer: question {i}" for i in range(6)]
+        assert server.most_active == 2
+        stats = gateway.stats()
+        assert stats['generations'] == 6 and stats['queued'] == 0 and stats['running'] == 0
+        assert stats['queue_ms_p95'] > 100 and stats['generation_ms_p50'] >= 200
+        gateway.close()
+
+    def test_identical_prompts_share_a_generation(self, fake_ollama):
+        """Test that identical prompts in flight are answered by one generation."""
+        server = fake_ollama(delay=0.3)
+        gateway = make_gateway(server)
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            answers = list(pool.map(lambda _: gateway.generate("same question"), range(5)))
+        assert answers == ["answer: same question"] * 5
+        assert len(server.requests) == 1
+        assert gateway.stats()['coalesced'] == 4
+        # Only in-flight prompts are shared: asking again generates again
+        gateway.generate("same question")
+        assert len(server.requests) == 2
+        gateway.close()
+
+    def test_different_options_are_not_shared(self, fake_ollama):
+        """Test that the same prompt with other options is generated separately."""
+        server = fake_ollama(delay=0.2)
+        gateway = make_gateway(server)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(lambda t: gateway.generate("question", temperature=t), [0.1, 0.9]))
+        assert len(server.requests) == 2
+        gateway.close()
+
+class TestDeadlines:
+    """Test cases for per-request deadlines and the wait queue."""
+
+    def test_timeout(self, fake_ollama):
+        """Test that a caller gets LLMTimeout when its deadline passes during generation."""
+        server = fake_ollama(delay=1.0)
+        gateway = make_gateway(server)
+        started = time.monotonic()
+        with pytest.raises(LLMTimeout):
+            gateway.generate("slow question", timeout=0.2)
+        assert time.monotonic() - started < 0.5
+        assert gateway.stats()['timeouts'] == 1
+        gateway.close()
+
+    def test_spent_budget(self, fake_ollama):
+        """Test that a zero timeout means the caller's budget is spent, not the gateway default."""
+        server = fake_ollama(delay=0.3)
+        gateway = make_gateway(server)
+        with pytest.raises(LLMTimeout):
+            gateway.generate("no time left", timeout=0)
+        gateway.close()
+
+    def test_abandoned_request_leaves_the_queue(self, fake_ollama):
+        """Test that a queued generation whose caller gave up is never sent."""
+        server = fake_ollama(delay=0.5)
+        gateway = make_gateway(server, max_concurrent=1)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            first = pool.submit(gateway.generate, "first")
+            time.sleep(0.1)
+            with pytest.raises(LLMTimeout):
+                gateway.generate("second", timeout=0.1)
+            assert gateway.stats()['queued'] == 0
+            assert first.result() == "answer: first"
+        assert [request['messages'][0]['content'] for request in server.requests] == ["first"]
+        gateway.close()
+
+    def test_full_queue_is_refused(self, fake_ollama):
+        """Test that requests beyond max_queue are refused at once."""
+        server = fake_ollama(delay=0.3)
+        gateway = make_gateway(server, max_concurrent=1, max_queue=1)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            running = pool.submit(gateway.generate, "running")
+            time.sleep(0.1)
+            queued = pool.submit(gateway.generate, "queued")
+            time.sleep(0.05)
+            assert gateway.stats()['queued'] == 1
+            with pytest.raises(LLMOverloaded):
+                gateway.generate("refused")
+            assert running.result() and queued.result()
+        assert gateway.stats()['rejected'] == 1
+        gateway.close()
+
+class TestAsyncAndStreaming:
+    """Test cases for the event loop and streaming entry points."""
+
+    def test_agenerate(self, fake_ollama):
+        """Test that concurrent async callers of one prompt share a generation."""
+        server = fake_ollama(delay=0.2)
+        gateway = make_gateway(server)
+        async def ask():
+            return await asyncio.gather(*(gateway.agenerate("async question") for _ in range(3)))
+        assert asyncio.run(ask()) == ["answer: async question"] * 3
+        assert len(server.requests) == 1
+        gateway.close()
+
+    def test_agenerate_timeout(self, fake_ollama):
+        """Test that an async caller's deadline raises LLMTimeout."""
+        server = fake_ollama(delay=1.0)
+        gateway = make_gateway(server)
+        with pytest.raises(LLMTimeout):
+            asyncio.run(gateway.agenerate("slow question", timeout=0.2))
+        gateway.close()
+
+    def test_stream(self, fake_ollama):
+        """Test that a streamed answer arrives in pieces and counts as a generation."""
+        server = fake_ollama()
+        gateway = make_gateway(server)
+        pieces = list(gateway.stream("streamed question"))
+        assert len(pieces) > 1 and "".join(pieces) == "answer: streamed question"
+        assert server.requests[0]['stream'] is True
+        assert gateway.stats()['generations'] == 1
+        gateway.close()
+
+    def test_stream_timeout(self, fake_ollama):
+        """Test that a stream whose deadline passes raises LLMTimeout."""
+        server = fake_ollama(delay=1.0)
+        gateway = make_gateway(server)
+        with pytest.raises(LLMTimeout):
+            list(gateway.stream("slow question", timeout=0.2))
+        gateway.close()
@@ -7,6 +7,8 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
+from unittest.mock import patch
+import config
 from components.map_visualization import InteractiveMap
 
 class TestInteractiveMap:
@@ -221,6 +223,15 @@ class TestInteractiveMap:
         assert 'clicked_location' in interactions
         assert 'zoom_level' in interactions
         assert 'center' in interactions
+    
+    def test_cube_cells_to_points_uses_configured_grid(self):
+        """Test that cube cell centres follow CUBE_CELL_DEGREES"""
+        cells = pd.DataFrame({'lat_cell': [10.0, 10.0], 'lon_cell': [70.0, 70.0], 'count': [3, 4]})
+        
+        with patch.object(config, 'CUBE_CELL_DEGREES', 5.0):
+            points = self.map_viz.cube_cells_to_points(cells)
+        
+        assert points.to_dict('records') == [{'lat': 12.5, 'lon': 72.5, 'count': 7}]
 
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
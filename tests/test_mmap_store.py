@@ -0,0 +1,234 @@
+"""
+Unit tests for the memory-mapped vector store
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from embedding_pipeline import InlineEncoder, attach_content_hashes, sync_collection
+from mmap_store import MmapClient, quantize
+from query_constraints import QueryConstraints, matches_where
+from retrieval import constrained_query
+
+def exact_neighbours(vectors, query, n, space='l2'):
+    """Ids of the n nearest float32 rows by Chroma's distance."""
+    if space == 'cosine':
+        distances = 1 - vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    elif space == 'ip':
+        distances = 1 - vectors @ query
+    else:
+        distances = ((vectors - query) ** 2).sum(axis=1)
+    return [str(i) for i in np.argsort(distances, kind='stable')[:n]]
+
+@pytest.fixture
+def client(tmp_path):
+    return MmapClient(str(tmp_path / "store"))
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(7).normal(size=(3000, 16)).astype(np.float32)
+
+@pytest.fixture
+def metadatas():
+    """Mixed metadata: some keys missing, strings of varying width, ints, floats and bools."""
+    found = []
+    for i in range(3000):
+        metadata = {'row': i, 'region': ['arabian sea', 'bay', 'equator'][i % 3], 'deep': i % 4 == 0}
+        if i % 5:
+            metadata['temperature'] = 10 + (i % 17) * 0.5
+        found.append(metadata)
+    return found
+
+@pytest.fixture
+def collection(client, vectors, metadatas):
+    collection = client.get_or_create_collection("measurements")
+    collection.add(ids=[str(i) for i in range(3000)], embeddings=vectors, metadatas=metadatas,
+                   documents=[f"measurement {i}" for i in range(3000)])
+    return collection
+
+class TestQuery:
+    """Test cases for exact search over quantized rows."""
+
+    @pytest.mark.parametrize('dtype', ['int8', 'float16'])
+    @pytest.mark.parametrize('space', ['l2', 'cosine', 'ip'])
+    def test_matches_exact_search(self, client, vectors, monkeypatch, dtype, space):
+        """Test that nearly all of the true top 10 are found for each space and storage type."""
+        monkeypatch.setattr(config, 'MMAP_STORE_DTYPE', dtype)
+        monkeypatch.setattr(config, 'MMAP_STORE_BLOCK_ROWS', 700)
+        collection = client.create_collection(f"test_{dtype}_{space}", metadata={'hnsw:space': space})
+        collection.add(ids=[str(i) for i in range(3000)], embeddings=vectors)
+        results = collection.query(query_embeddings=vectors[:20] + 0.1, n_results=10)
+        found = sum(len(set(ids) & set(exact_neighbours(vectors, query, 10, space)))
+                    for ids, query in zip(results['ids'], vectors[:20] + 0.1))
+        assert found >= 195
+        assert all(distances == sorted(distances) for distances in results['distances'])
+
+    def test_results(self, collection, vectors):
+        """Test the shape and contents of query results."""
+        results = collection.query(query_embeddings=[vectors[42].tolist()], n_results=2,
+                                   include=['documents', 'metadatas', 'distances'])
+        assert results['ids'][0][0] == '42'
+        assert results['documents'][0][0] == "measurement 42"
+        assert results['metadatas'][0][0] == {'row': 42, 'region': 'arabian sea', 'deep': False, 'temperature': 14.0}
+        assert results['distances'][0][0] == pytest.approx(0, abs=1e-3)
+        assert results['embeddings'] is None
+
+    def test_query_texts(self, client):
+        """Test that query_texts are embedded with the collection's embedding function."""
+        collection = client.create_collection("texts", embedding_function=lambda texts: [[len(t), 1.0] for t in texts])
+        collection.add(ids=['a', 'b'], documents=["ab", "abcdef"])
+        assert collection.query(query_texts=["abcde"], n_results=1)['ids'] == [['b']]
+
+    def test_quantization(self, vectors):
+        """Test that int8 rows restore each value to within half a step of its row's scale."""
+        stored, scales = quantize(vectors, 'int8')
+        assert stored.dtype == np.int8
+        error = np.abs(stored * scales[:, None] - vectors)
+        assert (error <= scales[:, None] / 2 + 1e-6).all()
+
+class TestWhere:
+    """Test cases for metadata filters evaluated as masks."""
+
+    FILTERS = [
+        {'region': 'bay'},
+        {'region': {'$ne': 'bay'}},
+        {'temperature': {'$gte': 14}},
+        {'temperature': {'$ne': 12.0}},
+        {'temperature': {'$in': [10.0, 11, 'x']}},
+        {'region': {'$nin': ['bay', 'equator']}},
+        {'deep': True},
+        {'row': {'$lt': 50}},
+        {'region': {'$gt': 'b'}},
+        {'region': 5},
+        {'row': {'$ne': 'ten'}},
+        {'missing': {'$ne': 1}},
+        {'$and': [{'deep': False}, {'$or': [{'row': {'$lt': 30}}, {'temperature': {'$gt': 17}}]}]},
+    ]
+
+    @pytest.mark.parametrize('where', FILTERS)
+    def test_matches_chroma_semantics(self, collection, metadatas, where):
+        """Test that get with a filter returns exactly the rows matches_where accepts."""
+        expected = [str(i) for i, metadata in enumerate(metadatas) if matches_where(where, metadata)]
+        assert collection.get(where=where, include=[])['ids'] == expected
+
+    def test_filtered_query(self, collection, vectors, metadatas):
+        """Test that a filtered query returns the nearest matching rows, selective or not."""
+        for where in [{'row': {'$lt': 40}}, {'deep': False}]:
+            allowed = [i for i, metadata in enumerate(metadatas) if matches_where(where, metadata)]
+            expected = [str(allowed[i]) for i in np.argsort(((vectors[allowed] - vectors[3]) ** 2).sum(axis=1))[:5]]
+            found = collection.query(query_embeddings=[vectors[3]], n_results=5, where=where)['ids'][0]
+            assert len(set(found) & set(expected)) >= 4
+
+    def test_fewer_matches_than_requested(self, collection, vectors):
+        """Test that a query returns only as many results as rows match."""
+        results = collection.query(query_embeddings=[vectors[0]], n_results=10, where={'row': {'$in': [5, 6]}})
+        assert sorted(results['ids'][0]) == ['5', '6']
+
+    def test_constrained_query_pushes_filter(self, collection, vectors, monkeypatch):
+        """Test that retrieval filters in the store rather than over-fetching."""
+        calls = []
+        query = collection.query
+        monkeypatch.setattr(collection, 'query', lambda **kwargs: calls.append(kwargs) or query(**kwargs))
+        constraints = QueryConstraints(float_ids=['2902746'])
+        monkeypatch.setattr(constraints, 'to_chroma_where', lambda level: {'region': 'bay'})
+        results = constrained_query(collection, vectors[1].tolist(), constraints, 'measurement', 3)
+        assert [call['where'] for call in calls] == [{'region': 'bay'}]
+        assert results['ids'][0][0] == '1'
+
+class TestWrites:
+    """Test cases for adding, replacing and deleting rows."""
+
+    def test_add_skips_existing(self, collection, vectors):
+        """Test that add leaves stored ids alone and appends new ones."""
+        collection.add(ids=['0', 'new'], embeddings=vectors[:2] * 2, documents=["changed", "new"])
+        assert collection.count() == 3001
+        assert collection.get(ids=['0', 'new'])['documents'] == ["measurement 0", "new"]
+
+    def test_upsert_replaces(self, collection, vectors):
+        """Test that upsert replaces a row's embedding, metadata and document."""
+        collection.upsert(ids=['7'], embeddings=[vectors[100]], metadatas=[{'region': 'a much longer region name'}])
+        stored = collection.get(ids=['7'], include=['metadatas', 'documents', 'embeddings'])
+        assert stored['metadatas'] == [{'region': 'a much longer region name'}]
+        assert stored['documents'] == [None]
+        assert stored['embeddings'][0] == pytest.approx(vectors[100].tolist(), abs=0.02)
+        assert collection.count() == 3000
+        assert collection.query(query_embeddings=[vectors[100]], n_results=2)['ids'][0] in (['7', '100'], ['100', '7'])
+
+    def test_delete_and_compact(self, collection, vectors):
+        """Test that deleted rows disappear and compaction keeps the rest intact."""
+        collection.delete(ids=['1', '2'])
+        collection.delete(where={'row': {'$lt': 2000}})
+        assert collection.count() == 1000
+        assert collection.get(limit=2, offset=1)['ids'] == ['2001', '2002']
+        assert collection.get(ids=['1', '2500'], include=['metadatas'])['metadatas'] == \
+            [{'row': 2500, 'region': 'bay', 'deep': True}]
+        assert collection.query(query_embeddings=[vectors[2999]], n_results=1)['ids'] == [['2999']]
+
+    def test_mixed_types_rejected(self, collection, vectors):
+        """Test that a key cannot hold both strings and numbers."""
+        with pytest.raises(ValueError):
+            collection.add(ids=['x'], embeddings=vectors[:1], metadatas=[{'row': 'first'}])
+
+    def test_dimension_checked(self, collection):
+        """Test that embeddings of another dimension are rejected."""
+        with pytest.raises(ValueError):
+            collection.add(ids=['x'], embeddings=[[1.0, 2.0]])
+
+class TestPersistence:
+    """Test cases for reopening collections and sharing them between handles."""
+
+    def test_reopen(self, client, collection, vectors):
+        """Test that a new client maps the stored collection as written."""
+        collection.modify(metadata={'synced_data_version': 3})
+        reopened = MmapClient(client.path).get_collection("measurements")
+        assert reopened.count() == 3000
+        assert reopened.metadata == {'synced_data_version': 3}
+        assert reopened.id == collection.id
+        assert reopened.query(query_embeddings=[vectors[9]], n_results=1)['ids'] == [['9']]
+
+    def test_reader_sees_writes(self, client, collection, vectors):
+        """Test that another client's handle picks up rows written after it opened the collection."""
+        reader = MmapClient(client.path).get_collection("measurements")
+        assert reader.count() == 3000
+        collection.add(ids=['late'], embeddings=[vectors[0] + 5], metadatas=[{'region': 'late'}])
+        assert reader.count() == 3001
+        assert reader.get(where={'region': 'late'})['ids'] == ['late']
+
+    def test_collections(self, client, collection):
+        """Test listing, missing and deleted collections."""
+        assert [c.name for c in client.list_collections()] == ["measurements"]
+        with pytest.raises(ValueError):
+            client.get_collection("absent")
+        with pytest.raises(ValueError):
+            client.create_collection("measurements")
+        client.delete_collection("measurements")
+        assert client.get_or_create_collection("measurements").count() == 0
+
+    def test_sync_collection(self, client):
+        """Test that the incremental sync runs against the store as it does against Chroma."""
+        def build(chunk):
+            ids = chunk['id'].astype(str).tolist()
+            documents = ("value " + chunk['value'].astype(str)).tolist()
+            metadatas = pd.DataFrame({'profile_id': (chunk['id'] // 10).astype('int64')}).to_dict('records')
+            attach_content_hashes(documents, metadatas)
+            return ids, documents, metadatas
+
+        def encode(documents):
+            return np.array([[len(doc), 1.0, float(doc.split()[-1])] for doc in documents])
+
+        collection = client.get_or_create_collection("synced")
+        df = pd.DataFrame({'id': np.arange(500), 'value': np.arange(500) * 10})
+        sync_collection(iter([df]), build, InlineEncoder(encode), collection, verbose=False)
+        df = df[df['id'] >= 10].copy()
+        df.loc[df['id'] == 50, 'value'] = -1
+        stats = sync_collection(iter([df]), build, InlineEncoder(encode), collection, verbose=False)
+        assert (stats.added, stats.updated, stats.deleted, stats.unchanged) == (0, 1, 10, 489)
+        assert collection.count() == 490
+        assert collection.get(ids=['50'])['documents'] == ['value -1']
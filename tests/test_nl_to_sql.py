@@ -0,0 +1,220 @@
+"""
+Unit tests for the NL-to-SQL translator routing and caching
+"""
+
+import pytest
+import asyncio
+import pandas as pd
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nl_to_sql
+from nl_to_sql import NLToSQLTranslator, get_translator
+from summary_views import SUMMARY_VIEWS, SUMMARY_VIEW_QUERIES
+
+class TestRouting:
+    """Test cases for query classification and template routing."""
+
+    @pytest.fixture
+    def translator(self, monkeypatch):
+        """Create a translator without touching the database."""
+        translator = NLToSQLTranslator()
+        monkeypatch.setattr(translator, '_summary_views_available', lambda: set())
+        return translator
+
+    @pytest.mark.parametrize("query,expected", [
+        ("What is the average temperature?", True),
+        ("Show me temperature measurements", False),
+        ("Compare salinity between regions", True),
+        ("Tell me about ARGO floats", False),
+        ("Count measurements by depth", True)
+    ])
+    def test_is_analytical_query(self, translator, query, expected):
+        """Test analytical query detection."""
+        assert translator.is_analytical_query(query) is expected
+
+    @pytest.mark.parametrize("query,expected", [
+        ("What is the average temperature at different depths?", "avg_by_depth"),
+        ("Compare salinity between northern and southern regions", "regional_comparison"),
+        ("Show BGC parameters by ocean zones", "depth_ranges"),
+        ("Give me a float overview", "float_summary"),
+        ("Show temperature trends over time", "temporal_trends"),
+        ("Average oxygen and chlorophyll", "bgc_analysis"),
+        ("List salinity values", "custom")
+    ])
+    def test_detect_query_intent(self, translator, query, expected):
+        """Test intent detection rules and their precedence."""
+        assert translator.detect_query_intent(query) == expected
+
+    def test_templates_are_ready_to_run(self, translator):
+        """Test that templates are stripped once and routed without an LLM call."""
+        sql, intent = translator.generate_sql("What is the average temperature at different depths?")
+        assert intent == 'avg_by_depth'
+        assert sql == sql.strip()
+        assert sql is translator.query_templates['avg_by_depth']
+
+class TestSummaryViews:
+    """Test cases for routing templates through materialized summary views."""
+
+    @pytest.fixture
+    def translator(self, monkeypatch):
+        """Create a translator that sees every summary view."""
+        translator = NLToSQLTranslator()
+        views = {spec['view'] for spec in SUMMARY_VIEWS.values()}
+        monkeypatch.setattr(translator, '_summary_views_available', lambda: views)
+        return translator
+
+    def test_view_used_when_available(self, translator):
+        """Test that template intents read their summary view."""
+        sql, intent = translator.generate_sql("Show temperature trends over time")
+        assert intent == 'temporal_trends'
+        assert sql == SUMMARY_VIEW_QUERIES['temporal_trends']
+        assert 'mv_temporal_trends' in sql
+
+    def test_base_template_without_view(self, translator, monkeypatch):
+        """Test the fallback to the base template when the view is missing."""
+        monkeypatch.setattr(translator, '_summary_views_available', lambda: set())
+        assert translator.get_template_sql('float_summary') == translator.query_templates['float_summary']
+
+    def test_non_view_intent_uses_template(self, translator):
+        """Test that intents without a view keep their template."""
+        assert translator.get_template_sql('multi_dataset_comparison') == translator.query_templates['multi_dataset_comparison']
+
+    @pytest.mark.parametrize("intent", list(SUMMARY_VIEWS.keys()))
+    def test_view_queries_pass_validation(self, translator, intent):
+        """Test that every view query is accepted by the SQL safety check."""
+        assert translator.validate_sql(SUMMARY_VIEW_QUERIES[intent])
+
+class TestSchemaCache:
+    """Test cases for cached schema introspection."""
+
+    @pytest.fixture
+    def translator(self, monkeypatch):
+        """Create a translator with stubbed schema loading and data version."""
+        translator = NLToSQLTranslator()
+        self.version = 1
+        self.loads = 0
+
+        def fake_schema():
+            self.loads += 1
+            return {'measurements': [{'column_name': 'depth', 'data_type': 'double precision'}]}
+
+        monkeypatch.setattr(translator, '_get_schema_info', fake_schema)
+        monkeypatch.setattr(nl_to_sql, 'get_data_version', lambda engine=None: self.version)
+        return translator
+
+    def test_construction_is_lazy(self, translator):
+        """Test that building a translator does not introspect the schema."""
+        assert self.loads == 0
+
+    def test_schema_cached_until_version_bump(self, translator):
+        """Test that the schema is reloaded only after a version change."""
+        translator.schema_info
+        translator.schema_info
+        assert self.loads == 1
+
+        self.version = 2
+        translator.schema_info
+        assert self.loads == 2
+
+    def test_invalidate_schema_cache(self, translator):
+        """Test explicit invalidation."""
+        translator.schema_info
+        translator.invalidate_schema_cache()
+        translator.schema_info
+        assert self.loads == 2
+
+    def test_missing_cube_is_rechecked(self, translator, monkeypatch):
+        """Test that a cube found missing is looked for again after the TTL, while a present one stays cached."""
+        checks = []
+        monkeypatch.setattr(nl_to_sql, 'data_cube_available', lambda engine=None: checks.append(1) or len(checks) > 1)
+        assert not translator._data_cube_available()
+        assert not translator._data_cube_available() and len(checks) == 1
+        monkeypatch.setattr(nl_to_sql.config, 'DATA_VERSION_TTL', 0)
+        assert translator._data_cube_available()
+        assert translator._data_cube_available() and len(checks) == 2
+
+def test_get_translator_singleton():
+    """Test that the process shares one translator."""
+    assert get_translator() is get_translator()
+
+class TestBuildSql:
+    """Test cases for binding extracted constraints into templates."""
+
+    @pytest.fixture
+    def translator(self, monkeypatch):
+        """Create a translator that sees every summary view but no data cube."""
+        translator = NLToSQLTranslator()
+        views = {spec['view'] for spec in SUMMARY_VIEWS.values()}
+        monkeypatch.setattr(translator, '_summary_views_available', lambda: views)
+        monkeypatch.setattr(translator, '_data_cube_available', lambda: False)
+        return translator
+
+    def test_unconstrained_uses_view(self, translator):
+        """Test that queries without constraints keep the summary view."""
+        sql, params, intent = translator.build_sql("What is the average temperature at different depths?")
+        assert intent == 'avg_by_depth'
+        assert params == {}
+        assert 'mv_avg_by_depth' in sql
+
+    def test_constraints_bound_into_template(self, translator):
+        """Test that constraints become parameterized predicates on the base table."""
+        sql, params, intent = translator.build_sql("average temperature by depth near the equator in March 2023")
+        assert intent == 'avg_by_depth'
+        assert 'FROM measurements' in sql
+        assert 'lat >= :lat_min' in sql and 'time < :time_end' in sql
+        assert params['lat_max'] == 5.0
+        assert '{filters}' not in sql
+
+    def test_aliased_template(self, translator):
+        """Test that aliased templates prefix the constrained columns."""
+        sql, params, intent = translator.build_sql("Show temperature trends over time in the Arabian Sea")
+        assert intent == 'temporal_trends'
+        assert 'm.lon <= :lon_max' in sql
+
+    def test_plain_templates_have_no_marker(self, translator):
+        """Test that unparameterized templates never leak the filter marker."""
+        assert all('{filters}' not in sql for sql in translator.query_templates.values())
+
+    def test_aligned_constraints_use_cube(self, translator, monkeypatch):
+        """Test that grid-aligned constraints are answered from the data cube."""
+        monkeypatch.setattr(translator, '_data_cube_available', lambda: True)
+        sql, params, intent = translator.build_sql("Show temperature trends over time in the Arabian Sea")
+        assert intent == 'temporal_trends'
+        assert 'FROM measurement_cube' in sql
+        assert 'lon_cell < :lon_max' in sql
+        assert translator.validate_sql(sql)
+
+    def test_unaligned_constraints_skip_cube(self, translator, monkeypatch):
+        """Test that constraints finer than the cube grid fall back to measurements."""
+        monkeypatch.setattr(translator, '_data_cube_available', lambda: True)
+        sql, params, intent = translator.build_sql("Show temperature trends over time in the tropics")
+        assert 'FROM measurements' in sql
+
+class TestAsyncPipeline:
+    """Test cases for analytical queries from async routes."""
+
+    def test_llm_not_on_database_executor(self, monkeypatch):
+        """Test that SQL generation awaits the gateway and only database work goes to the executor."""
+        translator = NLToSQLTranslator()
+        monkeypatch.setattr(translator, '_format_schema_for_prompt', lambda: "SCHEMA")
+        monkeypatch.setattr(translator, 'execute_sql_query',
+                            lambda sql, params=None, timeout=None: (pd.DataFrame({'max_salinity': [37.1]}), "success"))
+        monkeypatch.setattr(nl_to_sql, '_translator', translator)
+        executed = []
+        async def recording_run_blocking(func, *args):
+            executed.append(func.__name__)
+            return func(*args)
+        monkeypatch.setattr(nl_to_sql, 'run_blocking', recording_run_blocking)
+        class AsyncOnlyGateway:
+            async def agenerate(gateway, prompt, timeout=None, **options):
+                return "SELECT MAX(salinity) AS max_salinity FROM measurements"
+        monkeypatch.setattr(nl_to_sql, 'get_gateway', lambda: AsyncOnlyGateway())
+
+        result, error = asyncio.run(nl_to_sql.process_analytical_query_async("What is the maximum salinity recorded?"))
+        assert error is None
+        assert result['sql_query'] == "SELECT MAX(salinity) AS max_salinity FROM measurements LIMIT 1000"
+        assert executed == ['_sql_without_llm', '_sql_prompt', 'bind_constraints', '_run_analytical_sql']
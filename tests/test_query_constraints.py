@@ -0,0 +1,177 @@
+"""
+Unit tests for natural language query constraint extraction
+"""
+
+import pytest
+from datetime import datetime
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from query_constraints import QueryConstraints, extract_query_constraints, matches_where
+
+class TestExtraction:
+    """Test cases for extract_query_constraints."""
+
+    def test_no_constraints(self):
+        """Test that a plain question yields no constraints."""
+        constraints = extract_query_constraints("What is the average temperature at different depths?")
+        assert constraints.is_empty()
+
+    def test_named_region_and_month(self):
+        """Test a named region combined with a month."""
+        constraints = extract_query_constraints("average temperature by depth near the equator in March 2023")
+        assert (constraints.lat_min, constraints.lat_max) == (-5.0, 5.0)
+        assert constraints.time_start == datetime(2023, 3, 1)
+        assert constraints.time_end == datetime(2023, 4, 1)
+        assert constraints.regions == ['equator']
+
+    def test_basin_box(self):
+        """Test that a basin sets a lat/lon box."""
+        constraints = extract_query_constraints("salinity in the Bay of Bengal")
+        assert (constraints.lon_min, constraints.lon_max) == (78.0, 100.0)
+
+    def test_depth_below_is_not_a_year(self):
+        """Test that depth values are not mistaken for years."""
+        constraints = extract_query_constraints("average oxygen below 2000 m")
+        assert constraints.depth_min == 2000.0
+        assert constraints.time_start is None
+
+    def test_depth_range(self):
+        """Test an explicit depth range."""
+        constraints = extract_query_constraints("temperature between 100 and 500 m")
+        assert (constraints.depth_min, constraints.depth_max) == (100.0, 500.0)
+
+    def test_depth_upper(self):
+        """Test an upper-ocean depth limit."""
+        constraints = extract_query_constraints("chlorophyll in the upper 200 meters")
+        assert constraints.depth_max == 200.0
+        assert constraints.depth_min is None
+
+    def test_coordinate_box(self):
+        """Test hemisphere-suffixed coordinates."""
+        constraints = extract_query_constraints("mean temperature between 10N and 20N, 60E to 80E")
+        assert (constraints.lat_min, constraints.lat_max) == (10.0, 20.0)
+        assert (constraints.lon_min, constraints.lon_max) == (60.0, 80.0)
+
+    def test_west_east_range(self):
+        """Test that west longitudes are negative, as in the stored -180..180 positions."""
+        constraints = extract_query_constraints("salinity between 20W and 10E")
+        assert (constraints.lon_min, constraints.lon_max) == (-20.0, 10.0)
+
+    def test_single_hemisphere(self):
+        """Test that one hemisphere filters latitude."""
+        constraints = extract_query_constraints("average temperature in the southern hemisphere")
+        assert constraints.lat_max == 0.0
+
+    def test_hemisphere_comparison_is_unconstrained(self):
+        """Test that comparing both hemispheres does not filter."""
+        constraints = extract_query_constraints("Compare salinity between northern and southern hemispheres")
+        assert constraints.is_empty()
+        constraints = extract_query_constraints("Compare the northern and southern hemisphere temperatures")
+        assert constraints.is_empty()
+
+    def test_date_range(self):
+        """Test a range across two month mentions."""
+        constraints = extract_query_constraints("from Jan 2023 to Feb 2023")
+        assert constraints.time_start == datetime(2023, 1, 1)
+        assert constraints.time_end == datetime(2023, 3, 1)
+
+    def test_since_year(self):
+        """Test an open-ended start date."""
+        constraints = extract_query_constraints("temperature since 2022")
+        assert constraints.time_start == datetime(2022, 1, 1)
+        assert constraints.time_end is None
+
+    def test_iso_date(self):
+        """Test an ISO day."""
+        constraints = extract_query_constraints("profiles on 2023-03-15")
+        assert constraints.time_start == datetime(2023, 3, 15)
+        assert constraints.time_end == datetime(2023, 3, 16)
+
+    def test_impossible_iso_date(self):
+        """Test that a day the month does not have is skipped, like a month above 12."""
+        constraints = extract_query_constraints("temperature on 2023-02-30")
+        assert constraints.time_start is None and constraints.time_end is None
+
+    def test_float_and_wmo_ids(self):
+        """Test float and WMO identifiers."""
+        constraints = extract_query_constraints("compare ARGO_12 with WMO 5900003")
+        assert constraints.float_ids == ['ARGO_0012']
+        assert constraints.wmo_ids == [5900003]
+        assert constraints.time_start is None
+
+class TestSqlFilters:
+    """Test cases for rendering constraints as SQL predicates."""
+
+    def test_empty(self):
+        """Test that no constraints render no clause."""
+        assert QueryConstraints().to_sql_filters() == ('', {})
+
+    def test_bounds_and_alias(self):
+        """Test bound parameters and table alias."""
+        clause, params = QueryConstraints(lat_min=-5.0, depth_max=200.0).to_sql_filters('m')
+        assert clause == ' AND m.lat >= :lat_min AND m.depth <= :depth_max'
+        assert params == {'lat_min': -5.0, 'depth_max': 200.0}
+
+    def test_identifiers(self):
+        """Test float and WMO identifier predicates."""
+        clause, params = QueryConstraints(float_ids=['ARGO_0001'], wmo_ids=[5900002]).to_sql_filters()
+        assert 'float_id IN (:float_id_0)' in clause
+        assert 'wmo_id IN (:wmo_id_0)' in clause
+        assert params == {'float_id_0': 'ARGO_0001', 'wmo_id_0': 5900002}
+
+    def test_describe_is_serializable(self):
+        """Test that describe() returns JSON-friendly values."""
+        summary = extract_query_constraints("in March 2023 below 100 m").describe()
+        assert summary['time_start'] == '2023-03-01T00:00:00'
+        assert summary['depth_min'] == 100.0
+
+class TestChromaWhere:
+    """Test cases for QueryConstraints.to_chroma_where and matches_where."""
+
+    def test_empty(self):
+        """Test that no constraints means no filter, which Chroma would reject."""
+        assert QueryConstraints().to_chroma_where() is None
+
+    def test_single_condition(self):
+        """Test that one condition is not wrapped in $and."""
+        assert extract_query_constraints("below 1000 m").to_chroma_where() == {'depth': {'$gte': 1000.0}}
+
+    def test_region_and_year(self):
+        """Test that regions and years become numeric ranges, dates as yyyymmdd."""
+        where = extract_query_constraints("temperature near the equator in 2023").to_chroma_where()
+        assert where == {'$and': [
+            {'lat': {'$gte': -5.0}}, {'lat': {'$lte': 5.0}},
+            {'yyyymmdd': {'$gte': 20230101}}, {'yyyymmdd': {'$lt': 20240101}}
+        ]}
+
+    def test_profile_depth_overlap(self):
+        """Test that profiles match depth ranges their depth span overlaps."""
+        where = extract_query_constraints("between 100 and 500 m").to_chroma_where('profiles')
+        assert where == {'$and': [{'max_depth': {'$gte': 100.0}}, {'min_depth': {'$lte': 500.0}}]}
+
+    def test_identifiers(self):
+        """Test that float and WMO identifiers are alternatives."""
+        assert extract_query_constraints("float ARGO_0012").to_chroma_where() == {'float_id': {'$in': ['ARGO_0012']}}
+        where = QueryConstraints(float_ids=['ARGO_0001'], wmo_ids=[5900002]).to_chroma_where()
+        assert where == {'$or': [{'float_id': {'$in': ['ARGO_0001']}}, {'wmo_id': {'$in': [5900002]}}]}
+
+    def test_matches_chroma(self):
+        """Test that matches_where selects the same documents as Chroma's own filter."""
+        metadatas = [
+            {'lat': 2.5, 'depth': 1200.0, 'yyyymmdd': 20230305, 'float_id': 'ARGO_0012', 'wmo_id': 5900012},
+            {'lat': -12.0, 'depth': 10.0, 'yyyymmdd': 20221231, 'float_id': 'ARGO_0001', 'wmo_id': 5900001},
+            {'lat': 4.0, 'depth': 1000.0, 'yyyymmdd': 20240101, 'float_id': 'ARGO_0002', 'wmo_id': 5900002},
+            {'depth': 1500.0, 'float_id': 'ARGO_0003'}
+        ]
+        collection = chromadb.EphemeralClient().get_or_create_collection('test_matches_where', embedding_function=None)
+        collection.add(ids=['0', '1', '2', '3'], embeddings=[[float(i), 1.0] for i in range(4)], metadatas=metadatas)
+        for question in ["near the equator in 2023", "below 1000 m", "float ARGO_0001 or 5900002",
+                         "since 2023 above 1100 m", "equatorial water deeper than 1000 m before 2024"]:
+            where = extract_query_constraints(question).to_chroma_where()
+            expected = sorted(collection.get(where=where)['ids'])
+            assert [str(i) for i, meta in enumerate(metadatas) if matches_where(where, meta)] == expected, question
@@ -0,0 +1,278 @@
+"""
+Unit tests for profile-level retrieval with drill-down to measurements
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+import uuid
+import sys
+import os
+from unittest.mock import patch
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+import config
+from database import build_engine
+from lexical_index import LexicalIndex, index_path
+from query_constraints import extract_query_constraints
+from retrieval import (candidate_ids, constrained_query, fetch_profile_measurements, fuse, hybrid_query, level_phrases,
+                       profile_context, question_constraints, retrieve, search_measurements, search_profiles)
+
+class KeywordEmbedding(chromadb.EmbeddingFunction):
+    """Embeds texts by which ocean keywords they mention, so queries match deterministically."""
+    KEYWORDS = ['warm', 'cold', 'oxygen', 'salty']
+
+    def __call__(self, input):
+        return [[1.0 if word in text.lower() else 0.0 for word in self.KEYWORDS] + [0.1] for text in input]
+
+@pytest.fixture
+def engine(tmp_path):
+    """Create a SQLite measurements table with three profiles of four levels."""
+    engine = build_engine(f"sqlite:///{tmp_path / 'argo.db'}")
+    rows = pd.DataFrame({
+        'id': np.arange(1, 13),
+        'profile_id': np.repeat([1, 2, 3], 4),
+        'time': pd.Timestamp('2023-03-05 12:00'),
+        'lat': np.repeat([-10.0, 5.0, 20.0], 4),
+        'lon': np.repeat([70.0, 80.0, 90.0], 4),
+        'depth': np.tile([500.0, 10.0, 1000.0, 100.0], 3),
+        'temperature': np.tile([8.0, 28.0, 4.0, 20.0], 3),
+        'salinity': 35.0,
+        'oxygen': [np.nan] * 8 + [5.0] * 4,
+        'ph': np.nan,
+        'chlorophyll': 0.0
+    })
+    rows.to_sql('measurements', engine, index=False)
+    return engine
+
+@pytest.fixture
+def profile_collection():
+    """Create a profile summary collection matching the engine fixture."""
+    client = chromadb.EphemeralClient()
+    collection = client.get_or_create_collection(name=f"test_{uuid.uuid4().hex[:12]}",
+                                                 embedding_function=KeywordEmbedding())
+    collection.add(
+        ids=['profile_1', 'profile_2', 'profile_3'],
+        documents=["Profile 1 in warm surface water.", "Profile 2 in cold water.", "Profile 3 with oxygen data."],
+        metadatas=[{'profile_id': i, 'float_id': f'ARGO_000{i}', 'cycle_number': i, 'content_hash': 'x'}
+                   for i in (1, 2, 3)]
+    )
+    return collection
+
+class TestSearchProfiles:
+    """Test cases for profile search and the Postgres drill-down."""
+
+    def test_drill_down(self, engine, profile_collection):
+        """Test that the best profile comes first with its measurements by depth."""
+        result = search_profiles(profile_collection, "oxygen", n_profiles=2, engine=engine)
+        assert result.tier == 'profiles'
+        assert result.profile_ids[0] == 3
+        assert result.document_ids == [f"profile_{profile_id}" for profile_id in result.profile_ids]
+        assert result.documents[0].startswith("Profile 3 with oxygen data. Measured levels: 10 m: 28.00°C")
+        assert "O2 5.00 ml/L" in result.documents[0]
+
+        first = [meta for meta in result.metadatas if meta['profile_id'] == 3]
+        assert [meta['depth'] for meta in first] == [10.0, 100.0, 500.0, 1000.0]
+        assert first[0] == {'profile_id': 3, 'float_id': 'ARGO_0003', 'cycle_number': 3, 'postgres_id': 10,
+                            'time': '2023-03-05', 'depth': 10.0, 'lat': 20.0, 'lon': 90.0}
+        assert len(result.metadatas) == 8
+
+    def test_one_document_per_profile(self, engine, profile_collection):
+        """Test that every retrieved document is a distinct profile."""
+        result = search_profiles(profile_collection, "warm", n_profiles=3, engine=engine)
+        assert len(result.documents) == 3
+        assert sorted(result.profile_ids) == [1, 2, 3]
+
+    def test_fetch_empty(self, engine):
+        """Test that no profile ids means no query."""
+        assert fetch_profile_measurements([], engine).empty
+
+class RecordingCollection:
+    """Passes calls through to a collection, recording the keyword arguments of each query."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.queries = []
+
+    def query(self, **kwargs):
+        self.queries.append(kwargs)
+        return self.collection.query(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+class TestConstrainedQuery:
+    """Test cases for applying question constraints to the vector search."""
+
+    @pytest.fixture
+    def measurement_collection(self):
+        """The engine fixture's measurements; the coldest-sounding ones are far from the equator."""
+        collection = chromadb.EphemeralClient().get_or_create_collection(name=f"test_{uuid.uuid4().hex[:12]}",
+                                                                         embedding_function=KeywordEmbedding())
+        profiles = {1: ("cold water", -10.0), 2: ("cold salty water", 5.0), 3: ("warm water", 20.0)}
+        collection.add(
+            ids=[str(i) for i in range(1, 13)],
+            documents=[profiles[(i - 1) // 4 + 1][0] for i in range(1, 13)],
+            metadatas=[{'postgres_id': i, 'profile_id': (i - 1) // 4 + 1, 'lat': profiles[(i - 1) // 4 + 1][1],
+                        'yyyymmdd': 20230305} for i in range(1, 13)]
+        )
+        return collection
+
+    def test_post_filter(self, measurement_collection):
+        """Test that an over-fetched search keeps only documents matching the question."""
+        result = search_measurements(measurement_collection, "cold water near the equator", n_results=2)
+        assert [meta['profile_id'] for meta in result.metadatas] == [2, 2]
+
+    def test_candidates_ranked_exactly(self, engine, measurement_collection):
+        """Test that matches missing from the over-fetch are ranked over the Postgres candidates."""
+        constraints = extract_query_constraints("near the equator")
+        embedding = KeywordEmbedding()(["cold water"])[0]
+        recording = RecordingCollection(measurement_collection)
+        with patch.object(config, 'RETRIEVAL_OVERFETCH', 1):
+            results = constrained_query(recording, embedding, constraints, 'measurements', 2, engine)
+        assert all('where' not in kwargs for kwargs in recording.queries)
+        expected = measurement_collection.query(query_embeddings=[embedding], n_results=2,
+                                                where=constraints.to_chroma_where('measurements'))
+        assert set(results['ids'][0]) <= {'5', '6', '7', '8'}
+        assert results['distances'][0] == pytest.approx(expected['distances'][0])
+        assert [meta['profile_id'] for meta in results['metadatas'][0]] == [2, 2]
+        assert results['documents'][0] == ["cold salty water"] * 2
+
+    def test_pushdown(self, engine, measurement_collection):
+        """Test that broad filters with no matches near the question go to Chroma as a last resort."""
+        constraints = extract_query_constraints("near the equator")
+        recording = RecordingCollection(measurement_collection)
+        with patch.object(config, 'RETRIEVAL_OVERFETCH', 1), patch.object(config, 'RETRIEVAL_MAX_CANDIDATES', 1), \
+                patch.object(config, 'RETRIEVAL_MAX_FETCH', 4):
+            results = constrained_query(recording, KeywordEmbedding()(["cold water"])[0], constraints,
+                                        'measurements', 2, engine)
+        assert [kwargs['n_results'] for kwargs in recording.queries] == [2, 4, 2]
+        assert recording.queries[-1]['where'] == constraints.to_chroma_where('measurements')
+        assert set(results['ids'][0]) <= {'5', '6', '7', '8'}
+
+    def test_profile_candidates(self, engine):
+        """Test that profiles are candidates when any of their measurements matches."""
+        assert candidate_ids(extract_query_constraints("near the equator"), 'profiles', 10, engine) == ['profile_2']
+        deep = candidate_ids(extract_query_constraints("below 900 m"), 'profiles', 10, engine)
+        assert sorted(deep) == ['profile_1', 'profile_2', 'profile_3']
+
+    def test_no_candidates(self, engine, measurement_collection):
+        """Test that no matching rows in Postgres means no results, not the whole collection."""
+        with patch.object(config, 'RETRIEVAL_OVERFETCH', 1):
+            results = constrained_query(measurement_collection, KeywordEmbedding()(["cold water"])[0],
+                                        extract_query_constraints("in 2019"), 'measurements', 2, engine)
+        assert results['ids'] == [[]] and results['documents'] == [[]]
+
+    def test_nothing_matches(self, measurement_collection):
+        """Test that an unmatched constraint returns nothing rather than unfiltered results."""
+        result = search_measurements(measurement_collection, "cold water in 2019")
+        assert result.documents == [] and result.metadatas == []
+
+    def test_filters_disabled(self, measurement_collection):
+        """Test that RETRIEVAL_FILTERS=false searches the whole collection."""
+        with patch.object(config, 'RETRIEVAL_FILTERS', False):
+            result = search_measurements(measurement_collection, "cold water in 2019", n_results=3)
+        assert len(result.metadatas) == 3
+
+    def test_unparseable_constraints(self, measurement_collection):
+        """Test that a question the constraint parser fails on is searched unfiltered."""
+        def failing_extraction(query_text):
+            raise ValueError("day is out of range for month")
+        with patch('retrieval.extract_query_constraints', failing_extraction):
+            assert question_constraints("temperature on 2023-02-30").is_empty()
+            result = search_measurements(measurement_collection, "cold water on 2023-02-30", n_results=3)
+        assert len(result.metadatas) == 3
+
+class FailingEmbedding(chromadb.EmbeddingFunction):
+    """Fails on any call, to show a question was answered without embedding it."""
+
+    def __call__(self, input):
+        raise AssertionError("the question was embedded")
+
+def ranking(ids):
+    return {'ids': [ids], 'documents': [[f"doc {i}" for i in ids]], 'metadatas': [[{'id': i} for i in ids]]}
+
+class TestHybridQuery:
+    """Test cases for fusing BM25 matches with vector results."""
+
+    @pytest.fixture
+    def lexical_path(self, tmp_path):
+        with patch.object(config, 'LEXICAL_INDEX_PATH', str(tmp_path)):
+            yield tmp_path
+
+    def save_index(self, collection):
+        documents = collection.get(include=['documents', 'metadatas'])
+        index = LexicalIndex()
+        index.add(documents['ids'], documents['documents'], documents['metadatas'])
+        index.save(index_path(collection.name))
+
+    def test_fuse(self):
+        """Test that documents ranked well by both lists come first and ties go to the first list."""
+        fused = fuse([ranking(['a', 'b', 'c']), ranking(['c', 'd', 'a'])], n_results=4, k=60)
+        assert fused['ids'][0] == ['a', 'c', 'b', 'd']
+        assert fused['metadatas'][0][1] == {'id': 'c'}
+
+    def test_identifier_lookup_skips_embedding(self, lexical_path):
+        """Test that a float id question is answered from the lexical index alone."""
+        collection = chromadb.EphemeralClient().get_or_create_collection(name=f"test_{uuid.uuid4().hex[:12]}",
+                                                                         embedding_function=FailingEmbedding())
+        collection.add(ids=[f'profile_{i}' for i in (1, 2, 3)], embeddings=[[1.0, 0.0]] * 3,
+                       documents=[f"ARGO float ARGO_000{i} completed profile cycle {i}." for i in (1, 2, 3)],
+                       metadatas=[{'profile_id': i, 'float_id': f'ARGO_000{i}'} for i in (1, 2, 3)])
+        self.save_index(collection)
+        result = hybrid_query(collection, "profiles of float ARGO_0002", 'profiles', 5)
+        assert result['ids'][0] == ['profile_2']
+
+    def test_fused_with_vector_results(self, lexical_path, profile_collection):
+        """Test that documents found by both searches outrank one only the vector search returns."""
+        self.save_index(profile_collection)
+        result = hybrid_query(profile_collection, "cold oxygen", 'profiles', 3)
+        assert sorted(result['ids'][0][:2]) == ['profile_2', 'profile_3']
+        assert result['ids'][0][2] == 'profile_1'
+
+    def test_without_index(self, lexical_path, profile_collection):
+        """Test that vector search answers alone when no lexical index was saved."""
+        result = hybrid_query(profile_collection, "cold", 'profiles', 1)
+        assert result['ids'][0] == ['profile_2']
+
+class TestProfileContext:
+    """Test cases for the LLM context of a profile."""
+
+    def test_levels_thinned(self, engine):
+        """Test that long profiles are evenly thinned, keeping the top and bottom."""
+        levels = fetch_profile_measurements([1], engine)
+        context = profile_context("Summary.", level_phrases(levels), max_levels=2)
+        assert context == "Summary. Measured levels: 10 m: 28.00°C, 35.00 PSU; 1000 m: 4.00°C, 35.00 PSU."
+
+    def test_no_levels(self):
+        """Test that a profile without measurements keeps its summary."""
+        assert profile_context("Summary.", []) == "Summary."
+
+class TestRetrieve:
+    """Test cases for choosing the retrieval tier."""
+
+    def test_profiles_by_default(self, engine, profile_collection):
+        """Test that the profile tier is searched when configured."""
+        measurement_collection = chromadb.EphemeralClient().get_or_create_collection(
+            name=f"test_{uuid.uuid4().hex[:12]}", embedding_function=KeywordEmbedding())
+        with patch.object(config, 'RETRIEVAL_TIER', 'profiles'):
+            result = retrieve("cold", profile_collection, measurement_collection, engine)
+        assert result.tier == 'profiles'
+        assert result.profile_ids[0] == 2
+
+    def test_measurement_tier(self, profile_collection):
+        """Test that the measurement tier searches measurement documents directly."""
+        measurement_collection = chromadb.EphemeralClient().get_or_create_collection(
+            name=f"test_{uuid.uuid4().hex[:12]}", embedding_function=KeywordEmbedding())
+        measurement_collection.add(ids=['7'], documents=["cold deep water"], metadatas=[{'postgres_id': 7}])
+        with patch.object(config, 'RETRIEVAL_TIER', 'measurements'):
+            result = retrieve("cold", profile_collection, measurement_collection)
+        assert result.tier == 'measurements'
+        assert result.metadatas == [{'postgres_id': 7}]
+
+    def test_no_collections(self):
+        """Test that nothing is retrieved without an index."""
+        assert retrieve("cold").documents == []
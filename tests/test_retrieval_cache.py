@@ -0,0 +1,156 @@
+"""
+Unit tests for the retrieval cache
+"""
+
+import pytest
+import uuid
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from retrieval import RetrievalResult
+from retrieval_cache import RetrievalCache, cached_retrieve, normalize_query
+
+class CountingEmbedding(chromadb.EmbeddingFunction):
+    """Embeds texts by which ocean keywords they mention and counts the texts it embedded."""
+    KEYWORDS = ['warm', 'cold', 'oxygen']
+
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, input):
+        self.texts.extend(input)
+        return [[1.0 if word in text.lower() else 0.0 for word in self.KEYWORDS] + [0.1] for text in input]
+
+@pytest.fixture
+def client():
+    return chromadb.EphemeralClient()
+
+@pytest.fixture
+def embedding():
+    return CountingEmbedding()
+
+@pytest.fixture
+def collection(client, embedding):
+    """A small measurement collection synced at data version 1."""
+    collection = client.get_or_create_collection(name=f"test_{uuid.uuid4().hex[:12]}", embedding_function=embedding)
+    collection.add(ids=['1', '2'], documents=["warm surface water", "cold deep water"],
+                   embeddings=[[1.0, 0.0, 0.0, 0.1], [0.0, 1.0, 0.0, 0.1]],
+                   metadatas=[{'postgres_id': 1}, {'postgres_id': 2}])
+    collection.modify(metadata={'synced_data_version': 1})
+    return collection
+
+class TestNormalizeQuery:
+    """Test cases for question normalization."""
+
+    def test_near_duplicates(self):
+        """Test that case, spacing and punctuation do not distinguish questions."""
+        assert normalize_query("  What floats are near the Equator? ") == "what floats are near the equator"
+        assert normalize_query("what floats are  near the equator!!") == "what floats are near the equator"
+
+    def test_values_kept(self):
+        """Test that decimals, dates and ids are left intact."""
+        assert normalize_query("Temperature at 28.5°N on 2023-03-05 for ARGO_0012.") == \
+            "temperature at 28.5°n on 2023-03-05 for argo_0012"
+
+class TestRetrievalCache:
+    """Test cases for caching and invalidating retrieval results."""
+
+    def test_hit(self, client, collection, embedding):
+        """Test that a repeated question is answered without embedding or searching."""
+        cache = RetrievalCache(client)
+        first = cached_retrieve(cache, "Cold water?", measurement_collection=collection)
+        second = cached_retrieve(cache, "cold water", measurement_collection=collection)
+        assert second is first
+        assert first.metadatas[0] == {'postgres_id': 2}
+        assert embedding.texts == ["Cold water?"]
+        assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    def test_sync_invalidates(self, client, collection, embedding):
+        """Test that a new data version searches again, reusing the stored question embedding."""
+        cache = RetrievalCache(client)
+        cached_retrieve(cache, "warm water", measurement_collection=collection)
+        collection.upsert(ids=['1'], documents=["warm surface water"], embeddings=[[1.0, 0.0, 0.0, 0.1]],
+                          metadatas=[{'postgres_id': 1, 'qc': 'adjusted'}])
+        collection.modify(metadata={'synced_data_version': 2})
+        result = cached_retrieve(cache, "warm water", measurement_collection=collection)
+        assert result.metadatas[0] == {'postgres_id': 1, 'qc': 'adjusted'}
+        assert embedding.texts == ["warm water"]
+        assert cache.stats()['stale'] == 1
+
+    def test_rebuild_invalidates(self, client, collection):
+        """Test that a recreated collection, even at the same data version, is a different index."""
+        cache = RetrievalCache(client)
+        version = cache.index_version([collection])
+        client.delete_collection(collection.name)
+        rebuilt = client.create_collection(collection.name, embedding_function=None,
+                                           metadata={'synced_data_version': 1})
+        assert cache.index_version([rebuilt]) != version
+
+    def test_ingest_invalidates(self, client, collection, embedding, monkeypatch):
+        """Test that an ingest not yet synced to Chroma still invalidates, since results include its measurements."""
+        cache = RetrievalCache(client)
+        monkeypatch.setattr('retrieval_cache.get_data_version', lambda engine=None: 1)
+        cached_retrieve(cache, "warm water", measurement_collection=collection)
+        monkeypatch.setattr('retrieval_cache.get_data_version', lambda engine=None: 2)
+        cached_retrieve(cache, "warm water", measurement_collection=collection)
+        assert cache.stats()['stale'] == 1
+        assert embedding.texts == ["warm water"]
+
+    def test_lru_eviction(self, client):
+        """Test that the least recently used question is evicted first."""
+        cache = RetrievalCache(client, max_entries=2)
+        for question in ["a", "b"]:
+            cache.put(question, (), RetrievalResult(documents=[question]))
+        cache.get("a", ())
+        cache.put("c", (), RetrievalResult(documents=["c"]))
+        assert cache.get("b", ()) == (None, None)
+        assert cache.get("a", ())[0].documents == ["a"]
+        assert len(cache) == 2 and cache.stats()['evictions'] == 1
+
+    def test_no_cache(self, collection, embedding):
+        """Test that retrieval runs directly when caching is off."""
+        cached_retrieve(None, "cold", measurement_collection=collection)
+        cached_retrieve(None, "cold", measurement_collection=collection)
+        assert embedding.texts == ["cold", "cold"]
+
+class TestNearDuplicates:
+    """Test cases for results reused by near-duplicate questions."""
+
+    def test_near_duplicate_hit(self, client, collection, embedding):
+        """Test that a reworded question reuses the result and is then cached under its own text."""
+        cache = RetrievalCache(client, min_cosine=0.97)
+        first = cached_retrieve(cache, "cold water", measurement_collection=collection)
+        second = cached_retrieve(cache, "how cold is the water", measurement_collection=collection)
+        assert second.documents == first.documents
+        assert cache.stats()['semantic_hits'] == 1
+        cached_retrieve(cache, "How cold is the water?", measurement_collection=collection)
+        assert embedding.texts == ["cold water", "how cold is the water"]
+        assert cache.stats()['hits'] == 2
+
+    def test_dissimilar_question(self, client, collection, embedding):
+        """Test that a question below the cosine threshold is searched, embedded only once."""
+        cache = RetrievalCache(client, min_cosine=0.97)
+        cached_retrieve(cache, "cold water", measurement_collection=collection)
+        result = cached_retrieve(cache, "warm water", measurement_collection=collection)
+        assert result.metadatas[0] == {'postgres_id': 1}
+        assert embedding.texts == ["cold water", "warm water"]
+        assert cache.stats()['semantic_hits'] == 0
+
+    def test_constraints_must_match(self, client, collection, embedding):
+        """Test that a question with other constraints is not compared, and not embedded by the cache."""
+        cache = RetrievalCache(client, min_cosine=0.97)
+        cached_retrieve(cache, "cold water", measurement_collection=collection)
+        cached_retrieve(cache, "cold water in 2019", measurement_collection=collection)
+        assert cache.stats()['semantic_hits'] == 0
+        assert embedding.texts == ["cold water", "cold water in 2019"]
+
+    def test_disabled(self, client, collection):
+        """Test that only exact questions match when the near-duplicate tier is off."""
+        cache = RetrievalCache(client, semantic=False)
+        cached_retrieve(cache, "cold water", measurement_collection=collection)
+        cached_retrieve(cache, "how cold is the water", measurement_collection=collection)
+        assert cache.stats()['semantic_hits'] == 0 and cache.stats()['misses'] == 2
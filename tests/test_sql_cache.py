@@ -0,0 +1,168 @@
+"""
+Unit tests for the NL-to-SQL translation cache
+"""
+
+import pytest
+import pandas as pd
+import sys
+import os
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nl_to_sql
+from nl_to_sql import EMPTY_RESULT_STATUS, NLToSQLTranslator, process_analytical_query
+from sql_cache import TranslationCache, question_signature
+
+SQL = "SELECT float_id, MAX(salinity) AS max_salinity FROM measurements GROUP BY float_id LIMIT 1000"
+
+class KeywordEmbedding:
+    """Embeds questions by the topic words they mention and counts the questions it embedded."""
+    TOPICS = [('salinity', 'salt'), ('list', 'show', 'values'), ('float',), ('temperature',)]
+
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts.extend(texts)
+        return [[1.0 if any(word in text.lower() for word in topic) else 0.0 for topic in self.TOPICS] + [0.2]
+                for text in texts]
+
+@pytest.fixture
+def embedding():
+    return KeywordEmbedding()
+
+@pytest.fixture
+def cache(tmp_path, embedding):
+    cache = TranslationCache('ollama:test', embedding, path=str(tmp_path), min_cosine=0.95)
+    yield cache
+    cache.close()
+
+class TestTranslationCache:
+    """Test cases for storing and finding translations."""
+
+    def test_exact(self, cache, embedding):
+        """Test that the same question, up to case and punctuation, reuses the SQL without embedding it."""
+        cache.put("List salinity values per float", SQL, 0.25, 40)
+        embedding.texts.clear()
+        assert cache.get("list salinity values per float?") == SQL
+        assert embedding.texts == []
+
+    def test_paraphrase(self, cache):
+        """Test that a paraphrase with the same signature reuses the SQL."""
+        cache.put("List salinity values per float", SQL, 0.25, 40)
+        assert cache.get("Show the salinity values of each float") == SQL
+        assert cache.stats()['semantic_hits'] == 1
+
+    def test_different_numbers_miss(self, cache):
+        """Test that questions differing only in a year, variable or aggregate do not share SQL."""
+        cache.put("List salinity values per float in 2019", SQL, 0.25, 40)
+        assert cache.get("List salinity values per float in 2020") is None
+        cache.put("Highest salinity per float", SQL, 0.25, 40)
+        assert cache.get("Lowest salinity per float") is None
+        assert question_signature("mean salinity") == question_signature("average salinity")
+
+    def test_no_candidates_skips_embedding(self, cache, embedding):
+        """Test that a question no cached one could match is not embedded."""
+        cache.put("List salinity values per float", SQL, 0.25, 40)
+        embedding.texts.clear()
+        assert cache.get("List salinity values in the Arabian Sea") is None
+        assert embedding.texts == []
+
+    def test_without_embedding(self, tmp_path):
+        """Test that only exact questions match when no embedding function is attached."""
+        cache = TranslationCache('ollama:test', path=str(tmp_path))
+        cache.put("List salinity values per float", SQL, 0.25, 40)
+        assert cache.get("Show the salinity values of each float") is None
+        assert cache.get("List salinity values per float") == SQL
+        cache.close()
+
+    def test_execution_record(self, cache):
+        """Test that executions, their mean time and the latest row count are recorded."""
+        cache.put("List salinity values per float", SQL, 0.2, 40)
+        cache.put("List salinity values per float", SQL, 0.4, 42)
+        entry = cache.entry("List salinity values per float")
+        assert entry['executions'] == 2
+        assert entry['mean_ms'] == pytest.approx(300.0)
+        assert entry['last_ms'] == pytest.approx(400.0)
+        assert entry['row_count'] == 42
+
+    def test_evict_failed_sql(self, cache):
+        """Test that every question cached with SQL that failed is evicted."""
+        cache.put("List salinity values per float", SQL, 0.25, 40)
+        cache.put("Salinity of each float", SQL, 0.25, 40)
+        cache.put("List temperature values", "SELECT temperature FROM measurements LIMIT 1000", 0.1, 1000)
+        assert cache.evict(SQL) == 2
+        assert len(cache) == 1
+        assert cache.get("List salinity values per float") is None
+
+    def test_persists(self, cache, tmp_path, embedding):
+        """Test that translations survive a restart."""
+        cache.put("List salinity values per float", SQL, 0.25, 40)
+        cache.close()
+        reopened = TranslationCache('ollama:test', embedding, path=str(tmp_path))
+        assert reopened.get("List salinity values per float") == SQL
+        reopened.close()
+
+    def test_hits_touch_rarely(self, cache):
+        """Test that a hit only rewrites last_used once TOUCH_INTERVAL has passed."""
+        cache.put("List salinity values per float", SQL, 0.25, 40)
+        cache._db.execute("UPDATE translations SET last_used = 1")
+        cache.get("List salinity values per float")
+        touched = cache._db.execute("SELECT last_used FROM translations").fetchone()[0]
+        assert touched > 1
+        cache.get("List salinity values per float")
+        assert cache._db.execute("SELECT last_used FROM translations").fetchone()[0] == touched
+
+class TestTranslatorIntegration:
+    """Test cases for the translator reading and maintaining the cache."""
+
+    @pytest.fixture
+    def translator(self, cache, monkeypatch):
+        """A translator with the cache attached, a fake LLM and a fake database."""
+        translator = NLToSQLTranslator()
+        translator.translation_cache = cache
+        monkeypatch.setattr(translator, '_format_schema_for_prompt', lambda: "SCHEMA")
+        self.prompts = []
+        class FakeGateway:
+            def generate(gateway, prompt, **options):
+                self.prompts.append(prompt)
+                return f"```sql\n{SQL}\n```"
+        monkeypatch.setattr(nl_to_sql, 'get_gateway', lambda: FakeGateway())
+        monkeypatch.setattr(nl_to_sql, '_translator', translator)
+        self.status = "success"
+        monkeypatch.setattr(translator, 'execute_sql_query',
+                            lambda sql, params=None, timeout=None: (pd.DataFrame({'max_salinity': [37.1, 36.9]}) if self.status == "success"
+                                                      else pd.DataFrame(), self.status))
+        return translator
+
+    def test_second_question_skips_the_llm(self, translator, cache):
+        """Test that generated SQL is cached after it runs and reused for a paraphrase."""
+        first, _ = process_analytical_query("What is the maximum salinity recorded?")
+        assert first['sql_query'] == SQL and len(self.prompts) == 1
+        assert cache.entry("What is the maximum salinity recorded?")['row_count'] == 2
+
+        second, _ = process_analytical_query("What's the max salinity measured?")
+        assert second['sql_query'] == SQL and len(self.prompts) == 1
+
+    def test_failed_sql_is_evicted(self, translator, cache):
+        """Test that cached SQL failing later is evicted and regenerated next time."""
+        process_analytical_query("What is the maximum salinity recorded?")
+        self.status = "Database error: column \"salinity\" does not exist"
+        _, error = process_analytical_query("What is the maximum salinity recorded?")
+        assert error and len(cache) == 0
+        assert cache.stats()['evictions'] == 1
+        self.status = "success"
+        process_analytical_query("What is the maximum salinity recorded?")
+        assert len(self.prompts) == 2
+
+    def test_empty_result_neither_cached_nor_evicted(self, translator, cache):
+        """Test that SQL matching no rows is not cached, and not evicted when already cached."""
+        self.status = EMPTY_RESULT_STATUS
+        process_analytical_query("What is the maximum salinity recorded?")
+        assert len(cache) == 0
+        self.status = "success"
+        process_analytical_query("What is the maximum salinity recorded?")
+        self.status = EMPTY_RESULT_STATUS
+        process_analytical_query("What is the maximum salinity recorded?")
+        assert len(cache) == 1
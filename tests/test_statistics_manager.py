@@ -6,6 +6,7 @@ import pytest
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from unittest.mock import Mock
 import sys
 import os
 
@@ -313,5 +314,21 @@ class TestStatisticsManager:
         assessment_low = stats_manager.assess_data_quality(data_low)
         assert assessment_low['overall_score'] <= 2
 
+    def test_get_aggregate_statistics(self, stats_manager):
+        """Test cube aggregates fetched through the API client."""
+        api_client = Mock()
+        api_client.get_cube_statistics.return_value = pd.DataFrame({
+            'month': ['2023-01-01T00:00:00'], 'parameter': ['temperature'],
+            'count': [5], 'mean': [20.0], 'std': [1.0], 'min': [18.0], 'max': [23.0]
+        })
+        stats = stats_manager.get_aggregate_statistics(api_client, ['month'], ['temperature'], region='equator')
+        api_client.get_cube_statistics.assert_called_once_with(['month'], ['temperature'], region='equator')
+        assert stats.loc[0, 'range'] == 5.0
+        assert stats['month'].dtype.kind == 'M'
+
+    def test_get_aggregate_statistics_without_client(self, stats_manager):
+        """Test that no API client yields an empty frame."""
+        assert stats_manager.get_aggregate_statistics(None, ['month']).empty
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
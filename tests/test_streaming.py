@@ -0,0 +1,133 @@
+"""
+Unit tests for streaming answers as NDJSON events
+"""
+
+import pytest
+import asyncio
+import json
+import threading
+import time
+import os
+import sys
+
+# Add the parent directory to the path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import answer_events, encode_event, iterate_blocking
+
+def collect(async_iterator):
+    """All items of an async iterator, gathered on a fresh event loop"""
+    async def run():
+        return [item async for item in async_iterator]
+    return asyncio.run(run())
+
+def decode(lines):
+    return [json.loads(line) for line in lines]
+
+class TestIterateBlocking:
+    """Test cases for consuming a blocking iterator from the event loop."""
+
+    def test_items_in_order(self):
+        """Test that items arrive in order, produced off the event loop thread."""
+        threads = set()
+        def tokens(count):
+            for i in range(count):
+                threads.add(threading.current_thread())
+                yield f"t{i}"
+        assert collect(iterate_blocking(tokens, 3)) == ["t0", "t1", "t2"]
+        assert threading.main_thread() not in threads
+
+    def test_items_arrive_before_the_end(self):
+        """Test that the first item is available while the iterator is still producing."""
+        def slow():
+            yield "first"
+            time.sleep(0.5)
+            yield "second"
+
+        async def first_item():
+            started = time.perf_counter()
+            items = iterate_blocking(slow)
+            item = await items.__anext__()
+            elapsed = time.perf_counter() - started
+            await items.aclose()
+            return item, elapsed
+
+        item, elapsed = asyncio.run(first_item())
+        assert item == "first" and elapsed < 0.4
+
+    def test_error_propagates(self):
+        """Test that an exception raised by the iterator reaches the consumer after the items before it."""
+        def failing():
+            yield "partial"
+            raise ConnectionError("LLM went away")
+
+        received = []
+        async def run():
+            async for item in iterate_blocking(failing):
+                received.append(item)
+        with pytest.raises(ConnectionError):
+            asyncio.run(run())
+        assert received == ["partial"]
+
+    def test_stops_when_consumer_stops(self):
+        """Test that the producing thread stops once the consumer has gone."""
+        produced = []
+        def endless():
+            for i in range(1000):
+                produced.append(i)
+                time.sleep(0.005)
+                yield i
+
+        async def take_two():
+            items = iterate_blocking(endless)
+            taken = [await items.__anext__(), await items.__anext__()]
+            await items.aclose()
+            await asyncio.sleep(0.1)
+            return taken
+
+        assert asyncio.run(take_two()) == [0, 1]
+        count = len(produced)
+        time.sleep(0.1)
+        assert len(produced) == count < 100
+
+class TestAnswerEvents:
+    """Test cases for the event sequence of a streamed answer."""
+
+    def test_sequence(self):
+        """Test that the context comes first, then tokens, then the whole answer."""
+        async def tokens():
+            for token in ["Warm ", "", "water."]:
+                yield token
+        context = {'context_documents': ["doc"], 'retrieved_metadata': [{'profile_id': 1}]}
+        events = decode(collect(answer_events(context, tokens())))
+        assert events == [
+            {'type': 'context', 'context_documents': ["doc"], 'retrieved_metadata': [{'profile_id': 1}]},
+            {'type': 'token', 'text': "Warm "},
+            {'type': 'token', 'text': "water."},
+            {'type': 'done', 'answer': "Warm water."},
+        ]
+
+    def test_failure_mid_answer(self):
+        """Test that a failed generation ends with an error carrying the partial answer."""
+        async def tokens():
+            yield "Partial"
+            raise TimeoutError("generation timed out")
+        events = decode(collect(answer_events({}, tokens())))
+        assert [event['type'] for event in events] == ['context', 'token', 'error']
+        assert events[-1] == {'type': 'error', 'message': "generation timed out", 'answer': "Partial"}
+
+    def test_final_metadata(self):
+        """Test that metadata is read once the answer is complete and sent with done."""
+        state = {'source': 'llm'}
+        async def tokens():
+            state['source'] = 'retrieval'
+            yield "Retrieved data"
+        events = decode(collect(answer_events({}, tokens(), lambda: {'answer_source': state['source']})))
+        assert events[-1] == {'type': 'done', 'answer': "Retrieved data", 'metadata': {'answer_source': 'retrieval'}}
+
+    def test_encode_event(self):
+        """Test that each event is one line and unusual values are sent as strings."""
+        import datetime
+        line = encode_event('context', retrieved_metadata=[{'date': datetime.date(2023, 3, 5)}])
+        assert line.endswith(b"\n") and line.count(b"\n") == 1
+        assert json.loads(line)['retrieved_metadata'] == [{'date': "2023-03-05"}]